@@ -0,0 +1,52 @@
+"""
+Per-value f-string formatting vs storage.csv_format for logged spectra.
+
+    python benchmarks/bench_csv_format.py [pixels] [rows]
+
+Times a single spectrum, a buffered batch of rows as DataLogger writes
+them, and a snapshot table, and checks that both produce the same text.
+"""
+import os
+import sys
+import timeit
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from storage.csv_format import format_fixed, format_rows, format_table
+
+
+def best_of(func, repeat=7):
+    number = max(1, int(0.2 / min(timeit.repeat(func, number=1, repeat=3))))
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def report(name, old, new):
+    assert old() == new(), f"{name}: output differs"
+    t_old, t_new = best_of(old), best_of(new)
+    print(f"{name:<28}{t_old * 1e3:10.3f} ms{t_new * 1e3:10.3f} ms{t_old / t_new:9.1f}x")
+
+
+def main():
+    pixels = int(sys.argv[1]) if len(sys.argv) > 1 else 2048
+    rows = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    rng = np.random.default_rng(0)
+    spectra = rng.uniform(0, 65535, (rows, pixels))
+    prefixes = ["2025-01-01 12:00:00.000,50,1,OO,45.0"] * rows
+    wls = np.linspace(290.0, 620.0, pixels)
+    spectrum = spectra[0]
+
+    print(f"{pixels} pixels, {rows} rows per batch")
+    print(f"{'':<28}{'per value':>13}{'bulk':>13}{'speedup':>10}")
+    report("spectrum",
+           lambda: ",".join([f"{v:.4f}" for v in spectrum]),
+           lambda: format_fixed(spectrum))
+    report(f"batch of {rows} rows",
+           lambda: [p + "," + ",".join([f"{v:.4f}" for v in s]) for p, s in zip(prefixes, spectra)],
+           lambda: format_rows(prefixes, spectra))
+    report("snapshot table",
+           lambda: "".join(f"{w:.2f},{v:.4f}\n" for w, v in zip(wls, spectrum)),
+           lambda: format_table([wls, spectrum], [2, 4]))
+
+
+if __name__ == "__main__":
+    main()
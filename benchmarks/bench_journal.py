@@ -0,0 +1,69 @@
+"""
+Throughput of the row journal for each durability setting.
+
+    python benchmarks/bench_journal.py [rows] [pixels] [directory]
+
+Journals rows the size DataLogger writes ("both" format: CSV prefix,
+spectrum and archive record) and reports rows/s and time per row until
+they are written (and synced), the time per row append() takes on the
+caller's thread (the GUI thread in the application) and fsyncs.
+Run it with directory on the disk the data is logged to: fsync cost is a
+property of the storage (SD cards and USB sticks are far slower than SSDs).
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from storage.journal import RowJournal
+from storage.spectral_archive import SpectralArchiveWriter, empty_meta
+
+SETTINGS = [
+    ("os", {}),
+    ("batch", {"batch_rows": 50, "batch_interval_s": 10.0}),
+    ("batch", {"batch_rows": 10, "batch_interval_s": 2.0}),
+    ("batch", {"batch_rows": 2, "batch_interval_s": 2.0}),
+    ("row", {}),
+]
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    pixels = int(sys.argv[2]) if len(sys.argv) > 2 else 2048
+    base = sys.argv[3] if len(sys.argv) > 3 else None
+    directory = tempfile.mkdtemp(dir=base)
+    try:
+        archive = SpectralArchiveWriter(os.path.join(directory, "a.sga"), pixels)
+        spectrum = np.random.default_rng(0).uniform(0, 65535, pixels)
+        record = archive.encode_rows([empty_meta()], [spectrum])
+        archive.close()
+        prefix = "2025-01-01 12:00:00.000,45.0,2," + ",".join(["0.00"] * 24)
+
+        print(f"{rows} rows of {pixels} pixels ({len(record) + 8 * pixels + len(prefix)} bytes) in {directory}")
+        print(f"{'durability':<34}{'rows/s':>10}{'us/row':>10}{'caller us/row':>15}{'fsyncs':>8}")
+        print(f"{'off (no journal)':<34}{'-':>10}{0.0:>10.1f}{0.0:>15.1f}{0:>8}")
+        for durability, options in SETTINGS:
+            journal = RowJournal(directory, f"bench_{durability}", durability, **options)
+            journal.begin({"csv": None})
+            started = time.perf_counter()
+            for i in range(rows):
+                journal.append(i, i, prefix, spectrum, record)
+            if durability != "os":
+                journal.sync()
+            caller = time.perf_counter() - started
+            journal.flush()
+            elapsed = time.perf_counter() - started
+            journal.close()
+            journal.release()
+            label = durability + (f" (every {options['batch_rows']} rows)" if options else "")
+            print(f"{label:<34}{rows / elapsed:>10.0f}{1e6 * elapsed / rows:>10.1f}{1e6 * caller / rows:>15.1f}"
+                  f"{journal.fsyncs:>8}")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Throughput of the data pipeline fed by a replayed session.
+
+    python benchmarks/bench_replay.py [scans] [pixels] [source]
+
+Replays a session (a synthetic one of `scans` rows at 10 scans/s, made with a
+fixed seed, or `source`: a scan log, segment index or flight recorder dump)
+as fast as possible into increasingly complete pipelines: the state store
+alone, the flight recorder, DataLogger writing CSV and archive segments,
+and the live plot (pyqtgraph, offscreen), then times routine
+post-processing reading the archive back. For each it reports scans/s and
+the maximum sustainable replay speed relative to the original session.
+
+Timestamps are not rebased, so every run writes byte-identical files; the
+printed CRC of the CSV lets runs on different machines be compared.
+"""
+import os
+import sys
+import time
+import zlib
+import shutil
+import tempfile
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from core.replay import Replayer, load_recording
+from core.state_store import get_state_store
+from core.flight_recorder import FlightRecorder
+from core.scan_sampler import MODE_SCANS
+from storage.spectral_archive import SpectralArchiveWriter, empty_meta
+from storage.scan_reader import read_scans
+from storage.catalog import configure_catalog, DEFAULT_PATH
+from storage.file_writer import get_file_writer, shutdown_file_writer
+
+
+def synthetic_session(path, scans, pixels, rate=10.0):
+    """An archive of scans at rate per second with sensor readings of realistic periods"""
+    rng = np.random.default_rng(0)
+    base = rng.uniform(1000, 40000, pixels).astype(np.float32)
+    metas = []
+    for i in range(scans):
+        t = 1.7e9 + i / rate
+        meta = empty_meta()
+        meta.update(timestamp=t, motor_angle=float(45 * ((i // 200) % 4)), filter_pos=1 + (i // 400) % 2,
+                    integration_time=100.0, routine_code="OO" if i % 1000 < 800 else "XX",
+                    roll=float(rng.normal()), pitch=float(rng.normal()), yaw=float(rng.uniform(-180, 180)),
+                    imu_age=(i % 2) / rate, thp_temp=21.0 + (i // 30) * 0.01, thp_age=(i % 30) / rate,
+                    tec_current=25.0, tec_setpoint=25.0, tec_age=(i % 10) / rate,
+                    scan_first=i + 1, scan_count=1)
+        metas.append(meta)
+    spectra = base + rng.normal(0, 50, (scans, pixels)).astype(np.float32)
+    with SpectralArchiveWriter(path, pixels, np.linspace(290.0, 620.0, pixels)) as writer:
+        writer.append_many(metas, spectra)
+
+
+def make_logger(directory, scan_format):
+    from gui.components.data_logger import DataLogger
+    logger = DataLogger(None)
+    logger.csv_dir = logger.log_dir = directory
+    logger.scan_format = scan_format
+    logger.sampling_mode = MODE_SCANS
+    logger.scans_per_row = 5
+    logger.toggle_data_saving()
+    return logger
+
+
+def make_plot():
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    import pyqtgraph as pg
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication([])
+    widget = pg.PlotWidget()
+    curve = widget.plot()
+    wavelengths = None
+
+    def show(scan):
+        nonlocal wavelengths
+        intensities = np.array(scan.intensities)
+        if wavelengths is None:
+            wavelengths = np.arange(len(intensities), dtype=float)
+        curve.setData(wavelengths, intensities)
+        app.processEvents()
+    return widget, show
+
+
+def run(recording, name, on_scan=None, after=None):
+    store = get_state_store()
+    store.clear()
+    started = time.perf_counter()
+    stats = Replayer(recording, on_scan=on_scan, speed=None, rebase=False).run()
+    extra = after() if after else ""
+    elapsed = time.perf_counter() - started
+    print(f"{name:<34}{stats.scans / elapsed:>10.0f}{stats.recorded_s / elapsed:>10.0f}x  {extra}")
+
+
+def main():
+    scans = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    pixels = int(sys.argv[2]) if len(sys.argv) > 2 else 2048
+    source = sys.argv[3] if len(sys.argv) > 3 else None
+    directory = tempfile.mkdtemp()
+    configure_catalog(path=os.path.join(directory, "catalog.sqlite"))
+    try:
+        if source is None:
+            source = os.path.join(directory, "session.sga")
+            synthetic_session(source, scans, pixels)
+        started = time.perf_counter()
+        recording = load_recording(source)
+        print(f"{len(recording)} scans, {len(recording.records)} state records, "
+              f"{recording.duration:.0f} s recorded, loaded in {time.perf_counter() - started:.2f} s")
+        print(f"{'pipeline':<34}{'scans/s':>10}{'speed':>11}")
+
+        run(recording, "state store only")
+
+        recorder = FlightRecorder(os.path.join(directory, "flight"))
+        recorder.attach()
+        run(recording, "+ flight recorder", recorder.add_scan)
+        recorder.detach()
+
+        for scan_format in ("csv", "both"):
+            out = os.path.join(directory, scan_format)
+            os.makedirs(out)
+            logger = make_logger(out, scan_format)
+
+            def finish(logger=logger, out=out):
+                logger.toggle_data_saving()
+                get_file_writer().drain()
+                csv = [f for f in os.listdir(out) if f.endswith(".csv")]
+                with open(os.path.join(out, csv[0]), "rb") as f:
+                    return f"CSV crc32 {zlib.crc32(f.read()):08x}"
+            run(recording, f"+ data logger ({scan_format})", lambda scan, logger=logger: logger.add_scan(scan), finish)
+
+        try:
+            widget, show = make_plot()
+            run(recording, "+ plot (every scan)", show)
+        except ImportError as e:
+            print(f"{'+ plot':<34}skipped: {e}")
+
+        archive = [os.path.join(directory, "both", f) for f in os.listdir(os.path.join(directory, "both"))
+                   if f.endswith(".sga")][0]
+        started = time.perf_counter()
+        data = read_scans(archive, routine_code="OO", filter_pos=2, angle=[0, 90])
+        print(f"post-processing read: {len(data)} rows in {1e3 * (time.perf_counter() - started):.1f} ms")
+    finally:
+        shutdown_file_writer()
+        configure_catalog(path=DEFAULT_PATH)
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Memory and throughput of spectra as Python floats, float64 and float32 arrays.
+
+    python benchmarks/bench_spectra.py [pixels] [buffer sizes...]
+
+Memory: the bytes held per spectrum (measured with tracemalloc over a
+sample) and what buffers of N spectra take at that rate, as a list of
+Python floats per spectrum (the former spectrometer controller's intens and
+timer-mode samples), a tuple per spectrum (the former Scan), and float64 /
+float32 arrays (core.spectrum). The default sizes are a row's timer-mode
+samples, the flight recorder's max_scans and an hour of scans at 10
+scans/s (a replayed recording).
+
+Throughput: the per-scan work after acquisition, from the driver's buffer of
+4096 doubles to the spectrum, a 5-scan row average, the flight recorder's
+copy and the CSV text and archive record of the row, with the former code
+path and with core.spectrum in each dtype.
+"""
+import os
+import sys
+import ctypes
+import timeit
+import tracemalloc
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from core.spectrum import as_spectrum, mean_spectrum
+from storage.csv_format import format_rows
+from storage.spectral_archive import SpectralArchiveWriter, empty_meta
+
+SIZES = [20, 2000, 36000]
+SAMPLE = 200
+
+
+def bytes_per_spectrum(make):
+    """Bytes allocated per spectrum made by make(i), measured over SAMPLE spectra"""
+    tracemalloc.start()
+    buffer = [make(i) for i in range(SAMPLE)]
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del buffer
+    return held / SAMPLE
+
+
+def best_of(func, repeat=5):
+    number = max(1, int(0.2 / min(timeit.repeat(func, number=1, repeat=3))))
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def main():
+    pixels = int(sys.argv[1]) if len(sys.argv) > 1 else 2048
+    sizes = [int(n) for n in sys.argv[2:]] or SIZES
+    rng = np.random.default_rng(0)
+    # Detector counts, as the driver returns them
+    counts = rng.integers(1000, 60000, (8, 4096)).astype(np.float64)
+    buffers = [(ctypes.c_double * 4096)(*row) for row in counts]
+
+    representations = [
+        ("list of floats", lambda i: [float(v) for v in counts[i % 8, :pixels]]),
+        ("tuple of floats", lambda i: tuple(float(v) for v in counts[i % 8, :pixels])),
+        ("float64 array", lambda i: as_spectrum(buffers[i % 8], pixels, np.float64)),
+        ("float32 array", lambda i: as_spectrum(buffers[i % 8], pixels, np.float32)),
+    ]
+    print(f"Memory held by N spectra of {pixels} pixels (MB)")
+    print(f"{'representation':<18}" + "".join(f"{'N=' + str(n):>12}" for n in sizes) + f"{'bytes/pixel':>14}")
+    for name, make in representations:
+        held = bytes_per_spectrum(make)
+        print(f"{name:<18}" + "".join(f"{held * n / 1e6:12.1f}" for n in sizes) + f"{held / pixels:14.1f}")
+
+    archive = SpectralArchiveWriter(os.devnull, pixels)
+    meta = empty_meta()
+
+    def former():
+        # Pad to a list, emit a tuple, average through float64 to a list, copy to float32
+        scans = []
+        for buffer in buffers[:5]:
+            full = [0.0] * pixels
+            full[:] = buffer[:pixels]
+            scans.append(tuple(full))
+        recorded = [np.asarray(s, dtype=np.float32) for s in scans]
+        row = np.array([s[:pixels] for s in scans], dtype=float).mean(axis=0).tolist()
+        return recorded, format_rows(["t"], [row]), archive.encode_rows([meta], [row])
+
+    def canonical(dtype):
+        def run():
+            scans = [as_spectrum(buffer, pixels, dtype) for buffer in buffers[:5]]
+            recorded = [as_spectrum(s, dtype=dtype) for s in scans]
+            row = mean_spectrum(scans, dtype)
+            return recorded, format_rows(["t"], [row]), archive.encode_rows([meta], [row])
+        return run
+
+    print("\nPer 5-scan row: driver buffers to spectra, average, flight recorder, CSV text and archive record")
+    baseline = best_of(former)
+    print(f"{'former (floats)':<18}{baseline * 1e3:10.3f} ms")
+    for name, dtype in (("float64 array", np.float64), ("float32 array", np.float32)):
+        elapsed = best_of(canonical(dtype))
+        print(f"{name:<18}{elapsed * 1e3:10.3f} ms{baseline / elapsed:8.1f}x")
+    archive.close()
+
+
+if __name__ == "__main__":
+    main()
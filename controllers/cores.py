@@ -0,0 +1,807 @@
+"""
+Widget-free cores of the device controllers.
+
+Each core connects its device, polls or reads it, publishes its state
+records and events, and offers the methods the RoutineManager, DataLogger
+and FlightRecorder call (move_to, set_position, start_measurement,
+apply_integration_time, save, scan_signal, ...). The GUI controllers in
+controllers/*_controller.py wrap a core with their widgets and follow it
+through its state_signal; headless.py uses the cores directly. They need a
+Qt event loop (QCoreApplication), but no QApplication and no display.
+"""
+import os
+import time
+import threading
+
+import numpy as np
+import serial
+from PyQt5.QtCore import QObject, QTimer, QDateTime, pyqtSignal
+
+from drivers.motor import MotorConnectThread, send_move_command, move_duration
+from drivers.filterwheel import FilterWheelConnectThread, FilterWheelCommandThread
+from drivers.tc36_25_driver import TC36_25
+from drivers.thp_sensor import read_thp_sensor_data
+from drivers.imu import start_imu_read_thread
+from core.state_store import (get_state_store, MotorState, FilterWheelState, SpectrometerState, TECState,
+                              THPState, IMUState)
+from core.scan_sampler import Scan
+from core.spectrum import as_spectrum
+from core.event_log import EventSource
+from core.routine_simulator import scan_averages
+from storage.file_writer import get_file_writer
+from storage.compression import resolve_codec
+from storage.csv_format import format_table
+
+# AVS_GetScopeData time labels are 10 us ticks in a uint32 that wraps every ~11.9 h
+_TICK_SECONDS = 1e-5
+_TICK_WRAP = 2 ** 32
+
+FILTER_POSITIONS = range(1, 7)
+TEMP_READ_TIMEOUT_S = 0.5   # a TC read taking longer than this is reported (the driver call may block)
+
+
+class MotorCore(QObject):
+    """Motor on a serial port, moved in 0.01° steps"""
+    status_signal = pyqtSignal(str)
+    state_signal = pyqtSignal()         # after every published MotorState
+
+    def __init__(self, port=None, parent=None):
+        super().__init__(parent)
+        self.events = EventSource("motor", self.status_signal.emit)
+        self.port = port
+        self.serial = None
+        self._connected = False
+        self._connecting = False
+        self._moving = False
+        self._move_id = 0               # Identifies the latest move, so only its timer ends the motion
+        self._current_angle_deg = None
+
+    def connect(self, port=None):
+        """Open the port in the background; the motor goes to 0° once connected"""
+        if self._connected or self._connecting:
+            return
+        self.port = port or self.port
+        self._connecting = True
+        self.events.info("connecting", f"Motor: Connecting to {self.port}...", port=self.port)
+        self._thread = MotorConnectThread(self.port, parent=self)
+        self._thread.result_signal.connect(self._on_connect)
+        self._thread.start()
+
+    def _on_connect(self, ser, baud, msg):
+        self._connecting = False
+        if ser:
+            self.serial = ser
+            self._connected = True
+            self.events.info("connected", f"Motor connected on {ser.port}.", port=ser.port)
+            self.move_to(0)
+        else:
+            self.events.error("connect_failed", msg)
+        self._publish_state()
+
+    def disconnect(self):
+        if self.serial and self.serial.is_open:
+            try:
+                self.serial.close()
+                self.events.info("disconnected", "Motor disconnected.")
+            except Exception as e:
+                self.events.error("disconnect_failed", f"Motor: Error closing serial port: {e}", error=str(e))
+        self.serial = None
+        self._connected = self._moving = False
+        self._publish_state()
+
+    @property
+    def current_angle_deg(self):
+        return self._current_angle_deg
+
+    def _publish_state(self):
+        get_state_store().publish(MotorState(angle_deg=self._current_angle_deg, connected=self._connected,
+                                             moving=self._moving))
+        self.state_signal.emit()
+
+    def move_to(self, angle):
+        """Send a move to angle; in position once the move's motion profile has run"""
+        if not self._connected:
+            self.events.warning("not_connected", "Motor not connected", angle=angle)
+            return False
+        try:
+            ok = send_move_command(self.serial, int(angle * 100))
+        except Exception as e:
+            self.events.error("move_error", f"Motor: Error moving: {e}", angle=angle, error=str(e))
+            return False
+        if not ok:
+            self.events.error("move_failed", f"Motor: Failed to move to {angle}° (No ACK or other error)", angle=angle)
+            return False
+        # The ACK means the move was accepted; the motor is in position once
+        # its motion profile has run (a full turn if the start was unknown)
+        previous = self._current_angle_deg
+        distance = abs(angle - previous) if previous is not None else 360
+        self._moving = True
+        self._move_id += 1
+        move_id = self._move_id
+        self._current_angle_deg = angle
+        self._publish_state()
+        self.events.info("moved", f"Motor: Moved to {angle}°", angle=angle)
+        QTimer.singleShot(int(1000 * move_duration(distance * 100)), lambda: self._on_in_position(move_id))
+        return True
+
+    def _on_in_position(self, move_id):
+        """End of the motion of move move_id, unless a later move superseded it"""
+        if move_id != self._move_id or not self._moving:
+            return
+        self._moving = False
+        self._publish_state()
+        self.events.debug("in_position", f"Motor: In position at {self._current_angle_deg}°",
+                          angle=self._current_angle_deg)
+
+    def is_moving(self):
+        return self._moving
+
+    def is_connected(self):
+        return self._connected
+
+
+def _commanded_position(cmd):
+    """Position a filter wheel command moves to ("F1r" resets to 1), or None"""
+    if cmd == "F1r":
+        return 1
+    if cmd and len(cmd) == 3 and cmd.startswith("F1") and cmd[2].isdigit() and int(cmd[2]) in FILTER_POSITIONS:
+        return int(cmd[2])
+    return None
+
+
+class FilterWheelCore(QObject):
+    """Filter wheel with six positions on a serial port; commands run on background threads"""
+    status_signal = pyqtSignal(str)
+    state_signal = pyqtSignal()         # after every published FilterWheelState
+
+    def __init__(self, port=None, parent=None):
+        super().__init__(parent)
+        self.events = EventSource("filter_wheel", self.status_signal.emit)
+        self.port = port
+        self.serial = None
+        self._connected = False
+        self._connecting = False
+        self._current_position = None
+        self._pending = 0               # commands sent and not answered yet
+        self._threads = set()
+
+    def connect(self, port=None):
+        """Open the port in the background; the wheel is reset to position 1 once connected"""
+        if self._connected:
+            self.events.info("already_connected", "Already connected. Please disconnect first.")
+            return
+        if self._connecting:
+            return
+        self.port = port or self.port
+        self._connecting = True
+        self.events.info("connecting", f"Attempting to connect to {self.port}...", port=self.port)
+        self._run(FilterWheelConnectThread(self.port, parent=self), self._on_connect)
+
+    def _run(self, thread, slot):
+        self._threads.add(thread)
+        thread.result_signal.connect(slot)
+        thread.finished.connect(lambda: self._threads.discard(thread))
+        thread.start()
+
+    def _on_connect(self, ser, msg):
+        self._connecting = False
+        if not ser:
+            self.events.error("connect_failed", msg)
+            self._publish_state()
+            return
+        self.serial = ser
+        self._connected = True
+        self.events.info("connected", f"Connected to filter wheel on {ser.port}.", port=ser.port)
+        self._publish_state()
+        self.send_command("F1r")        # Reset to position 1 (Opaque)
+
+    def disconnect(self):
+        if self.serial and self.serial.is_open:
+            try:
+                self.serial.close()
+                self.events.info("disconnected", "Filter wheel disconnected.")
+            except Exception as e:
+                self.events.error("disconnect_failed", f"Error closing serial port: {e}", error=str(e))
+        self.serial = None
+        self._connected = False
+        self._current_position = None
+        self._publish_state()
+
+    def set_position(self, position):
+        """Move to position 1-6; returns whether the command was sent"""
+        if position not in FILTER_POSITIONS:
+            self.events.warning("invalid_position", f"Invalid position: {position}", position=position)
+            return False
+        return self.send_command(f"F1{position}")
+
+    def send_command(self, cmd):
+        """Send a command such as "F12" or "F1r"; returns whether it was sent"""
+        if not self._connected:
+            self.events.warning("not_connected", "Not connected", command=cmd)
+            return False
+        self._pending += 1
+        self._run(FilterWheelCommandThread(self.serial, cmd, parent=self),
+                  lambda pos, msg: self._on_result(cmd, pos, msg))
+        return True
+
+    def _on_result(self, cmd, pos, msg):
+        self._pending -= 1
+        self.events.info("command_result", msg, command=cmd, position=pos)
+        if pos is None:
+            # No answer from the wheel: assume it went where it was sent
+            position = _commanded_position(cmd)
+            self.events.warning("position_unconfirmed",
+                                f"Position not confirmed by device, using command assumption. {msg}", command=cmd)
+        else:
+            try:
+                position = int(pos)
+            except ValueError:
+                position = None
+            if position in FILTER_POSITIONS:
+                self.events.info("position_confirmed", f"Filter wheel position confirmed: {position}. {msg}",
+                                 position=position)
+            else:
+                self.events.warning("invalid_position", f"Filter wheel reported invalid position: {pos}. {msg}",
+                                    position=pos)
+                position = None
+        self._current_position = position
+        self._publish_state()
+
+    @property
+    def current_position(self):
+        return self._current_position
+
+    def _publish_state(self):
+        get_state_store().publish(FilterWheelState(position=self._current_position, connected=self._connected))
+        self.state_signal.emit()
+
+    def get_position(self):
+        """The last known position (1-6), or None if unknown"""
+        return self._current_position
+
+    def is_busy(self):
+        return self._pending > 0
+
+    def is_connected(self):
+        return self._connected
+
+
+class SpectrometerCore(QObject):
+    """The first AvaSpec spectrometer: measurement, scans, integration time and snapshots.
+
+    The SDK is only loaded by connect(), so a station without one (e.g.
+    replaying a recorded session) does not need it. station is the object
+    that owns the data logger (MainWindow or headless.HeadlessStation); its
+    sampling timers follow the integration time.
+    """
+    status_signal = pyqtSignal(str)
+    state_signal = pyqtSignal()         # after every published SpectrometerState, and on disconnect
+    scan_signal = pyqtSignal(object)    # core.scan_sampler.Scan for every completed scan
+    replay_signal = pyqtSignal(object)  # Scans of a replayed session (core.replay), from any thread
+
+    def __init__(self, station=None, parent=None, integration_time_ms=50.0, csv_dir="data"):
+        super().__init__(parent)
+        self.events = EventSource("spectrometer", self.status_signal.emit)
+        self.station = station
+        self.replay_signal.connect(self._on_replay_scan)
+        self.handle = None
+        self.wls = []
+        self.npix = 0
+        self.intens = as_spectrum(())
+        # Scan numbering for scan-driven logging; never reset during a session
+        self.scan_seq = 0
+        self._last_tick = None
+        self._tick_wraps = 0
+        self._ready = False
+        self.measure_active = False
+        self.measure_started = 0.0
+        self.integration_time_ms = float(integration_time_ms)
+        self.cycles = 1
+        self.repetitions = 1
+        self.high_res_adc = True
+        # Data directory for snapshots
+        self.csv_dir = csv_dir
+        os.makedirs(self.csv_dir, exist_ok=True)
+
+    @property
+    def current_integration_time_us(self):
+        # The name the data logger and station set-up use; the value is in ms
+        return self.integration_time_ms
+
+    @current_integration_time_us.setter
+    def current_integration_time_us(self, value):
+        self.integration_time_ms = value
+
+    def connect(self):
+        """Activate the first spectrometer; returns whether it is ready"""
+        if self._ready:
+            return True
+        self.events.info("connecting", "Spectrometer: Connecting...")
+        try:
+            from drivers.spectrometer import connect_spectrometer
+            handle, wavelengths, num_pixels, serial_str = connect_spectrometer()
+        except Exception as e:
+            self.events.error("connect_failed", f"Spectrometer: Connection failed: {e}", error=str(e))
+            return False
+        self.handle = handle
+        self.wls = wavelengths.tolist() if isinstance(wavelengths, np.ndarray) else list(wavelengths)
+        self.npix = num_pixels
+        self._ready = True
+        if self.high_res_adc:
+            try:
+                from drivers.avaspec import AVS_UseHighResAdc
+                AVS_UseHighResAdc(self.handle, True)
+                self.events.info("high_res_adc", "Spectrometer: High-resolution ADC mode enabled.", enabled=True)
+            except Exception as e:
+                self.events.warning("high_res_adc_failed", f"Spectrometer: Could not enable high-res ADC: {e}",
+                                    error=str(e))
+        self.events.info("connected", f"Spectrometer ready (SN={serial_str})", serial=serial_str, pixels=num_pixels)
+        self._publish_state()
+        return True
+
+    def disconnect(self):
+        """Stop measuring and deactivate the spectrometer"""
+        self.events.info("disconnecting", "Spectrometer: Disconnecting...")
+        if self.measure_active:
+            self.stop_measurement()
+            self.events.info("measurement_stopped", "Spectrometer: Measurement stopped for disconnection.")
+        if self.handle is not None:
+            from drivers.spectrometer import deactivate_spectrometer_handle
+            success, msg = deactivate_spectrometer_handle(self.handle)
+            if success:
+                self.events.info("deactivated", f"Spectrometer: {msg}")
+            else:
+                self.events.warning("deactivate_failed", f"Spectrometer: Deactivation issue: {msg}", error=msg)
+            self.handle = None
+        self._ready = False
+        get_state_store().clear(SpectrometerState)
+        self.state_signal.emit()
+        self.events.info("disconnected", "Spectrometer: Disconnected.")
+
+    def is_ready(self):
+        return self._ready
+
+    def _prepare(self):
+        """Send the integration time, averages, cycles and repetitions; returns the driver code"""
+        from drivers.spectrometer import prepare_measurement
+        return prepare_measurement(self.handle, self.npix, integration_time_ms=self.integration_time_ms,
+                                   averages=scan_averages(self.integration_time_ms),
+                                   cycles=self.cycles, repetitions=self.repetitions)
+
+    def _prepare_and_start(self):
+        from drivers.spectrometer import AVS_MeasureCallback, AVS_MeasureCallbackFunc
+        code = self._prepare()
+        if code != 0:
+            self.events.error("prepare_failed", f"Prepare error: {code}", error_code=code)
+            return False
+        self.measure_active = True
+        self.cb = AVS_MeasureCallbackFunc(self._cb)
+        err = AVS_MeasureCallback(self.handle, self.cb, -1)
+        if err != 0:
+            self.events.error("callback_failed", f"Callback error: {err}", error_code=err)
+            self.measure_active = False
+            return False
+        self.measure_started = time.time()
+        self._publish_state()
+        averages = scan_averages(self.integration_time_ms)
+        self.events.info("measurement_started",
+                         f"Measurement started (Int: {self.integration_time_ms}ms, Avg: {averages}, "
+                         f"Cycles: {self.cycles}, Rep: {self.repetitions})",
+                         integration_ms=self.integration_time_ms, averages=averages, cycles=self.cycles,
+                         repetitions=self.repetitions)
+        return True
+
+    def start_measurement(self):
+        if not self._ready:
+            self.events.warning("not_connected", "Spectrometer: Not ready/connected.")
+            return False
+        return self.measure_active or self._prepare_and_start()
+
+    def stop_measurement(self, then=None):
+        """Stop measuring on a background thread; then() runs once it has stopped"""
+        if not self.measure_active:
+            return False
+        from drivers.spectrometer import StopMeasureThread
+        self.measure_active = False
+        th = StopMeasureThread(self.handle, parent=self)
+        th.finished_signal.connect(then or self._on_stop)
+        th.start()
+        return True
+
+    def _on_stop(self):
+        self._publish_state()
+        self.events.info("measurement_stopped", "Measurement stopped")
+
+    def apply_integration_time(self, integration_time_ms):
+        """Use a new integration time, restarting a running measurement with it"""
+        self.integration_time_ms = float(integration_time_ms)
+        self._publish_state()
+        self._update_data_collection_timers()
+        if not self._ready:
+            return
+        if self.measure_active:
+            self.events.info("settings_restart", "Stopping measurement to update settings...")
+            self.stop_measurement(then=self._restart)
+            return
+        code = self._prepare()
+        if code != 0:
+            self.events.error("settings_failed", f"Settings update error: {code}", error_code=code)
+            return
+        self.events.info("settings_updated", f"Settings updated (Int: {self.integration_time_ms}ms, "
+                         f"Cycles: {self.cycles}, Rep: {self.repetitions})",
+                         integration_ms=self.integration_time_ms, cycles=self.cycles, repetitions=self.repetitions)
+
+    def _update_data_collection_timers(self):
+        """Timer sampling of the data logger follows the integration time"""
+        logger = getattr(self.station, 'data_logger', None)
+        if not getattr(logger, 'continuous_saving', False):
+            return
+        logger.collection_interval = max(100, int(self.integration_time_ms))     # at least 100 ms
+        logger.save_interval = int(self.integration_time_ms + 200)               # 200 ms for processing
+        for name, interval in (('data_timer', logger.collection_interval), ('save_timer', logger.save_interval)):
+            timer = getattr(self.station, name, None)
+            if timer is not None:
+                timer.setInterval(interval)
+        self.events.info("collection_interval", f"Updated data collection interval to {logger.collection_interval}ms",
+                         interval_ms=logger.collection_interval)
+
+    def _restart(self):
+        # Scans are not logged while the new integration time settles (see DataLogger)
+        setattr(self.station, '_integration_changing', True)
+        if self._prepare_and_start():
+            QTimer.singleShot(int(self.integration_time_ms * 2),
+                              lambda: setattr(self.station, '_integration_changing', False))
+
+    def _cb(self, p_data, p_user):
+        """Driver callback (on the driver's thread) for every new scan"""
+        if p_user[0] != 0:
+            self.events.error("scan_error", f"Spectrometer error code {p_user[0]}", error_code=p_user[0])
+            return
+        from drivers.spectrometer import AVS_GetScopeData
+        tick, data = AVS_GetScopeData(self.handle)
+        received = time.time()
+        # Copy the pixels we use (up to 2048) out of the driver's 4096 doubles
+        self.intens = as_spectrum(data, min(2048, self.npix))
+        if self._last_tick is not None and tick < self._last_tick:
+            self._tick_wraps += 1
+        self._last_tick = tick
+        self.scan_seq += 1
+        self.scan_signal.emit(Scan(seq=self.scan_seq,
+                                   hw_timestamp=(tick + self._tick_wraps * _TICK_WRAP) * _TICK_SECONDS,
+                                   host_timestamp=received, integration_time_ms=self.integration_time_ms,
+                                   intensities=self.intens))
+
+    def _on_replay_scan(self, scan):
+        """Take a replayed scan and pass it on like one from the driver"""
+        self.intens = scan.intensities
+        if len(self.wls) < len(self.intens):
+            spec = get_state_store().get(SpectrometerState)
+            wavelengths = list(spec.wavelengths) if spec is not None else []
+            self.wls = wavelengths if len(wavelengths) >= len(self.intens) else list(range(len(self.intens)))
+        self.integration_time_ms = scan.integration_time_ms
+        self.scan_signal.emit(scan)
+
+    def _publish_state(self):
+        get_state_store().publish(SpectrometerState(integration_time_ms=self.integration_time_ms,
+                                                    wavelengths=tuple(self.wls or ()),
+                                                    measuring=self.measure_active,
+                                                    started=self.measure_started))
+        self.state_signal.emit()
+
+    def save(self, filename=None, routine_name=None, routine_start_time_str=None, callback=None):
+        """Queue the current scan to be written as a CSV snapshot; returns True once queued.
+
+        callback(path, error), if given, is called on the writer thread once the
+        file is written.
+        """
+        if routine_name and routine_start_time_str and filename:
+            target_dir = os.path.join(self.csv_dir, routine_name, routine_start_time_str)
+            os.makedirs(target_dir, exist_ok=True)
+            path = os.path.join(target_dir, filename)
+        elif filename:
+            path = os.path.join(self.csv_dir, filename)
+        else:
+            path = os.path.join(self.csv_dir, f"snapshot_{QDateTime.currentDateTime().toString('yyyyMMdd_hhmmss')}.csv")
+
+        # Keep the current scan (read-only, so no copy is needed); formatting and writing happen on the writer thread
+        wls = list(self.wls)
+        intens = as_spectrum(self.intens)
+
+        def render():
+            num_points = min(len(wls), len(intens))
+            w = np.asarray(wls[:num_points], dtype=float)
+            v = np.asarray(intens[:num_points], dtype=float)
+            keep = v != 0
+            return "Wavelength (nm),Intensity\n" + format_table([w[keep], v[keep]], [2, 4])
+
+        try:
+            # Same "compression" setting as the continuous CSV log
+            codec = resolve_codec((getattr(self.station, 'config', None) or {}).get("compression"))
+            if codec:
+                path += codec.extension
+            # Catalog the snapshot with the hardware state it was taken in
+            store = get_state_store()
+            motor, wheel = store.get(MotorState), store.get(FilterWheelState)
+            now = time.time()
+            catalog = {"kind": "snapshot", "routine": routine_name, "routine_start": routine_start_time_str,
+                       "motor_angle": motor.angle_deg if motor is not None else None,
+                       "filter_pos": wheel.position if wheel is not None else None,
+                       "integration_time_ms": self.integration_time_ms,
+                       "first_timestamp": now, "last_timestamp": now,
+                       "rows": int(np.count_nonzero(intens[:len(wls)]))}
+            return get_file_writer().write_file(path, render,
+                                                callback=lambda p, error: self._on_snapshot_written(p, error, callback),
+                                                compression=codec.name if codec else None, catalog=catalog)
+        except Exception as e:
+            self.events.error("save_failed", f"Save error: {e}", error=str(e))
+            return False
+
+    def _on_snapshot_written(self, path, error, callback=None):
+        """Writer-thread callback for save()"""
+        if error is None:
+            self.events.info("snapshot_saved", f"Saved snapshot to {path}", path=path)
+        else:
+            self.events.error("save_failed", f"Save error: {error}", path=path, error=str(error))
+        if callback is not None:
+            callback(path, error)
+
+
+class TempCore(QObject):
+    """TC36-25 temperature controller, polled every second"""
+    status_signal = pyqtSignal(str)
+    state_signal = pyqtSignal()         # after every published TECState (also from the read timeout thread)
+
+    def __init__(self, port=None, parent=None, poll_ms=1000):
+        super().__init__(parent)
+        self.events = EventSource("tec", self.status_signal.emit)
+        self.port = port
+        self.tc = None                  # the TC36_25 driver while connected
+        self._connected = False
+        self.setpoint = 0.0             # last setpoint sent
+        self.current_temp = 0.0
+        self.auxiliary_temp = 0.0
+        self.reading_ok = False         # whether current_temp is a reading (0.0 otherwise)
+        self.poll_ms = poll_ms
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self._update)
+        self._read_timer = None         # threading.Timer reporting a read that hangs
+        self._read_timed_out = False
+
+    def connect(self, port=None):
+        """Connect, enable computer control and power the output; returns whether it worked"""
+        if self._connected:
+            return True
+        self.port = port or self.port
+        self.events.info("connecting", f"TC: Connecting to {self.port}...", port=self.port)
+        try:
+            self.tc = TC36_25(self.port)
+            self.tc.enable_computer_setpoint()
+            self.tc.power(True)
+        except Exception as e:
+            self.events.error("connect_failed", f"TC: Connection failed: {e}", port=self.port, error=str(e))
+            self.tc = None
+            self._reset_readings()
+            return False
+        self._connected = True
+        self.timer.start(self.poll_ms)
+        self.events.info("connected", f"TC: Connected on {self.port}", port=self.port)
+        self._publish_state()
+        return True
+
+    def disconnect(self):
+        """Power the output off and release the controller"""
+        self.events.info("disconnecting", "TC: Disconnecting...")
+        self.timer.stop()
+        if self._read_timer is not None:
+            self._read_timer.cancel()
+            self._read_timer = None
+        if self.tc is not None:
+            try:
+                self.tc.power(False)
+                self.events.info("power_off", "TC: Power turned off.")
+            except Exception as e:
+                self.events.error("disconnect_failed", f"TC: Error during power off/disconnect: {e}", error=str(e))
+        self.tc = None
+        self._connected = False
+        self._reset_readings()
+        self.events.info("disconnected", "TC: Disconnected.")
+
+    def set_preset_temp(self, temp):
+        """Send a new setpoint; returns whether it was set"""
+        if not self._connected or self.tc is None:
+            self.events.warning("not_connected", "TC: Not connected", setpoint=temp)
+            return False
+        try:
+            self.tc.set_setpoint(temp)
+        except Exception as e:
+            self.events.error("setpoint_failed", f"TC: Failed to set temperature: {e}", error=str(e))
+            return False
+        self.setpoint = float(temp)
+        self._publish_state()
+        self.events.info("setpoint", f"TC: Setpoint set to {temp:.1f}°C", setpoint=temp)
+        return True
+
+    def _update(self):
+        """Read both temperatures; a read that hangs is reported by _on_read_timeout"""
+        if not self._connected or self.tc is None:
+            return
+        try:
+            if self._read_timer is None or not self._read_timer.is_alive():
+                self._read_timer = threading.Timer(TEMP_READ_TIMEOUT_S, self._on_read_timeout)
+                self._read_timer.daemon = True
+                self._read_timer.start()
+            current = self.tc.get_temperature()
+            if self._read_timer is not None:
+                self._read_timer.cancel()
+            self._read_timer = None
+            self._read_timed_out = False
+            self.current_temp = current
+            self.reading_ok = True
+            try:
+                self.auxiliary_temp = self.tc.get_auxiliary_temperature()
+            except Exception as e:
+                self.auxiliary_temp = 0.0
+                self.events.warning("aux_read_error", f"TC: Aux temp read error: {e}", error=str(e))
+            self._publish_state()
+        except Exception as e:
+            if not self._read_timed_out:    # otherwise already reported
+                self._reset_readings()
+                self.events.error("read_error", f"TC: Main temp read error: {e}", error=str(e))
+
+    def _on_read_timeout(self):
+        """threading.Timer callback: the temperature read is taking too long"""
+        self._read_timed_out = True
+        self._reset_readings()
+        self.events.warning("read_timeout", "TC: Temperature read timed out.")
+        self._read_timer = None
+
+    def _reset_readings(self):
+        self.current_temp = self.auxiliary_temp = 0.0
+        self.reading_ok = False
+        self._publish_state()
+
+    def _publish_state(self):
+        get_state_store().publish(TECState(current_temp=self.current_temp, setpoint=self.setpoint,
+                                           auxiliary_temp=self.auxiliary_temp, connected=self._connected))
+        self.state_signal.emit()
+
+    def is_connected(self):
+        return self._connected
+
+
+class THPCore(QObject):
+    """THP sensor polled every 3 s (each read opens the port)"""
+    status_signal = pyqtSignal(str)
+    state_signal = pyqtSignal()         # after every poll
+
+    def __init__(self, port, parent=None, poll_ms=3000):
+        super().__init__(parent)
+        self.events = EventSource("thp", self.status_signal.emit)
+        self.port = port
+        self._connected = False
+        self.error = None               # the last read's exception text, if it raised
+        self.latest = {"temperature": 0.0, "humidity": 0.0, "pressure": 0.0}
+        self.poll_ms = poll_ms
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self._update)
+
+    def connect(self):
+        """Start polling; returns whether the first read succeeded"""
+        self.timer.start(self.poll_ms)
+        self._update()
+        return self._connected
+
+    def disconnect(self):
+        """Stop polling"""
+        self.timer.stop()
+        self._connected = False
+        self.events.info("stopped", f"THP sensor updates stopped for port {self.port}.", port=self.port)
+        self.state_signal.emit()
+
+    def reconnect(self):
+        """Read the sensor again, and poll it again if it was stopped"""
+        self.events.info("reconnecting", f"THP: Attempting to read from {self.port}...", port=self.port)
+        if not self.timer.isActive():
+            self.timer.start(self.poll_ms)
+        self._update()
+        if self._connected:
+            self.events.info("reconnected", f"THP: Reconnected/Read successful on {self.port}", port=self.port)
+        return self._connected
+
+    def is_polling(self):
+        return self.timer.isActive()
+
+    def _update(self):
+        try:
+            data = read_thp_sensor_data(self.port)
+            self.error = None
+        except Exception as e:
+            data = None
+            self.error = str(e)
+            if self._connected:
+                self.events.error("sensor_error", f"THP sensor error: {e}", port=self.port, error=str(e))
+        if data:
+            self.latest = data
+            get_state_store().publish(THPState(temperature=data.get('temperature', 0.0),
+                                               humidity=data.get('humidity', 0.0),
+                                               pressure=data.get('pressure', 0.0)))
+            if not self._connected:
+                self.events.info("connected", f"THP sensor connected on {self.port}", port=self.port)
+        elif self._connected and self.error is None:
+            self.events.warning("read_failed", f"THP sensor read failed/disconnected on port {self.port}",
+                                port=self.port)
+        self._connected = bool(data)
+        self.state_signal.emit()
+
+    def get_latest(self):
+        return self.latest
+
+    def is_connected(self):
+        return self._connected
+
+
+class IMUCore(QObject):
+    """IMU on a serial port, read on its own thread"""
+    status_signal = pyqtSignal(str)
+
+    def __init__(self, port=None, parent=None, baud=9600):
+        super().__init__(parent)
+        self.events = EventSource("imu", self.status_signal.emit)
+        self.port, self.baud = port, baud
+        self.serial = None
+        self.stop_evt = None
+        self._connected = False
+        self.latest = {'rpy': (0, 0, 0), 'latitude': 0, 'longitude': 0, 'temperature': 0, 'pressure': 0}
+
+    def connect(self, port=None, baud=None):
+        """Open the port and start the read thread; returns whether it is connected"""
+        if self._connected:
+            return True
+        self.port = port or self.port
+        self.baud = int(baud or self.baud)
+        self.events.info("connecting", f"IMU: Connecting to {self.port}@{self.baud}...", port=self.port, baud=self.baud)
+        try:
+            self.serial = serial.Serial(self.port, self.baud, timeout=1)
+        except Exception as e:
+            self.events.error("connect_failed", f"IMU connection error: {e}", port=self.port, baud=self.baud,
+                              error=str(e))
+            self.serial = None
+            return False
+        self._connected = True
+        self.events.info("connected", f"IMU connected on {self.port}@{self.baud}", port=self.port, baud=self.baud)
+        # The read thread fills a fresh dict
+        self.latest = {'rpy': (0, 0, 0), 'latitude': 0, 'longitude': 0, 'temperature': 0, 'pressure': 0}
+        self.stop_evt = start_imu_read_thread(self.serial, self.latest, self._publish_state)
+        return True
+
+    def disconnect(self):
+        """Stop the read thread and close the port"""
+        self.events.info("disconnecting", "IMU: Disconnecting...")
+        if self.stop_evt is not None:
+            self.stop_evt.set()
+        if self.serial and self.serial.is_open:
+            try:
+                self.serial.close()
+            except Exception as e:
+                self.events.error("disconnect_failed", f"IMU: Error closing serial port: {e}", error=str(e))
+        self.serial = self.stop_evt = None
+        self._connected = False
+        get_state_store().clear(IMUState)
+        self.events.info("disconnected", "IMU: Disconnected.")
+
+    def _publish_state(self, label=None):
+        """Publish the latest reading to the state store (called on the IMU read thread)"""
+        latest = self.latest
+        r, p, y = latest.get('rpy', (0, 0, 0))
+        get_state_store().publish(IMUState(
+            roll=r, pitch=p, yaw=y,
+            accel=tuple(latest.get('accel', (0.0, 0.0, 0.0))),
+            mag=tuple(latest.get('mag', (0.0, 0.0, 0.0))),
+            pressure=latest.get('pressure', 0.0),
+            temperature=latest.get('temperature', 0.0),
+            latitude=latest.get('latitude', 0.0),
+            longitude=latest.get('longitude', 0.0),
+        ))
+
+    def is_connected(self):
+        return self._connected
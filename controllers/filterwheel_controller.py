@@ -1,15 +1,17 @@
-import serial
 from serial.tools import list_ports
-from PyQt5.QtCore import QObject, pyqtSignal
+from PyQt5.QtCore import QObject
 from PyQt5.QtWidgets import QGroupBox, QHBoxLayout, QVBoxLayout, QLabel, QComboBox, QLineEdit, QPushButton
 
-from drivers.filterwheel import FilterWheelConnectThread, FilterWheelCommandThread
+from controllers.cores import FilterWheelCore
 
 class FilterWheelController(QObject):
-    status_signal = pyqtSignal(str)
+    """Filter wheel widgets around a FilterWheelCore (controllers.cores), which drives the device"""
 
     def __init__(self, parent=None):
         super().__init__(parent)
+        self.core = FilterWheelCore(parent=self)
+        self.status_signal = self.core.status_signal
+        self.events = self.core.events
         self.groupbox = QGroupBox("Filter Wheel")
         self.groupbox.setObjectName("filterwheelGroup")
         main_layout = QVBoxLayout()
@@ -86,180 +88,78 @@ class FilterWheelController(QObject):
         main_layout.addLayout(cmd_layout)
 
         self.groupbox.setLayout(main_layout)
-
-        self._connected = False
-        self.serial = None
-        self.last = None
-        self.current_position = None
+        self.core.state_signal.connect(self._update_ui)
 
         # Auto-connect on startup
         self.connect() # Initial attempt to connect
 
     def toggle_connection(self):
         """Toggles the connection state."""
-        if not self._connected:
+        if not self.core.is_connected():
             self.connect()
         else:
             self.disconnect() # This will update button text to "Connect"
 
     def connect(self):
         """Connects to the filter wheel."""
-        if self._connected: # Should not happen if toggle_connection is used properly
-            self.status_signal.emit("Already connected. Please disconnect first.")
-            return
-
-        self.connect_btn.setEnabled(False) # Disable while attempting to connect
-        self.connect_btn.setText("Connecting...")
-        self.status_signal.emit(f"Attempting to connect to {self.port_combo.currentText()}...")
-
-        port_name = self.port_combo.currentText()
-        th = FilterWheelConnectThread(port_name, parent=self)
-        th.result_signal.connect(self._on_connect)
-        th.start()
-
-    def _on_connect(self, ser, msg):
-        self.status_signal.emit(msg) # Display message from connect thread
-
-        if ser: # Successfully connected
-            self.serial = ser
-            self._connected = True
-            self.connect_btn.setText("Disconnect")
-            self.connect_btn.setEnabled(True)
-            self.send_btn.setEnabled(True)
-            self.open_btn.setEnabled(True)
-            self.opaque_btn.setEnabled(True)
-            self.diff_btn.setEnabled(True)
-            self.status_signal.emit(f"Connected to filter wheel on {self.serial.port}.")
-            self._send("F1r")  # Reset to position 1 (Opaque)
-        else: # Connection failed
-            self._connected = False
-            self.serial = None
-            self.connect_btn.setText("Connect") # Reset text
-            self.connect_btn.setEnabled(True) # Re-enable to allow another attempt
-            self.send_btn.setEnabled(False)
-            self.open_btn.setEnabled(False)
-            self.opaque_btn.setEnabled(False)
-            self.diff_btn.setEnabled(False)
-            self.pos_label.setText("--")
-            self.current_position = None
-            # msg already contains the error from FilterWheelConnectThread
-            # self.status_signal.emit(f"Failed to connect to filter wheel. {msg}")
+        if not self.core.is_connected():
+            self.connect_btn.setEnabled(False) # Disable while attempting to connect
+            self.connect_btn.setText("Connecting...")
+        self.core.connect(self.port_combo.currentText())
+
+    def _update_ui(self):
+        """Follow the core's connection state and position"""
+        connected = self.core.is_connected()
+        self.connect_btn.setText("Disconnect" if connected else "Connect")
+        self.connect_btn.setEnabled(True)
+        self._set_command_buttons(connected and not self.core.is_busy())
+        position = self.core.get_position()
+        self.pos_label.setText(str(position) if position is not None else ("?" if connected else "--"))
+
+    def _set_command_buttons(self, enabled):
+        for button in (self.send_btn, self.open_btn, self.opaque_btn, self.diff_btn):
+            button.setEnabled(enabled)
 
     def set_open_filter(self):
         """Set filter wheel to an open filter position (2, 3, or 4)"""
         self._send("F12")  # Default to position 2
-        self.status_signal.emit("Setting Open filter (position 2)")
+        self.events.info("set_filter", "Setting Open filter (position 2)", position=2)
 
     def set_opaque_filter(self):
         """Set filter wheel to an opaque filter position (1 or reset)"""
         self._send("F1r")  # Reset to position 1
-        self.status_signal.emit("Setting Opaque filter (position 1)")
+        self.events.info("set_filter", "Setting Opaque filter (position 1)", position=1)
 
     def set_diff_filter(self):
         """Set filter wheel to a diffuser filter position (5 or 6)"""
         self._send("F15")  # Default to position 5
-        self.status_signal.emit("Setting Diffuser filter (position 5)")
+        self.events.info("set_filter", "Setting Diffuser filter (position 5)", position=5)
 
     def set_position(self, position):
         """Set filter wheel to a specific position (1-6)"""
-        if position < 1 or position > 6:
-            self.status_signal.emit(f"Invalid position: {position}")
-            return
-        cmd = f"F1{position}"
-        self._send(cmd)
+        if self.core.set_position(position):
+            self._set_command_buttons(False)
 
     def send(self):
         cmd = self.cmd_input.text().strip()
         self._send(cmd)
 
     def _send(self, cmd):
-        if not self._connected:
-            return self.status_signal.emit("Not connected")
-        self.send_btn.setEnabled(False)
-        self.open_btn.setEnabled(False)
-        self.opaque_btn.setEnabled(False)
-        self.diff_btn.setEnabled(False)
-        self.last = cmd
-        th = FilterWheelCommandThread(self.serial, cmd, parent=self)
-        th.result_signal.connect(self._on_result)
-        th.start()
+        # The buttons come back with the core's next state (the command's answer)
+        if self.core.send_command(cmd):
+            self._set_command_buttons(False)
 
-    def _on_result(self, pos, msg):
-        self.send_btn.setEnabled(True)
-        self.open_btn.setEnabled(True)
-        self.opaque_btn.setEnabled(True)
-        self.diff_btn.setEnabled(True)
-        self.status_signal.emit(msg)
-
-        # Prefer the position reported by the command thread if available and valid
-        if pos is not None:
-            try:
-                # Ensure pos is an integer, as it might come from serial response
-                reported_pos = int(pos)
-                if 1 <= reported_pos <= 6: # Assuming 6 positions for the filter wheel
-                    self.current_position = reported_pos
-                    self.pos_label.setText(str(reported_pos))
-                    self.status_signal.emit(f"Filter wheel position confirmed: {reported_pos}. {msg}")
-                else:
-                    self.status_signal.emit(f"Filter wheel reported invalid position: {pos}. {msg}")
-                    # Optionally, try to infer from self.last or mark as unknown
-            except ValueError:
-                self.status_signal.emit(f"Filter wheel reported non-integer position: {pos}. {msg}")
-                # Optionally, try to infer from self.last or mark as unknown
-
-        elif self.last: # Fallback to command-based assumption if pos is None or invalid
-            self.status_signal.emit(f"Position not confirmed by device, using command assumption. {msg}")
-            if self.last == "F1r": # Reset command
-                self.current_position = 1
-                self.pos_label.setText("1")
-            elif self.last.startswith("F1") and len(self.last) == 3 and self.last[2].isdigit():
-                # Specific position command like "F12"
-                try:
-                    position_val = int(self.last[2])
-                    if 1 <= position_val <= 6:
-                        self.current_position = position_val
-                        self.pos_label.setText(str(position_val))
-                    else:
-                        self.pos_label.setText("N/A") # Commanded invalid position
-                        self.current_position = None
-                except ValueError:
-                    self.pos_label.setText("Err")
-                    self.current_position = None
-            else: # Unknown command structure, can't infer position
-                 self.pos_label.setText("?")
-                 self.current_position = None # Or keep old one, depending on desired behavior
-        else: # No pos from device and no self.last (should not happen if _send is used)
-            self.pos_label.setText("??")
-            self.current_position = None
-
-        self.last = None # Clear the last command sent
+    @property
+    def current_position(self):
+        return self.core.current_position
 
     def get_position(self):
         """Returns the current known position of the filter wheel."""
-        return self.current_position # self.current_position is None if unknown, or an int
+        return self.core.get_position() # None if unknown, or an int
 
     def is_connected(self):
-        return self._connected
+        return self.core.is_connected()
 
     def disconnect(self):
         """Disconnects from the serial port."""
-        if self.serial and self.serial.is_open:
-            try:
-                self.serial.close()
-                self.status_signal.emit("Filter wheel disconnected.")
-            except Exception as e:
-                self.status_signal.emit(f"Error closing serial port: {e}")
-
-        self._connected = False
-        self.serial = None
-
-        # Update UI
-        self.connect_btn.setText("Connect") # Reset button text
-        self.connect_btn.setEnabled(True) # Allow attempting to reconnect
-
-        self.send_btn.setEnabled(False)
-        self.open_btn.setEnabled(False)
-        self.opaque_btn.setEnabled(False)
-        self.diff_btn.setEnabled(False)
-        self.pos_label.setText("--")
-        self.current_position = None
+        self.core.disconnect()
@@ -1,19 +1,22 @@
-import serial, cv2
+import cv2
 from serial.tools import list_ports
-from PyQt5.QtCore import QObject, pyqtSignal, QTimer, Qt
+from PyQt5.QtCore import QObject, QTimer, Qt
 from PyQt5.QtWidgets import QGroupBox, QVBoxLayout, QHBoxLayout, QLabel, QComboBox, QPushButton
 from PyQt5.QtGui import QImage, QPixmap
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 import matplotlib.pyplot as plt
 
-from drivers.imu import start_imu_read_thread
+from controllers.cores import IMUCore
 import utils
 
 class IMUController(QObject):
-    status_signal = pyqtSignal(str)
+    """IMU widgets around an IMUCore (controllers.cores), which reads the device"""
 
     def __init__(self, parent=None):
         super().__init__(parent)
+        self.core = IMUCore(parent=self)
+        self.status_signal = self.core.status_signal
+        self.events = self.core.events
         self.groupbox = QGroupBox("IMU")
         self.groupbox.setObjectName("imuGroup")
         
@@ -51,16 +54,9 @@ class IMUController(QObject):
         main_layout.addWidget(self.data_label)
         
         self.groupbox.setLayout(main_layout)
-        
-        self._connected = False
-        self.serial = None
-        self.latest = {
-            'rpy': (0, 0, 0),
-            'latitude': 0,
-            'longitude': 0,
-            'temperature': 0,
-            'pressure': 0
-        }
+
+        self.update_timer = QTimer(self)
+        self.update_timer.timeout.connect(self._refresh)
         
         # Auto-select config port if provided
         if parent is not None and hasattr(parent, 'config'):
@@ -69,39 +65,17 @@ class IMUController(QObject):
                 self.port_combo.setCurrentText(cfg_port)
                 self.connect()
 
-    def connect(self):
-        if self._connected:
-            return self.status_signal.emit("Already connected")
-        port = self.port_combo.currentText().strip()
-        baud = int(self.baud_combo.currentText())
-        try:
-            self.serial = serial.Serial(port, baud, timeout=1)
-        except Exception as e:
-            return self.status_signal.emit(f"Fail: {e}")
-        self._connected = True
-        self.status_signal.emit(f"IMU on {port}@{baud}")
-        self.stop_evt = start_imu_read_thread(self.serial, self.latest)
-        self.update_timer = QTimer(self)
-        self.update_timer.timeout.connect(self._refresh)
-        self.update_timer.start(100)
-
-    # Removed _update_cam method as it was unused and seemed to be from a different controller.
-
     def _refresh(self):
-        if not self._connected: # Don't try to refresh if not connected
+        if not self.core.is_connected(): # Don't try to refresh if not connected
             self.data_label.setText("Not connected")
             return
 
-        r, p, y = self.latest['rpy']
-        lat = self.latest['latitude']
-        lon = self.latest['longitude']
-        t = self.latest['temperature']
-        pres = self.latest['pressure']
-        
-        # Make sure data is also available as individual components for data logger
-        self.latest['roll'] = r
-        self.latest['pitch'] = p
-        self.latest['yaw'] = y
+        latest = self.core.latest
+        r, p, y = latest['rpy']
+        lat = latest['latitude']
+        lon = latest['longitude']
+        t = latest['temperature']
+        pres = latest['pressure']
         
         # Format the data with larger text and better formatting
         self.data_label.setText(
@@ -116,79 +90,37 @@ class IMUController(QObject):
             f"</table>"
         )
 
+    @property
+    def latest(self):
+        return self.core.latest
+
     def is_connected(self):
-        return self._connected
+        return self.core.is_connected()
 
     def toggle_connection(self):
         """Toggles the IMU connection."""
-        if self._connected:
+        if self.core.is_connected():
             self.disconnect()
         else:
             self.connect()
 
     def connect(self):
-        if self._connected:
-            # self.status_signal.emit("IMU already connected.") # Not strictly needed if toggle used
-            return
+        if self.core.is_connected():
+            return True
 
         self.connect_btn.setText("Connecting...")
         self.connect_btn.setEnabled(False)
-        port = self.port_combo.currentText().strip()
-        baud = int(self.baud_combo.currentText())
-        self.status_signal.emit(f"IMU: Connecting to {port}@{baud}...")
-
-        try:
-            self.serial = serial.Serial(port, baud, timeout=1)
-        except Exception as e:
-            self.status_signal.emit(f"IMU connection error: {e}")
-            self.connect_btn.setText("Connect")
-            self.connect_btn.setEnabled(True)
-            return
-
-        self._connected = True
-        self.connect_btn.setText("Disconnect")
+        connected = self.core.connect(self.port_combo.currentText().strip(), int(self.baud_combo.currentText()))
+        self.connect_btn.setText("Disconnect" if connected else "Connect")
         self.connect_btn.setEnabled(True)
-        self.status_signal.emit(f"IMU connected on {port}@{baud}")
-
-        # Ensure latest is reset before starting thread
-        self.latest = {'rpy': (0,0,0), 'latitude': 0, 'longitude': 0, 'temperature': 0, 'pressure': 0, 'roll':0, 'pitch':0, 'yaw':0}
-
-        # Start the reading thread and the UI update timer
-        self.stop_evt = start_imu_read_thread(self.serial, self.latest)
-        if not hasattr(self, 'update_timer'):
-            self.update_timer = QTimer(self)
-            self.update_timer.timeout.connect(self._refresh)
-        self.update_timer.start(100)
+        if connected:
+            self.update_timer.start(100)
+        return connected
 
     def disconnect(self):
         """Disconnects the IMU, stops the reading thread and timer."""
-        self.status_signal.emit("IMU: Disconnecting...")
-        if hasattr(self, 'stop_evt') and self.stop_evt:
-            self.stop_evt.set() # Signal the thread to stop
-
-        if hasattr(self, 'update_timer') and self.update_timer:
-            self.update_timer.stop()
-
-        if self.serial and self.serial.is_open:
-            try:
-                self.serial.close()
-            except Exception as e:
-                self.status_signal.emit(f"IMU: Error closing serial port: {e}")
-
-        self._connected = False
-        self.serial = None
-        self.stop_evt = None
-
+        self.update_timer.stop()
+        self.core.disconnect()
         self.connect_btn.setText("Connect")
         self.connect_btn.setEnabled(True)
         self.data_label.setText("Not connected")
-        self.status_signal.emit("IMU: Disconnected.")
-
-
-
-
-
-
-
-
-
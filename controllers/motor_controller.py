@@ -1,14 +1,17 @@
-from PyQt5.QtCore import QObject, pyqtSignal
+from PyQt5.QtCore import QObject
 from PyQt5.QtWidgets import QGroupBox, QLabel, QComboBox, QPushButton, QLineEdit, QGridLayout
 from serial.tools import list_ports
 
-from drivers.motor import MotorConnectThread, send_move_command
+from controllers.cores import MotorCore
 
 class MotorController(QObject):
-    status_signal = pyqtSignal(str)
+    """Motor widgets around a MotorCore (controllers.cores), which drives the device"""
 
     def __init__(self, parent=None):
         super().__init__(parent)
+        self.core = MotorCore(parent=self)
+        self.status_signal = self.core.status_signal
+        self.events = self.core.events
         self.groupbox = QGroupBox("Motor")
         self.groupbox.setObjectName("motorGroup")
         layout = QGridLayout()
@@ -54,9 +57,7 @@ class MotorController(QObject):
         layout.addWidget(self.move_btn, 2, 2)
 
         self.groupbox.setLayout(layout)
-        self._connected = False
-        self.serial = None
-        self.current_angle_deg = None # Initialize current angle state
+        self.core.state_signal.connect(self._update_ui)
 
         # If configured port is provided, select and auto-connect
         if parent is not None and hasattr(parent, 'config'):
@@ -67,60 +68,37 @@ class MotorController(QObject):
 
     def toggle_connection(self):
         """Toggles the connection state."""
-        if not self._connected:
+        if not self.core.is_connected():
             self.connect()
         else:
             self.disconnect()
 
     def connect(self):
-        if self._connected: # Should not happen if toggle_connection is used correctly
+        if self.core.is_connected():
             return
-        port = self.port_combo.currentText().strip()
         self.connect_btn.setEnabled(False)
         self.connect_btn.setText("Connecting...")
-        self.status_signal.emit(f"Motor: Connecting to {port}...")
-        thread = MotorConnectThread(port, parent=self) # Assuming MotorConnectThread handles its own errors and emits msg
-        thread.result_signal.connect(self._on_connect)
-        thread.start()
-
-    def _on_connect(self, ser, baud, msg): # baud parameter seems unused by MotorController itself
-        self.status_signal.emit(msg) # Display message from connect thread (success or failure)
-        if ser: # Successfully connected
-            self.serial = ser
-            self._connected = True
-            self.move_btn.setEnabled(True)
-            self.connect_btn.setText("Disconnect")
-            self.status_signal.emit(f"Motor connected on {ser.port}.") # More specific success message
-            self.move_to(0)  # Move to 0 degrees on successful connection
-        else: # Connection failed
-            self._connected = False
-            self.move_btn.setEnabled(False)
-            self.connect_btn.setText("Connect") # Reset button text
-        self.connect_btn.setEnabled(True) # Re-enable button in both cases
+        self.core.connect(self.port_combo.currentText().strip())
 
     def disconnect(self):
         """Disconnects from the motor serial port."""
-        if self.serial and self.serial.is_open:
-            try:
-                self.serial.close()
-                self.status_signal.emit("Motor disconnected.")
-            except Exception as e:
-                self.status_signal.emit(f"Motor: Error closing serial port: {e}")
+        self.core.disconnect()
 
-        self._connected = False
-        self.serial = None # Clear the serial object
-
-        self.connect_btn.setText("Connect")
+    def _update_ui(self):
+        """Follow the core's connection state"""
+        connected = self.core.is_connected()
+        self.connect_btn.setText("Disconnect" if connected else "Connect")
         self.connect_btn.setEnabled(True)
-        self.move_btn.setEnabled(False)
-        # Optionally, reset current angle display here if desired
-        # self.current_angle_deg = None # Or some default
-        # self.angle_input.setText("")
+        self.move_btn.setEnabled(connected)
+
+    @property
+    def current_angle_deg(self):
+        return self.core.current_angle_deg
 
     def preset_selected(self, angle_text):
         """Handle selection from the preset angle dropdown"""
         self.angle_input.setText(angle_text)
-        if self._connected:
+        if self.core.is_connected():
             self.move()
 
     def move(self):
@@ -129,60 +107,16 @@ class MotorController(QObject):
             angle = int(self.angle_input.text().strip())
             self.move_to(angle)
         except ValueError:
-            self.status_signal.emit("Invalid angle")
+            self.events.warning("invalid_angle", "Invalid angle", text=self.angle_input.text())
 
     def move_to(self, angle):
         """Move to the specified angle"""
-        if not self._connected:
-            self.status_signal.emit("Motor not connected")
-            return False
-        
-        try:
-            # First update the angle input field
-            if hasattr(self, 'angle_input'): # Should always exist
-                self.angle_input.setText(str(angle))
-            
-            # Disable move buttons during operation
-            self.move_btn.setEnabled(False)
-            self.angle_preset.setEnabled(False)
-
-            # Convert angle to motor steps (100 steps per degree)
-            # Assuming this conversion (angle * 100) is correct for the specific motor hardware
-            motor_steps = int(angle * 100)
-            
-            ok = False
-            if self.serial:
-                # Note: If send_move_command is blocking and takes significant time,
-                # it would be better to run it in a separate thread to keep the UI responsive.
-                # For now, assuming it's acceptably fast for direct call.
-                ok = send_move_command(self.serial, motor_steps)
-                
-                if ok:
-                    self.current_angle_deg = angle # Update state upon successful command
-                    self.status_signal.emit(f"Motor: Moved to {angle}°")
-                else:
-                    # If move failed, current_angle_deg remains the old value.
-                    # Or set to None if position becomes uncertain: self.current_angle_deg = None
-                    self.status_signal.emit(f"Motor: Failed to move to {angle}° (No ACK or other error)")
-            else:
-                self.status_signal.emit("Motor: Serial connection not available")
-            
-            # Re-enable move buttons
-            self.move_btn.setEnabled(True)
-            self.angle_preset.setEnabled(True)
-            return ok
-
-        except Exception as e:
-            self.status_signal.emit(f"Motor: Error moving: {str(e)}")
-            # Ensure buttons are re-enabled in case of exception during the move process
-            if hasattr(self, 'move_btn') and self.move_btn: # Check if UI element still exists
-                self.move_btn.setEnabled(True)
-            if hasattr(self, 'angle_preset') and self.angle_preset: # Check if UI element still exists
-                self.angle_preset.setEnabled(True)
-            return False
-
-    def is_connected(self):
-        return self._connected
-
+        if self.core.is_connected():
+            self.angle_input.setText(str(angle))
+        return self.core.move_to(angle)
 
+    def is_moving(self):
+        return self.core.is_moving()
 
+    def is_connected(self):
+        return self.core.is_connected()
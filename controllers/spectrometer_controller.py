@@ -1,4 +1,4 @@
-from PyQt5.QtCore import QObject, pyqtSignal, QTimer, QDateTime
+from PyQt5.QtCore import QObject, QTimer
 from PyQt5.QtWidgets import (
     QGroupBox, QVBoxLayout, QHBoxLayout, QPushButton, 
     QWidget, QLabel, QSpinBox, QCheckBox
@@ -6,19 +6,26 @@ from PyQt5.QtWidgets import (
 import pyqtgraph as pg
 from pyqtgraph import ViewBox
 import numpy as np
-import os
 
-from drivers.spectrometer import (
-    connect_spectrometer, AVS_MeasureCallback, AVS_MeasureCallbackFunc, 
-    AVS_GetScopeData, StopMeasureThread, prepare_measurement, SpectrometerDriver,
-    deactivate_spectrometer_handle # Import the new function
-)
+from drivers.spectrometer import StopMeasureThread, SpectrometerDriver
+from controllers.cores import SpectrometerCore
+from core.spectrum import as_spectrum
 
 class SpectrometerController(QObject):
-    status_signal = pyqtSignal(str)
+    """Spectrometer widgets and plot around a SpectrometerCore (controllers.cores).
+
+    The core measures, numbers the scans (scan_signal), takes replayed scans
+    (replay_signal) and saves snapshots; this class adds the buttons, the
+    live plot and the multi-spectrometer SpectrometerDriver functions.
+    """
 
     def __init__(self, parent=None):
         super().__init__(parent)
+        self.core = SpectrometerCore(station=parent, parent=self)
+        self.status_signal = self.core.status_signal
+        self.scan_signal = self.core.scan_signal    # core.scan_sampler.Scan for every completed scan
+        self.replay_signal = self.core.replay_signal  # Scans of a replayed session (core.replay), from any thread
+        self.events = self.core.events
         # Store parent reference properly
         self.parent = parent
         
@@ -133,12 +140,8 @@ class SpectrometerController(QObject):
         main_layout.addWidget(self.plot_px)
         self.groupbox.setLayout(main_layout)
 
-        # Internal state
-        self._ready = False
-        self.handle = None
-        self.wls = []
-        self.intens = []
-        self.npix = 0
+        self.core.state_signal.connect(self._update_buttons)
+        self.scan_signal.connect(self._on_scan)
 
         # Ensure parent MainWindow's toggle_data_saving is used if parent exists
         if parent is not None:
@@ -148,10 +151,6 @@ class SpectrometerController(QObject):
                 pass
             self.toggle_btn.clicked.connect(parent.toggle_data_saving)
 
-        # Data directory for snapshots
-        self.csv_dir = "data"
-        os.makedirs(self.csv_dir, exist_ok=True)
-
         # Timer for updating plot - increase frequency for faster updates
         self.plot_timer = QTimer(self)
         self.plot_timer.timeout.connect(self._update_plot)
@@ -179,178 +178,124 @@ class SpectrometerController(QObject):
         self.static_curves = []
 
     def toggle_main_connection(self):
-        if not self._ready: # If not ready (implies not connected or connection lost)
+        if not self.core.is_ready(): # If not ready (implies not connected or connection lost)
             self.connect_main_spectrometer()
         else: # If ready (implies connected)
             self.disconnect_main_spectrometer()
 
     def connect_main_spectrometer(self):
-        """Connects to the primary spectrometer using self.handle."""
-        if self._ready: # Already connected
-            # self.status_signal.emit("Spectrometer already connected.")
+        """Connects to the primary spectrometer."""
+        if self.core.is_ready(): # Already connected
             return
 
         self.connect_btn.setText("Connecting...")
         self.connect_btn.setEnabled(False)
-        self.status_signal.emit("Spectrometer: Connecting...")
-        
-        try:
-            # Assuming connect_spectrometer is from drivers.spectrometer for the main handle
-            handle, wavelengths, num_pixels, serial_str = connect_spectrometer()
-        except Exception as e:
-            error_msg = f"Spectrometer: Connection failed: {e}"
-            self.status_signal.emit(error_msg)
+        if not self.core.connect():
             self.connect_btn.setText("Connect")
             self.connect_btn.setEnabled(True)
-            
             if self._auto_connecting: # If initial auto-connect fails, schedule a retry
-                self.status_signal.emit("Spectrometer: Will retry connection in 5 seconds...")
+                self.events.info("connect_retry", "Spectrometer: Will retry connection in 5 seconds...", delay_s=5)
                 QTimer.singleShot(5000, self.connect_main_spectrometer)
             return
-        
-        self._auto_connecting = False # Clear flag after first successful attempt or manual attempt
-        self.handle = handle
-        self.wls = wavelengths.tolist() if isinstance(wavelengths, np.ndarray) else wavelengths
-        self.npix = num_pixels
-        self._ready = True
-        
-        if hasattr(self, 'high_res_adc') and self.high_res_adc:
-            try:
-                from drivers.avaspec import AVS_UseHighResAdc # Assuming this is the correct import
-                AVS_UseHighResAdc(self.handle, True)
-                self.status_signal.emit("Spectrometer: High-resolution ADC mode enabled.")
-            except Exception as e:
-                self.status_signal.emit(f"Spectrometer: Could not enable high-res ADC: {e}")
-        
-        self.connect_btn.setText("Disconnect")
-        self.connect_btn.setEnabled(True)
-        self.start_btn.setEnabled(True)
-        self.apply_btn.setEnabled(False) # Apply settings should be enabled only when measuring
-        self.status_signal.emit(f"Spectrometer ready (SN={serial_str})")
 
+        self._auto_connecting = False # Clear flag after first successful attempt or manual attempt
+        if not self.plot_timer.isActive():
+            self.plot_timer.start(50)
         if self.wls:
             self.plot_px.setXRange(min(self.wls), max(self.wls), padding=0)
             self.plot_px.getViewBox().enableAutoRange(pg.ViewBox.XAxis, False)
 
     def disconnect_main_spectrometer(self):
-        """Disconnects the primary spectrometer (self.handle)."""
-        self.status_signal.emit("Spectrometer: Disconnecting...")
-        if hasattr(self, 'measure_active') and self.measure_active:
-            self.stop() # Stop measurement first
-            # Note: stop() is asynchronous. Proper handling might need to wait for _on_stop.
-            # For simplicity here, we proceed, assuming stop() will eventually finish.
-            # A more robust solution would use a signal or callback before proceeding.
-            self.status_signal.emit("Spectrometer: Measurement stopped for disconnection.")
-
-        if self.handle is not None:
-            # Call the proper deactivation function from the driver module
-            success, msg = deactivate_spectrometer_handle(self.handle)
-            if success:
-                self.status_signal.emit(f"Spectrometer: {msg}")
-            else:
-                self.status_signal.emit(f"Spectrometer: Deactivation issue: {msg}")
-            self.handle = None # Ensure handle is None after deactivation attempt
-        
-        self._ready = False
-        if hasattr(self, 'plot_timer') and self.plot_timer.isActive():
-            self.plot_timer.stop()
-
-        # self.watchdog_timer.stop() # This seems related to SpectrometerDriver, handle separately
+        """Disconnects the primary spectrometer."""
+        self.core.disconnect()
+        self.plot_timer.stop()
+        self.curve_px.clear() # Clear plot
 
-        self.connect_btn.setText("Connect")
+    def _update_buttons(self):
+        """Follow the core's connection and measurement state"""
+        ready, measuring = self.core.is_ready(), self.core.measure_active
+        self.connect_btn.setText("Disconnect" if ready else "Connect")
         self.connect_btn.setEnabled(True)
-        self.start_btn.setEnabled(False)
-        self.stop_btn.setEnabled(False)
-        self.save_btn.setEnabled(False)
-        self.toggle_btn.setEnabled(False)
-        self.apply_btn.setEnabled(False)
-        self.curve_px.clear() # Clear plot
-        self.status_signal.emit("Spectrometer: Disconnected.")
+        self.start_btn.setEnabled(ready and not measuring)
+        self.stop_btn.setEnabled(ready and measuring)
+        self.apply_btn.setEnabled(ready and measuring)  # Apply settings only while measuring
+        if not ready:
+            self.save_btn.setEnabled(False)
+            self.toggle_btn.setEnabled(False)
+
+    def _on_scan(self, scan):
+        # Enable snapshot save and continuous save once data is received (also replayed data)
+        self.save_btn.setEnabled(True)
+        self.toggle_btn.setEnabled(True)
+
+    # The state the data logger, routines and main window read lives in the core
+    @property
+    def intens(self):
+        return self.core.intens
+
+    @intens.setter
+    def intens(self, value):
+        self.core.intens = value
+
+    @property
+    def wls(self):
+        return self.core.wls
+
+    @property
+    def npix(self):
+        return self.core.npix
+
+    @property
+    def handle(self):
+        return self.core.handle
+
+    @property
+    def scan_seq(self):
+        return self.core.scan_seq
+
+    @property
+    def measure_active(self):
+        return self.core.measure_active
+
+    @measure_active.setter
+    def measure_active(self, value):
+        self.core.measure_active = value
+
+    @property
+    def current_integration_time_us(self):
+        return self.core.current_integration_time_us
+
+    @property
+    def csv_dir(self):
+        return self.core.csv_dir
+
+    @csv_dir.setter
+    def csv_dir(self, value):
+        self.core.csv_dir = value
+
+    @property
+    def high_res_adc(self):
+        return self.core.high_res_adc
+
+    @high_res_adc.setter
+    def high_res_adc(self, value):
+        self.core.high_res_adc = value
 
     def start(self):
-        if not self._ready: # Checks if self.handle is valid and spectrometer is initialized
-            self.status_signal.emit("Spectrometer: Not ready/connected.")
-            return
-        
-        # Get integration time from UI
-        integration_time = float(self.integ_spinbox.value())
-        
-        # Get cycles and repetitions from UI
-        cycles = self.cycles_spinbox.value()
-        repetitions = self.repetitions_spinbox.value()
-        
-        # Calculate averages based on integration time
-        # For shorter integration times, use more averages to improve signal quality
-        # For longer integration times, use fewer averages to maintain responsiveness
-        if integration_time < 10:
-            averages = 10  # More averages for very short integration times
-        elif integration_time < 100:
-            averages = 5   # Medium averages for short integration times
-        elif integration_time < 1000:
-            averages = 2   # Few averages for medium integration times
-        else:
-            averages = 1   # No averaging for long integration times
-        
-        # Store current integration time for data saving
-        self.current_integration_time_us = integration_time
-        
-        # Update status with current settings
-        self.status_signal.emit(f"Starting measurement (Int: {integration_time}ms, Avg: {averages}, Cycles: {cycles}, Rep: {repetitions})")
-        
-        code = prepare_measurement(self.handle, self.npix, 
-                                  integration_time_ms=integration_time, 
-                                  averages=averages,
-                                  cycles=cycles,
-                                  repetitions=repetitions)
-        if code != 0:
-            self.status_signal.emit(f"Prepare error: {code}")
-            return
-        self.measure_active = True
-        self.cb = AVS_MeasureCallbackFunc(self._cb)
-        err = AVS_MeasureCallback(self.handle, self.cb, -1)
-        if err != 0:
-            self.status_signal.emit(f"Callback error: {err}")
-            self.measure_active = False
-            return
-        self.start_btn.setEnabled(False)
-        self.stop_btn.setEnabled(True)
-        self.apply_btn.setEnabled(True)  # Enable the apply button when measurement starts
-        self.status_signal.emit("Measurement started")
-
-    def _cb(self, p_data, p_user):
-        # Spectrometer driver callback (on new scan)
-        status_code = p_user[0]
-        if status_code == 0:
-            _, data = AVS_GetScopeData(self.handle)
-            # Ensure intensities list has correct length (up to 2048)
-            max_pixels = min(2048, self.npix)
-            full = [0.0] * max_pixels
-            # Copy only the data we need (up to 2048 pixels)
-            data_to_use = data[:max_pixels] if len(data) > max_pixels else data
-            full[:len(data_to_use)] = data_to_use
-            self.intens = full
-            
-            # Make sure integration time is accessible to MainWindow
-            if hasattr(self, 'current_integration_time_us'):
-                # Make it accessible to parent (MainWindow)
-                if hasattr(self, 'parent') and self.parent is not None:
-                    # Removed "if not callable(self.parent)" check, assuming parent is MainWindow instance
-                    self.parent.current_integration_time_us = self.current_integration_time_us
-            
-            # Enable snapshot save and continuous save after first data received
-            self.save_btn.setEnabled(True)
-            self.toggle_btn.setEnabled(True)
-        else:
-            self.status_signal.emit(f"Spectrometer error code {status_code}")
+        """Start measuring with the integration time, cycles and repetitions of the spin boxes"""
+        self.core.integration_time_ms = float(self.integ_spinbox.value())
+        self.core.cycles = self.cycles_spinbox.value()
+        self.core.repetitions = self.repetitions_spinbox.value()
+        return self.core.start_measurement()
 
     def _update_plot(self):
         """Update the plot with current data"""
-        if not hasattr(self, 'intens') or not self.intens:
+        if not hasattr(self, 'intens') or not len(self.intens):
             return
         
         try:
-            # Get the data arrays - use numpy for better performance
-            intensities = np.array(self.intens)
+            # The current spectrum is a read-only array, plotted without a copy
+            intensities = np.asarray(self.intens)
             
             # Get wavelengths
             wavelengths = np.array(self.wls[:len(intensities)])
@@ -396,49 +341,12 @@ class SpectrometerController(QObject):
                 pass
 
     def stop(self):
-        if not hasattr(self, 'measure_active') or not self.measure_active:
-            return
-        self.measure_active = False
-        th = StopMeasureThread(self.handle, parent=self)
-        th.finished_signal.connect(self._on_stop)
-        th.start()
-
-    def _on_stop(self):
-        self.start_btn.setEnabled(True)
-        self.stop_btn.setEnabled(False)
-        self.apply_btn.setEnabled(False)  # Disable the apply button when measurement stops
-        self.status_signal.emit("Measurement stopped")
-
-    def save(self, filename=None, routine_name=None, routine_start_time_str=None):
-        # csv_dir is an instance attribute, self.csv_dir
-        
-        path = None # Initialize path
-        
-        if routine_name and routine_start_time_str and filename:
-            target_dir = os.path.join(self.csv_dir, routine_name, routine_start_time_str)
-            os.makedirs(target_dir, exist_ok=True)
-            path = os.path.join(target_dir, filename)
-        elif filename:
-            path = os.path.join(self.csv_dir, filename)
-        else:
-            # Manual snapshot
-            ts = QDateTime.currentDateTime().toString("yyyyMMdd_hhmmss")
-            path = os.path.join(self.csv_dir, f"snapshot_{ts}.csv")
+        return self.core.stop_measurement()
 
-        if not path: # Should not happen if logic is correct, but as a safeguard
-            self.status_signal.emit("Save error: Could not determine save path.")
-            return
-
-        try:
-            with open(path, 'w') as f:
-                f.write("Wavelength (nm),Intensity\n")
-                num_points = min(len(self.wls), len(self.intens))
-                for i in range(num_points):
-                    if self.intens[i] != 0: # Optional: keep filtering out zero intensity
-                        f.write(f"{self.wls[i]:.2f},{self.intens[i]:.4f}\n")
-            self.status_signal.emit(f"Saved snapshot to {path}")
-        except Exception as e:
-            self.status_signal.emit(f"Save error: {e}")
+    def save(self, filename=None, routine_name=None, routine_start_time_str=None, callback=None):
+        """Queue the current scan to be written as a CSV snapshot (see SpectrometerCore.save)"""
+        return self.core.save(filename=filename or None, routine_name=routine_name,
+                              routine_start_time_str=routine_start_time_str, callback=callback)
 
     def toggle(self):
         # This method is overridden by MainWindow if parent is provided.
@@ -448,129 +356,36 @@ class SpectrometerController(QObject):
                 self.toggle_btn.setText("Stop Saving")
             else:
                 self.toggle_btn.setText("Start Saving")
-        self.status_signal.emit("Continuous-save not yet implemented")
+        self.events.warning("not_implemented", "Continuous-save not yet implemented")
 
     def is_ready(self):
-        return self._ready
+        return self.core.is_ready()
+
+    def apply_integration_time(self, integration_time_ms):
+        """Set the integration time spinbox and apply it (used by routines)"""
+        self.integ_spinbox.setValue(int(integration_time_ms))
+        self.update_measurement_settings()
 
     def update_measurement_settings(self):
-        """Update measurement settings without stopping the current measurement"""
-        if not self._ready:
-            self.status_signal.emit("Spectrometer not ready")
-            return
-        
-        # Get all settings from UI
-        integration_time = float(self.integ_spinbox.value())
-        cycles = self.cycles_spinbox.value()
-        repetitions = self.repetitions_spinbox.value()
-        
-        # Calculate averages based on integration time
-        if integration_time < 10:
-            averages = 10
-        elif integration_time < 100:
-            averages = 5
-        elif integration_time < 1000:
-            averages = 2
-        else:
-            averages = 1
-        
-        # Store current integration time for data saving
-        self.current_integration_time_us = integration_time
-        
-        # Update data collection timers if data logging is active
-        self._update_data_collection_timers(integration_time)
-        
-        # If measurement is active, need to stop and restart with new settings
-        if hasattr(self, 'measure_active') and self.measure_active:
-            self.status_signal.emit("Stopping measurement to update settings...")
-            
-            # Use StopMeasureThread to properly stop the measurement
-            th = StopMeasureThread(self.handle, parent=self)
-            th.finished_signal.connect(lambda: self._apply_new_settings(integration_time, averages, cycles, repetitions))
-            th.start()
-        else:
-            # Just prepare the measurement with new settings
-            code = prepare_measurement(self.handle, self.npix, 
-                                      integration_time_ms=integration_time, 
-                                      averages=averages,
-                                      cycles=cycles,
-                                      repetitions=repetitions)
-            if code != 0:
-                self.status_signal.emit(f"Settings update error: {code}")
-                return
-            self.status_signal.emit(f"Settings updated (Int: {integration_time}ms, Avg: {averages}, Cycles: {cycles}, Rep: {repetitions})")
-
-    def _update_data_collection_timers(self, integration_time_ms):
-        """Update data collection timers based on new integration time"""
-        # Check if parent window has data logging active
-        if hasattr(self, 'parent') and self.parent is not None:
-            if hasattr(self.parent, 'data_logger') and hasattr(self.parent.data_logger, 'continuous_saving'):
-                if self.parent.data_logger.continuous_saving:
-                    # Ensure minimum interval of 100ms
-                    collection_interval = max(100, int(integration_time_ms))
-                    save_interval = int(integration_time_ms + 200)  # Add 200ms buffer
-                    
-                    # Update the timers if they exist
-                    if hasattr(self.parent, 'data_timer'):
-                        self.parent.data_timer.setInterval(collection_interval)
-                    if hasattr(self.parent, 'save_timer'):
-                        self.parent.save_timer.setInterval(save_interval)
-                    
-                    # Store the updated intervals
-                    self.parent.data_logger.collection_interval = collection_interval
-                    self.parent.data_logger.save_interval = save_interval
-                    
-                    self.status_signal.emit(f"Updated data collection interval to {collection_interval}ms")
-
-    def _apply_new_settings(self, integration_time, averages, cycles, repetitions):
-        """Helper to apply new settings after measurement has stopped"""
-        # Set flag to indicate integration time is changing
-        if hasattr(self, 'parent') and self.parent is not None:
-                # Removed "if not callable(self.parent)" check
-                if not hasattr(self.parent, '_integration_changing'):
-                    setattr(self.parent, '_integration_changing', True)
-                else:
-                    self.parent._integration_changing = True
-        
-        code = prepare_measurement(self.handle, self.npix, 
-                                integration_time_ms=integration_time, 
-                                averages=averages,
-                                cycles=cycles,
-                                repetitions=repetitions)
-        if code != 0:
-            self.status_signal.emit(f"Settings update error: {code}")
-            return
-        
-        self.cb = AVS_MeasureCallbackFunc(self._cb)
-        err = AVS_MeasureCallback(self.handle, self.cb, -1)
-        if err != 0:
-            self.status_signal.emit(f"Callback error on restart: {err}")
-            self.measure_active = False
+        """Apply the spin boxes' settings, restarting a running measurement with them"""
+        if not self.core.is_ready():
+            self.events.warning("not_connected", "Spectrometer not ready")
             return
-        
-        self.measure_active = True
-        self.stop_btn.setEnabled(True)
-        self.status_signal.emit(f"Settings updated (Int: {integration_time}ms, Avg: {averages}, Cycles: {cycles}, Rep: {repetitions})")
-        
-        # Add a delay before resetting the flag to ensure stable readings
-        if hasattr(self, 'parent') and self.parent is not None: # Removed "not callable(self.parent)"
-            if hasattr(self.parent, '_integration_changing'):
-                # Convert integration_time to integer for QTimer.singleShot
-                delay_ms = int(integration_time * 2) # Ensure integration_time is float or int
-                QTimer.singleShot(delay_ms, 
-                                 lambda: setattr(self.parent, '_integration_changing', False))
+        self.core.cycles = self.cycles_spinbox.value()
+        self.core.repetitions = self.repetitions_spinbox.value()
+        self.core.apply_integration_time(float(self.integ_spinbox.value()))
 
     def connect_spectrometer(self, ispec=0):
         """Connect to a specific spectrometer by index"""
         success, message = self.driver.reset(ispec, ini=True)
         if success:
             self.active_spectrometers[ispec] = True
-            self.status_signal.emit(message)
+            self.events.info("connected", message, index=ispec)
             # Update UI elements
             self.start_btn.setEnabled(True)
             return True
         else:
-            self.status_signal.emit(message)
+            self.events.error("connect_failed", message, index=ispec)
             return False
 
     def disconnect_spectrometer(self, ispec=0, free_resources=False):
@@ -578,19 +393,19 @@ class SpectrometerController(QObject):
         success, message = self.driver.disconnect(ispec, dofree=free_resources)
         if success and ispec in self.active_spectrometers:
             del self.active_spectrometers[ispec]
-        self.status_signal.emit(message)
+        self.events.info("disconnected", message, index=ispec, ok=success)
         return success
 
     def set_integration_time(self, ispec=0, integration_time=50.0):
         """Set integration time for a specific spectrometer"""
         success, message = self.driver.set_it(ispec, integration_time)
-        self.status_signal.emit(message)
+        self.events.info("integration_time", message, index=ispec, integration_ms=integration_time, ok=success)
         return success
 
     def start_measurement(self, ispec=0, cycles=1):
         """Start measurement on a specific spectrometer"""
         if ispec not in self.active_spectrometers:
-            self.status_signal.emit(f"Spectrometer {ispec} not connected")
+            self.events.warning("not_connected", f"Spectrometer {ispec} not connected", index=ispec)
             return False
             
         # Get integration time from UI
@@ -601,7 +416,7 @@ class SpectrometerController(QObject):
         
         # Start measurement
         success, message = self.driver.measure(ispec, ncy=cycles)
-        self.status_signal.emit(message)
+        self.events.info("measurement_started", message, index=ispec, ok=success)
         
         if success:
             self.measure_active = True
@@ -619,7 +434,7 @@ class SpectrometerController(QObject):
         if hasattr(self, 'measure_active') and self.measure_active:
             self.measure_active = False
             th = StopMeasureThread(self.driver.handles[ispec]['handle'], parent=self)
-            th.finished_signal.connect(self._on_stop)
+            th.finished_signal.connect(self.core._on_stop)
             th.start()
             return True
         return False
@@ -628,10 +443,10 @@ class SpectrometerController(QObject):
         """Get temperature from spectrometer"""
         success, message, temp = self.driver.get_temp(ispec, syst8i=board_temp)
         if success:
-            self.status_signal.emit(f"Temperature: {temp:.1f}°C")
+            self.events.info("temperature", f"Temperature: {temp:.1f}°C", index=ispec, celsius=temp)
             return temp
         else:
-            self.status_signal.emit(message)
+            self.events.warning("temperature_failed", message, index=ispec)
             return None
 
     def _check_measurement_status(self):
@@ -647,7 +462,7 @@ class SpectrometerController(QObject):
                 elif status == 'ERROR':
                     # Handle error condition
                     error_level = self.driver.recovery_level.get(ispec, 0)
-                    self.status_signal.emit(f"Spectrometer {ispec} error (level {error_level})")
+                    self.events.error("recovery", f"Spectrometer {ispec} error (level {error_level})", index=ispec, recovery_level=error_level)
 
     def _process_new_data(self, ispec):
         """Process new data from spectrometer"""
@@ -655,11 +470,11 @@ class SpectrometerController(QObject):
             data = self.driver.handles[ispec]['last_data']
             
             # Update the data for plotting
-            self.intens = data
+            self.intens = as_spectrum(data, min(2048, self.npix) if self.npix else None)
             
             # Check for saturation
             if self.driver.handles[ispec].get('saturated', False):
-                self.status_signal.emit("Warning: Detector saturation detected")
+                self.events.warning("saturation", "Warning: Detector saturation detected", index=ispec)
                 
             # Reset data status to prevent reprocessing
             self.driver.data_status[ispec] = 'PROCESSED'
@@ -671,38 +486,38 @@ class SpectrometerController(QObject):
     def enable_high_res_adc(self, enable=True):
         """Enable or disable high-resolution ADC mode"""
         self.high_res_adc = enable
-        if self._ready and self.handle:
+        if self.core.is_ready() and self.handle:
             try:
                 from drivers.avaspec import AVS_UseHighResAdc
                 AVS_UseHighResAdc(self.handle, enable)
-                self.status_signal.emit(f"High-resolution ADC mode {'enabled' if enable else 'disabled'}")
+                self.events.info("high_res_adc", f"High-resolution ADC mode {'enabled' if enable else 'disabled'}", enabled=enable)
                 return True
             except Exception as e:
-                self.status_signal.emit(f"Could not change ADC mode: {e}")
+                self.events.warning("high_res_adc_failed", f"Could not change ADC mode: {e}", error=str(e))
                 return False
         return False
 
     def set_sync_mode(self, enable=False):
         """Enable or disable synchronous measurement mode"""
-        if self._ready and self.handle:
+        if self.core.is_ready() and self.handle:
             try:
                 from drivers.avaspec import AVS_SetSyncMode
                 AVS_SetSyncMode(self.handle, enable)
-                self.status_signal.emit(f"Synchronous mode {'enabled' if enable else 'disabled'}")
+                self.events.info("sync_mode", f"Synchronous mode {'enabled' if enable else 'disabled'}", enabled=enable)
                 return True
             except Exception as e:
-                self.status_signal.emit(f"Could not change sync mode: {e}")
+                self.events.warning("sync_mode_failed", f"Could not change sync mode: {e}", error=str(e))
                 return False
         return False
 
     def plot_final_data(self, data):
         """Plot final data from a completed routine"""
-        if not data or not isinstance(data, list):
-            self.status_signal.emit("No valid data to plot")
+        if not isinstance(data, (list, tuple, np.ndarray)) or not len(data):
+            self.events.warning("no_data", "No valid data to plot")
             return
         
         try:
-            import numpy as np
+            data = as_spectrum(data)
             # Create pixel indices array
             pixel_indices = np.arange(len(data))
             
@@ -710,8 +525,8 @@ class SpectrometerController(QObject):
             self.curve_px.setData(pixel_indices, data)
             
             # Update y-axis range
-            if len(data) > 0 and max(data) > 0:
-                max_y = max(data) * 1.1
+            if len(data) > 0 and data.max() > 0:
+                max_y = data.max() * 1.1
                 self.plot_px.setYRange(0, max_y)
             
             # Add timestamp to the plot title
@@ -723,11 +538,12 @@ class SpectrometerController(QObject):
             self.save_btn.setEnabled(True)
             
             # Store the data as current intensities
-            self.intens = data.copy()
+            self.intens = data
             
-            self.status_signal.emit(f"Plotted final data with peak value: {max(data):.1f}")
+            peak = float(data.max())
+            self.events.info("final_data_plotted", f"Plotted final data with peak value: {peak:.1f}", peak=peak)
         except Exception as e:
-            self.status_signal.emit(f"Error plotting final data: {e}")
+            self.events.error("plot_failed", f"Error plotting final data: {e}", error=str(e))
 
     def clear_static_curves(self):
         """Clear all static curves from the plot"""
@@ -736,7 +552,7 @@ class SpectrometerController(QObject):
                 self.plot_px.removeItem(curve)
             self.static_curves = []
             self.plot_px.setTitle("Spectrometer - All static curves cleared")
-            self.status_signal.emit("All static curves cleared")
+            self.events.info("curves_cleared", "All static curves cleared")
 
 
 
@@ -1,12 +1,15 @@
-from PyQt5.QtCore import QObject, QTimer, pyqtSignal, Qt
+from PyQt5.QtCore import QObject, Qt
 from PyQt5.QtWidgets import QGroupBox, QLabel, QVBoxLayout, QHBoxLayout, QPushButton
-from drivers.thp_sensor import read_thp_sensor_data
+from controllers.cores import THPCore
 
 class THPController(QObject):
-    status_signal = pyqtSignal(str)
+    """THP sensor widgets around a THPCore (controllers.cores), which polls the sensor"""
 
     def __init__(self, port, parent=None):
         super().__init__(parent)
+        self.core = THPCore(port, parent=self)
+        self.status_signal = self.core.status_signal
+        self.events = self.core.events
         self.port = port
         self.groupbox = QGroupBox("THP Sensor")
         self.groupbox.setObjectName("thpGroup")
@@ -36,69 +39,39 @@ class THPController(QObject):
         layout.addWidget(self.readings_label)
         
         self.groupbox.setLayout(layout)
-        
-        self._connected = False # Initialize connection state flag
-        self.latest = {
-            "temperature": 0.0,
-            "humidity": 0.0,
-            "pressure": 0.0
-        }
-        
-        self.timer = QTimer(self)
-        self.timer.timeout.connect(self._update_data)
-        self.timer.start(3000) # Start periodic updates
-        self._update_data() # Initial data read attempt
+        self.core.state_signal.connect(self._update_ui)
+        self.core.connect() # Start periodic updates with an initial read
 
-    def _update_data(self):
-        try:
-            data = read_thp_sensor_data(self.port) # Assuming this handles port open/close
-            if data:
-                self.latest = data
-                self.readings_label.setText(
-                    f"Temp: {data['temperature']:.1f} °C | "
-                    f"Humidity: {data['humidity']:.1f} % | "
-                    f"Pressure: {data['pressure']:.1f} hPa"
-                )
-                if not self._connected: # If was previously disconnected
-                    self.status_signal.emit(f"THP sensor connected on {self.port}")
-                self._connected = True
-            else:
-                if self._connected: # If was previously connected
-                    self.status_signal.emit(f"THP sensor read failed/disconnected on port {self.port}")
-                self.readings_label.setText(f"Sensor not responding on {self.port}")
-                self._connected = False
-        except Exception as e:
-            if self._connected: # If was previously connected
-                self.status_signal.emit(f"THP sensor error: {e}")
+    def _update_ui(self):
+        """Show the core's latest reading"""
+        data = self.core.latest
+        if not self.core.is_polling():
+            self.readings_label.setText("THP updates stopped.")
+        elif self.core.is_connected():
+            self.readings_label.setText(
+                f"Temp: {data['temperature']:.1f} °C | "
+                f"Humidity: {data['humidity']:.1f} % | "
+                f"Pressure: {data['pressure']:.1f} hPa"
+            )
+        elif self.core.error is not None:
             self.readings_label.setText(f"Sensor error on {self.port}")
-            self._connected = False
+        else:
+            self.readings_label.setText(f"Sensor not responding on {self.port}")
+
+    @property
+    def latest(self):
+        return self.core.latest
 
     def get_latest(self):
-        return self.latest
+        return self.core.get_latest()
 
     def is_connected(self):
-        return self._connected # Use the internal flag
+        return self.core.is_connected()
 
     def reconnect(self):
         """Try to read data from the THP sensor again."""
-        self.status_signal.emit(f"THP: Attempting to read from {self.port}...")
-        self._update_data() # This already updates status and UI based on success/failure
-        if self._connected:
-            self.status_signal.emit(f"THP: Reconnected/Read successful on {self.port}")
-        # else: # _update_data would have emitted a failure status
-            # self.status_signal.emit(f"THP: Reconnect/Read failed on {self.port}")
-        return self._connected
+        return self.core.reconnect()
 
     def disconnect(self):
         """Stops periodic updates for the THP sensor."""
-        if self.timer.isActive():
-            self.timer.stop()
-        self._connected = False
-        self.readings_label.setText("THP updates stopped.")
-        self.status_signal.emit(f"THP sensor updates stopped for port {self.port}.")
-
-
-
-
-
-
+        self.core.disconnect()
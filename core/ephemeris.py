@@ -0,0 +1,202 @@
+"""
+Precomputed solar ephemeris for scheduling and sun tracking.
+
+utils.compute_sun_vector evaluates astral's solar position for one instant
+per call. SolarEphemeris evaluates the same NOAA equations (refraction
+included) with NumPy for a whole UTC day at once, on a grid of step_s
+seconds (10 s by default, 8641 points), and answers from the table:
+
+    ephemeris = get_ephemeris(52.0, 4.4)
+    ephemeris.elevation(time.time())                  # degrees, interpolated
+    ephemeris.position(time.time())                   # (azimuth, elevation)
+    ephemeris.next_crossing(10.0, time.time())        # next time the sun rises through 10°
+
+A day's table is built the first time a time on that day is asked for and
+the few most recent days are kept, so a long-running process refreshes
+lazily once a day. Between grid points elevation and azimuth are
+interpolated linearly; at 10 s the error is far below 0.001°.
+
+The table is split at the extremes of the elevation into monotonic
+segments (normally the morning and the afternoon), so next_crossing()
+finds a crossing by binary search in O(log n) rather than by sampling.
+"""
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+DEFAULT_STEP_S = 10.0
+DAY_S = 86400.0
+_TABLES_PER_SITE = 4              # days of tables kept per site
+_SITES = 16                       # sites kept by get_ephemeris
+
+
+def _refraction(elevation):
+    """Refraction (degrees) at the unrefracted elevation (degrees), as astral.sun.refraction_at_zenith"""
+    te = np.tan(np.radians(np.clip(elevation, -89.9, 89.9)))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        high = 58.1 / te - 0.07 / te ** 3 + 0.000086 / te ** 5
+        low = 1735.0 + elevation * (-518.2 + elevation * (103.4 + elevation * (-12.79 + elevation * 0.711)))
+        below = -20.774 / te
+    correction = np.where(elevation > 5.0, high, np.where(elevation > -0.575, low, below))
+    return np.where(elevation >= 85.0, 0.0, correction) / 3600.0
+
+
+def solar_position(latitude, longitude, ts):
+    """(azimuth, elevation) in degrees at epoch seconds ts (a number or an array), refraction included.
+
+    The NOAA equations of astral.sun.zenith_and_azimuth, evaluated for all of
+    ts at once.
+    """
+    ts = np.asarray(ts, dtype=np.float64)
+    latitude = min(89.8, max(-89.8, latitude))
+    t = (ts / DAY_S + 2440587.5 - 2451545.0) / 36525.0          # Julian centuries since J2000
+    l0 = np.radians((280.46646 + t * (36000.76983 + 0.0003032 * t)) % 360.0)
+    m = np.radians(357.52911 + t * (35999.05029 - 0.0001537 * t))
+    e = 0.016708634 - t * (0.000042037 + 0.0000001267 * t)
+    center = (np.sin(m) * (1.914602 - t * (0.004817 + 0.000014 * t))
+              + np.sin(2 * m) * (0.019993 - 0.000101 * t) + np.sin(3 * m) * 0.000289)
+    omega = np.radians(125.04 - 1934.136 * t)
+    apparent = np.radians(np.degrees(l0) + center - 0.00569 - 0.00478 * np.sin(omega))
+    seconds = 21.448 - t * (46.815 + t * (0.00059 - t * 0.001813))
+    obliquity = np.radians(23.0 + (26.0 + seconds / 60.0) / 60.0 + 0.00256 * np.cos(omega))
+    declination = np.arcsin(np.sin(obliquity) * np.sin(apparent))
+    y = np.tan(obliquity / 2.0) ** 2
+    eq_time = 4.0 * np.degrees(y * np.sin(2 * l0) - 2 * e * np.sin(m) + 4 * e * y * np.sin(m) * np.cos(2 * l0)
+                               - 0.5 * y * y * np.sin(4 * l0) - 1.25 * e * e * np.sin(2 * m))
+
+    true_solar_time = (ts % DAY_S) / 60.0 + eq_time + 4.0 * longitude
+    true_solar_time = np.where(true_solar_time > 1440.0, true_solar_time % 1440.0, true_solar_time)
+    hour_angle = true_solar_time / 4.0 - 180.0
+    hour_angle = np.radians(np.where(hour_angle < -180.0, hour_angle + 360.0, hour_angle))
+
+    lat = math.radians(latitude)
+    cos_zenith = np.clip(math.cos(lat) * np.cos(declination) * np.cos(hour_angle)
+                         + math.sin(lat) * np.sin(declination), -1.0, 1.0)
+    zenith = np.arccos(cos_zenith)
+    denominator = math.cos(lat) * np.sin(zenith)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.clip((math.sin(lat) * cos_zenith - np.sin(declination)) / denominator, -1.0, 1.0)
+    azimuth = 180.0 - np.degrees(np.arccos(ratio))
+    azimuth = np.where(hour_angle > 0.0, -azimuth, azimuth)
+    azimuth = np.where(np.abs(denominator) > 0.001, azimuth, 180.0 if latitude > 0.0 else 0.0) % 360.0
+
+    elevation = 90.0 - np.degrees(zenith)
+    elevation = elevation + _refraction(elevation)
+    return azimuth, elevation
+
+
+class _DayTable:
+    """Azimuth and elevation of one UTC day on a grid, split into monotonic elevation segments"""
+
+    def __init__(self, latitude, longitude, start, step_s):
+        self.start, self.step_s = start, step_s
+        self.times = start + step_s * np.arange(int(round(DAY_S / step_s)) + 1)
+        azimuth, self.elevations = solar_position(latitude, longitude, self.times)
+        self.azimuths = np.degrees(np.unwrap(np.radians(azimuth)))   # continuous through north
+        # Segments end where the elevation turns; flat steps belong to the segment they are in
+        slope = np.sign(np.diff(self.elevations))
+        for i in range(1, len(slope)):
+            if slope[i] == 0:
+                slope[i] = slope[i - 1]
+        turns = np.flatnonzero(slope[1:] != slope[:-1]) + 1
+        bounds = [0, *turns.tolist(), len(self.times) - 1]
+        self.segments = [(first, last, slope[first] > 0) for first, last in zip(bounds, bounds[1:])]
+
+    def interpolate(self, values, ts):
+        i = min(max(int((ts - self.start) // self.step_s), 0), len(values) - 2)
+        fraction = (ts - self.start) / self.step_s - i
+        return float(values[i] + (values[i + 1] - values[i]) * fraction)
+
+    def crossing(self, degrees, after, rising):
+        """First time after after (within the table) the elevation crosses degrees, or None"""
+        for first, last, up in self.segments:
+            if up != rising or self.times[last] <= after:
+                continue
+            # From the first grid point after after, with the value at after in front
+            k = max(first, int(np.searchsorted(self.times, after, side="right")))
+            t0, e0 = max(after, self.times[first]), self.interpolate(self.elevations, max(after, self.times[first]))
+            values = self.elevations[k:last + 1] if rising else -self.elevations[k:last + 1]
+            target = degrees if rising else -degrees
+            if (e0 if rising else -e0) >= target or not len(values) or values[-1] < target:
+                continue
+            j = int(np.searchsorted(values, target, side="left")) + k
+            if j > k:
+                t0, e0 = self.times[j - 1], self.elevations[j - 1]
+            t1, e1 = self.times[j], self.elevations[j]
+            return float(t0 + (t1 - t0) * (degrees - e0) / (e1 - e0)) if e1 != e0 else float(t1)
+        return None
+
+
+class SolarEphemeris:
+    """Solar azimuth and elevation for a site, from lazily built tables of a day each"""
+
+    def __init__(self, latitude, longitude, step_s=DEFAULT_STEP_S):
+        self.latitude, self.longitude, self.step_s = float(latitude), float(longitude), float(step_s)
+        self._tables = OrderedDict()      # UTC day number -> _DayTable, most recently used last
+        self._lock = threading.Lock()
+        self.builds = 0                   # tables built so far
+
+    def _table(self, ts):
+        day = math.floor(ts / DAY_S)
+        with self._lock:
+            table = self._tables.get(day)
+            if table is None:
+                table = self._tables[day] = _DayTable(self.latitude, self.longitude, day * DAY_S, self.step_s)
+                self.builds += 1
+                while len(self._tables) > _TABLES_PER_SITE:
+                    self._tables.popitem(last=False)
+            else:
+                self._tables.move_to_end(day)
+            return table
+
+    def elevation(self, ts):
+        """Elevation of the sun (degrees, refraction included) at epoch seconds ts"""
+        table = self._table(ts)
+        return table.interpolate(table.elevations, ts)
+
+    def azimuth(self, ts):
+        """Azimuth of the sun (degrees clockwise from north) at epoch seconds ts"""
+        table = self._table(ts)
+        return table.interpolate(table.azimuths, ts) % 360.0
+
+    def position(self, ts):
+        return self.azimuth(ts), self.elevation(ts)
+
+    def sun_vector(self, ts):
+        """Unit vector (east, north, up) towards the sun, as utils.compute_sun_vector"""
+        azimuth, elevation = (math.radians(angle) for angle in self.position(ts))
+        return (math.cos(elevation) * math.sin(azimuth), math.cos(elevation) * math.cos(azimuth),
+                math.sin(elevation))
+
+    def next_crossing(self, degrees, after, rising=True, within_s=2 * DAY_S):
+        """First time after epoch seconds after that the sun rises (or sets) through degrees.
+
+        None if it does not within within_s (e.g. polar day or night).
+        """
+        day = math.floor(after / DAY_S)
+        while day * DAY_S < after + within_s:
+            when = self._table(day * DAY_S).crossing(degrees, after, rising)
+            if when is not None:
+                return when if when <= after + within_s else None
+            day += 1
+        return None
+
+
+_ephemerides = OrderedDict()
+_ephemerides_lock = threading.Lock()
+
+
+def get_ephemeris(latitude, longitude, step_s=DEFAULT_STEP_S):
+    """The shared SolarEphemeris of a site"""
+    key = (round(float(latitude), 6), round(float(longitude), 6), float(step_s))
+    with _ephemerides_lock:
+        ephemeris = _ephemerides.get(key)
+        if ephemeris is None:
+            ephemeris = _ephemerides[key] = SolarEphemeris(latitude, longitude, step_s)
+            while len(_ephemerides) > _SITES:
+                _ephemerides.popitem(last=False)
+        else:
+            _ephemerides.move_to_end(key)
+        return ephemeris
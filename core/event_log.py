@@ -0,0 +1,221 @@
+"""
+Structured event log.
+
+Components report what happens to them as typed Event records (component,
+level, code, message, payload, timestamp) instead of free-form status
+strings whose severity had to be guessed from their wording:
+
+    self.events = EventSource("motor", self.status_signal.emit)
+    self.events.warning("not_connected", "Motor not connected")
+    self.events.info("moved", f"Motor: Moved to {angle}°", angle=angle)
+
+An EventSource logs the event and shows its message on its status callback
+(the status bar). The EventLog keeps the most recent events in a ring
+buffer for the UI and appends every event as one JSON line to a session file
+through the background file writer, so logging never blocks on the disk.
+
+Repeated events are rate limited per (component, code): at most `burst`
+events per `rate_window_s` are recorded, further ones are counted and the
+count is reported in the "suppressed" field of the next recorded event of
+that code (or in a summary record when the log is closed). The status
+callback is rate limited with the log: a repeated message is shown as often
+as it is recorded, with the number of repeats held back since.
+"""
+import json
+import time
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Dict
+
+DEBUG = "DEBUG"
+INFO = "INFO"
+WARNING = "WARNING"
+ERROR = "ERROR"
+LEVELS = {DEBUG: 10, INFO: 20, WARNING: 30, ERROR: 40}
+
+_DEFAULTS = {
+    "history": 1000,          # events kept in memory for the UI
+    "rate_window_s": 10.0,    # rate limiting window per (component, code)
+    "burst": 3,               # events of one code recorded per window
+    "min_level": DEBUG,       # events below this level are dropped
+}
+
+
+def _now():
+    return time.time()
+
+
+@dataclass(frozen=True)
+class Event:
+    component: str
+    level: str
+    code: str
+    message: str = ""
+    payload: Dict[str, Any] = field(default_factory=dict)
+    timestamp: float = field(default_factory=_now)
+    suppressed: int = 0       # events of this code dropped by rate limiting before this one
+
+    def to_dict(self):
+        record = {"timestamp": self.timestamp, "component": self.component, "level": self.level,
+                  "code": self.code, "message": self.message}
+        if self.payload:
+            record["payload"] = self.payload
+        if self.suppressed:
+            record["suppressed"] = self.suppressed
+        return record
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), default=str, ensure_ascii=False)
+
+
+class EventLog:
+    """Thread-safe event log with history, rate limiting and a JSON-lines file"""
+
+    def __init__(self, **options):
+        self.options = dict(_DEFAULTS)
+        self.options.update({k: v for k, v in options.items() if v is not None})
+        self._history = deque(maxlen=int(self.options["history"]))
+        self._lock = threading.Lock()
+        self._rates = {}          # (component, code) -> [window start, recorded, suppressed, last event]
+        self._listeners = []
+        self._stream = None
+        self.path = None
+        self.counts = {level: 0 for level in LEVELS}
+
+    def open(self, path, writer=None, catalog=None):
+        """Start writing events to path (JSON lines) through the background file writer"""
+        from storage.file_writer import get_file_writer, DROP
+        self.close()
+        writer = writer or get_file_writer()
+        self.path = path
+        self._stream = writer.open_stream(path, "w", policy=DROP,
+                                          catalog=dict(catalog or {}, kind="event_log"))
+
+    def close(self):
+        """Record what rate limiting held back and close the file"""
+        with self._lock:
+            pending = [(key, state) for key, state in self._rates.items() if state[2]]
+            self._rates.clear()
+        for (component, code), (_, _, suppressed, last) in pending:
+            self._record(Event(component, last.level, code, f"{suppressed} more '{code}' events suppressed",
+                               suppressed=suppressed))
+        if self._stream is not None:
+            self._stream.annotate(rows=sum(self.counts.values()))
+            self._stream.close()
+            self._stream = None
+
+    def accepts(self, level):
+        """Whether events of level are recorded (not below min_level)"""
+        return LEVELS.get(level, 0) >= LEVELS[self.options["min_level"]]
+
+    def log(self, component, level, code, message="", /, **payload):
+        """Record an event; returns it, or None if it was filtered or rate limited"""
+        if not self.accepts(level):
+            return None
+        now = _now()
+        with self._lock:
+            state = self._rates.get((component, code))
+            if state is None or now - state[0] >= self.options["rate_window_s"]:
+                carried = state[2:] if state is not None else [0, None]
+                state = self._rates[(component, code)] = [now, 0] + carried
+            if state[1] >= self.options["burst"]:
+                state[2] += 1
+                state[3] = Event(component, level, code, message, payload, now)
+                return None
+            event = Event(component, level, code, message, payload, now, suppressed=state[2])
+            state[1] += 1
+            state[2] = 0
+        self._record(event)
+        return event
+
+    def _record(self, event):
+        with self._lock:
+            self._history.append(event)
+            self.counts[event.level] = self.counts.get(event.level, 0) + 1
+            listeners = list(self._listeners)
+            stream = self._stream
+        if stream is not None:
+            # Serialised on the writer thread
+            stream.write(lambda: event.to_json() + "\n")
+        for listener in listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                print(f"EventLog: listener failed: {e}")
+
+    def recent(self, count=None, min_level=None, component=None):
+        """The most recent events, oldest first, optionally filtered"""
+        with self._lock:
+            events = list(self._history)
+        if min_level is not None:
+            events = [e for e in events if LEVELS[e.level] >= LEVELS[min_level]]
+        if component is not None:
+            events = [e for e in events if e.component == component]
+        return events[-count:] if count else events
+
+    def subscribe(self, callback):
+        """Call callback(event) for every recorded event (on the reporting thread)"""
+        with self._lock:
+            self._listeners.append(callback)
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+
+class EventSource:
+    """A component's handle for reporting events.
+
+    status is an optional callable shown the message (e.g. a status_signal's
+    emit) when the event is recorded, with the count of repeats the rate limit
+    held back before it, so a repeated message does not flood the status bar.
+    Events below the log's min_level are still shown.
+    """
+
+    def __init__(self, component, status=None, log=None):
+        self.component = component
+        self.status = status
+        self._log = log
+
+    def report(self, level, code, message, /, **payload):
+        log = self._log or get_event_log()
+        event = log.log(self.component, level, code, message, **payload)
+        if self.status is None:
+            return
+        if event is not None:
+            self.status(f"{message} ({event.suppressed} repeats suppressed)" if event.suppressed else message)
+        elif not log.accepts(level):
+            self.status(message)
+
+    def debug(self, code, message, /, **payload):
+        self.report(DEBUG, code, message, **payload)
+
+    def info(self, code, message, /, **payload):
+        self.report(INFO, code, message, **payload)
+
+    def warning(self, code, message, /, **payload):
+        self.report(WARNING, code, message, **payload)
+
+    def error(self, code, message, /, **payload):
+        self.report(ERROR, code, message, **payload)
+
+
+_event_log = None
+_event_log_options = {}
+_event_log_lock = threading.Lock()
+
+
+def configure_event_log(**options):
+    """Set options for the shared event log; takes effect when it is created"""
+    _event_log_options.update(options)
+
+
+def get_event_log():
+    """Return the shared EventLog, creating it on first use"""
+    global _event_log
+    with _event_log_lock:
+        if _event_log is None:
+            _event_log = EventLog(**_event_log_options)
+        return _event_log
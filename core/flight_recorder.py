@@ -0,0 +1,257 @@
+"""
+Flight recorder for raw scans and sensor records.
+
+Continuous logging only keeps averaged rows. The flight recorder keeps the
+raw material of the last `seconds` seconds in memory: every scan (its
+read-only spectrum array, shared with the other consumers of the scan, see
+core.spectrum) and every record published to the state store (motor,
+filter wheel, IMU, THP, TEC, ...). When triggered it dumps that history to a
+.npz file:
+
+    recorder = FlightRecorder(directory)
+    recorder.attach()                           # state store + event log
+    spec_ctrl.scan_signal.connect(recorder.add_scan)
+    recorder.trigger("manual")
+
+Triggers are manual, the `recorder dump` routine command, or automatic:
+`saturation_scans` consecutive saturated scans, a TEC temperature more than
+`tec_excursion_c` from its setpoint, or one of the `trigger_events`
+("component:code", e.g. a spectrometer recovery). A dump also covers the
+`post_trigger_s` seconds after the trigger; further triggers in that time are
+merged into it, and automatic triggers are ignored for `cooldown_s` after a
+dump. The dump is rendered and written on the background file writer thread,
+so triggering never blocks the caller.
+
+Memory is bounded by max_scans spectra (max_scans * pixels * 4 bytes, 16 MB
+for the defaults, 2048 pixels and float32 spectra; twice that with float64)
+and max_samples sensor records.
+
+load_flight_record() reads a dump back.
+"""
+import io
+import os
+import json
+import time
+import threading
+import dataclasses
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+
+from storage.file_writer import get_file_writer
+from core.state_store import get_state_store, TECState
+from core.event_log import EventSource, get_event_log
+from core.spectrum import as_spectrum
+
+DUMP_PREFIX = "flight_"
+DUMP_EXTENSION = ".npz"
+
+_DEFAULTS = {
+    "enabled": True,
+    "seconds": 60.0,               # history kept before a trigger
+    "max_scans": 2000,             # at most this many scans, whatever the scan rate
+    "max_samples": 5000,           # at most this many sensor records
+    "post_trigger_s": 2.0,         # history after a trigger included in its dump
+    "cooldown_s": 30.0,            # automatic triggers ignored for this long after a dump
+    "saturation_counts": 65535.0,  # a scan reaching this value is saturated
+    "saturation_scans": 3,         # consecutive saturated scans that trigger a dump (0: off)
+    "tec_excursion_c": 0.0,        # TEC |temperature - setpoint| that triggers a dump (0: off)
+    "trigger_events": ["spectrometer:recovery", "spectrometer:scan_error", "spectrometer:saturation",
+                       "motor:move_failed", "motor:move_error"],
+}
+
+
+def _now():
+    return time.time()
+
+
+class FlightRecorder:
+    """Ring buffers of recent scans and sensor records, dumped to disk on a trigger"""
+
+    def __init__(self, directory, writer=None, **options):
+        self.directory = directory
+        self.options = dict(_DEFAULTS)
+        self.options.update({k: v for k, v in options.items() if v is not None})
+        self.trigger_events = set(self.options["trigger_events"])
+        self._writer = writer
+        self._lock = threading.Lock()
+        self._scans = deque(maxlen=int(self.options["max_scans"]))
+        self._samples = deque(maxlen=int(self.options["max_samples"]))
+        self._pending = None          # (path, triggers, timer) of the dump waiting for post-trigger data
+        self._last_dump = None
+        self._saturated_run = 0
+        self._tec_excursion = False
+        self._store = None
+        self._event_log = None
+        self.dumps = []               # paths of the dumps written (or being written)
+        self.ignored = 0              # automatic triggers dropped by the cooldown
+        self.events = EventSource("flight_recorder")
+
+    @property
+    def enabled(self):
+        return bool(self.options["enabled"])
+
+    def attach(self, store=None, event_log=None):
+        """Record the state store's records and trigger on the event log's trigger_events"""
+        if not self.enabled:
+            return
+        self._store = store or get_state_store()
+        self._event_log = event_log or get_event_log()
+        self._store.subscribe(self.add_sample)
+        self._event_log.subscribe(self._on_event)
+
+    def detach(self):
+        if self._store is not None:
+            self._store.unsubscribe(self.add_sample)
+            self._store = None
+        if self._event_log is not None:
+            self._event_log.unsubscribe(self._on_event)
+            self._event_log = None
+
+    def add_scan(self, scan):
+        """Slot for SpectrometerController.scan_signal (core.scan_sampler.Scan)"""
+        if not self.enabled:
+            return
+        spectrum = as_spectrum(scan.intensities)
+        with self._lock:
+            self._scans.append((scan.seq, scan.hw_timestamp, scan.host_timestamp,
+                                scan.integration_time_ms, spectrum))
+            oldest = scan.host_timestamp - self.options["seconds"]
+            while self._scans[0][2] < oldest:
+                self._scans.popleft()
+            if spectrum.size and spectrum.max() >= self.options["saturation_counts"]:
+                self._saturated_run += 1
+            else:
+                self._saturated_run = 0
+            saturated = self._saturated_run == self.options["saturation_scans"]
+        if saturated:
+            self.trigger("saturation", automatic=True, scan=scan.seq)
+
+    def add_sample(self, record):
+        """State store listener: keep the record and check the TEC excursion trigger"""
+        with self._lock:
+            self._samples.append(record)
+            oldest = record.timestamp - self.options["seconds"]
+            while self._samples[0].timestamp < oldest:
+                self._samples.popleft()
+        limit = self.options["tec_excursion_c"]
+        if limit and isinstance(record, TECState) and record.connected:
+            excursion = abs(record.current_temp - record.setpoint) > limit
+            if excursion and not self._tec_excursion:
+                self.trigger("tec_excursion", automatic=True,
+                             temperature=record.current_temp, setpoint=record.setpoint)
+            self._tec_excursion = excursion
+
+    def _on_event(self, event):
+        if f"{event.component}:{event.code}" in self.trigger_events:
+            self.trigger(f"{event.component}:{event.code}", automatic=True, message=event.message)
+
+    def trigger(self, reason, automatic=False, **info):
+        """Dump the recorded history; returns the dump's path, or None if it was ignored.
+
+        The dump is written post_trigger_s seconds later (at once if 0), on the
+        file writer thread.
+        """
+        if not self.enabled:
+            return None
+        now = _now()
+        entry = dict(info, reason=reason, time=now, automatic=automatic)
+        with self._lock:
+            if self._pending is not None:
+                self._pending[1].append(entry)
+                return self._pending[0]
+            if automatic and self._last_dump is not None and now - self._last_dump < self.options["cooldown_s"]:
+                self.ignored += 1
+                return None
+            self._last_dump = now
+            stamp = datetime.fromtimestamp(now).strftime("%Y%m%d_%H%M%S_%f")[:-3]
+            label = "".join(c if c.isalnum() else "_" for c in reason)
+            path = os.path.join(self.directory, f"{DUMP_PREFIX}{stamp}_{label}{DUMP_EXTENSION}")
+            delay = float(self.options["post_trigger_s"])
+            timer = threading.Timer(delay, self._dump) if delay > 0 else None
+            self._pending = (path, [entry], timer)
+            self.dumps.append(path)
+        self.events.warning("triggered", f"Flight recorder: {reason}, dumping to {os.path.basename(path)}",
+                            reason=reason, path=path)
+        if timer is None:
+            self._dump()
+        else:
+            timer.daemon = True
+            timer.start()
+        return path
+
+    def _dump(self):
+        """Hand the pending dump to the writer thread (runs on the timer thread)"""
+        with self._lock:
+            if self._pending is None:
+                return
+            path, triggers, _ = self._pending
+            self._pending = None
+            scans = list(self._scans)
+            samples = list(self._samples)
+        timestamps = [s[2] for s in scans] + [r.timestamp for r in samples]
+        catalog = {"kind": "flight_record", "rows": len(scans),
+                   "first_timestamp": min(timestamps) if timestamps else None,
+                   "last_timestamp": max(timestamps) if timestamps else None}
+        os.makedirs(self.directory, exist_ok=True)
+        (self._writer or get_file_writer()).write_file(
+            path, lambda: _render(scans, samples, triggers, self.options), mode="wb",
+            callback=self._on_written, catalog=catalog)
+
+    def _on_written(self, path, error):
+        """Writer-thread callback for _dump"""
+        if error is None:
+            self.events.info("dumped", f"Flight recorder dump saved to {path}", path=path)
+        else:
+            self.events.error("dump_failed", f"Flight recorder dump failed: {error}", path=path, error=str(error))
+
+    def flush(self):
+        """Write the pending dump now instead of after the post-trigger time"""
+        with self._lock:
+            timer = self._pending[2] if self._pending is not None else None
+        if timer is not None:
+            timer.cancel()
+        self._dump()
+
+    def close(self):
+        self.flush()
+        self.detach()
+
+
+def _render(scans, samples, triggers, options):
+    """The .npz bytes of a dump"""
+    npix = max((s[4].size for s in scans), default=0)
+    dtype = np.result_type(np.float32, *{s[4].dtype for s in scans})
+    spectra = np.full((len(scans), npix), np.nan, dtype=dtype)
+    for row, scan in enumerate(scans):
+        spectra[row, :scan[4].size] = scan[4]
+    sensors = [json.dumps(dict(dataclasses.asdict(r), kind=r.KEY), default=str) for r in samples]
+    meta = {"triggers": triggers, "options": options, "scans": len(scans), "samples": len(samples)}
+    buffer = io.BytesIO()
+    np.savez(buffer,
+             seq=np.array([s[0] for s in scans], dtype=np.int64),
+             hw_timestamp=np.array([s[1] for s in scans], dtype=np.float64),
+             host_timestamp=np.array([s[2] for s in scans], dtype=np.float64),
+             integration_time_ms=np.array([s[3] for s in scans], dtype=np.float64),
+             spectra=spectra,
+             sensors=np.array(sensors, dtype=str),
+             meta=np.array(json.dumps(meta, default=str)))
+    return buffer.getvalue()
+
+
+def load_flight_record(path):
+    """Contents of a dump as a dict.
+
+    Keys: seq, hw_timestamp, host_timestamp, integration_time_ms (per scan),
+    spectra (scans x pixels float32, or float64 if recorded so, NaN-padded), sensors (list of record
+    dicts with a "kind" key, oldest first), triggers and options.
+    """
+    with np.load(path, allow_pickle=False) as data:
+        record = {name: data[name] for name in ("seq", "hw_timestamp", "host_timestamp",
+                                                "integration_time_ms", "spectra")}
+        record["sensors"] = [json.loads(s) for s in data["sensors"]]
+        meta = json.loads(str(data["meta"]))
+    record["triggers"] = meta["triggers"]
+    record["options"] = meta["options"]
+    return record
@@ -0,0 +1,254 @@
+"""
+Replay of recorded sessions through the live data pipeline.
+
+A Recording holds scans and the sensor state records that were current
+around them, loaded from a continuous scan log (archive, CSV or segment
+index, see storage.scan_reader) or a flight recorder dump:
+
+    recording = load_recording("data/Scans_20250611_113227_mini_index.json", start=t0, end=t1)
+    replayer = Replayer(recording, on_scan=spec_ctrl.replay_signal.emit, speed=10.0)
+    replayer.start()
+
+The Replayer publishes the records to the state store and passes each scan
+(a core.scan_sampler.Scan) to on_scan, the same interfaces the hardware
+controllers use, either paced like the original session (scaled by speed)
+or, with speed=None, as fast as possible. By default timestamps are moved to
+the replay's own clock so components that compare them with time.time()
+behave as they do live; rebase=False keeps the recorded timestamps, which
+makes runs repeatable.
+
+A logged row is the average of several scans, so a scan log replays as one
+scan per row; its sensor values become records timestamped when they were
+read (the row time minus the logged age) and are published when they
+change. Flight recorder dumps replay their raw scans and records as they were.
+"""
+import time
+import math
+import threading
+import dataclasses
+from dataclasses import dataclass
+
+import numpy as np
+
+from core.state_store import (get_state_store, MotorState, FilterWheelState, IMUState,
+                              THPState, TECState, SpectrometerState, RoutineState)
+from core.scan_sampler import Scan
+
+_RECORD_TYPES = {cls.KEY: cls for cls in (MotorState, FilterWheelState, IMUState, THPState,
+                                           TECState, SpectrometerState, RoutineState)}
+_EMPTY = {"imu": IMUState(), "thp": THPState(), "tec": TECState(connected=True)}
+
+
+class Recording:
+    """Scans (metadata arrays plus a scans x pixels float32 array) and timestamped state records"""
+
+    def __init__(self, seq, hw_timestamp, timestamp, integration_time_ms, spectra, records=()):
+        self.seq = np.asarray(seq, dtype=np.int64)
+        self.hw_timestamp = np.asarray(hw_timestamp, dtype=np.float64)
+        self.timestamp = np.asarray(timestamp, dtype=np.float64)
+        self.integration_time_ms = np.asarray(integration_time_ms, dtype=np.float64)
+        self.spectra = spectra
+        self.records = sorted(records, key=lambda r: r.timestamp)
+
+    def __len__(self):
+        return len(self.seq)
+
+    @property
+    def duration(self):
+        times = self.timestamp.tolist() + [r.timestamp for r in self.records]
+        return max(times) - min(times) if times else 0.0
+
+    def steps(self):
+        """(timestamp, record or scan index) in replay order; records go before a scan at the same time"""
+        steps = [(r.timestamp, 0, r) for r in self.records]
+        steps += [(t, 1, i) for i, t in enumerate(self.timestamp.tolist())]
+        steps.sort(key=lambda s: (s[0], s[1]))
+        return [(t, item) for t, _, item in steps]
+
+
+@dataclass
+class ReplayStats:
+    scans: int = 0
+    records: int = 0
+    recorded_s: float = 0.0      # span of the replayed data
+    elapsed_s: float = 0.0       # wall time the replay took
+    max_lag_s: float = 0.0       # furthest behind schedule (paced replays)
+
+    @property
+    def scans_per_s(self):
+        return self.scans / self.elapsed_s if self.elapsed_s else 0.0
+
+    @property
+    def speed(self):
+        """Achieved replay speed relative to the original session"""
+        return self.recorded_s / self.elapsed_s if self.elapsed_s else 0.0
+
+
+class Replayer:
+    """Feeds a Recording to on_scan and the state store"""
+
+    def __init__(self, recording, on_scan=None, store=None, speed=1.0, rebase=True, loop=False):
+        self.recording = recording
+        self.on_scan = on_scan
+        self.store = store or get_state_store()
+        self.speed = speed
+        self.rebase = rebase
+        self.loop = loop
+        self.stats = ReplayStats()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run(self):
+        """Replay on the calling thread until done (or stopped); returns the ReplayStats"""
+        self.stats = ReplayStats()
+        steps = self.recording.steps()
+        if not steps:
+            return self.stats
+        spectra = self.recording.spectra
+        seq, hw, integration = self.recording.seq, self.recording.hw_timestamp, self.recording.integration_time_ms
+        paced = bool(self.speed)
+        t0 = steps[0][0]
+        started = time.perf_counter()
+        base = time.time()
+        offset = 0.0                  # recorded time of earlier loop passes
+        while True:
+            for t, item in steps:
+                if self._stop.is_set():
+                    break
+                recorded = offset + t - t0
+                if paced:
+                    due = started + recorded / self.speed
+                    delay = due - time.perf_counter()
+                    if delay > 0:
+                        self._stop.wait(delay)
+                    else:
+                        self.stats.max_lag_s = max(self.stats.max_lag_s, -delay)
+                stamp = base + (recorded / self.speed if paced else recorded) if self.rebase else t
+                if isinstance(item, int):
+                    if self.on_scan is not None:
+                        self.on_scan(Scan(seq=int(seq[item]), hw_timestamp=float(hw[item]),
+                                          host_timestamp=stamp, integration_time_ms=float(integration[item]),
+                                          intensities=spectra[item]))
+                    self.stats.scans += 1
+                else:
+                    self.store.publish(dataclasses.replace(item, timestamp=stamp) if self.rebase else item)
+                    self.stats.records += 1
+            offset += steps[-1][0] - t0
+            if not self.loop or self._stop.is_set():
+                break
+        self.stats.recorded_s = offset
+        self.stats.elapsed_s = time.perf_counter() - started
+        return self.stats
+
+    def start(self):
+        """Replay on a background thread"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="Replayer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+
+def load_recording(source, start=None, end=None, **filters):
+    """Recording of a scan log (see storage.scan_reader.read_scans) or a flight recorder dump (.npz)"""
+    if isinstance(source, str) and source.endswith(".npz"):
+        return _load_flight_record(source, start, end)
+    from storage.scan_reader import read_scans
+    return recording_from_scans(read_scans(source, start=start, end=end, **filters))
+
+
+def _load_flight_record(path, start, end):
+    from core.flight_recorder import load_flight_record
+    dump = load_flight_record(path)
+    keep = np.ones(len(dump["seq"]), dtype=bool)
+    if start is not None:
+        keep &= dump["host_timestamp"] >= start
+    if end is not None:
+        keep &= dump["host_timestamp"] <= end
+    records = []
+    for sample in dump["sensors"]:
+        cls = _RECORD_TYPES.get(sample.pop("kind", None))
+        if cls is None:
+            continue
+        names = {f.name for f in dataclasses.fields(cls)}
+        values = {k: tuple(v) if isinstance(v, list) else v for k, v in sample.items() if k in names}
+        records.append(cls(**values))
+    records = [r for r in records if (start is None or r.timestamp >= start) and (end is None or r.timestamp <= end)]
+    spectra = dump["spectra"][keep]
+    return Recording(dump["seq"][keep], dump["hw_timestamp"][keep], dump["host_timestamp"][keep],
+                     dump["integration_time_ms"][keep], spectra, records)
+
+
+def recording_from_scans(data):
+    """Recording of a storage.scan_reader.ScanData, one scan per logged row"""
+    meta = data.meta
+    seq = np.where(meta["scan_first"] > 0, meta["scan_first"], np.arange(1, len(meta) + 1))
+    records = _records_from_meta(meta, data.wavelengths)
+    return Recording(seq, meta["timestamp"], meta["timestamp"], meta["integration_time"], data.spectra, records)
+
+
+def _finite(value):
+    return value is not None and not math.isnan(value)
+
+
+def _records_from_meta(meta, wavelengths):
+    """State records implied by the logged rows, emitted when a value or reading time changes"""
+    wavelengths = tuple(float(w) for w in wavelengths) if np.any(wavelengths) else ()
+    records = []
+    last = {}
+
+    def emit(key, values, record):
+        if last.get(key) != values:
+            last[key] = values
+            records.append(record)
+
+    for row in meta.tolist():
+        row = dict(zip(meta.dtype.names, row))
+        t = row["timestamp"]
+        angle = float(row["motor_angle"])
+        angle = angle if _finite(angle) else None
+        emit("motor", angle, MotorState(angle_deg=angle, connected=angle is not None, timestamp=t))
+        position = int(row["filter_pos"])
+        position = position if position >= 0 else None
+        emit("filter_wheel", position, FilterWheelState(position=position, connected=position is not None,
+                                                        timestamp=t))
+        emit("spectrometer", float(row["integration_time"]),
+             SpectrometerState(integration_time_ms=float(row["integration_time"]), wavelengths=wavelengths,
+                               measuring=True, timestamp=t))
+        code = row["routine_code"].decode("ascii", "replace") if isinstance(row["routine_code"], bytes) \
+            else str(row["routine_code"])
+        emit("routine", code, RoutineState(name=code if code != "XX" else None, running=code != "XX", timestamp=t))
+
+        imu = IMUState(roll=row["roll"], pitch=row["pitch"], yaw=row["yaw"],
+                       accel=(row["accel_x"], row["accel_y"], row["accel_z"]),
+                       mag=(row["mag_x"], row["mag_y"], row["mag_z"]),
+                       pressure=row["pressure"], temperature=row["temp_env"],
+                       latitude=row["latitude"], longitude=row["longitude"],
+                       timestamp=_read_time(t, row["imu_age"]))
+        thp = THPState(temperature=row["thp_temp"], humidity=row["thp_hum"], pressure=row["thp_pres"],
+                       timestamp=_read_time(t, row["thp_age"]))
+        tec = TECState(current_temp=row["tec_current"], setpoint=row["tec_setpoint"],
+                       auxiliary_temp=row["spec_temp"], connected=True, timestamp=_read_time(t, row["tec_age"]))
+        for key, record, age in (("imu", imu, row["imu_age"]), ("thp", thp, row["thp_age"]),
+                                 ("tec", tec, row["tec_age"])):
+            if _finite(age):
+                # A new reading is a new read time
+                emit(key, round(record.timestamp, 3), record)
+            else:
+                # Logs without ages: a change of value, unless the sensor never reported (all zeros)
+                values = dataclasses.replace(record, timestamp=0)
+                if values != dataclasses.replace(_EMPTY[key], timestamp=0):
+                    emit(key, values, record)
+    return records
+
+
+def _read_time(t, age):
+    return t - float(age) if _finite(age) else t
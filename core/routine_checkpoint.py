@@ -0,0 +1,111 @@
+"""
+Checkpoints of a running routine, to resume it after a crash or a stop.
+
+After every completed step the RoutineManager replaces a small JSON file
+with a Checkpoint: the routine file and the SHA-256 of its compiled
+content, the index of the next instruction, the state the routine left
+the devices in and where the run's files go:
+
+    save_checkpoint(path, checkpoint)       # atomic: the old or the new file, never half of one
+    checkpoint = load_checkpoint(path)      # None when there is none (or it is unreadable)
+    checkpoint.restore_commands(program.devices)   # routine lines that re-establish the device state
+
+Loops, variables and sub-routines are expanded when a routine is compiled
+(core.routine_compiler), so the instruction index alone fixes the position
+in every loop; a routine whose file changed since (another digest) is not
+resumed. Concurrent (async) commands still running are not a completed
+step: the checkpoint stays at the last point where none was.
+"""
+import json
+import os
+import time
+from dataclasses import dataclass, asdict, fields
+from typing import Optional
+
+from core.routine_compiler import MOTOR, FILTER_WHEEL, SPECTROMETER, TEMPERATURE
+
+CHECKPOINT_VERSION = 1
+
+
+@dataclass(frozen=True)
+class Checkpoint:
+    routine: str                        # path of the routine file
+    name: str                           # routine name, as in the data directory
+    digest: str                         # SHA-256 of the routine file the run compiled
+    next_index: int                     # instruction to continue with
+    total: int                          # instructions of the program
+    line: int = 0                       # routine file line of the next instruction (0 at the end)
+    start_time: str = ""                # the run's start (yyyyMMdd_hhmmss), naming its snapshot directory
+    saved: float = 0.0                  # epoch seconds
+    motor_angle: Optional[float] = None
+    filter_pos: Optional[int] = None
+    integration_ms: Optional[float] = None
+    measuring: bool = False
+    setpoint: Optional[float] = None    # last temperature the routine set
+    data_saving: bool = False           # continuous data saving was on
+    data_index: Optional[str] = None    # segment index of that data session
+
+    def restore_commands(self, devices):
+        """Routine lines that put the devices of the routine back in the recorded state"""
+        lines = []
+        if TEMPERATURE in devices and self.setpoint is not None:
+            lines.append(f"temperature set {self.setpoint:g}")
+        if SPECTROMETER in devices and self.integration_ms:
+            lines.append(f"integration {self.integration_ms:g}")
+        moves = []
+        if FILTER_WHEEL in devices and self.filter_pos is not None:
+            moves.append(f"filter position {self.filter_pos}")
+        if MOTOR in devices and self.motor_angle is not None:
+            moves.append(f"motor move {self.motor_angle:g}")
+        if len(moves) > 1:
+            lines.append(f"parallel {{ {'; '.join(moves)} }}")
+        else:
+            lines.extend(moves)
+        if SPECTROMETER in devices and self.measuring:
+            lines.append("spectrometer start")
+        if self.data_saving:
+            lines.append("data start")
+        return lines
+
+    def describe(self):
+        """"OO at line 24 (step 12/30), saved 14:02:11" """
+        where = f"line {self.line}" if self.line else "the end"
+        return (f"{self.name} at {where} (step {self.next_index + 1}/{self.total}), "
+                f"saved {time.strftime('%H:%M:%S', time.localtime(self.saved))}")
+
+
+def save_checkpoint(path, checkpoint):
+    """Replace the checkpoint file; synced to the disk, so it survives a power loss"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(dict(asdict(checkpoint), version=CHECKPOINT_VERSION), f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def load_checkpoint(path):
+    """The Checkpoint in path, or None"""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("version") != CHECKPOINT_VERSION:
+            raise ValueError(f"version {data.get('version')} is not supported")
+        names = {field.name for field in fields(Checkpoint)}
+        return Checkpoint(**{key: value for key, value in data.items() if key in names})
+    except (OSError, ValueError, TypeError, AttributeError) as e:
+        print(f"Routine: cannot read checkpoint {path}: {e}")
+        return None
+
+
+def clear_checkpoint(path):
+    if path and os.path.exists(path):
+        try:
+            os.remove(path)
+        except OSError as e:
+            print(f"Routine: cannot remove checkpoint {path}: {e}")
@@ -0,0 +1,547 @@
+"""
+Compiler for routine files.
+
+A routine file holds one command per line. compile_routine() parses it once
+into a Program: a tuple of Instructions, each with the line it came from, an
+operation name ("motor.move"), its arguments converted to their types and the
+device it drives. All errors (unknown commands, missing, extra or malformed
+arguments, values out of range) are collected with their line numbers and
+raised together as a RoutineCompileError, before any hardware moves:
+
+    program = compile_file("routines/OO.txt")      # cached by content hash
+    missing = check_devices(program, {"motor", "filter_wheel", "spectrometer"})
+    for instruction in program:
+        handlers[instruction.op](*instruction.args)
+
+Keywords are case-insensitive. A "#" at the start of a line or after
+whitespace starts a comment ("filter position 2 # Open"); blank lines are
+ignored.
+
+Independent devices can work concurrently. "async <command>" issues a
+command without waiting for it to complete; "sync" waits until every
+concurrent command has. A parallel block is shorthand for async commands
+followed by a sync, on one line (commands separated by ";") or several:
+
+    parallel { motor move 45; filter position 1 }
+    parallel {
+        motor move 90
+        filter position 2
+    }
+
+Concurrent instructions are compiled with background=True and each block
+ends with a "sync" instruction. A device busy with a concurrent command may
+not be used again before the next sync, and a routine ending with concurrent
+commands still running gets a final sync.
+
+Repeated blocks are written once with variables, loops and sub-routines,
+which are expanded into the flat instruction stream when the routine is
+compiled (nothing of them is left at run time):
+
+    set prefix = OOD
+    def snapshot filter name {
+        filter position ${filter}
+        spectrometer save_snapshot ${name}_${angle}.csv
+    }
+    for angle in 0 45 90 135 {              # or: for angle in range 0 180 45
+        motor move ${angle}
+        call snapshot 1 Opaque
+        log ${prefix} done at ${angle}
+    }
+
+"${name}" is replaced by the value of a variable (set, a loop variable or a
+sub-routine parameter). "range <start> <stop> [step]" counts from start up
+to, not including, stop. A sub-routine sees the caller's variables and its
+parameters; "set" inside it does not change the caller's. Sub-routines are
+defined at the top level, anywhere in the file, and checked where called.
+Loops and sub-routines may contain parallel blocks, but a parallel block
+cannot contain a loop.
+"""
+import difflib
+import hashlib
+import math
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from typing import Any, Callable, Optional, Tuple
+
+# Devices an instruction may need; the executor decides which are available
+MOTOR = "motor"
+FILTER_WHEEL = "filter_wheel"
+SPECTROMETER = "spectrometer"
+TEMPERATURE = "temperature"
+CAMERA = "camera"
+FLIGHT_RECORDER = "flight_recorder"
+
+_CACHE_SIZE = 32
+MAX_EXPANDED = 100000             # commands a routine may expand to
+
+
+@dataclass(frozen=True)
+class Arg:
+    name: str
+    parse: Callable[[str], Any] = str
+    low: Optional[float] = None
+    high: Optional[float] = None
+    rest: bool = False            # takes the rest of the line as text
+    optional: bool = False
+
+
+@dataclass(frozen=True)
+class Command:
+    op: str                       # operation name the executor dispatches on
+    words: Tuple[str, ...]        # keywords, lower case
+    args: Tuple[Arg, ...] = ()
+    device: Optional[str] = None
+
+    @property
+    def syntax(self):
+        parts = list(self.words)
+        for arg in self.args:
+            parts.append(f"[{arg.name}]" if arg.optional else f"<{arg.name}>")
+        return " ".join(parts)
+
+
+COMMANDS = (
+    Command("log", ("log",), (Arg("message", rest=True, optional=True),)),
+    Command("wait", ("wait",), (Arg("time_ms", int, low=0),)),
+    Command("integration", ("integration",), (Arg("time_ms", float, 1, 4000),), SPECTROMETER),
+    Command("plot", ("plot",), (), SPECTROMETER),
+    Command("motor.move", ("motor", "move"), (Arg("angle", float),), MOTOR),
+    Command("filter.position", ("filter", "position"), (Arg("position", int, 1, 6),), FILTER_WHEEL),
+    Command("spectrometer.start", ("spectrometer", "start"), (), SPECTROMETER),
+    Command("spectrometer.stop", ("spectrometer", "stop"), (), SPECTROMETER),
+    Command("spectrometer.save", ("spectrometer", "save"), (), SPECTROMETER),
+    Command("spectrometer.save_snapshot", ("spectrometer", "save_snapshot"), (Arg("filename"),), SPECTROMETER),
+    Command("data.start", ("data", "start")),
+    Command("data.stop", ("data", "stop")),
+    Command("recorder.dump", ("recorder", "dump"), (Arg("label", rest=True, optional=True),), FLIGHT_RECORDER),
+    Command("camera.save_image", ("camera", "save_image"), (Arg("filename"),), CAMERA),
+    Command("temperature.set", ("temperature", "set"), (Arg("celsius", float, 15, 40),), TEMPERATURE),
+    Command("sync", ("sync",)),
+)
+
+# Keywords handled by compile_routine rather than the COMMANDS table
+_KEYWORDS = ("async", "parallel", "set", "for", "def", "call")
+_PARALLEL = re.compile(r"parallel\s*\{(.*)$", re.IGNORECASE)
+_FOR = re.compile(r"for\s+(\w+)\s+in\s+(.*?)\s*\{$", re.IGNORECASE)
+_DEF = re.compile(r"def\s+(\w+)((?:\s+\w+)*)\s*\{$", re.IGNORECASE)
+_SET = re.compile(r"set\s+(\w+)\s*=\s*(.*)$", re.IGNORECASE)
+_CALL = re.compile(r"call\s+(\w+)(.*)$", re.IGNORECASE)
+_VARIABLE = re.compile(r"\$\{(\w+)\}")
+
+
+@dataclass(frozen=True)
+class Instruction:
+    line: int                     # 1-based line number in the routine file
+    op: str
+    args: Tuple[Any, ...] = ()
+    text: str = ""                # the command as written, without its comment
+    device: Optional[str] = None
+    background: bool = False      # issued without waiting for completion (async / parallel)
+
+
+@dataclass(frozen=True)
+class Program:
+    instructions: Tuple[Instruction, ...]
+    source: Optional[str] = None  # path of the routine file
+    digest: str = ""              # SHA-256 of the file's bytes
+
+    def __len__(self):
+        return len(self.instructions)
+
+    def __iter__(self):
+        return iter(self.instructions)
+
+    def __getitem__(self, index):
+        return self.instructions[index]
+
+    @property
+    def devices(self):
+        return frozenset(i.device for i in self.instructions if i.device)
+
+
+@dataclass(frozen=True)
+class CompileError:
+    line: int
+    message: str
+    text: str = ""
+
+
+class RoutineCompileError(ValueError):
+    """A routine file with errors; errors lists every CompileError found"""
+
+    def __init__(self, errors, source=None):
+        self.errors = list(errors)
+        self.source = source
+        name = source or "routine"
+        super().__init__("\n".join(f"{name}:{e.line}: {e.message}" for e in self.errors))
+
+
+def strip_comment(line):
+    """line without its comment ("#" at the start or after whitespace) and surrounding whitespace"""
+    for i, char in enumerate(line):
+        if char == "#" and (i == 0 or line[i - 1].isspace()):
+            return line[:i].strip()
+    return line.strip()
+
+
+def _by_keywords():
+    table = {}
+    for command in COMMANDS:
+        table.setdefault(command.words[0], []).append(command)
+    return table
+
+
+_TABLE = _by_keywords()
+
+
+def _suggest(word, choices):
+    close = difflib.get_close_matches(word, choices, n=1)
+    return f" (did you mean '{close[0]}'?)" if close else ""
+
+
+def _convert(arg, token):
+    """Value of token for arg; raises ValueError with a message"""
+    try:
+        value = arg.parse(token)
+    except ValueError:
+        kind = {int: "an integer", float: "a number"}.get(arg.parse, "a value")
+        raise ValueError(f"{arg.name} must be {kind}, got '{token}'")
+    if isinstance(value, float) and not math.isfinite(value):
+        raise ValueError(f"{arg.name} must be finite, got '{token}'")
+    if (arg.low is not None and value < arg.low) or (arg.high is not None and value > arg.high):
+        bounds = f"{arg.low:g} to {arg.high:g}" if arg.high is not None else f">= {arg.low:g}"
+        raise ValueError(f"{arg.name} must be {bounds}, got '{token}'")
+    return value
+
+
+def parse_line(number, line):
+    """Instruction for one source line, None for blank and comment lines; raises ValueError"""
+    text = strip_comment(line)
+    if not text:
+        return None
+    tokens = text.split()
+    candidates = _TABLE.get(tokens[0].lower())
+    if candidates is None:
+        raise ValueError(f"unknown command '{tokens[0]}'"
+                         f"{_suggest(tokens[0].lower(), list(_TABLE) + list(_KEYWORDS))}")
+    command = None
+    for candidate in candidates:
+        words = [t.lower() for t in tokens[:len(candidate.words)]]
+        if tuple(words) == candidate.words:
+            command = candidate
+            break
+    if command is None:
+        subcommands = [c.words[1] for c in candidates]
+        given = tokens[1] if len(tokens) > 1 else ""
+        if not given:
+            raise ValueError(f"'{tokens[0]}' needs one of: {', '.join(subcommands)}")
+        raise ValueError(f"unknown {tokens[0].lower()} command '{given}'{_suggest(given.lower(), subcommands)}")
+    rest = tokens[len(command.words):]
+    args = []
+    for i, arg in enumerate(command.args):
+        if arg.rest:
+            # Text arguments keep the line's own spacing and case
+            remainder = text.split(None, len(command.words))[len(command.words):]
+            args.append(remainder[0].strip() if remainder else "")
+            rest = []
+            break
+        if i >= len(rest):
+            if arg.optional:
+                break
+            raise ValueError(f"missing {arg.name} (usage: {command.syntax})")
+        args.append(_convert(arg, rest[i]))
+    else:
+        extra = rest[len(command.args):]
+        if extra:
+            raise ValueError(f"unexpected argument '{extra[0]}' (usage: {command.syntax})")
+    return Instruction(line=number, op=command.op, args=tuple(args), text=text, device=command.device)
+
+
+class _Compilation:
+    """State of compile_routine while it walks the lines"""
+
+    def __init__(self):
+        self.instructions = []
+        self.errors = []
+        self.busy = {}            # device -> line of the concurrent command still running on it
+        self.concurrent = False   # a concurrent command was issued since the last sync
+
+    def statement(self, number, text, background=False):
+        """Compile one command; errors are collected"""
+        try:
+            instruction = parse_line(number, text)
+            if instruction is None:
+                if background:
+                    raise ValueError("'async' needs a command")
+                return
+            if instruction.op == "sync":
+                if background:
+                    raise ValueError("'sync' cannot run concurrently")
+                self.busy.clear()
+                self.concurrent = False
+            elif instruction.device in self.busy:
+                raise ValueError(f"{instruction.device} is still busy with line {self.busy[instruction.device]} "
+                                 f"(add 'sync' before this command)")
+            if background:
+                instruction = replace(instruction, background=True)
+                self.concurrent = True
+                if instruction.device:
+                    self.busy[instruction.device] = number
+            self.instructions.append(instruction)
+        except ValueError as e:
+            self.errors.append(CompileError(number, str(e), text))
+
+    def block(self, number, body):
+        """Commands of a parallel block separated by ";"; returns True if body closes the block"""
+        closed = _closes_block(body)
+        if closed:
+            body = body.rstrip()[:-1]
+        for text in body.split(";"):
+            if text.strip().lower().startswith("parallel"):
+                self.errors.append(CompileError(number, "parallel blocks cannot be nested", text.strip()))
+            elif text.strip():
+                self.statement(number, text.strip(), background=True)
+        if closed:
+            self.statement(number, "sync")
+        return closed
+
+
+@dataclass
+class _Block:
+    kind: str                     # "for", "def" or "parallel"
+    line: int
+    header: Tuple[str, ...]       # ("angle", "0 45 90") for a loop, ("name", "param", ...) for a def
+    body: list                    # (line, code) statements and nested _Blocks
+
+
+def _closes_block(code):
+    """Whether code ends with the "}" of a block, not of a "${name}" """
+    return _VARIABLE.sub("", code).rstrip().endswith("}")
+
+
+def _parse_blocks(text, errors):
+    """(statements and loops of the routine, {name: def _Block}); parallel blocks are kept as statements"""
+    root, stack, defs = [], [], {}
+    for number, line in enumerate(text.splitlines(), start=1):
+        code = strip_comment(line)
+        if not code:
+            continue
+        top = stack[-1] if stack else None
+        body = top.body if top is not None else root
+        if top is not None and top.kind == "parallel":
+            match = _FOR.match(code) or _DEF.match(code)
+            if match:
+                # Reported, and its lines up to its "}" skipped, so that they do not close the block
+                kind = code.split()[0].lower()
+                errors.append(CompileError(number, f"'{kind}' cannot be used inside a parallel block", code))
+                stack.append(_Block(kind, number, (), []))
+                continue
+            body.append((number, code))
+            if _closes_block(code):
+                stack.pop()
+            continue
+        if code == "}" and top is not None:
+            stack.pop()
+            continue
+        match = _FOR.match(code)
+        if match:
+            block = _Block("for", number, match.groups(), [])
+            body.append(block)
+            stack.append(block)
+            continue
+        match = _DEF.match(code)
+        if match:
+            name = match.group(1)
+            block = _Block("def", number, (name,) + tuple(match.group(2).split()), [])
+            if stack:
+                errors.append(CompileError(number, "'def' is only allowed at the top level", code))
+            elif name in defs:
+                errors.append(CompileError(number, f"'{name}' is already defined on line {defs[name].line}", code))
+            else:
+                defs[name] = block
+            stack.append(block)
+            continue
+        body.append((number, code))
+        if _PARALLEL.match(code) and not _closes_block(code):
+            # Its lines stay statements of the enclosing body, for compile_routine to group
+            stack.append(_Block("parallel", number, (), body))
+    for block in stack:
+        if block.kind != "parallel":
+            errors.append(CompileError(block.line, f"'{block.kind}' is not closed with '}}'", block.kind))
+    return root, defs
+
+
+def _loop_values(spec):
+    """Values of a loop: the words of spec, or the numbers of 'range <start> <stop> [step]'"""
+    words = spec.split()
+    if not words:
+        raise ValueError("'for' needs values to loop over")
+    if words[0].lower() != "range":
+        return words
+    try:
+        numbers = [float(word) for word in words[1:]]
+    except ValueError:
+        raise ValueError(f"range needs numbers, got '{' '.join(words[1:])}'")
+    if len(numbers) not in (2, 3):
+        raise ValueError("usage: range <start> <stop> [step]")
+    start, stop = numbers[:2]
+    step = numbers[2] if len(numbers) == 3 else 1.0
+    if step == 0:
+        raise ValueError("range step must not be 0")
+    count = max(0, math.ceil((stop - start) / step))
+    if count > MAX_EXPANDED:
+        raise ValueError(f"range has more than {MAX_EXPANDED} values")
+    values = []
+    for i in range(count):
+        value = round(start + i * step, 10)
+        values.append(str(int(value)) if value == int(value) else repr(value))
+    return values
+
+
+class _Expander:
+    """Flattens variables, loops and sub-routine calls into (line, code) statements"""
+
+    def __init__(self, defs, errors):
+        self.defs = defs
+        self.errors = errors
+        self.lines = []
+        self.calls = []           # names of the sub-routines being expanded
+
+    def error(self, number, message, code):
+        error = CompileError(number, message, code)
+        if error not in self.errors:  # a loop body repeats its errors
+            self.errors.append(error)
+
+    def substitute(self, code, variables):
+        def value(match):
+            name = match.group(1)
+            if name not in variables:
+                raise ValueError(f"unknown variable '{name}'{_suggest(name, list(variables))}")
+            return variables[name]
+        return _VARIABLE.sub(value, code)
+
+    def expand(self, nodes, variables):
+        for node in nodes:
+            if len(self.lines) > MAX_EXPANDED:
+                return
+            if isinstance(node, _Block):
+                self.expand_for(node, variables)
+                continue
+            number, code = node
+            try:
+                code = self.substitute(code, variables)
+                match = _SET.match(code)
+                if match:
+                    variables[match.group(1)] = match.group(2).strip()
+                    continue
+                match = _CALL.match(code)
+                if match:
+                    self.expand_call(match.group(1), match.group(2).split(), variables)
+                    continue
+            except ValueError as e:
+                self.error(number, str(e), code)
+                continue
+            self.lines.append((number, code))
+
+    def expand_for(self, block, variables):
+        name, spec = block.header
+        try:
+            values = _loop_values(self.substitute(spec, variables))
+        except ValueError as e:
+            self.error(block.line, str(e), f"for {name} in {spec} {{")
+            return
+        for value in values:
+            variables[name] = value
+            self.expand(block.body, variables)
+
+    def expand_call(self, name, args, variables):
+        block = self.defs.get(name)
+        if block is None:
+            raise ValueError(f"unknown sub-routine '{name}'{_suggest(name, list(self.defs))}")
+        params = block.header[1:]
+        if len(args) != len(params):
+            raise ValueError(f"'{name}' takes {len(params)} argument{'s' if len(params) != 1 else ''} "
+                             f"({' '.join(params) or 'none'}), got {len(args)}")
+        if name in self.calls:
+            raise ValueError(f"'{name}' calls itself")
+        self.calls.append(name)
+        self.expand(block.body, dict(variables, **dict(zip(params, args))))
+        self.calls.pop()
+
+
+def expand_routine(text, errors):
+    """(line, code) statements of a routine's text with its variables, loops and calls expanded.
+
+    Comments and blank lines are dropped; errors are appended to errors.
+    """
+    root, defs = _parse_blocks(text, errors)
+    expander = _Expander(defs, errors)
+    expander.expand(root, {})
+    if len(expander.lines) > MAX_EXPANDED:
+        errors.append(CompileError(1, f"routine expands to more than {MAX_EXPANDED} commands"))
+    return expander.lines
+
+
+def compile_routine(text, source=None, digest=""):
+    """Program of a routine's text; raises RoutineCompileError listing every error"""
+    compilation = _Compilation()
+    block = None                  # line of the open parallel block
+    number = 0
+    for number, code in expand_routine(text, compilation.errors):
+        if block is not None:
+            if compilation.block(number, code):
+                block = None
+            continue
+        match = _PARALLEL.match(code)
+        if match:
+            if not compilation.block(number, match.group(1).strip()):
+                block = number
+            continue
+        keyword, _, rest = code.partition(" ")
+        if keyword.lower() == "async":
+            compilation.statement(number, rest.strip(), background=True)
+        elif code == "}":
+            compilation.errors.append(CompileError(number, "'}' without 'parallel {'", code))
+        else:
+            compilation.statement(number, code)
+    if block is not None:
+        compilation.errors.append(CompileError(block, "'parallel {' is not closed with '}'", "parallel {"))
+    elif compilation.concurrent:
+        # Wait for the concurrent commands still running before the routine ends
+        compilation.statement(number, "sync")
+    if compilation.errors:
+        raise RoutineCompileError(sorted(compilation.errors, key=lambda e: e.line), source)
+    return Program(tuple(compilation.instructions), source, digest)
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def compile_file(path):
+    """Program of a routine file, compiled once per distinct content"""
+    with open(path, "rb") as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()
+    with _cache_lock:
+        program = _cache.get(digest)
+        if program is not None:
+            _cache.move_to_end(digest)
+            return replace(program, source=path)
+    program = compile_routine(data.decode("utf-8", errors="replace"), path, digest)
+    with _cache_lock:
+        _cache[digest] = program
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return program
+
+
+def check_devices(program, available):
+    """{device: [line numbers]} of the program's instructions whose device is not in available"""
+    missing = {}
+    for instruction in program:
+        if instruction.device and instruction.device not in available:
+            missing.setdefault(instruction.device, []).append(instruction.line)
+    return missing
@@ -0,0 +1,127 @@
+"""
+Mean spectra of a routine run, aggregated while it runs.
+
+RoutineResults keeps, for every combination of filter position, motor
+angle and tagged state (e.g. the integration time) that the routine
+actually measured at, the running sum and count of its scans:
+
+    results = RoutineResults()
+    results.add(scan.intensities, filter_pos=2, angle=45.0, integration_ms=100)
+    ...
+    for key in results.keys():                  # ResultKey(filter_pos, angle, tags)
+        results.label(key), results.count(key), results.mean(key)
+
+so the mean spectra are ready the moment the routine ends, whatever
+positions and angles it visited. The filter position or angle is None
+when there is no such device. The first scan after the state changes is
+skipped, since it may have been integrating across the change; while the
+state is changing (motor moving, wheel turning), the caller calls
+interrupt() instead of add().
+"""
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import numpy as np
+
+ANGLE_DECIMALS = 1   # angles are grouped to 0.1°, like storage.scan_reader's default tolerance
+
+
+@dataclass(frozen=True)
+class ResultKey:
+    filter_pos: Optional[int]
+    angle: Optional[float]
+    tags: Tuple[Tuple[str, object], ...] = ()   # sorted (name, value) pairs
+
+
+class _Group:
+    __slots__ = ("count", "total")
+
+    def __init__(self, intensities):
+        self.count = 1
+        self.total = np.array(intensities, dtype=np.float64)
+
+
+class RoutineResults:
+    """Running mean spectra per (filter position, angle, tagged state)"""
+
+    def __init__(self):
+        self._groups = {}           # ResultKey -> _Group, in the order first measured
+        self._last_key = None
+        self.scans = 0              # scans averaged
+        self.skipped = 0            # scans at a changing or unknown state, or of another pixel count
+
+    @staticmethod
+    def key(filter_pos, angle, **tags):
+        return ResultKey(None if filter_pos is None else int(filter_pos),
+                         None if angle is None else round(float(angle), ANGLE_DECIMALS) + 0.0,
+                         tuple(sorted(tags.items())))
+
+    def add(self, intensities, filter_pos, angle, **tags):
+        """Add a scan measured at a state; returns whether it was averaged"""
+        key = self.key(filter_pos, angle, **tags)
+        settled, self._last_key = key == self._last_key, key
+        group = self._groups.get(key)
+        if not settled or (group is not None and len(intensities) != len(group.total)):
+            self.skipped += 1
+            return False
+        if group is None:
+            self._groups[key] = _Group(intensities)
+        else:
+            group.count += 1
+            group.total += intensities
+        self.scans += 1
+        return True
+
+    def interrupt(self):
+        """Skip a scan measured while the state changes, and the first one after"""
+        self._last_key = None
+        self.skipped += 1
+
+    def __len__(self):
+        return len(self._groups)
+
+    def __contains__(self, key):
+        return key in self._groups
+
+    def keys(self):
+        return list(self._groups)
+
+    def count(self, key):
+        return self._groups[key].count
+
+    def mean(self, key):
+        group = self._groups[key]
+        return group.total / group.count
+
+    def means(self):
+        """{ResultKey: mean spectrum}"""
+        return {key: group.total / group.count for key, group in self._groups.items()}
+
+    def sorted_keys(self):
+        """Keys by filter position, then angle (unknown first)"""
+        return sorted(self._groups, key=lambda k: (k.filter_pos is not None, k.filter_pos or 0,
+                                                   k.angle is not None, k.angle or 0.0, str(k.tags)))
+
+    def filter_positions(self):
+        return list(dict.fromkeys(key.filter_pos for key in self.sorted_keys()))
+
+    def angles(self, filter_pos=None):
+        """Angles measured (at filter_pos), in order"""
+        return list(dict.fromkeys(key.angle for key in self.sorted_keys() if key.filter_pos == filter_pos))
+
+    def varying_tags(self):
+        """Names of the tags that took more than one value during the run"""
+        values = {}
+        for key in self._groups:
+            for name, value in key.tags:
+                values.setdefault(name, set()).add(value)
+        return sorted(name for name, seen in values.items() if len(seen) > 1)
+
+    def label(self, key):
+        """"Filter 2, 45°", with the tags that varied during the run"""
+        varying = self.varying_tags()
+        parts = ([] if key.filter_pos is None else [f"Filter {key.filter_pos}"]) + \
+                ([] if key.angle is None else [f"{key.angle:g}°"]) + \
+                [f"{name} {value:g}" if isinstance(value, float) else f"{name} {value}"
+                 for name, value in key.tags if name in varying]
+        return ", ".join(parts) or "All scans"
@@ -0,0 +1,240 @@
+"""
+Dry runs of compiled routines against simulated devices.
+
+simulate() plays a Program through timing models of the motor, filter
+wheel, spectrometer and file writer in simulated time, with the completion
+rules of RoutineManager (gui.components.routine_manager): a motor move
+completes after its motion profile and two scans begun in position, a
+filter move after the wheel's confirmation and two scans, an integration
+change after the restart and a scan, a save when the file is written and a
+wait after its time. Concurrent instructions ("async", "parallel") run
+alongside the routine until their "sync". A routine of hours is simulated
+in milliseconds:
+
+    simulation = simulate(compile_file("routines/OOD.txt"))
+    print(simulation.report())          # timeline, duration, device use and idle time
+    simulation.fits(3600)               # within an hour's observation window?
+
+The models' defaults are taken from the drivers (motor speed, acceleration
+and settling, the filter wheel's move and position query) and are
+overridden by the "simulation" entry of the "routine" config, as is the
+state the devices start in (motor angle, integration time, measuring).
+The result is an estimate: a device slower than its model, or a command
+that times out, makes the real run longer.
+
+    python -m core.routine_simulator routines/OOD.txt [--window seconds] [--config hardware_config.json]
+"""
+import argparse
+import dataclasses
+import json
+import math
+import os
+import sys
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Optional
+
+from core.routine_compiler import Instruction, compile_file, RoutineCompileError
+from drivers.motor import TrackerSpeed, TrackerAccel, SettleTime, move_duration
+
+_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def scan_averages(integration_ms):
+    """Scans the spectrometer averages per delivered scan, as SpectrometerController sets them"""
+    if integration_ms < 10:
+        return 10
+    if integration_ms < 100:
+        return 5
+    if integration_ms < 1000:
+        return 2
+    return 1
+
+
+@dataclass
+class DeviceModels:
+    """Timing models of the simulated devices and the state they start in"""
+    motor_speed: float = TrackerSpeed         # steps/s
+    motor_accel: float = TrackerAccel         # steps/s^2
+    motor_settle_s: float = SettleTime
+    motor_angle: Optional[float] = None       # None: unknown, the first move counts as 360°
+    filter_move_s: float = 1.5                # FilterWheelCommandThread: 1 s to move, 0.5 s to query the position
+    command_s: float = 0.02                   # serial round trip of a motor command until its ACK
+    integration_ms: float = 50.0              # the spectrometer panel's default
+    scan_overhead_ms: float = 2.0             # readout and transfer of each scan
+    restart_s: float = 0.1                    # stopping and restarting a measurement
+    measuring: bool = True
+    write_s: float = 0.05                     # queueing and writing a snapshot or camera image
+
+    @classmethod
+    def from_config(cls, config, **state):
+        """Models from a "simulation" config dict, then the given state (e.g. motor_angle=0.0)"""
+        names = {field.name for field in dataclasses.fields(cls)}
+        options = {}
+        for key, value in dict(config or {}, **state).items():
+            if key in names:
+                options[key] = value
+            else:
+                print(f"Routine simulation: unknown model option '{key}'")
+        return cls(**options)
+
+    def scan_period_s(self, integration_ms):
+        """Seconds between the scans delivered at integration_ms"""
+        return (integration_ms * scan_averages(integration_ms) + self.scan_overhead_ms) / 1000.0
+
+    def motor_travel_s(self, degrees):
+        """Seconds from the ACK of a move over degrees until the motor is in position"""
+        profile = move_duration(100 * degrees, self.motor_speed, self.motor_accel) - SettleTime
+        return profile + self.motor_settle_s
+
+
+@dataclass(frozen=True)
+class SimulatedStep:
+    """An instruction of the simulated run, from when it was issued to when it completed"""
+    instruction: Instruction
+    start: float
+    end: float
+
+    @property
+    def seconds(self):
+        return self.end - self.start
+
+
+def _format_seconds(seconds):
+    text = f"{seconds:.1f} s"
+    return text if seconds < 60 else f"{text} ({timedelta(seconds=round(seconds))})"
+
+
+class Simulation:
+    """Timeline of a simulated routine run, with the busy and idle time of each device"""
+
+    def __init__(self, steps, devices=()):
+        self.steps = tuple(steps)
+        self.duration = max((step.end for step in self.steps), default=0.0)
+        self.busy = {device: 0.0 for device in sorted(devices)}  # device -> seconds its commands took
+        for step in self.steps:
+            if step.instruction.device:
+                self.busy[step.instruction.device] = self.busy.get(step.instruction.device, 0.0) + step.seconds
+
+    @property
+    def idle(self):
+        """device -> seconds of the run it was not working on a command"""
+        return {device: self.duration - busy for device, busy in self.busy.items()}
+
+    def utilization(self, device):
+        return self.busy.get(device, 0.0) / self.duration if self.duration else 0.0
+
+    def fits(self, window_s):
+        """Whether the run ends within an observation window of window_s seconds"""
+        return self.duration <= window_s
+
+    def summary(self):
+        return f"{_format_seconds(self.duration)} for {len(self.steps)} commands"
+
+    def report(self):
+        lines = [f"{'start (s)':>10}{'time (s)':>10}{'line':>6}  command"]
+        for step in self.steps:
+            instruction = step.instruction
+            concurrent = "async " if instruction.background else ""
+            lines.append(f"{step.start:10.2f}{step.seconds:10.2f}{instruction.line:>6}  {concurrent}{instruction.text}")
+        lines.append(f"total {_format_seconds(self.duration)}")
+        lines.append(f"{'device':<16}{'busy (s)':>10}{'idle (s)':>10}{'use':>7}")
+        for device, idle in self.idle.items():
+            lines.append(f"{device:<16}{self.busy[device]:10.1f}{idle:10.1f}{self.utilization(device):7.0%}")
+        return "\n".join(lines)
+
+
+class _Simulator:
+    """Simulated devices, advanced by the instructions of a routine"""
+
+    def __init__(self, models):
+        self.models = models
+        self.motor_angle = models.motor_angle
+        self.measuring = models.measuring
+        self.period = models.scan_period_s(models.integration_ms)
+        self.origin = 0.0                     # time the current measurement (re)started
+
+    def after_scans(self, reached, count):
+        """Time the count-th scan arriving at or after reached arrives (reached if not measuring)"""
+        if not self.measuring or not count:
+            return reached
+        arrived = max(1, math.ceil((reached - self.origin) / self.period - 1e-9))
+        return self.origin + (arrived + count - 1) * self.period
+
+    def restart(self, at):
+        self.origin = at
+        return at + self.period
+
+    def complete(self, instruction, now):
+        """Time the instruction issued at now completes; updates the devices' state"""
+        models, op, args = self.models, instruction.op, instruction.args
+        if op == "wait":
+            return now + args[0] / 1000.0
+        if op == "motor.move":
+            degrees = abs(args[0] - self.motor_angle) if self.motor_angle is not None else 360
+            self.motor_angle = args[0]
+            return self.after_scans(now + models.command_s + models.motor_travel_s(degrees), 2)
+        if op == "filter.position":
+            return self.after_scans(now + models.filter_move_s, 2)
+        if op == "integration":
+            self.period = models.scan_period_s(args[0])
+            return self.restart(now + models.restart_s) if self.measuring else now
+        if op == "spectrometer.start":
+            if self.measuring:
+                return self.after_scans(now, 1)
+            self.measuring = True
+            return self.restart(now + models.restart_s)
+        if op == "spectrometer.stop":
+            self.measuring = False
+            return now
+        if op in ("spectrometer.save", "spectrometer.save_snapshot", "camera.save_image"):
+            return now + models.write_s
+        return now
+
+
+def simulate(program, models=None):
+    """Simulation of running program (a Program or instructions) with the device models"""
+    simulator = _Simulator(models or DeviceModels())
+    steps, running = [], []          # running: end times of the concurrent instructions before the next sync
+    now = 0.0
+    for instruction in program:
+        if instruction.op == "sync":
+            end = max(running, default=now)
+            running = []
+        else:
+            end = simulator.complete(instruction, now)
+        steps.append(SimulatedStep(instruction, now, end))
+        if instruction.background:
+            running.append(end)
+        else:
+            now = end
+    devices = {instruction.device for instruction in program if instruction.device}
+    return Simulation(steps, devices)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Estimate how long a routine takes with simulated devices")
+    parser.add_argument("routine", help="routine file")
+    parser.add_argument("--window", type=float, help="observation window (s) the routine has to fit in")
+    parser.add_argument("--config", default=os.path.join(_ROOT, "hardware_config.json"),
+                        help="config with the models in routine.simulation")
+    options = parser.parse_args(argv)
+    config = {}
+    if os.path.exists(options.config):
+        with open(options.config) as f:
+            config = json.load(f)
+    try:
+        program = compile_file(options.routine)
+    except RoutineCompileError as e:
+        print(e)
+        return 2
+    simulation = simulate(program, DeviceModels.from_config(config.get("routine", {}).get("simulation")))
+    print(simulation.report())
+    if options.window is not None and not simulation.fits(options.window):
+        print(f"Does not fit the {_format_seconds(options.window)} window")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""
+Scan-driven row aggregation for continuous logging.
+
+The spectrometer controller numbers every completed scan and emits it as a
+Scan. ScanAggregator groups consecutive scans into rows, either exactly
+scans_per_row scans per row or all scans whose hardware timestamps fall into
+consecutive window_s windows, so every scan ends up in exactly one row and the
+row knows which scans it contains.
+
+A scan's intensities are a read-only spectrum array (see core.spectrum),
+shared by every consumer of the scan.
+"""
+from dataclasses import dataclass, field
+from typing import List
+
+import numpy as np
+
+from core.spectrum import as_spectrum, mean_spectrum
+
+MODE_TIMER = "timer"      # legacy: sample the latest scan on a QTimer
+MODE_SCANS = "scans"      # N consecutive scans per row
+MODE_WINDOW = "window"    # all scans in a hardware-timestamp window per row
+
+
+@dataclass(frozen=True)
+class Scan:
+    seq: int                      # sequence number since the measurement started
+    hw_timestamp: float           # spectrometer clock, seconds (unwrapped)
+    host_timestamp: float         # POSIX time the scan was received
+    integration_time_ms: float
+    # Arrays do not compare as a bool, so scans compare by number and timestamps
+    intensities: np.ndarray = field(compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "intensities", as_spectrum(self.intensities))
+
+
+@dataclass
+class ScanRow:
+    scans: List[Scan] = field(default_factory=list)
+
+    @property
+    def scan_ids(self):
+        return [s.seq for s in self.scans]
+
+    @property
+    def host_start(self):
+        return self.scans[0].host_timestamp
+
+    @property
+    def host_end(self):
+        return self.scans[-1].host_timestamp
+
+    @property
+    def integration_time_ms(self):
+        return self.scans[0].integration_time_ms
+
+    def average(self):
+        """Mean spectrum of the row's scans (a spectrum array)"""
+        return mean_spectrum(s.intensities for s in self.scans)
+
+
+def format_scan_ids(ids):
+    """Compact text form of a list of scan numbers: [4, 5, 6, 9] -> "4-6;9" """
+    parts = []
+    start = prev = None
+    for seq in ids:
+        if start is not None and seq == prev + 1:
+            prev = seq
+            continue
+        if start is not None:
+            parts.append(str(start) if start == prev else f"{start}-{prev}")
+        start = prev = seq
+    if start is not None:
+        parts.append(str(start) if start == prev else f"{start}-{prev}")
+    return ";".join(parts)
+
+
+def parse_scan_ids(text):
+    """Inverse of format_scan_ids"""
+    ids = []
+    for part in filter(None, str(text).split(";")):
+        if "-" in part:
+            first, last = part.split("-")
+            ids.extend(range(int(first), int(last) + 1))
+        else:
+            ids.append(int(part))
+    return ids
+
+
+class ScanAggregator:
+    """Collects scans and returns completed ScanRows.
+
+    A row never mixes integration times; a change of integration time (or
+    reset()) discards the partial row so it is not averaged across settings.
+    """
+
+    def __init__(self, mode=MODE_SCANS, scans_per_row=5, window_s=1.0):
+        if mode not in (MODE_SCANS, MODE_WINDOW):
+            raise ValueError(f"Unknown scan aggregation mode '{mode}'")
+        self.mode = mode
+        self.scans_per_row = max(1, int(scans_per_row))
+        self.window_s = float(window_s)
+        self.discarded = 0          # scans dropped with incomplete rows
+        self._row = ScanRow()
+        self._window_end = None
+        self._last_seq = None
+
+    def reset(self):
+        """Drop the partial row (e.g. while hardware is moving)"""
+        self.discarded += len(self._row.scans)
+        self._row = ScanRow()
+        self._window_end = None
+
+    def add(self, scan):
+        """Add one scan; returns the list of rows completed by it"""
+        if self._last_seq is not None and scan.seq <= self._last_seq:
+            return []               # duplicate or restarted numbering
+        self._last_seq = scan.seq
+        done = []
+        row = self._row
+        if row.scans and scan.integration_time_ms != row.integration_time_ms:
+            self.reset()
+            row = self._row
+        if self.mode == MODE_WINDOW:
+            if self._window_end is None:
+                self._window_end = scan.hw_timestamp + self.window_s
+            elif scan.hw_timestamp >= self._window_end:
+                if row.scans:
+                    done.append(row)
+                # Advance by whole windows so rows stay aligned to the first one
+                skipped = int((scan.hw_timestamp - self._window_end) // self.window_s)
+                self._window_end += (skipped + 1) * self.window_s
+                self._row = row = ScanRow()
+            row.scans.append(scan)
+        else:
+            row.scans.append(scan)
+            if len(row.scans) >= self.scans_per_row:
+                done.append(row)
+                self._row = ScanRow()
+        return done
+
+    def flush(self):
+        """Return the partial row (or None) and start a new one"""
+        row, self._row = self._row, ScanRow()
+        self._window_end = None
+        return row if row.scans else None
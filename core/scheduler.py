@@ -0,0 +1,369 @@
+"""
+Schedule of routines for unattended operation.
+
+A schedule file (JSON, schedules/schedule.json by default) lists routine
+files and when to run them:
+
+    {
+        "latitude": 52.0, "longitude": 4.4,
+        "entries": [
+            {"name": "morning", "routine": "schedule_so.txt", "sun_elevation": 10, "direction": "rising",
+             "priority": 5},
+            {"name": "noon", "routine": "schedule_re.txt", "at": "12:00"},
+            {"name": "survey", "routine": "OOD.txt", "every": 1800, "start": "06:00", "end": "20:00"},
+            {"name": "campaign", "routine": "schedule_fu.txt", "at": "2026-11-01T09:30:00"}
+        ]
+    }
+
+"at" is a daily local time ("HH:MM[:SS]") or a date and time (ISO format,
+local time unless it has an offset) for a single run; "every" is an
+interval in seconds from "start" (default midnight), optionally only until
+"end" each day; "sun_elevation" runs when the sun's elevation (degrees, at
+the schedule's latitude and longitude, from core.ephemeris)
+crosses the value, "rising" (default) in the morning or "setting" in the
+evening. Routine files are looked up in schedules/, then routines/.
+
+Scheduler keeps the next due time of every entry in a heap, so however
+many entries there are, only the earliest one has to be waited for. Only
+one routine runs at a time; an entry that comes due while another routine
+runs is handled by the conflict policy:
+
+    "queue"    run it when the devices are free, highest priority first (default)
+    "skip"     drop it
+    "preempt"  stop a scheduled routine of lower priority and run it; otherwise queue it
+
+A routine started by hand is never preempted. Runs are recorded in a
+state file, so after downtime an entry whose occurrences were missed is
+handled by the missed-run policy: "run_once" (default) runs it once on
+startup if its last missed occurrence is at most max_late_s ago,
+"skip" waits for its next occurrence. Queued entries that have waited
+longer than max_late_s are dropped in either case.
+
+Times are epoch seconds; Scheduler takes the current time as an argument
+and has no timers of its own (see gui.components.schedule_manager). Missed
+and skipped runs (warnings) and state file errors are reported to the event
+log as component "scheduler", and printed.
+"""
+import datetime
+import heapq
+import json
+import math
+import os
+from dataclasses import dataclass
+
+from core.ephemeris import get_ephemeris
+from core.event_log import EventSource
+
+CONFLICT_POLICIES = ("queue", "skip", "preempt")
+MISSED_POLICIES = ("run_once", "skip")
+DEFAULT_MAX_LATE_S = 3600.0
+SUN_SEARCH_DAYS = 2               # no crossing within this long: polar day or night
+_MAX_OCCURRENCES = 100000         # occurrences examined for missed runs
+
+
+def _local(ts):
+    return datetime.datetime.fromtimestamp(ts).astimezone()
+
+
+def _parse_time_of_day(text):
+    """Seconds after midnight of "HH:MM[:SS]\""""
+    parts = [int(part) for part in text.split(":")]
+    if len(parts) not in (2, 3) or not (0 <= parts[0] < 24 and all(0 <= p < 60 for p in parts[1:])):
+        raise ValueError(f"'{text}' is not a time of day (HH:MM[:SS])")
+    hours, minutes, seconds = parts + [0] * (3 - len(parts))
+    return hours * 3600 + minutes * 60 + seconds
+
+
+def _at_offset(day, offset):
+    """Epoch seconds offset seconds of local time after the midnight of day (handles DST changes)"""
+    midnight = _local(day).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (midnight.replace(tzinfo=None) + datetime.timedelta(seconds=offset)).astimezone().timestamp()
+
+
+class DailyAt:
+    """Every day at a local time of day"""
+
+    def __init__(self, text):
+        self.text = text
+        self.offset = _parse_time_of_day(text)
+
+    def next_after(self, t):
+        for day in range(3):
+            due = _at_offset(t + day * 86400, self.offset)
+            if due > t:
+                return due
+        return None
+
+    def __str__(self):
+        return f"daily at {self.text}"
+
+
+class Once:
+    """A single date and time"""
+
+    def __init__(self, text):
+        self.text = text
+        when = datetime.datetime.fromisoformat(text)
+        self.ts = (when if when.tzinfo else when.astimezone()).timestamp()
+
+    def next_after(self, t):
+        return self.ts if self.ts > t else None
+
+    def __str__(self):
+        return f"at {self.text}"
+
+
+class Every:
+    """At a fixed interval from a local time of day, optionally only until an end time each day"""
+
+    def __init__(self, interval_s, start="00:00", end=None):
+        if interval_s <= 0:
+            raise ValueError("'every' must be a positive number of seconds")
+        self.interval_s = float(interval_s)
+        self.start, self.end = start, end
+        self.start_offset = _parse_time_of_day(start)
+        self.end_offset = _parse_time_of_day(end) if end else None
+        if self.end_offset is not None and self.end_offset <= self.start_offset:
+            raise ValueError(f"'end' {end} is not after 'start' {start}")
+
+    def next_after(self, t):
+        # The count restarts at start each day and runs up to end, or to the next day's start
+        for day in range(-1, 2):
+            first = _at_offset(t + day * 86400, self.start_offset)
+            count = max(0, math.floor((t - first) / self.interval_s) + 1)
+            due = first + count * self.interval_s
+            if self.end_offset is not None:
+                if due <= _at_offset(t + day * 86400, self.end_offset):
+                    return due
+            elif due < _at_offset(t + (day + 1) * 86400, self.start_offset):
+                return due
+        return None
+
+    def __str__(self):
+        window = f" from {self.start} to {self.end}" if self.end else (f" from {self.start}" if self.start != "00:00" else "")
+        return f"every {self.interval_s:g} s{window}"
+
+
+def sun_elevation(latitude, longitude, ts):
+    """Elevation of the sun (degrees) at latitude, longitude and epoch seconds ts"""
+    return get_ephemeris(latitude, longitude).elevation(ts)
+
+
+class SunElevation:
+    """When the sun's elevation crosses a value, rising or setting"""
+
+    def __init__(self, degrees, latitude, longitude, direction="rising"):
+        if direction not in ("rising", "setting"):
+            raise ValueError(f"direction must be 'rising' or 'setting', not '{direction}'")
+        self.degrees = float(degrees)
+        self.latitude, self.longitude = float(latitude), float(longitude)
+        self.rising = direction == "rising"
+
+    def next_after(self, t):
+        """First crossing after t, from the site's precomputed ephemeris"""
+        return get_ephemeris(self.latitude, self.longitude).next_crossing(
+            self.degrees, t, self.rising, SUN_SEARCH_DAYS * 86400)
+
+    def __str__(self):
+        return f"sun {'rising' if self.rising else 'setting'} through {self.degrees:g}°"
+
+
+@dataclass(frozen=True)
+class ScheduleEntry:
+    name: str
+    routine: str                  # path of the routine file
+    trigger: object               # DailyAt, Once, Every or SunElevation
+    priority: int = 0
+
+    def __str__(self):
+        return f"{self.name} ({os.path.basename(self.routine)}, {self.trigger}, priority {self.priority})"
+
+
+def _trigger(entry, schedule):
+    if "at" in entry:
+        text = str(entry["at"])
+        return Once(text) if "T" in text or "-" in text else DailyAt(text)
+    if "every" in entry:
+        return Every(float(entry["every"]), entry.get("start", "00:00"), entry.get("end"))
+    if "sun_elevation" in entry:
+        if "latitude" not in schedule or "longitude" not in schedule:
+            raise ValueError("'sun_elevation' needs the schedule's latitude and longitude")
+        return SunElevation(entry["sun_elevation"], schedule["latitude"], schedule["longitude"],
+                            entry.get("direction", "rising"))
+    raise ValueError("needs 'at', 'every' or 'sun_elevation'")
+
+
+def _find_routine(name, directories):
+    if os.path.isabs(name):
+        return name
+    for directory in directories:
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            return path
+    raise ValueError(f"routine file '{name}' not found in {', '.join(directories)}")
+
+
+def load_schedule(path, routine_dirs=()):
+    """(ScheduleEntries, schedule dict) of a schedule file; raises ValueError naming the bad entry"""
+    with open(path) as f:
+        schedule = json.load(f)
+    directories = list(routine_dirs) or [os.path.dirname(os.path.abspath(path))]
+    entries, names = [], set()
+    for number, entry in enumerate(schedule.get("entries", []), start=1):
+        name = entry.get("name") or os.path.splitext(os.path.basename(entry.get("routine", "")))[0] or f"entry {number}"
+        try:
+            if name in names:
+                raise ValueError("name is used by another entry")
+            if "routine" not in entry:
+                raise ValueError("needs a 'routine' file")
+            entries.append(ScheduleEntry(name, _find_routine(entry["routine"], directories),
+                                         _trigger(entry, schedule), int(entry.get("priority", 0))))
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"{path}: entry {number} ({name}): {e}")
+        names.add(name)
+    return entries, schedule
+
+
+@dataclass(frozen=True)
+class Run:
+    """An entry to run now; preempt: stop the running (scheduled) routine first"""
+    entry: ScheduleEntry
+    due: float
+    preempt: bool = False
+
+
+class Scheduler:
+    """Due times of schedule entries, and which one to run next under the conflict and missed-run policies"""
+
+    def __init__(self, entries, now, conflict="queue", missed="run_once", max_late_s=DEFAULT_MAX_LATE_S,
+                 state_path=None):
+        if conflict not in CONFLICT_POLICIES:
+            raise ValueError(f"unknown conflict policy '{conflict}' (one of {', '.join(CONFLICT_POLICIES)})")
+        if missed not in MISSED_POLICIES:
+            raise ValueError(f"unknown missed-run policy '{missed}' (one of {', '.join(MISSED_POLICIES)})")
+        self.entries = list(entries)
+        self.conflict, self.missed, self.max_late_s = conflict, missed, float(max_late_s)
+        self.state_path = state_path
+        self.events = EventSource("scheduler", lambda message: print(f"Scheduler: {message}"))
+        self.last_runs = self._load_state()       # name -> due time of its last run or skipped occurrence
+        self.dropped = 0                          # runs skipped by the policies
+        self._seq = 0
+        self._heap = []                           # (due, seq, entry) of every entry's next occurrence
+        self._ready = []                          # (-priority, due, seq, entry) of due entries waiting to run
+        for entry in self.entries:
+            last = self.last_runs.get(entry.name)
+            missed_due = self._last_missed(entry, last, now) if last is not None else None
+            if missed_due is not None:
+                missed_at = f"{_local(missed_due):%Y-%m-%d %H:%M:%S}"
+                if self.missed == "run_once" and now - missed_due <= self.max_late_s:
+                    self.events.warning("missed", f"{entry.name} missed its run at {missed_at}, running it now",
+                                        entry=entry.name, due=missed_due, action="run")
+                    self._push_ready(entry, missed_due)
+                else:
+                    self.events.warning("missed", f"{entry.name} missed its run at {missed_at}, skipped",
+                                        entry=entry.name, due=missed_due, action="skip")
+                    self._drop(entry, missed_due)
+            self._push_next(entry, now)
+
+    def _push_next(self, entry, after):
+        due = entry.trigger.next_after(after)
+        if due is not None:
+            self._seq += 1
+            heapq.heappush(self._heap, (due, self._seq, entry))
+
+    def _push_ready(self, entry, due):
+        if any(queued is entry for *_, queued in self._ready):
+            return  # Still waiting from an earlier occurrence
+        self._seq += 1
+        heapq.heappush(self._ready, (-entry.priority, due, self._seq, entry))
+
+    @staticmethod
+    def _last_missed(entry, last, now):
+        """Latest occurrence of entry after last and up to now, or None"""
+        missed = None
+        due = entry.trigger.next_after(last)
+        for _ in range(_MAX_OCCURRENCES):
+            if due is None or due > now:
+                break
+            missed = due
+            due = entry.trigger.next_after(due)
+        return missed
+
+    def next_wakeup(self):
+        """Epoch seconds of the earliest occurrence still to come, or None"""
+        return self._heap[0][0] if self._heap else None
+
+    def waiting(self):
+        """Entries that are due and wait for the devices, in the order they will run"""
+        return [entry for *_, entry in sorted(self._ready)]
+
+    def next_run(self, now, running=None):
+        """The Run to start now, or None.
+
+        running is None when no routine runs, the running scheduled entry,
+        or any other object (e.g. True) for a routine started by hand.
+        Entries due by now are taken from the heap and rescheduled first.
+        """
+        while self._heap and self._heap[0][0] <= now:
+            due, _, entry = heapq.heappop(self._heap)
+            self._push_next(entry, max(due, now))
+            if running is not None and self.conflict == "skip":
+                self.events.warning("skipped", f"{entry.name} due while another routine runs, skipped",
+                                    entry=entry.name, due=due)
+                self._drop(entry, due)
+                continue
+            self._push_ready(entry, due)
+        while self._ready:
+            _, due, _, entry = self._ready[0]
+            if now - due > self.max_late_s:
+                heapq.heappop(self._ready)
+                self.events.warning("overrun", f"{entry.name} waited more than {self.max_late_s:g} s, skipped",
+                                    entry=entry.name, due=due, late_s=now - due)
+                self._drop(entry, due)
+                continue
+            if running is None:
+                heapq.heappop(self._ready)
+                return Run(entry, due)
+            if (self.conflict == "preempt" and isinstance(running, ScheduleEntry)
+                    and entry.priority > running.priority):
+                heapq.heappop(self._ready)
+                return Run(entry, due, preempt=True)
+            return None
+        return None
+
+    def started(self, run):
+        """Record that run was started, so it is not run again after a restart"""
+        self.last_runs[run.entry.name] = run.due
+        self._save_state()
+
+    def _drop(self, entry, due):
+        """An occurrence skipped by the policies counts as handled, not as missed after a restart"""
+        self.dropped += 1
+        self.last_runs[entry.name] = max(due, self.last_runs.get(entry.name, due))
+        self._save_state()
+
+    def _load_state(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return {}
+        try:
+            with open(self.state_path) as f:
+                return {name: float(due) for name, due in json.load(f).get("last_runs", {}).items()}
+        except (OSError, ValueError, AttributeError) as e:
+            self.events.error("state_read_failed", f"cannot read {self.state_path}: {e}",
+                              path=self.state_path, error=str(e))
+            return {}
+
+    def _save_state(self):
+        if not self.state_path:
+            return
+        try:
+            directory = os.path.dirname(self.state_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp = self.state_path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump({"last_runs": self.last_runs}, f, indent=2)
+            os.replace(tmp, self.state_path)
+        except OSError as e:
+            self.events.error("state_write_failed", f"cannot write {self.state_path}: {e}",
+                              path=self.state_path, error=str(e))
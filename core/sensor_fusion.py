@@ -0,0 +1,106 @@
+"""
+Align slow ancillary sensor readings with a spectrum's acquisition window.
+
+Sensors publish at their own rates (IMU ~10 Hz, TEC 1 Hz, THP every 3 s), so
+the value that happens to be current when a row is written can be seconds
+old. fuse() combines a sensor's recorded history into one value that belongs
+to the window [start, end] in which the spectrum was actually measured:
+
+* readings inside the window are averaged;
+* otherwise the readings just before and just after the window are linearly
+  interpolated to the window midpoint;
+* if readings exist on one side only, the nearest one is held.
+
+Along with the value it returns the reading age: the distance in seconds from
+the window midpoint to the nearest reading that was used.
+"""
+import math
+import bisect
+import dataclasses
+
+
+def _numeric_fields(record):
+    """Names of the fields of record that carry measured numbers"""
+    names = []
+    for f in dataclasses.fields(record):
+        if f.name == "timestamp":
+            continue
+        value = getattr(record, f.name)
+        if isinstance(value, bool) or value is None:
+            continue
+        if isinstance(value, (int, float)) or (
+                isinstance(value, tuple) and value and all(isinstance(v, (int, float)) for v in value)):
+            names.append(f.name)
+    return names
+
+
+def _wrap180(angle):
+    return (angle + 180.0) % 360.0 - 180.0
+
+
+def _mean(values, angle=False):
+    if isinstance(values[0], tuple):
+        return tuple(_mean(list(column), angle) for column in zip(*values))
+    if angle:
+        s = sum(math.sin(math.radians(v)) for v in values)
+        c = sum(math.cos(math.radians(v)) for v in values)
+        return math.degrees(math.atan2(s, c))
+    return sum(values) / len(values)
+
+
+def _interp(a, b, frac, angle=False):
+    if isinstance(a, tuple):
+        return tuple(_interp(x, y, frac, angle) for x, y in zip(a, b))
+    if angle:
+        return _wrap180(a + _wrap180(b - a) * frac)
+    return a + (b - a) * frac
+
+
+def fuse(records, start, end):
+    """Fuse a sensor history (records sorted by timestamp) over [start, end].
+
+    Returns (record, age_s): a record of the same type carrying the fused
+    values and the timestamp of the nearest reading used, and that reading's
+    distance from the window midpoint. Returns (None, None) without records.
+    """
+    if not records:
+        return None, None
+    if end < start:
+        start, end = end, start
+    mid = 0.5 * (start + end)
+    times = [r.timestamp for r in records]
+    lo = bisect.bisect_left(times, start)
+    hi = bisect.bisect_right(times, end)
+    template = records[0]
+    fields = _numeric_fields(template)
+    angles = set(getattr(template, "ANGLE_FIELDS", ()))
+
+    if hi > lo:
+        inside = records[lo:hi]
+        values = {name: _mean([getattr(r, name) for r in inside], name in angles) for name in fields}
+        nearest = min(inside, key=lambda r: abs(r.timestamp - mid))
+    elif 0 < lo < len(records):
+        before, after = records[lo - 1], records[lo]
+        span = after.timestamp - before.timestamp
+        frac = (mid - before.timestamp) / span if span > 0 else 0.0
+        values = {name: _interp(getattr(before, name), getattr(after, name), frac, name in angles)
+                  for name in fields}
+        nearest = before if mid - before.timestamp <= after.timestamp - mid else after
+    else:
+        nearest = records[-1] if lo > 0 else records[0]
+        values = {}
+    fused = dataclasses.replace(nearest, **values) if values else nearest
+    return fused, abs(mid - nearest.timestamp)
+
+
+def wait_satisfied(records, end, now, max_delay_s):
+    """True once a reading at or after end exists, or max_delay_s has passed since end.
+
+    Rows are held back until this holds for every sensor so that the window can
+    be bracketed by readings on both sides.
+    """
+    if not records or records[-1].timestamp >= end:
+        return True
+    if records[-1].timestamp < end - max_delay_s:
+        return True     # sensor has gone quiet, no point waiting for it
+    return now - end >= max_delay_s
@@ -0,0 +1,90 @@
+"""
+In-memory representation of spectra.
+
+The driver returns every scan as a ctypes array of 4096 doubles. From there
+on a spectrum is a one-dimensional, read-only NumPy array of the configured
+dtype, float32 by default:
+
+    spectrum = as_spectrum(driver_buffer, npix)     # copy, float32, read-only
+    row = mean_spectrum(spectra)                    # accumulated in float64
+
+float32 holds detector counts exactly (integers up to 2**24) and averages to
+about 7 significant digits, which is what the binary archive and the flight
+recorder store anyway. It takes 4 bytes per pixel, against 8 for float64 and
+about 32 for a list or tuple of Python floats (pointer plus float object), so
+the scan buffers, averaging collections, CSV batches and static curves that
+hold spectra shrink by a factor of 2 to 8. Because spectra are read-only, a
+scan's array is shared by every consumer (plot, data logger, flight
+recorder) instead of copied.
+
+Where the extra digits matter (e.g. CSV output of long averages that has to
+match float64 formatting exactly) configure_spectra(dtype="float64") keeps
+spectra in double precision; it is set from the "spectra" entry of
+hardware_config.json at startup.
+"""
+import threading
+
+import numpy as np
+
+DTYPES = {"float32": np.dtype(np.float32), "float64": np.dtype(np.float64)}
+DEFAULT_DTYPE = "float32"
+
+_dtype = DTYPES[DEFAULT_DTYPE]
+_lock = threading.Lock()
+
+
+def configure_spectra(**options):
+    """Set the dtype of spectra ("float32" or "float64")"""
+    global _dtype
+    name = options.get("dtype") or DEFAULT_DTYPE
+    if name not in DTYPES:
+        print(f"Spectra: unknown dtype '{name}', using '{DEFAULT_DTYPE}'")
+        name = DEFAULT_DTYPE
+    with _lock:
+        _dtype = DTYPES[name]
+
+
+def spectrum_dtype():
+    """The configured numpy dtype of spectra"""
+    return _dtype
+
+
+def as_spectrum(values, npix=None, dtype=None):
+    """values (a driver buffer, sequence or array) as a read-only spectrum array.
+
+    The result has npix pixels (values are truncated or zero-padded; default:
+    all of them) and the configured dtype unless dtype is given. An array that
+    already has the right dtype and length is returned as a read-only view
+    rather than copied.
+    """
+    dtype = np.dtype(dtype) if dtype is not None else _dtype
+    # ctypes arrays and ndarrays convert without a copy, lists and tuples to float64
+    source = np.asarray(values)
+    if source.ndim != 1:
+        source = source.ravel()
+    if npix is None:
+        npix = source.size
+    if isinstance(values, np.ndarray) and source.dtype == dtype and source.size == npix:
+        spectrum = source.view()
+    else:
+        spectrum = np.zeros(npix, dtype=dtype)
+        count = min(npix, source.size)
+        spectrum[:count] = source[:count]
+    spectrum.flags.writeable = False
+    return spectrum
+
+
+def mean_spectrum(spectra, dtype=None):
+    """Pixel-wise mean of spectra (truncated to the shortest) as a read-only spectrum array.
+
+    The sum is accumulated in float64, so averaging many float32 scans loses
+    no more precision than rounding the result.
+    """
+    spectra = list(spectra)
+    if not spectra:
+        return as_spectrum((), dtype=dtype)
+    npix = min(len(s) for s in spectra)
+    total = np.zeros(npix, dtype=np.float64)
+    for spectrum in spectra:
+        total += np.asarray(spectrum)[:npix]
+    return as_spectrum(total / len(spectra), dtype=dtype)
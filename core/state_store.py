@@ -0,0 +1,194 @@
+"""
+Shared store of controller state snapshots.
+
+Each controller publishes an immutable, timestamped record describing its
+current state whenever that state changes (a motor move, a sensor reading, a
+new integration time ...). Consumers such as DataLogger read the latest
+records from the store instead of probing controller attributes or widgets.
+
+Records may be published from any thread; reads return consistent snapshots.
+A short, time-bounded history of every kind is kept as well, so consumers can
+look up the readings that were current during a past acquisition window (see
+core.sensor_fusion).
+"""
+import os
+import time
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import ClassVar, Optional, Tuple
+
+
+def _now():
+    return time.time()
+
+
+@dataclass(frozen=True)
+class MotorState:
+    KEY: ClassVar[str] = "motor"
+    angle_deg: Optional[float] = None        # None when the position is unknown
+    connected: bool = False
+    moving: bool = False                     # True from the accepted move command until in position
+    timestamp: float = field(default_factory=_now)
+
+
+@dataclass(frozen=True)
+class FilterWheelState:
+    KEY: ClassVar[str] = "filter_wheel"
+    position: Optional[int] = None           # None when the position is unknown
+    connected: bool = False
+    timestamp: float = field(default_factory=_now)
+
+
+@dataclass(frozen=True)
+class IMUState:
+    KEY: ClassVar[str] = "imu"
+    ANGLE_FIELDS: ClassVar[Tuple[str, ...]] = ("roll", "pitch", "yaw")   # wrap at +/-180 deg
+    roll: float = 0.0
+    pitch: float = 0.0
+    yaw: float = 0.0
+    accel: Tuple[float, float, float] = (0.0, 0.0, 0.0)
+    mag: Tuple[float, float, float] = (0.0, 0.0, 0.0)
+    pressure: float = 0.0
+    temperature: float = 0.0
+    latitude: float = 0.0
+    longitude: float = 0.0
+    timestamp: float = field(default_factory=_now)
+
+
+@dataclass(frozen=True)
+class THPState:
+    KEY: ClassVar[str] = "thp"
+    temperature: float = 0.0
+    humidity: float = 0.0
+    pressure: float = 0.0
+    timestamp: float = field(default_factory=_now)
+
+
+@dataclass(frozen=True)
+class TECState:
+    KEY: ClassVar[str] = "tec"
+    current_temp: float = 0.0
+    setpoint: float = 0.0
+    auxiliary_temp: float = 0.0              # spectrometer temperature
+    connected: bool = False
+    timestamp: float = field(default_factory=_now)
+
+
+@dataclass(frozen=True)
+class SpectrometerState:
+    KEY: ClassVar[str] = "spectrometer"
+    integration_time_ms: float = 0.0          # the UI value (logged as IntegTime_us for compatibility)
+    wavelengths: Tuple[float, ...] = ()
+    measuring: bool = False
+    started: float = 0.0                      # when the running measurement was (re)started with its settings
+    timestamp: float = field(default_factory=_now)
+
+
+@dataclass(frozen=True)
+class RoutineState:
+    KEY: ClassVar[str] = "routine"
+    name: Optional[str] = None
+    start_time: Optional[str] = None         # "yyyyMMdd_hhmmss" the run started, names its snapshot directory
+    running: bool = False
+    command_index: int = 0
+    command: str = ""
+    timestamp: float = field(default_factory=_now)
+
+    @property
+    def code(self):
+        """Two-letter routine code written to every logged row ("XX" when idle)"""
+        if not self.running or not self.name:
+            return "XX"
+        name = os.path.basename(self.name)
+        if name.endswith(".txt"):
+            name = name[:-4]
+        return name[:2].upper()
+
+
+class StateStore:
+    """Thread-safe map from record KEY to the latest published record.
+
+    The records of the last history_seconds (at most max_history per kind) are
+    kept in publication order and returned by history().
+    """
+
+    def __init__(self, history_seconds=30.0, max_history=10000):
+        self._lock = threading.Lock()
+        self._latest = {}
+        self._history = {}
+        self._listeners = []
+        self.history_seconds = float(history_seconds)
+        self.max_history = int(max_history)
+
+    def publish(self, record):
+        """Store record as the latest state of its kind and notify listeners"""
+        with self._lock:
+            self._latest[record.KEY] = record
+            history = self._history.get(record.KEY)
+            if history is None:
+                history = self._history[record.KEY] = deque(maxlen=self.max_history)
+            history.append(record)
+            oldest = record.timestamp - self.history_seconds
+            while history[0].timestamp < oldest:
+                history.popleft()
+            listeners = list(self._listeners)
+        for callback in listeners:
+            try:
+                callback(record)
+            except Exception as e:
+                print(f"StateStore: listener failed for {record.KEY}: {e}")
+
+    def get(self, kind, default=None):
+        """Latest record of kind (a record class or its KEY)"""
+        key = getattr(kind, "KEY", kind)
+        with self._lock:
+            return self._latest.get(key, default)
+
+    def snapshot(self):
+        """Dict of KEY -> latest record, taken atomically"""
+        with self._lock:
+            return dict(self._latest)
+
+    def history(self, kind, since=None):
+        """Records of kind still in the history (oldest first), optionally only those at or after since"""
+        key = getattr(kind, "KEY", kind)
+        with self._lock:
+            records = list(self._history.get(key, ()))
+        if since is not None:
+            records = [r for r in records if r.timestamp >= since]
+        return records
+
+    def clear(self, kind=None):
+        """Forget the record and history of kind, or of every kind"""
+        with self._lock:
+            if kind is None:
+                self._latest.clear()
+                self._history.clear()
+            else:
+                key = getattr(kind, "KEY", kind)
+                self._latest.pop(key, None)
+                self._history.pop(key, None)
+
+    def subscribe(self, callback):
+        """Call callback(record) on every publish (on the publishing thread)"""
+        with self._lock:
+            self._listeners.append(callback)
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_state_store():
+    """Return the application-wide StateStore"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = StateStore()
+        return _store
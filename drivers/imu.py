@@ -33,7 +33,11 @@ def parse_imu_packet(packet: bytes):
 
 import serial # Make sure serial is imported for SerialException
 
-def read_from_imu(serial_obj, data_dict: dict, stop_event: threading.Event):
+def read_from_imu(serial_obj, data_dict: dict, stop_event: threading.Event, on_update=None):
+    """Read packets into data_dict until stop_event is set.
+
+    on_update(label), if given, is called on this thread after each packet is stored.
+    """
     buffer = []
     try:
         while serial_obj.is_open and not stop_event.is_set():
@@ -66,6 +70,8 @@ def read_from_imu(serial_obj, data_dict: dict, stop_event: threading.Event):
                         elif label == "Mag":
                             data_dict["mag"] = tuple(vals)
                         # else: unknown packet, already handled by parse_imu_packet
+                        if on_update is not None and label != "Unknown":
+                            on_update(label)
                     else: # Checksum failed
                         buffer.pop(0) # Discard start byte and retry
                 else: # First byte is not 0x55
@@ -83,8 +89,8 @@ def read_from_imu(serial_obj, data_dict: dict, stop_event: threading.Event):
         print("IMU Read Thread: Exiting.")
         # The serial_obj is managed by the controller, so this thread should not close it.
 
-def start_imu_read_thread(serial_obj, data_dict: dict):
+def start_imu_read_thread(serial_obj, data_dict: dict, on_update=None):
     stop_event = threading.Event()
-    thread = threading.Thread(target=read_from_imu, args=(serial_obj, data_dict, stop_event), daemon=True)
+    thread = threading.Thread(target=read_from_imu, args=(serial_obj, data_dict, stop_event, on_update), daemon=True)
     thread.start()
     return stop_event
\ No newline at end of file
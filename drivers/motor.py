@@ -1,3 +1,4 @@
+import math
 import serial
 from PyQt5.QtCore import QThread, pyqtSignal
 import utils
@@ -5,6 +6,8 @@ import utils
 # Motor control constants for Oriental Motor AZ series (Modbus)
 TrackerSpeed = 10000       # Motor rotation speed (steps/s)
 TrackerCurrent = 1000      # Motor current limit (in 0.1% units, 1000 = 100.0%)
+TrackerAccel = 8000        # Acceleration and deceleration rate of a move (steps/s^2, 0x1F40 in the move command)
+SettleTime = 0.2           # Time allowed after the motion profile ends for the motor to settle (s)
 SlaveID = 2                # Modbus slave address of the motor controller
 BaudRateList = [9600, 19200, 38400, 57600, 115200, 230400]
 
@@ -47,6 +50,16 @@ class MotorConnectThread(QThread):
         # Emit result (serial object if found, else None)
         self.result_signal.emit(found_serial, found_baud if found_baud else 0, message)
 
+def move_duration(steps, speed=TrackerSpeed, accel=TrackerAccel):
+    """Seconds a move of steps takes with the trapezoidal profile of send_move_command, settling included"""
+    steps = abs(steps)
+    ramp = speed * speed / accel  # steps to reach full speed and stop again
+    if steps <= ramp:
+        travel = 2.0 * math.sqrt(steps / accel)
+    else:
+        travel = 2.0 * speed / accel + (steps - ramp) / speed
+    return travel + SettleTime
+
 def send_move_command(serial_obj, angle: int) -> bool:
     """
     Send a move command to the motor to go to the specified angle (in motor steps).
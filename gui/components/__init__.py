@@ -1,6 +1,4 @@
-# This file makes the components directory a Python package
-# Import the component classes for easier access
-from .data_logger import DataLogger
-from .routine_manager import RoutineManager
-from .camera_manager import CameraManager
-from .ui_manager import UIManager
\ No newline at end of file
+# This file makes the components directory a Python package.
+# Components are imported from their modules (gui.components.data_logger, ...):
+# importing them here would load the camera (cv2) and the widgets for
+# headless.py, which only needs the data logger and the routine manager.
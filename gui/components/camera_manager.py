@@ -1,8 +1,12 @@
 import cv2
 import os
+import time
 from PyQt5.QtCore import QObject, Qt
 from PyQt5.QtGui import QImage, QPixmap
 
+from storage.file_writer import get_file_writer
+from core.state_store import get_state_store, MotorState, FilterWheelState, RoutineState
+
 class CameraManager(QObject):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -94,7 +98,8 @@ class CameraManager(QObject):
             self.camera.release()
             self.camera = None
 
-    def save_image(self, full_path_filename):
+    def save_image(self, full_path_filename, callback=None):
+        """Queue the current frame to be written; callback(path, error) runs on the writer thread once it is"""
         if not hasattr(self, 'camera') or self.camera is None or not self.camera.isOpened():
             print("Camera not initialized or not open. Cannot save image.")
             # Optionally, emit a signal or use main_window.statusBar() if accessible and appropriate
@@ -119,8 +124,33 @@ class CameraManager(QObject):
                     self.main_window.statusBar().showMessage(f"Info: Created directory {directory}")
 
 
-            cv2.imwrite(full_path_filename, frame)
-            print(f"Camera image saved successfully to {full_path_filename}")
+            # Encode and write on the background writer thread
+            ext = os.path.splitext(full_path_filename)[1] or ".jpg"
+
+            def encode():
+                ok, buf = cv2.imencode(ext, frame)
+                if not ok:
+                    raise IOError(f"Could not encode image as {ext}")
+                return buf.tobytes()
+
+            store = get_state_store()
+            routine = store.get(RoutineState)
+            motor = store.get(MotorState)
+            wheel = store.get(FilterWheelState)
+            now = time.time()
+            catalog = {
+                "kind": "image",
+                "routine": routine.name if routine is not None and routine.running else None,
+                "routine_start": routine.start_time if routine is not None and routine.running else None,
+                "motor_angle": motor.angle_deg if motor is not None else None,
+                "filter_pos": wheel.position if wheel is not None else None,
+                "first_timestamp": now,
+                "last_timestamp": now,
+            }
+            get_file_writer().write_file(full_path_filename, encode, mode="wb",
+                                         callback=lambda path, error: self._on_image_written(path, error, callback),
+                                         catalog=catalog)
+            print(f"Camera image queued for {full_path_filename}")
             if hasattr(self.main_window, 'statusBar'):
                 self.main_window.statusBar().showMessage(f"Success: Image saved to {full_path_filename}")
             return True
@@ -129,3 +159,12 @@ class CameraManager(QObject):
             if hasattr(self.main_window, 'statusBar'):
                 self.main_window.statusBar().showMessage(f"Error: Could not save image: {e}")
             return False
+
+    def _on_image_written(self, path, error, callback=None):
+        """Writer-thread callback for save_image"""
+        if error is None:
+            print(f"Camera image saved successfully to {path}")
+        else:
+            print(f"Error saving camera image to {path}: {error}")
+        if callback is not None:
+            callback(path, error)
@@ -1,15 +1,88 @@
 import os
+import time
+import numpy as np
 from PyQt5.QtCore import QObject, QDateTime, pyqtSignal
 
+from storage.spectral_archive import SpectralArchiveWriter, ARCHIVE_EXTENSION
+from storage.file_writer import get_file_writer, DROP
+from storage.compression import resolve_codec
+from storage.segment_index import SegmentIndex, INDEX_SUFFIX
+from storage.csv_format import format_fixed, format_rows, format_table
+from storage.journal import RowJournal, recover_journals, DURABILITY_OFF, DURABILITIES
+from core.state_store import (get_state_store, MotorState, FilterWheelState, IMUState,
+                              THPState, TECState, SpectrometerState, RoutineState)
+from core.sensor_fusion import fuse, wait_satisfied
+from core.scan_sampler import ScanAggregator, MODE_TIMER, format_scan_ids
+from core.spectrum import as_spectrum, mean_spectrum, spectrum_dtype
+from core.event_log import EventSource
+
+# Sensors whose readings are aligned with each row's acquisition window, with their age columns
+FUSED_SENSORS = ((IMUState, 'imu_age'), (THPState, 'thp_age'), (TECState, 'tec_age'))
+
 class DataLogger(QObject):
     status_signal = pyqtSignal(str)
     
     def __init__(self, parent=None):
         super().__init__(parent)
+        self.events = EventSource("data_logger", self.status_signal.emit)
         self.main_window = parent
         self.log_file = None
         self.csv_file = None
+        self.archive_writer = None
+        self._archive_stream = None
         self.continuous_saving = False
+        # Row metadata comes from the state records the controllers publish
+        self.state_store = get_state_store()
+        
+        # Output format for continuous scans: "csv", "binary" or "both"
+        config = getattr(parent, 'config', None) or {}
+        self.scan_format = config.get("scan_format", "csv")
+        
+        # Optional streaming compression of the continuous CSV: "gzip", "zstd" or "lz4"
+        self.compression = None
+        self.compression_level = config.get("compression_level")
+        try:
+            self.compression = resolve_codec(config.get("compression"))
+        except ValueError as e:
+            print(f"DataLogger: {e}; writing uncompressed CSV")
+        if self.compression and self.compression.name != config.get("compression"):
+            print(f"DataLogger: '{config.get('compression')}' not installed, using {self.compression.name}")
+        
+        # Ancillary sensor values are fused over each row's acquisition window; a row is
+        # held back up to max_delay_s for readings taken after the window ended
+        fusion = config.get("sensor_fusion", {})
+        self.fusion_enabled = fusion.get("enabled", True)
+        self.fusion_max_delay_s = float(fusion.get("max_delay_s", 3.5))
+        self._pending_rows = []
+        
+        # Row sampling: "timer" samples the latest scan on the collect/save timers,
+        # "scans" averages exactly scans_per_row new scans, "window" all scans in window_s
+        sampling = config.get("sampling", {})
+        self.sampling_mode = sampling.get("mode", MODE_TIMER)
+        self.scans_per_row = int(sampling.get("scans_per_row", 5))
+        self.window_s = float(sampling.get("window_s", 1.0))
+        self._aggregator = None
+        
+        # Segment rotation of long sessions: a new set of files is started once the
+        # current CSV/archive reaches max_bytes or a max_seconds boundary is crossed (0 = off)
+        rotation = config.get("rotation", {})
+        self.rotate_max_bytes = int(rotation.get("max_bytes", 0))
+        self.rotate_max_seconds = float(rotation.get("max_seconds", 0))
+        self.segment_index = None
+        self._segment_catalog = {}    # storage.catalog fields shared by the segment's files
+        
+        # Write-ahead journal of rows not yet on disk (see storage/journal.py):
+        # durability "off", "os", "batch" (fsync every batch_rows / batch_interval_s) or "row"
+        journal = config.get("journal", {})
+        self.journal_durability = journal.get("durability", "batch")
+        if self.journal_durability not in DURABILITIES:
+            print(f"DataLogger: unknown journal durability '{self.journal_durability}', using 'batch'")
+            self.journal_durability = "batch"
+        self.journal_batch_rows = int(journal.get("batch_rows", 10))
+        self.journal_batch_interval_s = float(journal.get("batch_interval_s", 2.0))
+        self.journal_checkpoint_rows = int(journal.get("checkpoint_rows", 100))
+        self._journal_dir = journal.get("dir")
+        self._journal = None
         
         # Create log directories if they don't exist
         self.log_dir = os.path.join(os.path.dirname(__file__), "..", "..", "logs")
@@ -22,10 +95,32 @@ class DataLogger(QObject):
         self._csv_buffer = []
         self._csv_buffer_count = 0
         self._csv_buffer_max = 5  # Write to disk every 5 samples
+        self._csv_header_written = False
+        self._csv_header_pending = None
+        self._csv_offset = 0          # bytes written to the current CSV segment
+        self._csv_row_bytes = 0       # length of the last written CSV row
+        self._segment_rows = 0
+        self._segment_slot = None     # max_seconds period of the current segment's first row
         
         # Store collection and save intervals
         self.collection_interval = 1000  # Default 1 second
         self.save_interval = 1200  # Default 1.2 seconds
+        
+        # Rows journaled before a crash or power loss are put back into their files
+        self.recovered = []
+        try:
+            self.recovered = [(path, rows) for path, rows in recover_journals(self.journal_dir) if rows]
+        except Exception as e:
+            print(f"DataLogger: journal recovery failed: {e}")
+        for path, rows in self.recovered:
+            print(f"DataLogger: recovered {rows} rows into {os.path.basename(path)}")
+    
+    @property
+    def journal_dir(self):
+        if self._journal_dir:
+            return os.path.join(os.path.dirname(__file__), "..", "..", self._journal_dir) \
+                if not os.path.isabs(self._journal_dir) else self._journal_dir
+        return os.path.join(self.csv_dir, ".journal")
 
     def toggle_data_saving(self):
         """Toggle continuous data saving on/off"""
@@ -43,26 +138,19 @@ class DataLogger(QObject):
     
     def _start_data_saving(self):
         """Start continuous data saving"""
-        if hasattr(self, 'csv_file') and self.csv_file:
-            self.csv_file.close()
-        if hasattr(self, 'log_file') and self.log_file:
-            self.log_file.close()
+        if self.csv_file or self.log_file or self.archive_writer is not None:
+            self._close_segment()
             
-        ts = QDateTime.currentDateTime().toString("yyyyMMdd_hhmmss")
-        self.csv_file_path = os.path.join(self.csv_dir, f"Scans_{ts}_mini.csv")
-        self.log_file_path = os.path.join(self.log_dir, f"log_{ts}.txt")
-        
-        try:
-            self.csv_file = open(self.csv_file_path, "w", encoding="utf-8", newline="")
-            self.log_file = open(self.log_file_path, "w", encoding="utf-8")
-        except Exception as e:
-            self.status_signal.emit(f"Cannot open files: {e}")
+        self._session_ts = QDateTime.currentDateTime().toString("yyyyMMdd_hhmmss")
+        rotation = {"max_bytes": self.rotate_max_bytes, "max_seconds": self.rotate_max_seconds}
+        self.segment_index_path = os.path.join(self.csv_dir, f"Scans_{self._session_ts}_mini{INDEX_SUFFIX}")
+        self.segment_index = SegmentIndex(self.segment_index_path, self._session_ts, rotation)
+        if not self._open_segment():
             return
         
-        # Write headers to CSV file
-        headers = self._get_csv_headers()
-        self.csv_file.write(",".join(headers) + "\n")
-        self.csv_file.flush() # Ensures headers are written to OS buffer
+        self._pending_rows = []
+        if self.scan_driven:
+            self._aggregator = ScanAggregator(self.sampling_mode, self.scans_per_row, self.window_s)
         
         # Initialize data collection for averaging
         self._data_collection = []
@@ -70,117 +158,255 @@ class DataLogger(QObject):
         
         # Log the integration time being used
         integration_time_ms = 1000  # Default
-        if hasattr(self.main_window, 'spec_ctrl') and hasattr(self.main_window.spec_ctrl, 'current_integration_time_us'):
-            integration_time_ms = self.main_window.spec_ctrl.current_integration_time_us
+        spec = self.state_store.get(SpectrometerState)
+        if spec is not None and spec.integration_time_ms:
+            integration_time_ms = spec.integration_time_ms
         
-        self.status_signal.emit(f"Data saving started with integration time: {integration_time_ms}ms")
+        self.events.info("saving_started", f"Data saving started with integration time: {integration_time_ms}ms", integration_ms=integration_time_ms)
         
         # Store the collection and save intervals based on integration time
         self.collection_interval = max(100, integration_time_ms)
         self.save_interval = integration_time_ms + 200  # Add 200ms buffer
     
-    def _stop_data_saving(self):
-        """Stop continuous data saving"""
-        if hasattr(self, 'csv_file') and self.csv_file:
-            self.csv_file.close()
+    @property
+    def rotation_enabled(self):
+        return self.rotate_max_bytes > 0 or self.rotate_max_seconds > 0
+    
+    def _open_segment(self):
+        """Open the CSV and log files of the next segment; the archive opens with its first row"""
+        ts = self._session_ts
+        # Without rotation a session is a single segment and keeps the plain file names
+        suffix = f"_{len(self.segment_index.segments) + 1:03d}" if self.rotation_enabled else ""
+        self.csv_file_path = os.path.join(self.csv_dir, f"Scans_{ts}_mini{suffix}.csv")
+        if self.compression:
+            self.csv_file_path += self.compression.extension
+        self.archive_file_path = os.path.join(self.csv_dir, f"Scans_{ts}_mini{suffix}{ARCHIVE_EXTENSION}")
+        self.log_file_path = os.path.join(self.log_dir, f"log_{ts}{suffix}.txt")
+        
+        # Catalog fields shared by the segment's files
+        routine = self.state_store.get(RoutineState)
+        spec = self.state_store.get(SpectrometerState)
+        self._segment_catalog = {
+            "session": ts,
+            "segment": len(self.segment_index.segments) + 1,
+            "routine": routine.name if routine is not None and routine.running else None,
+            "routine_start": routine.start_time if routine is not None and routine.running else None,
+            "integration_time_ms": spec.integration_time_ms if spec is not None else None,
+        }
+        
+        # Files are opened and written by the background writer thread
+        writer = get_file_writer()
+        try:
+            if self.scan_format in ("csv", "both"):
+                self.csv_file = writer.open_stream(
+                    self.csv_file_path, "w", newline="",
+                    compression=self.compression.name if self.compression else None,
+                    level=self.compression_level,
+                    catalog=dict(self._segment_catalog, kind="scan_csv"))
+            # Log lines may be dropped under back-pressure; data rows wait for room and
+            # are reported as lost if the writer stays full (see _report_dropped)
+            self.log_file = writer.open_stream(self.log_file_path, "w", policy=DROP,
+                                               catalog=dict(self._segment_catalog, kind="log"))
+        except Exception as e:
+            self.events.error("open_failed", f"Cannot open files: {e}", error=str(e))
+            return False
+        
+        self.segment_index.start_segment({
+            "csv": self.csv_file_path if self.csv_file else None,
+            "archive": self.archive_file_path if self.scan_format in ("binary", "both") else None,
+            "log": self.log_file_path,
+        })
+        self.segment_index.save(get_file_writer())
+        if self.journal_durability != DURABILITY_OFF:
+            name = os.path.basename(self.csv_file_path if self.csv_file else self.archive_file_path)
+            self._journal = RowJournal(self.journal_dir, name, self.journal_durability,
+                                       self.journal_batch_rows, self.journal_batch_interval_s)
+        
+        # Every segment starts with its own header line, written with the first row
+        self._csv_header_written = False
+        self._csv_header_pending = None
+        self._csv_offset = 0
+        self._segment_rows = 0
+        self._segment_slot = None
+        return True
+    
+    def _close_segment(self):
+        """Write out and close the current segment's files and update the index"""
+        self._flush_csv_buffer()
+        segment = self.segment_index.current if self.segment_index is not None else None
+        if segment is not None:
+            span = {"first_timestamp": segment["first_timestamp"],
+                    "last_timestamp": segment["last_timestamp"], "rows": segment["rows"]}
+            for stream in (self.csv_file, self.log_file, self._archive_stream):
+                if stream is not None:
+                    stream.annotate(**span)
+        if self.csv_file:
+            stream = self.csv_file
+            callback = None
+            if self.compression:
+                callback = lambda path, error: self._on_compressed_csv_closed(stream, error)
+            if self._journal is not None and self._journal.started:
+                stream.sync()
+            stream.close(callback=callback)
             self.csv_file = None
-        if hasattr(self, 'log_file') and self.log_file:
+        if self.log_file:
             self.log_file.close()
             self.log_file = None
+        journal, self._journal = self._journal, None
+        if journal is not None and journal.started:
+            # The journal goes once the data files are on disk
+            journal.close()
+            if self._archive_stream is not None:
+                self._archive_stream.sync()
+        self._close_archive()
+        if journal is not None and journal.started:
+            get_file_writer().submit(journal.release)
+        if self.segment_index is not None:
+            self.segment_index.save(get_file_writer())
     
-    def _get_csv_headers(self):
-        """Get CSV headers based on available data"""
+    def close_files(self):
+        """Write out buffered rows and close any files still open (application exit)"""
+        if self.csv_file or self.log_file or self.archive_writer is not None:
+            self._close_segment()
+    
+    def _rotation_due(self, timestamp):
+        """True if a row taken at timestamp belongs in a new segment"""
+        if not self.rotation_enabled or self.segment_index is None or not self._segment_rows:
+            return False
+        if self.rotate_max_seconds > 0 and int(timestamp // self.rotate_max_seconds) != self._segment_slot:
+            return True
+        if self.rotate_max_bytes > 0:
+            # Buffered CSV rows are not formatted yet; count them at the last flushed row length
+            csv_size = self._csv_offset + self._csv_buffer_count * self._csv_row_bytes
+            size = max(csv_size, self.archive_writer.tell() if self.archive_writer is not None else 0)
+            return size >= self.rotate_max_bytes
+        return False
+    
+    def _rotate(self):
+        self._close_segment()
+        if self._open_segment():
+            self.events.info("rotated", f"Continuous log rotated to segment {len(self.segment_index.segments)}", segment=len(self.segment_index.segments))
+    
+    def _stop_data_saving(self):
+        """Stop continuous data saving"""
+        if self._aggregator is not None:
+            # An incomplete row would not hold the configured number of scans; drop it
+            self._aggregator.reset()
+            if self._aggregator.discarded:
+                self.events.warning("scans_discarded", f"Scan logging: {self._aggregator.discarded} scans in incomplete rows discarded", count=self._aggregator.discarded)
+            self._aggregator = None
+        self._write_ready_rows(force=True)
+        self._close_segment()
+        self.segment_index = None
+    
+    def _on_compressed_csv_closed(self, stream, error):
+        """Writer-thread callback reporting how well the scan CSV compressed"""
+        if error is not None:
+            self.events.error("close_failed", f"Error closing {stream.path}: {error}", path=stream.path, error=str(error))
+            return
+        stats = stream.compression_stats()
+        self.events.info(
+            "compressed",
+            f"Compressed {os.path.basename(stream.path)} ({stats['codec']}): {stats['rows']} rows, "
+            f"ratio {stats['ratio']:.1f}x, {stats['cpu_us_per_row']:.1f} us CPU/row",
+            path=stream.path, **stats)
+
+    def _open_archive(self, num_pixels):
+        """Create the binary archive once the spectrum size is known"""
+        wavelengths = self._wavelengths() or None
+        catalog = dict(self._segment_catalog, kind="scan_archive")
+        stream = get_file_writer().open_stream(self.archive_file_path, "wb", catalog=catalog)
+        self._archive_stream = stream
+        self.archive_writer = SpectralArchiveWriter(self.archive_file_path, num_pixels, wavelengths,
+                                                    stream=stream)
+    
+    def _close_archive(self):
+        if self.archive_writer is not None:
+            try:
+                self.archive_writer.close()
+            except Exception as e:
+                self.events.error("close_failed", f"Error closing archive: {e}", error=str(e))
+            self.archive_writer = None
+        self._archive_stream = None
+    
+    def _get_csv_headers(self, num_points=0):
+        """Get CSV headers for rows with num_points spectrum values"""
         headers = [
             "Timestamp", "MotorAngle_deg", "FilterPos",
             "Roll_deg", "Pitch_deg", "Yaw_deg", "AccelX_g", "AccelY_g", "AccelZ_g",
             "MagX_uT", "MagY_uT", "MagZ_uT",
             "Pressure_hPa", "TempEnv_C", "TempCurr_C", "TempSet_C",
             "Latitude", "Longitude", "IntegTime_us", "THPTemp_C",
-            "THPHum_pct", "THPPres_hPa", "Spec_temp_C", "RoutineCode"
+            "THPHum_pct", "THPPres_hPa", "Spec_temp_C", "RoutineCode",
+            "IMUAge_s", "THPAge_s", "TECAge_s", "NumScans", "ScanIDs"
         ]
         
-        # Add wavelength or pixel headers if spectrometer data is available
-        if hasattr(self.main_window, 'spec_ctrl') and self.main_window.spec_ctrl:
-            spec_ctrl = self.main_window.spec_ctrl
-            if hasattr(spec_ctrl, 'wls') and spec_ctrl.wls and \
-               hasattr(spec_ctrl, 'intens') and len(spec_ctrl.intens) > 0:
-                # Use wavelengths if available
-                num_points = len(spec_ctrl.intens) # Match number of intensity points
-                headers += [f"Wavelength_{w:.2f}nm" for w in spec_ctrl.wls[:num_points]]
-            elif hasattr(spec_ctrl, 'intens') and len(spec_ctrl.intens) > 0:
-                # Fallback to pixel-based headers
-                headers += [f"Pixel_{i}" for i in range(len(spec_ctrl.intens))]
+        # Use wavelengths if the spectrometer published them, pixel numbers otherwise
+        wavelengths = self._wavelengths()
+        if wavelengths and len(wavelengths) >= num_points:
+            headers += [f"Wavelength_{w:.2f}nm" for w in wavelengths[:num_points]]
+        else:
+            headers += [f"Pixel_{i}" for i in range(num_points)]
             
         return headers
     
+    def _wavelengths(self):
+        spec = self.state_store.get(SpectrometerState)
+        return spec.wavelengths if spec is not None else ()
+    
     def collect_data_sample(self):
         """Collect a data sample for averaging"""
         if not hasattr(self.main_window, 'spec_ctrl'):
             return
             
-        # Create a copy of the current intensity data
-        intensities = self.main_window.spec_ctrl.intens.copy()
+        # The current spectrum is read-only, so the sample can share it
+        intensities = as_spectrum(self.main_window.spec_ctrl.intens)
         
-        # Store the sample with timestamp
+        # Store the sample with timestamp and the number of the scan it came from
         sample = {
             'timestamp': QDateTime.currentDateTime(),
-            'intensities': intensities
+            'intensities': intensities,
+            'scan_id': getattr(self.main_window.spec_ctrl, 'scan_seq', 0),
         }
         
         # Add to collection
         self._data_collection.append(sample)
     
+    @property
+    def scan_driven(self):
+        """True when rows are built from numbered scans instead of the collect/save timers"""
+        return self.sampling_mode != MODE_TIMER
+    
+    def add_scan(self, scan):
+        """Slot for SpectrometerController.scan_signal in scan-driven sampling modes"""
+        if not self.continuous_saving or self._aggregator is None:
+            return
+        # Scans taken while hardware moves or the integration time changes are not logged
+        if getattr(self.main_window, '_hardware_changing', False) or \
+           getattr(self.main_window, '_integration_changing', False):
+            self._aggregator.reset()
+            return
+        try:
+            for row in self._aggregator.add(scan):
+                self._queue_row(row.host_start - row.integration_time_ms / 1000.0, row.host_end,
+                                row.average(), row.scan_ids)
+            self._write_ready_rows()
+        except Exception as e:
+            self.events.error("add_scan_failed", f"Error in add_scan: {e}", error=str(e))
+    
     def _debug_controller_values(self):
-        """Debug method to print current controller values"""
-        debug_info = []
-        
-        # Motor controller debug
-        if hasattr(self.main_window, 'motor_ctrl') and self.main_window.motor_ctrl is not None:
-            motor_info = "Motor: "
-            if hasattr(self.main_window.motor_ctrl, 'current_angle'):
-                motor_info += f"current_angle={self.main_window.motor_ctrl.current_angle}"
-            else:
-                motor_info += "current_angle=None"
-            debug_info.append(motor_info)
-        
-        # IMU controller debug
-        if hasattr(self.main_window, 'imu_ctrl') and self.main_window.imu_ctrl is not None:
-            imu_info = "IMU: "
-            if hasattr(self.main_window.imu_ctrl, 'data_dict'):
-                imu_info += f"data_dict={self.main_window.imu_ctrl.data_dict}"
-            else:
-                imu_info += "data_dict=None"
-            
-            if hasattr(self.main_window.imu_ctrl, 'latest_data'):
-                imu_info += f", latest_data={self.main_window.imu_ctrl.latest_data}"
-            else:
-                imu_info += ", latest_data=None"
-            debug_info.append(imu_info)
-        
-        # THP controller debug
-        if hasattr(self.main_window, 'thp_ctrl') and self.main_window.thp_ctrl is not None:
-            thp_info = "THP: "
-            if hasattr(self.main_window.thp_ctrl, 'latest'):
-                thp_info += f"latest={self.main_window.thp_ctrl.latest}"
-            else:
-                thp_info += "latest=None"
-            
-            if hasattr(self.main_window.thp_ctrl, 'get_latest'):
-                try:
-                    thp_info += f", get_latest()={self.main_window.thp_ctrl.get_latest()}"
-                except:
-                    thp_info += ", get_latest()=Error"
-            debug_info.append(thp_info)
-        
-        # Print debug info
-        # print("\n".join(debug_info))
-        
-        # Also log to status
-        self.status_signal.emit("Debug info printed to console")
+        """Log the age of each controller's latest state record as a debug event"""
+        now = time.time()
+        ages = {key: round(now - record.timestamp, 1)
+                for key, record in sorted(self.state_store.snapshot().items())}
+        summary = ", ".join(f"{key} {age:.1f}s" for key, age in ages.items()) or "no records"
+        self.events.debug("debug_info", f"State record ages: {summary}", ages=ages)
 
     def save_continuous_data(self):
         """Average collected samples and save to CSV"""
-        if not hasattr(self, 'csv_file') or not self.csv_file or not hasattr(self, 'continuous_saving') or not self.continuous_saving:
+        if not getattr(self, 'continuous_saving', False):
+            return
+        if not self.csv_file and self.scan_format == "csv":
             return
         
         # If hardware is changing or integration time is being adjusted, don't save data
@@ -203,217 +429,282 @@ class DataLogger(QObject):
             if num_samples == 0:
                 return
                 
-            # Get timestamps
-            ts_csv = self._data_collection[0]['timestamp'].toString("yyyy-MM-dd HH:mm:ss.zzz")
-            ts_txt = self._data_collection[0]['timestamp'].toString("HH:mm:ss.zzz")
-            
             # Average intensity values
             avg_intensities = self._calculate_average_intensities()
             
-            # Get current values from controllers
-            row = self._build_csv_row(ts_csv, avg_intensities)
-            
-            # Add to buffer
-            line = ",".join(row) + "\n"
-            self._csv_buffer.append(line)
-            self._csv_buffer_count += 1
-            
-            # Only write to disk when buffer is full
-            if self._csv_buffer_count >= self._csv_buffer_max:
-                self.csv_file.write(''.join(self._csv_buffer))
-                self.csv_file.flush()
-                self._csv_buffer = []
-                self._csv_buffer_count = 0
-            
-            # Log file can be written immediately as it's much smaller
-            peak = max(avg_intensities) if avg_intensities else 0
-            txt_line = f"{ts_txt} | Peak {peak:.1f} (avg of {num_samples} samples)\n"
-            self.log_file.write(txt_line)
-            self.log_file.flush()
+            # The row is completed once the sensors have reported around its acquisition window
+            start, end = self._acquisition_window()
+            self._queue_row(start, end, avg_intensities,
+                            [sample.get('scan_id', 0) for sample in self._data_collection],
+                            timestamp=self._data_collection[0]['timestamp'])
+            self._write_ready_rows()
             
             # Clear the data collection for the next interval
             self._data_collection = []
             
         except Exception as e:
             # print("save_continuous_data error:", e) # Changed to emit status signal
-            self.status_signal.emit(f"Error in save_continuous_data: {e}")
+            self.events.error("save_failed", f"Error in save_continuous_data: {e}", error=str(e))
+    
+    def _queue_row(self, start, end, avg_intensities, scan_ids, timestamp=None):
+        """Queue an averaged spectrum measured during [start, end] (POSIX seconds) for writing"""
+        if timestamp is None:
+            timestamp = QDateTime.fromMSecsSinceEpoch(int(round(start * 1000)))
+        self._pending_rows.append({
+            'window': (start, end),
+            'timestamp': timestamp.toMSecsSinceEpoch() / 1000.0,
+            'ts_csv': timestamp.toString("yyyy-MM-dd HH:mm:ss.zzz"),
+            'intensities': avg_intensities,
+            'scan_ids': list(scan_ids),
+        })
+        # Log file can be written immediately as it's much smaller
+        if self.log_file:
+            peak = float(np.max(avg_intensities)) if len(avg_intensities) else 0
+            self.log_file.write(f"{timestamp.toString('HH:mm:ss.zzz')} | Peak {peak:.1f} "
+                                f"(avg of {len(scan_ids)} samples)\n")
+
+    def _acquisition_window(self):
+        """(start, end) in POSIX seconds covering the scans averaged into the current row"""
+        first = self._data_collection[0]['timestamp'].toMSecsSinceEpoch() / 1000.0
+        last = self._data_collection[-1]['timestamp'].toMSecsSinceEpoch() / 1000.0
+        # Each sample is the last completed scan, which began one integration time earlier
+        spec = self.state_store.get(SpectrometerState)
+        integration_s = spec.integration_time_ms / 1000.0 if spec is not None else 0.0
+        return first - integration_s, last
+
+    def _write_ready_rows(self, force=False):
+        """Write pending rows whose sensor readings are complete (all of them if force)"""
+        now = time.time()
+        while self._pending_rows:
+            pending = self._pending_rows[0]
+            window = pending['window']
+            histories = {kind.KEY: self.state_store.history(kind) for kind, _ in FUSED_SENSORS}
+            if self.fusion_enabled and not force and not all(
+                    wait_satisfied(h, window[1], now, self.fusion_max_delay_s) for h in histories.values()):
+                break
+            self._pending_rows.pop(0)
+            values = self._collect_row_values(window=window if self.fusion_enabled else None,
+                                              histories=histories)
+            self._write_row(pending, values)
+
+    def _write_row(self, pending, values):
+        avg_intensities = pending['intensities']
+        scan_ids = pending['scan_ids']
+        values = dict(values, scan_first=scan_ids[0] if scan_ids else -1, scan_count=len(scan_ids),
+                      scan_ids=format_scan_ids(scan_ids))
+        if self._rotation_due(pending['timestamp']):
+            self._rotate()
+        offsets = {}
+        if self.scan_format in ("binary", "both") and len(avg_intensities):
+            if self.archive_writer is None:
+                self._open_archive(len(avg_intensities))
+            meta = dict(values)
+            meta['timestamp'] = pending['timestamp']
+            if meta['motor_angle'] is None:
+                meta['motor_angle'] = float("nan")
+            if meta['filter_pos'] is None:
+                meta['filter_pos'] = -1
+            start = self.archive_writer.tell()
+            archive_index = self.archive_writer.rows_written
+            archive_record = self.archive_writer.encode_rows([meta], [avg_intensities])
+            if self.archive_writer.write_raw(archive_record):
+                offsets['archive'] = (start, self.archive_writer.tell())
+            else:
+                self._report_dropped(self.archive_file_path, 1)
+                archive_index, archive_record = -1, b""
+        else:
+            archive_index, archive_record = -1, b""
+        
+        self._segment_rows += 1
+        if self._segment_slot is None and self.rotate_max_seconds > 0:
+            self._segment_slot = int(pending['timestamp'] // self.rotate_max_seconds)
+        index_entry = (pending['timestamp'], values.get('routine_code'), offsets)
+        
+        if self.csv_file:
+            if not self._csv_header_written:
+                self._csv_header_pending = ",".join(self._get_csv_headers(len(avg_intensities))) + "\n"
+                self._csv_header_written = True
+            # The metadata columns are formatted now, the spectra of the whole buffer at once
+            prefix = ",".join(self._build_csv_row(pending['ts_csv'], [], values))
+            self._journal_row(self._segment_rows - 1, archive_index, prefix, avg_intensities, archive_record)
+            self._csv_buffer.append((prefix, avg_intensities, index_entry))
+            self._csv_buffer_count += 1
+        
+            # Only write to disk when buffer is full
+            if self._csv_buffer_count >= self._csv_buffer_max:
+                self._flush_csv_buffer()
+        else:
+            self._journal_row(-1, archive_index, "", (), archive_record)
+            if self.segment_index is not None:
+                self.segment_index.record_row(*index_entry)
+        
+        # Checkpoint between CSV batches, when every row so far has been handed to the writer
+        if self._journal is not None and not self._csv_buffer_count and \
+                self._journal.rows_since_checkpoint >= self.journal_checkpoint_rows:
+            self._checkpoint_journal()
     
+    def _journal_row(self, csv_index, archive_index, prefix, spectrum, archive_record):
+        if self._journal is None or (csv_index < 0 and archive_index < 0):
+            return
+        try:
+            if not self._journal.started:
+                self._journal.begin({
+                    "csv": os.path.abspath(self.csv_file_path) if self.csv_file else None,
+                    "csv_header": self._csv_header_pending,
+                    "archive": os.path.abspath(self.archive_file_path) if self.archive_writer is not None else None,
+                    "npix": len(spectrum) if len(spectrum) else
+                            (self.archive_writer.npix if self.archive_writer is not None else 0),
+                    "wavelengths": list(self._wavelengths() or []),
+                    "dtype": spectrum_dtype().newbyteorder("<").str,
+                })
+            self._journal.append(csv_index, archive_index, prefix, spectrum, archive_record)
+        except OSError as e:
+            # Logging goes on without the journal rather than stopping
+            self.events.warning("journal_disabled", f"Journal disabled for this segment: {e}", error=str(e))
+            print(f"DataLogger: journal error: {e}")
+            self._journal.close()
+            self._journal = None
+    
+    def _checkpoint_journal(self):
+        """Start a new journal generation; the old one is deleted once the data files are synced"""
+        generation = self._journal.checkpoint()
+        for stream in (self.csv_file, self._archive_stream):
+            if stream is not None:
+                stream.sync()
+        journal = self._journal
+        get_file_writer().submit(lambda: journal.release(generation))
+    
+    def _flush_csv_buffer(self):
+        """Format the buffered rows in one pass, write them and enter them in the segment index"""
+        rows, self._csv_buffer = self._csv_buffer, []
+        self._csv_buffer_count = 0
+        if not rows or not self.csv_file:
+            return
+        chunks = []
+        offset = self._csv_offset
+        if self._csv_header_pending:
+            chunks.append(self._csv_header_pending)
+            offset += len(self._csv_header_pending)
+        lines = format_rows([prefix for prefix, _, _ in rows], [spectrum for _, spectrum, _ in rows])
+        for line, (_, _, (_, _, offsets)) in zip(lines, rows):
+            # Rows are ASCII, so characters equal bytes for the index offsets
+            line += "\n"
+            chunks.append(line)
+            offsets['csv'] = (offset, offset + len(line))
+            offset += len(line)
+        if self.csv_file.write("".join(chunks)) is False:
+            # Nothing reached the file: keep the header pending and the offsets where they were
+            self._report_dropped(self.csv_file_path, len(rows))
+            return
+        self._csv_offset = offset
+        self._csv_header_pending = None
+        self._csv_row_bytes = len(chunks[-1])
+        if self.segment_index is not None:
+            for _, _, index_entry in rows:
+                self.segment_index.record_row(*index_entry)
+    
+    def _report_dropped(self, path, rows):
+        """Data rows the file writer could not queue in time are lost; say so"""
+        self.events.error("rows_dropped", f"File writer queue full, {rows} row(s) not written to "
+                          f"{os.path.basename(path)}", path=path, rows=rows)
+
     def _calculate_average_intensities(self):
         """Calculate average intensities from collected samples"""
-        if not self._data_collection:
-            return []
-            
-        # Get the first sample to determine array size
-        first_sample = self._data_collection[0]['intensities']
-        avg_intensities = [0.0] * len(first_sample)
-        
-        # Sum all samples
-        for sample in self._data_collection:
-            intensities = sample['intensities']
-            for i in range(len(avg_intensities)):
-                if i < len(intensities):
-                    avg_intensities[i] += intensities[i]
-        
-        # Divide by number of samples
-        num_samples = len(self._data_collection)
-        if num_samples > 0:
-            avg_intensities = [val / num_samples for val in avg_intensities]
-            
-        return avg_intensities
+        return mean_spectrum(sample['intensities'] for sample in self._data_collection)
     
-    def _build_csv_row(self, ts_csv, avg_intensities):
+    def _collect_row_values(self, snapshot=None, window=None, histories=None):
+        """Build the row metadata from the controllers' published state records.
+        
+        With an acquisition window (start, end), IMU/THP/TEC values are fused from
+        the recorded history over that window; otherwise the latest records are used.
+        """
+        snapshot = dict(self.state_store.snapshot() if snapshot is None else snapshot)
+        ages = {}
+        now = time.time()
+        for kind, age_field in FUSED_SENSORS:
+            if window is not None:
+                records = histories.get(kind.KEY) if histories else self.state_store.history(kind)
+                record, age = fuse(records, *window)
+                if record is not None:
+                    snapshot[kind.KEY] = record
+            else:
+                record = snapshot.get(kind.KEY)
+                age = now - record.timestamp if record is not None else None
+            ages[age_field] = float("nan") if age is None else age
+        values = {
+            'motor_angle': None, 'filter_pos': None,
+            'roll': 0, 'pitch': 0, 'yaw': 0,
+            'accel_x': 0, 'accel_y': 0, 'accel_z': 0,
+            'mag_x': 0, 'mag_y': 0, 'mag_z': 0,
+            'pressure': 0, 'temp_env': 0,
+            'tec_current': 0, 'tec_setpoint': 0,
+            'latitude': 0, 'longitude': 0,
+            'integration_time': 0,
+            'thp_temp': 0, 'thp_hum': 0, 'thp_pres': 0,
+            'spec_temp': 0, 'routine_code': "XX",
+        }
+        values.update(ages)
+        
+        motor = snapshot.get(MotorState.KEY)
+        if motor is not None:
+            values['motor_angle'] = motor.angle_deg
+        
+        filter_wheel = snapshot.get(FilterWheelState.KEY)
+        if filter_wheel is not None:
+            values['filter_pos'] = filter_wheel.position
+        
+        imu = snapshot.get(IMUState.KEY)
+        if imu is not None:
+            values.update(roll=imu.roll, pitch=imu.pitch, yaw=imu.yaw,
+                          pressure=imu.pressure, temp_env=imu.temperature,
+                          latitude=imu.latitude, longitude=imu.longitude)
+            values['accel_x'], values['accel_y'], values['accel_z'] = imu.accel
+            values['mag_x'], values['mag_y'], values['mag_z'] = imu.mag
+        
+        thp = snapshot.get(THPState.KEY)
+        if thp is not None:
+            values.update(thp_temp=thp.temperature, thp_hum=thp.humidity, thp_pres=thp.pressure)
+        
+        tec = snapshot.get(TECState.KEY)
+        if tec is not None:
+            values.update(tec_current=tec.current_temp, tec_setpoint=tec.setpoint,
+                          spec_temp=tec.auxiliary_temp)
+        
+        spec = snapshot.get(SpectrometerState.KEY)
+        if spec is not None:
+            values['integration_time'] = spec.integration_time_ms
+        
+        routine = snapshot.get(RoutineState.KEY)
+        if routine is not None:
+            values['routine_code'] = routine.code
+        
+        return values
+    
+    def _build_csv_row(self, ts_csv, avg_intensities, values=None):
         """Build CSV row with current values from all controllers"""
-        # Default values
-        motor_angle = 0
-        filter_pos = 0
-        r, p, y = 0, 0, 0
-        ax, ay, az = 0, 0, 0
-        mx, my, mz = 0, 0, 0
-        pres, temp_env = 0, 0
-        tc_curr, tc_set = 0, 0
-        lat, lon = 0, 0
-        integ_us = 0
-        thp_temp, thp_hum, thp_pres = 0, 0, 0
-        spec_temp = 0
-        routine_code = "XX"
-        
-        # Get motor angle - fix for MotorAngle_deg
-        if hasattr(self.main_window, 'motor_ctrl') and self.main_window.motor_ctrl is not None:
-            # Try different attribute names that might contain the angle
-            if hasattr(self.main_window.motor_ctrl, 'current_angle_deg'):
-                motor_angle = self.main_window.motor_ctrl.current_angle_deg
-            elif hasattr(self.main_window.motor_ctrl, 'current_angle'):
-                motor_angle = self.main_window.motor_ctrl.current_angle
-            elif hasattr(self.main_window.motor_ctrl, 'angle'):
-                motor_angle = self.main_window.motor_ctrl.angle
-            elif hasattr(self.main_window.motor_ctrl, 'position'):
-                motor_angle = self.main_window.motor_ctrl.position
-            # Try to get from the UI if available
-            elif hasattr(self.main_window.motor_ctrl, 'angle_input'):
-                try:
-                    motor_angle = float(self.main_window.motor_ctrl.angle_input.text().strip())
-                except (ValueError, AttributeError):
-                    pass
-            elif hasattr(self.main_window.motor_ctrl, 'angle_display'):
-                try:
-                    motor_angle = float(self.main_window.motor_ctrl.angle_display.text().replace('°', ''))
-                except (ValueError, AttributeError):
-                    pass
-        
-        # Get IMU data - fix for Roll, Pitch, Yaw, Accel, Mag, Pressure
-        if hasattr(self.main_window, 'imu_ctrl') and self.main_window.imu_ctrl is not None:
-            # Try to get data from the latest attribute
-            if hasattr(self.main_window.imu_ctrl, 'latest'):
-                imu_data = self.main_window.imu_ctrl.latest
-                if imu_data:
-                    r = imu_data.get('rpy', [0, 0, 0])[0] if 'rpy' in imu_data else imu_data.get('roll', r)
-                    p = imu_data.get('rpy', [0, 0, 0])[1] if 'rpy' in imu_data else imu_data.get('pitch', p)
-                    y = imu_data.get('rpy', [0, 0, 0])[2] if 'rpy' in imu_data else imu_data.get('yaw', y)
-                    
-                    if 'accel' in imu_data and isinstance(imu_data['accel'], (list, tuple)) and len(imu_data['accel']) >= 3:
-                        ax, ay, az = imu_data['accel']
-                    else:
-                        ax = imu_data.get('accel_x', ax)
-                        ay = imu_data.get('accel_y', ay)
-                        az = imu_data.get('accel_z', az)
-                    
-                    if 'mag' in imu_data and isinstance(imu_data['mag'], (list, tuple)) and len(imu_data['mag']) >= 3:
-                        mx, my, mz = imu_data['mag']
-                    else:
-                        mx = imu_data.get('mag_x', mx)
-                        my = imu_data.get('mag_y', my)
-                        mz = imu_data.get('mag_z', mz)
-                    
-                    pres = imu_data.get('pressure', pres)
-                    temp_env = imu_data.get('temperature', temp_env)
-            
-            # Try to get data from the data_label if available
-            if (r == 0 or p == 0 or y == 0) and hasattr(self.main_window.imu_ctrl, 'data_label'):
-                try:
-                    # Try to parse the HTML table in data_label
-                    from PyQt5.QtCore import Qt
-                    text = self.main_window.imu_ctrl.data_label.text()
-                    if "Roll:" in text and "°" in text:
-                        import re
-                        # Extract roll, pitch, yaw values
-                        roll_match = re.search(r'Roll:</b></td><td align=\'left\'>([+-]?\d+\.?\d*)°', text)
-                        pitch_match = re.search(r'Pitch:</b></td><td align=\'left\'>([+-]?\d+\.?\d*)°', text)
-                        yaw_match = re.search(r'Yaw:</b></td><td align=\'left\'>([+-]?\d+\.?\d*)°', text)
-                        
-                        if roll_match:
-                            r = float(roll_match.group(1))
-                        if pitch_match:
-                            p = float(pitch_match.group(1))
-                        if yaw_match:
-                            y = float(yaw_match.group(1))
-                except Exception as e:
-                    print(f"Error parsing IMU data from label: {e}")
-        
-        # Get THP sensor data - fix for THPTemp, THPHum, THPPres
-        if hasattr(self.main_window, 'thp_ctrl') and self.main_window.thp_ctrl is not None:
-            # Try different methods to get THP data
-            if hasattr(self.main_window.thp_ctrl, 'get_latest'):
-                thp_data = self.main_window.thp_ctrl.get_latest()
-                if thp_data:
-                    thp_temp = thp_data.get('temperature', thp_temp)
-                    thp_hum = thp_data.get('humidity', thp_hum)
-                    thp_pres = thp_data.get('pressure', thp_pres)
-            
-            # Try direct attribute access
-            if hasattr(self.main_window.thp_ctrl, 'latest'):
-                thp_data = self.main_window.thp_ctrl.latest
-                if thp_data:
-                    thp_temp = thp_data.get('temperature', thp_temp)
-                    thp_hum = thp_data.get('humidity', thp_hum)
-                    thp_pres = thp_data.get('pressure', thp_pres)
-            
-            # Try to get from UI elements if available
-            if thp_temp == 0 and hasattr(self.main_window.thp_ctrl, 'temp_display'):
-                try:
-                    thp_temp = float(self.main_window.thp_ctrl.temp_display.text().replace('°C', ''))
-                except (ValueError, AttributeError):
-                    pass
-        
-        if hasattr(self.main_window, 'filter_ctrl') and self.main_window.filter_ctrl is not None:
-            if hasattr(self.main_window.filter_ctrl, 'current_position'):
-                filter_pos = self.main_window.filter_ctrl.current_position
-        
-        if hasattr(self.main_window, 'temp_ctrl') and self.main_window.temp_ctrl is not None:
-            if hasattr(self.main_window.temp_ctrl, 'current_temp'):
-                tc_curr = self.main_window.temp_ctrl.current_temp
-            if hasattr(self.main_window.temp_ctrl, 'setpoint'):
-                tc_set = self.main_window.temp_ctrl.setpoint
-            # New: Get auxiliary temperature (spectrometer temperature)
-            if hasattr(self.main_window.temp_ctrl, 'auxiliary_temp'):
-                spec_temp = self.main_window.temp_ctrl.auxiliary_temp
-        
-        if hasattr(self.main_window, 'spec_ctrl') and self.main_window.spec_ctrl is not None:
-            if hasattr(self.main_window.spec_ctrl, 'current_integration_time_us'):
-                integ_us = self.main_window.spec_ctrl.current_integration_time_us
-        
-        # New: Get routine code if a routine is running
-        if hasattr(self.main_window, 'routine_manager') and self.main_window.routine_manager is not None:
-            if hasattr(self.main_window.routine_manager, 'current_routine'):
-                current_routine = self.main_window.routine_manager.current_routine
-                if current_routine:
-                    # Extract first two characters of routine name
-                    routine_name = os.path.basename(current_routine)
-                    if routine_name.endswith('.txt'):
-                        routine_name = routine_name[:-4]  # Remove .txt extension
-                    routine_code = routine_name[:2].upper() if len(routine_name) >= 2 else routine_name.upper()
+        if values is None:
+            values = self._collect_row_values()
+        v = values
+        # Not reported yet: the archive's sentinels, so the columns stay numeric
+        motor_angle = float("nan") if v['motor_angle'] is None else v['motor_angle']
+        filter_pos = -1 if v['filter_pos'] is None else v['filter_pos']
         
         # Create CSV row
         row = [
             ts_csv, str(motor_angle), str(filter_pos),
-            f"{r:.2f}", f"{p:.2f}", f"{y:.2f}", f"{ax:.2f}", f"{ay:.2f}", f"{az:.2f}",
-            f"{mx:.2f}", f"{my:.2f}", f"{mz:.2f}",
-            f"{pres:.2f}", f"{temp_env:.2f}", f"{tc_curr:.2f}", f"{tc_set:.2f}",
-            f"{lat:.6f}", f"{lon:.6f}", str(integ_us), f"{thp_temp:.2f}",
-            f"{thp_hum:.2f}", f"{thp_pres:.2f}", f"{spec_temp:.2f}", routine_code
+            f"{v['roll']:.2f}", f"{v['pitch']:.2f}", f"{v['yaw']:.2f}",
+            f"{v['accel_x']:.2f}", f"{v['accel_y']:.2f}", f"{v['accel_z']:.2f}",
+            f"{v['mag_x']:.2f}", f"{v['mag_y']:.2f}", f"{v['mag_z']:.2f}",
+            f"{v['pressure']:.2f}", f"{v['temp_env']:.2f}", f"{v['tec_current']:.2f}", f"{v['tec_setpoint']:.2f}",
+            f"{v['latitude']:.6f}", f"{v['longitude']:.6f}", str(v['integration_time']), f"{v['thp_temp']:.2f}",
+            f"{v['thp_hum']:.2f}", f"{v['thp_pres']:.2f}", f"{v['spec_temp']:.2f}", v['routine_code'],
+            f"{v['imu_age']:.3f}", f"{v['thp_age']:.3f}", f"{v['tec_age']:.3f}",
+            str(v.get('scan_count', 0)), v.get('scan_ids', "")
         ]
         
         # Add averaged intensity values
-        row.extend([f"{val:.4f}" for val in avg_intensities])
+        if len(avg_intensities):
+            row.extend(format_fixed(avg_intensities).split(","))
         
         return row
 
@@ -427,21 +718,37 @@ class DataLogger(QObject):
             ts = QDateTime.currentDateTime().toString("yyyyMMdd_hhmmss")
             final_csv_path = os.path.join(self.csv_dir, f"final_{ts}.csv")
             
-            with open(final_csv_path, "w", encoding="utf-8", newline="") as f:
+            # Copy now; the text is formatted on the writer thread
+            data = list(data)
+            metadata = dict(metadata) if isinstance(metadata, dict) else None
+            
+            def render():
+                lines = []
                 # Write metadata header if provided
-                if metadata and isinstance(metadata, dict):
+                if metadata:
                     for key, value in metadata.items():
-                        f.write(f"# {key}: {value}\n")
-                
+                        lines.append(f"# {key}: {value}\n")
                 # Write column headers
-                f.write("Pixel,Intensity\n")
-                
+                lines.append("Pixel,Intensity\n")
                 # Write data
-                for i, intensity in enumerate(data):
-                    f.write(f"{i},{intensity:.4f}\n")
+                lines.append(format_table([range(len(data)), data], [0, 4]))
+                return "".join(lines)
             
-            self.status_signal.emit(f"Saved final data to {final_csv_path}")
+            routine = self.state_store.get(RoutineState)
+            get_file_writer().write_file(final_csv_path, render, newline="",
+                                         callback=self._on_final_data_written,
+                                         catalog={"kind": "final",
+                                                  "routine": routine.name if routine else None,
+                                                  "routine_start": routine.start_time if routine else None,
+                                                  "rows": len(data)})
             return True
         except Exception as e:
-            self.status_signal.emit(f"Error saving final data: {e}")
+            self.events.error("final_data_failed", f"Error saving final data: {e}", error=str(e))
             return False
+
+    def _on_final_data_written(self, path, error):
+        """Writer-thread callback for save_final_data"""
+        if error is None:
+            self.events.info("final_data_saved", f"Saved final data to {path}", path=path)
+        else:
+            self.events.error("final_data_failed", f"Error saving final data: {error}", path=path, error=str(error))
@@ -0,0 +1,80 @@
+from datetime import datetime
+from PyQt5.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QLabel, QComboBox, QTableWidget, QTableWidgetItem
+from PyQt5.QtCore import QTimer
+from PyQt5.QtGui import QColor
+
+from core.event_log import get_event_log, LEVELS, DEBUG, WARNING, ERROR
+
+_LEVEL_COLORS = {WARNING: "#ff9800", ERROR: "#f44336"}
+
+
+class EventViewerDialog(QDialog):
+    """Recent entries of the event log, refreshed while the dialog is open"""
+    def __init__(self, parent=None, count=500):
+        super().__init__(parent)
+        self.setWindowTitle("Events")
+        self.setMinimumSize(900, 400)
+        self.count = count
+        self._shown = None
+
+        layout = QVBoxLayout()
+        self.setLayout(layout)
+
+        filters = QHBoxLayout()
+        filters.addWidget(QLabel("Level:"))
+        self.level_combo = QComboBox()
+        self.level_combo.addItems(sorted(LEVELS, key=LEVELS.get))
+        self.level_combo.setCurrentText(DEBUG)
+        self.level_combo.currentTextChanged.connect(self.refresh)
+        filters.addWidget(self.level_combo)
+        filters.addWidget(QLabel("Component:"))
+        self.component_combo = QComboBox()
+        self.component_combo.addItem("All")
+        self.component_combo.currentTextChanged.connect(self.refresh)
+        filters.addWidget(self.component_combo)
+        filters.addStretch()
+        layout.addLayout(filters)
+
+        self.table = QTableWidget(0, 5)
+        self.table.setHorizontalHeaderLabels(["Time", "Level", "Component", "Code", "Message"])
+        self.table.horizontalHeader().setStretchLastSection(True)
+        self.table.verticalHeader().setVisible(False)
+        layout.addWidget(self.table)
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(1000)
+        self.refresh()
+
+    def refresh(self):
+        """Show the latest events matching the filters, newest first"""
+        log = get_event_log()
+        component = self.component_combo.currentText()
+        events = log.recent(self.count, min_level=self.level_combo.currentText(),
+                            component=None if component in ("", "All") else component)
+        key = (len(events), events[-1] if events else None, self.level_combo.currentText(), component)
+        if key == self._shown:
+            return
+        self._shown = key
+
+        known = {self.component_combo.itemText(i) for i in range(self.component_combo.count())}
+        for name in sorted({e.component for e in log.recent(self.count)} - known):
+            self.component_combo.addItem(name)
+
+        self.table.setRowCount(len(events))
+        for row, event in enumerate(reversed(events)):
+            message = event.message
+            if event.suppressed:
+                message += f" (+{event.suppressed} suppressed)"
+            cells = [datetime.fromtimestamp(event.timestamp).strftime("%H:%M:%S.%f")[:-3],
+                     event.level, event.component, event.code, message]
+            for col, text in enumerate(cells):
+                item = QTableWidgetItem(text)
+                if event.level in _LEVEL_COLORS:
+                    item.setForeground(QColor(_LEVEL_COLORS[event.level]))
+                self.table.setItem(row, col, item)
+        self.table.resizeColumnsToContents()
+
+    def closeEvent(self, event):
+        self.timer.stop()
+        super().closeEvent(event)
@@ -0,0 +1,76 @@
+import os
+import numpy as np
+from PyQt5.QtWidgets import QDialog, QVBoxLayout
+from PyQt5.QtCore import QDateTime
+
+
+class ResultsPlotDialog(QDialog):
+    """Dialog to display the results plot after routine completion"""
+    def __init__(self, title, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(title)
+        self.setMinimumSize(800, 600)
+        
+        # Create layout
+        layout = QVBoxLayout()
+        self.setLayout(layout)
+        
+        # Create matplotlib figure and canvas (matplotlib is only loaded once results are plotted)
+        import matplotlib.pyplot as plt
+        from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+        self.figure = plt.figure(figsize=(10, 6))
+        self.canvas = FigureCanvas(self.figure)
+        layout.addWidget(self.canvas)
+        
+        # Set dialog flags to ensure it's modal and blocks until closed
+        self.setModal(True)
+    
+    def plot_data(self, results):
+        """Plot the mean spectrum of every state in a RoutineResults"""
+        import matplotlib.pyplot as plt
+        self.figure.clear()
+        ax = self.figure.add_subplot(111)
+        
+        # A color map per filter position, shaded by angle
+        colormaps = ['Blues', 'Oranges', 'Greens', 'Purples', 'Reds', 'Greys']
+        positions = results.filter_positions()
+        for key in results.sorted_keys():
+            mean = results.mean(key)
+            angles = results.angles(key.filter_pos)
+            shade = 0.45 + 0.5 * angles.index(key.angle) / max(1, len(angles) - 1)
+            color = plt.get_cmap(colormaps[positions.index(key.filter_pos) % len(colormaps)])(shade)
+            ax.plot(np.arange(len(mean)), mean, color=color, linewidth=1.5,
+                    label=f"{results.label(key)} ({results.count(key)} scans)")
+        
+        ax.set_xlabel('Pixel')
+        ax.set_ylabel('Count (Average)')
+        ax.set_title(f'{self.windowTitle()} - Pixel Counts by Filter Position and Angle')
+        ax.grid(True, alpha=0.3)
+        ax.legend(loc='upper right', fontsize='small', ncol=max(1, len(positions) // 2))
+        self.canvas.draw()
+        
+    def closeEvent(self, event):
+        """Handle dialog close event - save the plot"""
+        try:
+            # Create diagrams directory if it doesn't exist
+            diagrams_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "diagrams")
+            os.makedirs(diagrams_dir, exist_ok=True)
+            
+            # Create a timestamp for the filename
+            ts = QDateTime.currentDateTime().toString("yyyyMMdd_hhmmss")
+            name = "_".join(self.windowTitle().lower().split())
+            filename = os.path.join(diagrams_dir, f"{name}_plot_{ts}.png")
+            
+            # Save the figure
+            self.figure.savefig(filename, dpi=300, bbox_inches='tight')
+            print(f"Plot saved to {filename}")
+            
+            # Close all matplotlib figures to prevent memory leaks
+            import matplotlib.pyplot as plt
+            plt.close(self.figure)
+            plt.close('all')
+        except Exception as e:
+            print(f"Error saving plot: {e}")
+        
+        # Call the parent class closeEvent
+        super().closeEvent(event)
@@ -1,110 +1,127 @@
 import os
+import time
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from PyQt5.QtWidgets import QDialog, QVBoxLayout, QFileDialog
-from PyQt5.QtCore import QDateTime, QTimer, pyqtSignal, QObject
+from PyQt5.QtCore import QDateTime, QTimer, pyqtSignal, QObject, Qt
+from dataclasses import dataclass
 from datetime import datetime
+from typing import Callable, Optional
+
+from storage.file_writer import get_file_writer
+from core.state_store import (get_state_store, RoutineState, MotorState, FilterWheelState, SpectrometerState,
+                              TECState)
+from core.routine_results import RoutineResults
+from core.spectrum import as_spectrum
+from core.routine_compiler import (compile_file, compile_routine, check_devices, RoutineCompileError, Instruction,
+                                   MOTOR, FILTER_WHEEL, SPECTROMETER, TEMPERATURE, CAMERA, FLIGHT_RECORDER)
+from core.routine_checkpoint import Checkpoint, save_checkpoint, load_checkpoint, clear_checkpoint
+from core.routine_simulator import simulate, DeviceModels
+from drivers.motor import move_duration
+
+# MainWindow attribute of the component behind each routine device
+_DEVICE_ATTRIBUTES = {
+    MOTOR: "motor_ctrl",
+    FILTER_WHEEL: "filter_ctrl",
+    SPECTROMETER: "spec_ctrl",
+    TEMPERATURE: "temp_ctrl",
+    CAMERA: "camera_manager",
+    FLIGHT_RECORDER: "flight_recorder",
+}
+
+# Delay (ms) after each operation when instructions completed after fixed delays;
+# still used in the "fixed" completion mode and as the baseline of the timing report
+FIXED_DELAYS_MS = {
+    "log": 500,
+    "integration": 1000,
+    "plot": 1000,
+    "motor.move": 2000,
+    "filter.position": 2000,
+    "spectrometer.start": 500,
+    "spectrometer.stop": 500,
+    "spectrometer.save": 500,
+    "spectrometer.save_snapshot": 500,
+    "data.start": 500,
+    "data.stop": 500,
+    "recorder.dump": 100,
+    "camera.save_image": 500,
+    "temperature.set": 500,
+}
+COMPLETION_MODES = ("events", "fixed")
+DEFAULT_TIMEOUT_S = 10.0
+DEFAULT_CHECKPOINT = os.path.join("data", "routine_checkpoint.json")
+
+
+@dataclass
+class _Wait:
+    """What a running instruction waits for (see RoutineManager._expect)"""
+    description: str
+    state: Optional[Callable] = None      # predicate on published state records
+    scans: int = 0                        # scans to receive once the state is reached
+    reached: Optional[float] = None       # time the state was reached
+    timeout_s: Optional[float] = None
+
+
+@dataclass(frozen=True)
+class ConcurrentStep:
+    """Commands run concurrently up to a sync, with the one on the critical path"""
+    first_line: int
+    last_line: int
+    seconds: float                        # from the first command to the end of the sync
+    sequential: float                     # the commands' times added up
+    critical: Instruction                 # the command that took longest
+    critical_seconds: float
+
+    def __str__(self):
+        return (f"lines {self.first_line}-{self.last_line}: {self.seconds:.1f} s, critical path line "
+                f"{self.critical.line} '{self.critical.text}' {self.critical_seconds:.1f} s "
+                f"(one after another: {self.sequential:.1f} s)")
+
+
+class RoutineTiming:
+    """Time a routine run took per operation, against the fixed delays it used to take"""
+
+    def __init__(self):
+        self.ops = {}                     # op -> [count, seconds, fixed-delay seconds]
+        self.steps = []                   # ConcurrentSteps
+        self.timeouts = 0
+        self.elapsed = 0.0                # run time: sequential instructions and concurrent steps
+
+    def add(self, instruction, seconds, timed_out=False, concurrent=False):
+        """Time of one instruction; concurrent ones count towards elapsed through their step"""
+        fixed_ms = instruction.args[0] if instruction.op == "wait" else FIXED_DELAYS_MS.get(instruction.op, 0)
+        entry = self.ops.setdefault(instruction.op, [0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+        entry[2] += fixed_ms / 1000.0
+        self.timeouts += bool(timed_out)
+        if not concurrent:
+            self.elapsed += seconds
+
+    def add_step(self, sync, seconds, commands):
+        """A concurrent step ended by the sync instruction; commands are (instruction, seconds) pairs"""
+        critical, critical_seconds = max(commands, key=lambda command: command[1])
+        step = ConcurrentStep(min(instruction.line for instruction, _ in commands), sync.line, seconds,
+                              sum(s for _, s in commands), critical, critical_seconds)
+        self.steps.append(step)
+        self.elapsed += seconds
+        return step
+
+    @property
+    def fixed(self):
+        return sum(entry[2] for entry in self.ops.values())
+
+    def summary(self):
+        saved = self.fixed - self.elapsed
+        timeouts = f", {self.timeouts} timed out" if self.timeouts else ""
+        return f"{self.elapsed:.1f} s (fixed delays: {self.fixed:.1f} s, saved {saved:.1f} s{timeouts})"
+
+    def report(self):
+        lines = [f"{'operation':<28}{'count':>6}{'time (s)':>10}{'fixed (s)':>11}"]
+        for op, (count, seconds, fixed) in sorted(self.ops.items()):
+            lines.append(f"{op:<28}{count:>6}{seconds:>10.1f}{fixed:>11.1f}")
+        lines.append(f"{'run time':<28}{sum(e[0] for e in self.ops.values()):>6}{self.elapsed:>10.1f}{self.fixed:>11.1f}")
+        lines.extend(f"concurrent {step}" for step in self.steps)
+        return "\n".join(lines)
 
-class ResultsPlotDialog(QDialog):
-    """Dialog to display the results plot after routine completion"""
-    def __init__(self, title, parent=None):
-        super().__init__(parent)
-        self.setWindowTitle(title)
-        self.setMinimumSize(800, 600)
-        
-        # Create layout
-        layout = QVBoxLayout()
-        self.setLayout(layout)
-        
-        # Create matplotlib figure and canvas
-        self.figure = plt.figure(figsize=(10, 6))
-        self.canvas = FigureCanvas(self.figure)
-        layout.addWidget(self.canvas)
-        
-        # Set dialog flags to ensure it's modal and blocks until closed
-        self.setModal(True)
-    
-    def plot_data(self, data_dict, pixel_indices):
-        """Plot the data from the dictionary"""
-        # Clear the figure
-        self.figure.clear()
-        
-        # Create subplot
-        ax = self.figure.add_subplot(111)
-        
-        # Dark colors for Opaque filter (position 1)
-        dark_colors = ['#1a237e', '#311b92', '#4a148c', '#880e4f', '#b71c1c']
-        # Light colors for Open filter (position 2)
-        light_colors = ['#7986cb', '#9575cd', '#ba68c8', '#f48fb1', '#ef9a9a']
-        
-        # Print data keys for debugging
-        print(f"Data keys: {list(data_dict.keys())}")
-        
-        # Plot Opaque filter data (position 1)
-        for i, angle in enumerate([0, 45, 90, 135, 180]):
-            key = f"pos1_angle{angle}"
-            if key in data_dict and len(data_dict[key]) > 0:
-                print(f"Plotting {key} with {len(data_dict[key])} points, color: {dark_colors[i]}")
-                ax.plot(pixel_indices, data_dict[key], 
-                        color=dark_colors[i], 
-                        linewidth=2, 
-                        label=f"Opaque ({angle}°)")
-            else:
-                print(f"No data for {key}")
-        
-        # Plot Open filter data (position 2)
-        for i, angle in enumerate([0, 45, 90, 135, 180]):
-            key = f"pos2_angle{angle}"
-            if key in data_dict and len(data_dict[key]) > 0:
-                print(f"Plotting {key} with {len(data_dict[key])} points, color: {light_colors[i]}")
-                ax.plot(pixel_indices, data_dict[key], 
-                        color=light_colors[i], 
-                        linewidth=2, 
-                        label=f"Open ({angle}°)")
-            else:
-                print(f"No data for {key}")
-        
-        # Set labels and title
-        ax.set_xlabel('Pixel')
-        ax.set_ylabel('Count (Average)')
-        ax.set_title('PO Routine Results - Pixel Counts by Position and Angle')
-        
-        # Add grid
-        ax.grid(True, alpha=0.3)
-        
-        # Add legend
-        ax.legend(loc='upper right')
-        
-        # Update the canvas
-        self.canvas.draw()
-        
-        print("Plot completed and canvas updated")
-        
-    def closeEvent(self, event):
-        """Handle dialog close event - save the plot"""
-        try:
-            # Create diagrams directory if it doesn't exist
-            diagrams_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "diagrams")
-            os.makedirs(diagrams_dir, exist_ok=True)
-            
-            # Create a timestamp for the filename
-            ts = QDateTime.currentDateTime().toString("yyyyMMdd_hhmmss")
-            filename = os.path.join(diagrams_dir, f"po_routine_plot_{ts}.png")
-            
-            # Save the figure
-            self.figure.savefig(filename, dpi=300, bbox_inches='tight')
-            print(f"Plot saved to {filename}")
-            
-            # Close all matplotlib figures to prevent memory leaks
-            plt.close(self.figure)
-            plt.close('all')
-        except Exception as e:
-            print(f"Error saving plot: {e}")
-        
-        # Call the parent class closeEvent
-        super().closeEvent(event)
 
 class RoutineManager(QObject):
     """
@@ -122,21 +139,87 @@ class RoutineManager(QObject):
     - data stop: Stops continuous data saving
     - plot: Takes a snapshot of the current spectrometer data and adds it as a static curve
     - integration [time_ms]: Sets the spectrometer integration time in milliseconds
+    - recorder dump [label]: Saves the flight recorder's last seconds of raw scans and sensor data
+    - camera save_image [filename]: Saves a camera image in the routine's data directory
+    - temperature set [celsius]: Sets the temperature controller's setpoint
+    - async [command]: Issues a command without waiting for it to complete
+    - sync: Waits until every async command has completed
+    - parallel { [command]; [command] }: Runs the commands concurrently, then syncs
+    
+    Routine files are compiled by core.routine_compiler when loaded; each
+    compiled instruction is dispatched to its handler in self._handlers,
+    which returns a delay in milliseconds before the next instruction, or
+    None. None completes the instruction at once, unless the handler armed
+    _expect(): it then completes on its event (motor in position, filter
+    position confirmed, first scan at the new settings, file written) or after
+    a timeout. With "completion": "fixed" in the "routine" config every
+    instruction waits its FIXED_DELAYS_MS instead.
+
+    After every completed step a checkpoint (core.routine_checkpoint) is
+    written to the "checkpoint" file of the "routine" config; a stopped or
+    crashed run continues from it with resume_routine().
     """
     status_signal = pyqtSignal(str)
+    finished_signal = pyqtSignal(bool)  # a run ended: True when completed, False when stopped
+    _state_event = pyqtSignal(object)   # published state records while an instruction waits, from any thread
+    _wait_done = pyqtSignal(int)        # token of the completed instruction, from any thread
     
     def __init__(self, main_window):
         super().__init__(main_window)  # Initialize QObject with parent
         self.main_window = main_window
+        config = dict((getattr(main_window, 'config', None) or {}).get("routine", {}))
+        self.completion_mode = config.get("completion", "events")
+        if self.completion_mode not in COMPLETION_MODES:
+            print(f"Routine: unknown completion mode '{self.completion_mode}', using 'events'")
+            self.completion_mode = "events"
+        self.timeout_s = float(config.get("timeout_s", DEFAULT_TIMEOUT_S))
+        self.simulation_config = config.get("simulation", {})  # DeviceModels options of dry runs
+        checkpoint = config.get("checkpoint", DEFAULT_CHECKPOINT)   # false: no checkpoints
+        self.checkpoint_path = None if not checkpoint else checkpoint if os.path.isabs(checkpoint) else \
+            os.path.join(os.path.dirname(__file__), "..", "..", checkpoint)
+        self._restore_count = 0            # leading instructions that re-establish a checkpoint's device state
+        self._program_offset = 0           # program index of an instruction minus its index in routine_commands
+        self._setpoint = None              # last temperature the routine set
+        self.timing = None                 # RoutineTiming of the current or last run
+        self._current = None               # (token, instruction, start time) of the instruction the routine is on
+        self._waits = {}                   # token -> _Wait of each running instruction that awaits an event
+        self._background = {}              # token -> (instruction, start time) of running concurrent instructions
+        self._step = None                  # (start time, [(instruction, seconds)]) of the concurrent step
+        self._wait_token = 0
+        # Queued even within the GUI thread, so an instruction never completes inside its handler
+        self._state_event.connect(self._on_state, Qt.QueuedConnection)
+        self._wait_done.connect(self._on_wait_done, Qt.QueuedConnection)
         self.routine_running = False
-        self.routine_commands = []
+        self.program = None
+        self.routine_commands = ()         # compiled Instructions of the loaded routine
         self.current_command_index = 0
         self.routine_timer = QTimer()
         self.routine_timer.timeout.connect(self._execute_next_command)
         self.data_saving_started_by_routine = False
         self.final_data = None
+        self.results = None                # RoutineResults of the current or last run
+        self._commanded = {}               # state record class -> time a command last changed it
+        self.current_routine = None        # path of the loaded routine file
         self.current_routine_name = None
         self.current_routine_start_time_str = None
+        self._handlers = {
+            "log": self._cmd_log,
+            "wait": self._cmd_wait,
+            "integration": self._cmd_integration,
+            "plot": self._cmd_plot,
+            "motor.move": self._cmd_motor_move,
+            "filter.position": self._cmd_filter_position,
+            "spectrometer.start": self._cmd_spectrometer_start,
+            "spectrometer.stop": self._cmd_spectrometer_stop,
+            "spectrometer.save": self._cmd_spectrometer_save,
+            "spectrometer.save_snapshot": self._cmd_spectrometer_save,
+            "data.start": self._cmd_data_start,
+            "data.stop": self._cmd_data_stop,
+            "recorder.dump": self._cmd_recorder_dump,
+            "camera.save_image": self._cmd_camera_save_image,
+            "temperature.set": self._cmd_temperature_set,
+            "sync": self._cmd_sync,
+        }
         
         # Set up routines directory
         self.routines_dir = os.path.join(os.path.dirname(__file__), "..", "..", "routines")
@@ -160,6 +243,7 @@ class RoutineManager(QObject):
 
     def load_routine_file(self):
         """Load a routine file from disk"""
+        from PyQt5.QtWidgets import QFileDialog
         file_path, _ = QFileDialog.getOpenFileName(
             self.main_window,
             "Open Routine File",
@@ -191,18 +275,12 @@ class RoutineManager(QObject):
             self.main_window.statusBar().showMessage(f"Unknown preset: {preset_name}")
 
     def _load_routine_from_file(self, file_path):
-        """Load and parse a routine file"""
+        """Load and compile a routine file"""
+        self.program = None
+        self.routine_commands = ()
         try:
-            with open(file_path, 'r') as f:
-                content = f.read()
-            
-            # Parse the routine
-            self.routine_commands = []
-            for line in content.splitlines():
-                line = line.strip()
-                if not line or line.startswith('#'):
-                    continue
-                self.routine_commands.append(line)
+            self.program = compile_file(file_path)
+            self.routine_commands = self.program.instructions
             
             # Update UI
             self.main_window.statusBar().showMessage(f"Loaded routine with {len(self.routine_commands)} commands")
@@ -210,7 +288,21 @@ class RoutineManager(QObject):
                 self.main_window.routine_status.setText(f"Loaded: {os.path.basename(file_path)}")
             if hasattr(self.main_window, 'run_routine_btn'):
                 self.main_window.run_routine_btn.setEnabled(len(self.routine_commands) > 0)
+            if hasattr(self.main_window, 'dry_run_btn'):
+                self.main_window.dry_run_btn.setEnabled(len(self.routine_commands) > 0)
         
+        except RoutineCompileError as e:
+            # Every error is reported now rather than when the run reaches it
+            print(f"Routine errors:\n{e}")
+            first = e.errors[0]
+            more = f" (+{len(e.errors) - 1} more, see console)" if len(e.errors) > 1 else ""
+            self.main_window.statusBar().showMessage(f"Routine error on line {first.line}: {first.message}{more}")
+            if hasattr(self.main_window, 'routine_status'):
+                self.main_window.routine_status.setText(f"Errors in routine ({len(e.errors)})")
+            if hasattr(self.main_window, 'run_routine_btn'):
+                self.main_window.run_routine_btn.setEnabled(False)
+            if hasattr(self.main_window, 'dry_run_btn'):
+                self.main_window.dry_run_btn.setEnabled(False)
         except Exception as e:
             self.main_window.statusBar().showMessage(f"Error loading routine: {e}")
             if hasattr(self.main_window, 'routine_status'):
@@ -227,8 +319,23 @@ class RoutineManager(QObject):
             self.stop_routine()
             return
         
-        # Set routine start time string
-        self.current_routine_start_time_str = QDateTime.currentDateTime().toString("yyyyMMdd_hhmmss")
+        self._end_resume()
+        self._setpoint = None
+        self._start_run(QDateTime.currentDateTime().toString("yyyyMMdd_hhmmss"))
+
+    def _start_run(self, start_time_str):
+        """Start routine_commands, as the run that started at start_time_str"""
+        # Refuse to start if a device the routine drives is not available
+        missing = check_devices(self.program, self.available_devices())
+        if missing:
+            details = "; ".join(f"{device} (line{'s' if len(lines) > 1 else ''} {', '.join(map(str, lines))})"
+                                for device, lines in sorted(missing.items()))
+            self.main_window.statusBar().showMessage(f"Routine not started, not available: {details}")
+            print(f"Routine not started, devices not available: {details}")
+            return
+        
+        # Set routine start time string (a resumed run keeps its directory)
+        self.current_routine_start_time_str = start_time_str
         
         # Reset plot creation flag when starting a new routine
         self._plot_created = False
@@ -239,6 +346,12 @@ class RoutineManager(QObject):
         # Start the routine
         self.routine_running = True
         self.current_command_index = 0
+        self.timing = RoutineTiming()
+        self.results = RoutineResults()
+        self._commanded = {}
+        self._attach_completion()
+        if not self._restore_count:
+            self._save_checkpoint()
         if hasattr(self.main_window, 'run_routine_btn'):
             self.main_window.run_routine_btn.setText("Stop")
         if hasattr(self.main_window, 'routine_status'):
@@ -249,10 +362,150 @@ class RoutineManager(QObject):
         
         self.main_window.statusBar().showMessage(f"Started routine")
 
+    def run_file(self, file_path, name=None):
+        """Load and start a routine file (e.g. from the scheduler); returns whether it started"""
+        if self.routine_running:
+            return False
+        self._load_routine_from_file(file_path)
+        if not self.routine_commands:
+            return False
+        self.current_routine = file_path
+        self.current_routine_name = name or os.path.splitext(os.path.basename(file_path))[0]
+        self.run_routine()
+        return self.routine_running
+
+    def pending_checkpoint(self):
+        """Checkpoint of a stopped or interrupted run, or None"""
+        return load_checkpoint(self.checkpoint_path)
+
+    def resume_routine(self, checkpoint_path=None):
+        """Continue the run of a checkpoint after its last completed step; returns whether it started.
+
+        The devices the routine drives are first put back in the recorded
+        state (temperature, integration time, filter, angle, measuring, data
+        saving), with routine commands run before the remaining instructions.
+        """
+        if self.routine_running:
+            return False
+        path = checkpoint_path or self.checkpoint_path
+        checkpoint = load_checkpoint(path)
+        if checkpoint is None:
+            self.main_window.statusBar().showMessage("No routine checkpoint to resume")
+            return False
+        self._load_routine_from_file(checkpoint.routine)
+        if not self.routine_commands:
+            return False
+        if self.program.digest != checkpoint.digest:
+            self.routine_commands = ()
+            self.main_window.statusBar().showMessage(
+                f"Routine not resumed: {os.path.basename(checkpoint.routine)} has changed since the checkpoint")
+            return False
+        restore = compile_routine("\n".join(checkpoint.restore_commands(self.program.devices)),
+                                  source=f"{path} (device state)").instructions
+        self.routine_commands = restore + self.program.instructions[checkpoint.next_index:]
+        self._restore_count = len(restore)
+        self._program_offset = checkpoint.next_index - len(restore)
+        self._setpoint = checkpoint.setpoint
+        self.current_routine = checkpoint.routine
+        self.current_routine_name = checkpoint.name
+        print(f"Routine: resuming {checkpoint.describe()}")
+        for instruction in restore:
+            print(f"Routine:   restore: {instruction.text}")
+        if checkpoint.data_index:
+            print(f"Routine:   data saved before the stop: {checkpoint.data_index}")
+        self._start_run(checkpoint.start_time)
+        if self.routine_running:
+            self.main_window.statusBar().showMessage(f"Resumed routine {checkpoint.describe()}")
+        return self.routine_running
+
+    def _end_resume(self):
+        """Put the whole loaded program back in place of a resumed run's remainder"""
+        if self.program is not None:
+            self.routine_commands = self.program.instructions
+        self._restore_count = self._program_offset = 0
+
+    def _save_checkpoint(self):
+        """Record where the routine is and the state it left the devices in"""
+        if not self.checkpoint_path or self.program is None:
+            return
+        store = get_state_store()
+        motor, wheel, spec = store.get(MotorState), store.get(FilterWheelState), store.get(SpectrometerState)
+        logger = getattr(self.main_window, 'data_logger', None)
+        saving = bool(getattr(logger, 'continuous_saving', False))
+        index = self.current_command_index + self._program_offset
+        try:
+            save_checkpoint(self.checkpoint_path, Checkpoint(
+                routine=os.path.abspath(self.program.source or self.current_routine),
+                name=self.current_routine_name or "",
+                digest=self.program.digest,
+                next_index=index,
+                total=len(self.program),
+                line=self.program[index].line if index < len(self.program) else 0,
+                start_time=self.current_routine_start_time_str or "",
+                saved=time.time(),
+                motor_angle=motor.angle_deg if motor is not None and motor.connected else None,
+                filter_pos=wheel.position if wheel is not None and wheel.connected else None,
+                integration_ms=spec.integration_time_ms if spec is not None else None,
+                measuring=bool(spec is not None and spec.measuring),
+                setpoint=self._setpoint,
+                data_saving=saving,
+                data_index=getattr(logger, 'segment_index_path', None) if saving else None))
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Routine: cannot write checkpoint {self.checkpoint_path}: {e}")
+
+    def dry_run(self):
+        """Estimate the loaded routine's run with simulated devices, starting from their current state"""
+        if not self.routine_commands:
+            self.main_window.statusBar().showMessage("No routine loaded")
+            return None
+        state = {}
+        motor_ctrl = getattr(self.main_window, 'motor_ctrl', None)
+        if motor_ctrl is not None and motor_ctrl.current_angle_deg is not None:
+            state["motor_angle"] = motor_ctrl.current_angle_deg
+        spec = get_state_store().get(SpectrometerState)
+        if spec is not None:
+            state["measuring"] = spec.measuring
+            if spec.integration_time_ms:
+                state["integration_ms"] = spec.integration_time_ms
+        simulation = simulate(self.program, DeviceModels.from_config(self.simulation_config, **state))
+        print(f"Routine dry run:\n{simulation.report()}")
+        self.main_window.statusBar().showMessage(f"Dry run: routine takes about {simulation.summary()}")
+        return simulation
+
+    def available_devices(self):
+        """Routine devices whose component exists and is connected"""
+        available = set()
+        for device, attribute in _DEVICE_ATTRIBUTES.items():
+            component = getattr(self.main_window, attribute, None)
+            if component is None:
+                continue
+            if device == CAMERA:
+                ready = getattr(component, 'camera', None) is not None
+            elif device == FLIGHT_RECORDER:
+                ready = component.enabled
+            elif hasattr(component, 'is_ready'):
+                ready = component.is_ready()
+            else:
+                ready = component.is_connected()
+            if ready:
+                available.add(device)
+        return available
+
+    def _publish_state(self, command=""):
+        """Publish the routine name, running flag and current command to the state store"""
+        get_state_store().publish(RoutineState(name=self.current_routine_name,
+                                               start_time=self.current_routine_start_time_str,
+                                               running=self.routine_running,
+                                               command_index=self.current_command_index,
+                                               command=command))
+
     def stop_routine(self):
         """Stop the currently running routine"""
         self.routine_running = False
         self.routine_timer.stop()
+        self._cancel_wait()
+        self._detach_completion()
+        self._publish_state()
         
         # Stop data saving if it was started by the routine
         if self.data_saving_started_by_routine:
@@ -266,7 +519,12 @@ class RoutineManager(QObject):
             self.main_window.run_routine_btn.setText("Run Code")
         if hasattr(self.main_window, 'routine_status'):
             self.main_window.routine_status.setText("Routine stopped")
+        self._end_resume()
+        checkpoint = self.pending_checkpoint()
+        if checkpoint is not None:
+            print(f"Routine: stopped; resume continues {checkpoint.describe()}")
         self.main_window.statusBar().showMessage("Routine execution stopped")
+        self.finished_signal.emit(False)
     
     def _execute_next_command(self):
         """Execute the next command in the routine"""
@@ -275,15 +533,16 @@ class RoutineManager(QObject):
             self._routine_complete()
             return
         
-        # Get the current command
-        command = self.routine_commands[self.current_command_index]
+        # Get the current instruction
+        instruction = self.routine_commands[self.current_command_index]
         
         # Update status
         if hasattr(self.main_window, 'routine_status'):
-            self.main_window.routine_status.setText(f"Running command {self.current_command_index + 1}/{len(self.routine_commands)}: {command}")
+            self.main_window.routine_status.setText(f"Running command {self.current_command_index + 1}/{len(self.routine_commands)}: {instruction.text}")
         
         # Execute the command
-        self._execute_command(command)
+        self._publish_state(instruction.text)
+        self._execute_command(instruction)
         
         # Move to the next command
         self.current_command_index += 1
@@ -300,6 +559,11 @@ class RoutineManager(QObject):
         
         self.routine_running = False
         self.current_command_index = 0
+        self._cancel_wait()
+        self._detach_completion()
+        self._publish_state()
+        clear_checkpoint(self.checkpoint_path)
+        self._end_resume()
         
         # Update UI
         if hasattr(self.main_window, 'routine_status'):
@@ -312,16 +576,10 @@ class RoutineManager(QObject):
                     self.main_window.toggle_data_saving()
             self.data_saving_started_by_routine = False
         
-        # Process the data and create the plot - only do this once
+        # Plot the results aggregated during the run - only do this once
         if not hasattr(self, '_plot_created') or not self._plot_created:
-            self.main_window.statusBar().showMessage("Processing routine data for plotting...")
-            print("Routine completed, processing data for plotting...")
-            
-            # Set flag to indicate we're creating the plot
             self._plot_created = True
-            
-            # Add a small delay to ensure data is saved before processing
-            QTimer.singleShot(1000, self._process_and_plot_routine_data)
+            self._process_and_plot_routine_data()
         else:
             print("Plot already created for this routine, skipping")
         
@@ -329,179 +587,61 @@ class RoutineManager(QObject):
         if hasattr(self.main_window, 'run_routine_btn'):
             self.main_window.run_routine_btn.setText("Run")
         
-        # Log completion
-        self.main_window.statusBar().showMessage("Routine completed")
+        # Log completion with the time completion events saved over fixed delays
+        if self.timing is not None and self.timing.ops:
+            print(f"Routine timing:\n{self.timing.report()}")
+            self.main_window.statusBar().showMessage(f"Routine completed in {self.timing.summary()}")
+        else:
+            self.main_window.statusBar().showMessage("Routine completed")
+        self.finished_signal.emit(True)
         
         # Reset completion flag after a delay to allow for any pending operations
         QTimer.singleShot(5000, lambda: setattr(self, '_completion_in_progress', False))
 
     def _process_and_plot_routine_data(self):
-        """Process the data from the routine and create a plot"""
+        """Plot the mean spectra the routine measured, from the results aggregated while it ran"""
         try:
             # Check if we already have a plot dialog open to prevent duplicates
             if hasattr(self, '_plot_dialog_open') and self._plot_dialog_open:
                 print("Plot dialog already open, skipping duplicate processing")
                 return
             
-            # Set flag to prevent multiple dialogs
-            self._plot_dialog_open = True
-            
-            self.main_window.statusBar().showMessage("Starting data processing...")
-            
-            # Find the most recent CSV file in the data directory
-            csv_dir = "data"
-            if not os.path.exists(csv_dir):
-                self.main_window.statusBar().showMessage("Data directory not found")
-                self._plot_dialog_open = False
-                return
-            
-            # Get list of CSV files
-            csv_files = [f for f in os.listdir(csv_dir) if f.endswith('.csv') and not f.startswith('final_')]
-            if not csv_files:
-                self.main_window.statusBar().showMessage("No CSV files found")
-                self._plot_dialog_open = False
-                return
-            
-            # Sort by modification time (most recent first)
-            csv_files.sort(key=lambda x: os.path.getmtime(os.path.join(csv_dir, x)), reverse=True)
-            
-            # Get the most recent file
-            latest_csv = os.path.join(csv_dir, csv_files[0])
-            self.main_window.statusBar().showMessage(f"Processing data from {latest_csv}")
-            
-            # Read the CSV file
-            df = pd.read_csv(latest_csv)
-            
-            # Print column names for debugging
-            print(f"CSV columns: {df.columns.tolist()}")
-            
-            # Check for required columns with different possible names
-            motor_angle_col = None
-            filter_pos_col = None
-            
-            # Check for motor angle column
-            for col_name in ['MotorAngle', 'MotorAngle_deg', 'Motor_Angle']:
-                if col_name in df.columns:
-                    motor_angle_col = col_name
-                    break
-            
-            # Check for filter position column
-            for col_name in ['FilterPosition', 'FilterPos', 'Filter_Position']:
-                if col_name in df.columns:
-                    filter_pos_col = col_name
-                    break
-            
-            if not motor_angle_col or not filter_pos_col:
-                self.main_window.statusBar().showMessage(f"CSV file missing required columns. Found: {', '.join(df.columns)}")
-                self._plot_dialog_open = False
-                return
-            
-            # Find the intensity columns (they start with 'Pixel_')
-            intensity_cols = [col for col in df.columns if col.startswith('Pixel_')]
-            
-            # If no columns start with 'Pixel_', try other patterns
-            if not intensity_cols:
-                intensity_cols = [col for col in df.columns if 'Pixel' in col]
-            
-            # If still no intensity columns, try numeric columns after the metadata columns
-            if not intensity_cols:
-                # Assume all numeric columns after standard metadata are pixel data
-                metadata_cols = ['Timestamp', motor_angle_col, filter_pos_col, 
-                                'Roll_deg', 'Pitch_deg', 'Yaw_deg', 
-                                'AccelX_g', 'AccelY_g', 'AccelZ_g',
-                                'MagX_uT', 'MagY_uT', 'MagZ_uT',
-                                'Pressure_hPa', 'TempEnv_C', 'TempCurr_C', 'TempSet_C',
-                                'Latitude', 'Longitude', 'IntegTime_us', 'THPTemp_C',
-                                'THPHum_pct', 'THPPres_hPa', 'Spec_temp_C', 'RoutineCode']
-                
-                # Get columns that are not in metadata_cols
-                remaining_cols = [col for col in df.columns if col not in metadata_cols]
-                
-                # Try to convert these to numeric and use those that succeed
-                for col in remaining_cols:
-                    try:
-                        pd.to_numeric(df[col])
-                        intensity_cols.append(col)
-                    except:
-                        pass
-            
-            if not intensity_cols:
-                self.main_window.statusBar().showMessage("No intensity columns found in CSV file")
-                self._plot_dialog_open = False
+            results = self.results
+            if results is None or not len(results):
+                self.main_window.statusBar().showMessage("No routine data to plot")
                 return
+            print(f"Routine results: {results.scans} scans in {len(results)} states ({results.skipped} skipped)")
+            for key in results.sorted_keys():
+                print(f"  {results.label(key)}: {results.count(key)} scans, avg: {results.mean(key).mean():.2f}")
             
-            self.main_window.statusBar().showMessage(f"Found {len(intensity_cols)} intensity columns")
-            print(f"Using intensity columns: {intensity_cols[:5]}... (total: {len(intensity_cols)})")
-            
-            # Create a dictionary to store the averaged data
-            data_dict = {}
-            
-            # Process data for each filter position and angle
-            for filter_pos in [1, 2]:  # 1=Opaque, 2=Open
-                for angle in [0, 45, 90, 135, 180]:
-                    # Filter the data
-                    filtered_df = df[(df[filter_pos_col] == filter_pos) & 
-                                    (df[motor_angle_col] == angle)]
-                    
-                    if not filtered_df.empty:
-                        # Calculate the average intensity for each pixel
-                        avg_intensities = filtered_df[intensity_cols].mean().values
-                        
-                        # Store in the dictionary
-                        key = f"pos{filter_pos}_angle{angle}"
-                        data_dict[key] = avg_intensities
-                        print(f"Processed data for position {filter_pos}, angle {angle}: {len(filtered_df)} rows, avg: {avg_intensities.mean():.2f}")
-                    else:
-                        print(f"No data found for position {filter_pos}, angle {angle}")
-            
-            if not data_dict:
-                self.main_window.statusBar().showMessage("No matching data found in CSV file")
-                self._plot_dialog_open = False
+            # Without a display (headless.py) the printed results are all
+            if getattr(self.main_window, 'headless', False):
+                self.main_window.statusBar().showMessage(f"Routine results: {len(results)} states, {results.scans} scans")
                 return
-            
-            # Create pixel indices
-            pixel_indices = np.arange(len(intensity_cols))
-            
+
             # Create and show the plot dialog - ONLY ONCE
-            self.main_window.statusBar().showMessage("Creating plot dialog...")
-            plot_dialog = ResultsPlotDialog("PO Routine Results", self.main_window)
-            plot_dialog.plot_data(data_dict, pixel_indices)
-            
-            # Connect the dialog's close event to reset the flag
+            from gui.components.results_plot import ResultsPlotDialog
+            self._plot_dialog_open = True
+            plot_dialog = ResultsPlotDialog(f"{self.current_routine_name or 'Routine'} Results", self.main_window)
+            plot_dialog.plot_data(results)
             plot_dialog.finished.connect(self._on_plot_dialog_closed)
-            
-            # Show the dialog
             plot_dialog.show()
             
-            # Also update the spectrometer plot if available
-            if hasattr(self.main_window, 'spec_ctrl') and hasattr(self.main_window.spec_ctrl, 'curve_px'):
-                # Create a combined plot for the spectrometer view
-                # Use position 2 (Open) data as it's more interesting
-                combined_data = np.zeros(len(intensity_cols))
-                count = 0
-                
-                for angle in [0, 45, 90, 135, 180]:
-                    key = f"pos2_angle{angle}"
-                    if key in data_dict and len(data_dict[key]) > 0:
-                        combined_data += data_dict[key]
-                        count += 1
-                
-                if count > 0:
-                    combined_data /= count
-                    
-                    # Update the spectrometer plot
-                    self.main_window.spec_ctrl.curve_px.setData(pixel_indices, combined_data)
-                    
-                    # Update y-axis range
-                    if np.max(combined_data) > 0:
-                        max_y = np.max(combined_data) * 1.1
-                        self.main_window.spec_ctrl.plot_px.setYRange(0, max_y)
-                    
-                    # Add timestamp to the plot title
-                    timestamp = QDateTime.currentDateTime().toString("yyyy-MM-dd HH:mm:ss")
-                    self.main_window.spec_ctrl.plot_px.setTitle(f"PO Routine Results - {timestamp}")
-                    
-                    self.main_window.statusBar().showMessage("Updated spectrometer plot with routine data")
+            # Also show the brightest filter position (e.g. Open), averaged over its angles, in the spectrometer plot
+            spec_ctrl = getattr(self.main_window, 'spec_ctrl', None)
+            if spec_ctrl is not None and hasattr(spec_ctrl, 'curve_px'):
+                means = results.means()
+                by_position = {}
+                for key, mean in means.items():
+                    by_position.setdefault(key.filter_pos, []).append(mean)
+                brightest = max(by_position.values(), key=lambda spectra: np.mean(spectra))
+                combined_data = np.mean(brightest, axis=0)
+                spec_ctrl.curve_px.setData(np.arange(len(combined_data)), combined_data)
+                if np.max(combined_data) > 0:
+                    spec_ctrl.plot_px.setYRange(0, np.max(combined_data) * 1.1)
+                timestamp = QDateTime.currentDateTime().toString("yyyy-MM-dd HH:mm:ss")
+                spec_ctrl.plot_px.setTitle(f"{self.current_routine_name or 'Routine'} Results - {timestamp}")
+            self.main_window.statusBar().showMessage(f"Routine results: {len(results)} states, {results.scans} scans")
         
         except Exception as e:
             import traceback
@@ -510,6 +650,24 @@ class RoutineManager(QObject):
             print(traceback.format_exc())
             self._plot_dialog_open = False
 
+    def _collect_scan(self, scan):
+        """Add a scan to the results under the state it was measured at, unless that is changing"""
+        if self.results is None:
+            return
+        store = get_state_store()
+        motor, wheel, tec = store.get(MotorState), store.get(FilterWheelState), store.get(TECState)
+        # Not while moving, nor until a device has reported the state a command put it in
+        for kind, record in ((MotorState, motor), (FilterWheelState, wheel)):
+            commanded = self._commanded.get(kind)
+            if (commanded is not None and (record is None or record.timestamp < commanded)) or \
+                    getattr(record, 'moving', False):
+                self.results.interrupt()
+                return
+        tags = {"integration_ms": scan.integration_time_ms}
+        if tec is not None and tec.connected:
+            tags["setpoint"] = tec.setpoint
+        self.results.add(scan.intensities, wheel and wheel.position, motor and motor.angle_deg, **tags)
+
     def _on_plot_dialog_closed(self):
         """Handle plot dialog closed event"""
         print("Plot dialog closed")
@@ -517,267 +675,318 @@ class RoutineManager(QObject):
         # Don't reset _plot_created flag here, as we want to prevent creating another plot
         # for this routine run
 
-    def _execute_command(self, command):
-        """Execute a single command from the routine"""
-        print(f"ROUTINE_MANAGER: _execute_command() CALLED WITH: '{command}'")
-        # Split the command into parts
-        parts = command.strip().split()
-        print(f"Routine command raw parts: {parts}")
-        if not parts:
-            # Empty command, skip to next
-            QTimer.singleShot(100, self._execute_next_command)
-            return
-        
-        cmd_type = parts[0].lower()
-        print(f"Processing cmd_type: '{cmd_type}', Full parts: {parts}")
-        
+    def _execute_command(self, instruction):
+        """Run one compiled instruction; the routine goes on once it completes, or at once if it is concurrent"""
+        print(f"ROUTINE_MANAGER: line {instruction.line}: {instruction.op} {instruction.args}")
+        self._wait_token += 1
+        token = self._wait_token
+        started = time.monotonic()
+        self._current = (token, instruction, started)
+        if instruction.background and self._step is None:
+            self._step = (started, [])
         try:
-            # Log command
-            if cmd_type == "log":
-                message = " ".join(parts[1:])
-                self.main_window.statusBar().showMessage(message)
-                print(f"Routine log: {message}")
-                
-                # Continue to next command after a short delay
-                QTimer.singleShot(500, self._execute_next_command)
-            
-            # Wait command
-            elif cmd_type == "wait":
-                if len(parts) > 1:
-                    try:
-                        wait_time = int(parts[1])
-                        self.main_window.statusBar().showMessage(f"Waiting for {wait_time} ms")
-                        QTimer.singleShot(wait_time, self._execute_next_command)
-                    except ValueError:
-                        print(f"Invalid wait time: {parts[1]}")
-                        QTimer.singleShot(100, self._execute_next_command)
-                else:
-                    print("Wait command requires a time value")
-                    QTimer.singleShot(100, self._execute_next_command)
-            
-            # Integration time command - NEW
-            elif cmd_type == "integration":
-                if len(parts) > 1:
-                    try:
-                        integration_time = float(parts[1])
-                        self.main_window.statusBar().showMessage(f"Setting integration time to {integration_time} ms")
-                        
-                        # Set integration time in the spectrometer controller
-                        if hasattr(self.main_window, 'spec_ctrl'):
-                            # Update the spinbox value
-                            self.main_window.spec_ctrl.integ_spinbox.setValue(int(integration_time))
-                            
-                            # Apply the new settings
-                            self.main_window.spec_ctrl.update_measurement_settings()
-                            
-                            # Log the change
-                            print(f"Integration time set to {integration_time} ms")
-                        else:
-                            self.main_window.statusBar().showMessage("Spectrometer controller not available")
-                            
-                        # Continue to next command after a delay to allow settings to apply
-                        QTimer.singleShot(1000, self._execute_next_command)
-                    except ValueError:
-                        print(f"Invalid integration time: {parts[1]}")
-                        QTimer.singleShot(100, self._execute_next_command)
-                else:
-                    print("Integration command requires a time value in milliseconds")
-                    QTimer.singleShot(100, self._execute_next_command)
-            
-            # Plot command
-            elif cmd_type == "plot":
-                self.main_window.statusBar().showMessage("Taking snapshot for plot")
-                self._take_snapshot_and_plot()
-                # Continue to next command after a delay to allow plot to complete
-                QTimer.singleShot(1000, self._execute_next_command)
-            
-            # Motor command
-            elif cmd_type == "motor":
-                if len(parts) > 2 and parts[1].lower() == "move":
-                    try:
-                        angle = float(parts[2])
-                        if hasattr(self.main_window, 'motor_ctrl'):
-                            self.main_window.statusBar().showMessage(f"Moving motor to {angle} degrees")
-                            # Use the correct method from MotorController
-                            self.main_window.motor_ctrl.move_to(angle)
-                            print(f"Motor move command sent: {angle} degrees")
-                        else:
-                            self.main_window.statusBar().showMessage("Motor controller not available")
-                            print("Motor controller not available")
-                        # Continue to next command after a longer delay to allow motor to move
-                        QTimer.singleShot(2000, self._execute_next_command)
-                    except ValueError:
-                        print(f"Invalid motor angle: {parts[2]}")
-                        QTimer.singleShot(100, self._execute_next_command)
-                else:
-                    print(f"Invalid motor command: {command}")
-                    QTimer.singleShot(100, self._execute_next_command)
-            
-            # Filter command
-            elif cmd_type == "filter":
-                if len(parts) > 2 and parts[1].lower() == "position":
-                    try:
-                        position = int(parts[2])
-                        if hasattr(self.main_window, 'filter_ctrl'):
-                            self.main_window.statusBar().showMessage(f"Moving filter wheel to position {position}")
-                            # Use the correct method from FilterWheelController
-                            self.main_window.filter_ctrl.set_position(position)
-                            print(f"Filter wheel position command sent: {position}")
-                        else:
-                            self.main_window.statusBar().showMessage("Filter controller not available")
-                            print("Filter controller not available")
-                        # Continue to next command after a longer delay to allow filter wheel to move
-                        QTimer.singleShot(2000, self._execute_next_command)
-                    except ValueError:
-                        print(f"Invalid filter position: {parts[2]}")
-                        QTimer.singleShot(100, self._execute_next_command)
-                else:
-                    print(f"Invalid filter command: {command}")
-                    QTimer.singleShot(100, self._execute_next_command)
-            
-            # Spectrometer command
-            elif cmd_type == "spectrometer":
-                if len(parts) > 1:
-                    if parts[1].lower() == "start":
-                        if hasattr(self.main_window, 'spec_ctrl'):
-                            self.main_window.statusBar().showMessage("Starting spectrometer measurement")
-                            self.main_window.spec_ctrl.start_measurement()
-                        else:
-                            self.main_window.statusBar().showMessage("Spectrometer controller not available")
-                    elif parts[1].lower() == "stop":
-                        if hasattr(self.main_window, 'spec_ctrl'):
-                            self.main_window.statusBar().showMessage("Stopping spectrometer measurement")
-                            self.main_window.spec_ctrl.stop_measurement()
-                        else:
-                            self.main_window.statusBar().showMessage("Spectrometer controller not available")
-                    elif parts[1].lower() == "save_snapshot": # Updated command name
-                        if len(parts) > 2:
-                            snapshot_filename = parts[2]
-                            if self.main_window.spec_ctrl:
-                                self.main_window.statusBar().showMessage(f"Saving spectrometer snapshot: {snapshot_filename}")
-                                self.main_window.spec_ctrl.save(
-                                    filename=snapshot_filename,
-                                    routine_name=self.current_routine_name,
-                                    routine_start_time_str=self.current_routine_start_time_str
-                                )
-                            else:
-                                self.main_window.statusBar().showMessage("Spectrometer controller not available for saving snapshot.")
-                        else:
-                            print(f"Spectrometer SAVE_SNAPSHOT command requires a filename: {command}")
-                            self.main_window.statusBar().showMessage("SAVE_SNAPSHOT command needs a filename.")
-                    elif parts[1].lower() == "save": # Kept old "save" for compatibility, maps to new save without specific filename
-                        if self.main_window.spec_ctrl:
-                             self.main_window.statusBar().showMessage("Saving current spectrometer data (routine context)...")
-                             self.main_window.spec_ctrl.save(
-                                routine_name=self.current_routine_name,
-                                routine_start_time_str=self.current_routine_start_time_str
-                                # Filename will be auto-generated by spec_ctrl.save if None
-                             )
-                        else:
-                            self.main_window.statusBar().showMessage("Spectrometer controller not available.")
-                    else:
-                        print(f"Invalid spectrometer command: {command}")
-                else:
-                    print(f"Invalid spectrometer command: {command}")
-                
-                # Continue to next command after a short delay
-                QTimer.singleShot(500, self._execute_next_command)
-            
-            # Data command
-            elif cmd_type == "data":
-                if len(parts) > 1:
-                    if parts[1].lower() == "start":
-                        if hasattr(self.main_window, 'data_logger') and not self.main_window.data_logger.continuous_saving:
-                            self.main_window.statusBar().showMessage("Starting data saving")
-                            self.main_window.toggle_data_saving()
-                    elif parts[1].lower() == "stop":
-                        if hasattr(self.main_window, 'data_logger') and self.main_window.data_logger.continuous_saving:
-                            self.main_window.statusBar().showMessage("Stopping data saving")
-                            self.main_window.toggle_data_saving()
-                    else:
-                        print(f"Invalid data command: {command}")
-                else:
-                    print(f"Invalid data command: {command}")
-                
-                # Continue to next command after a short delay
-                QTimer.singleShot(500, self._execute_next_command)
-
-            # Camera command
-            elif cmd_type == "camera":
-                print(f"Inside 'camera' block. Checking parts[1]: '{parts[1] if len(parts) > 1 else 'N/A'}', parts[1].lower(): '{parts[1].lower() if len(parts) > 1 else 'N/A'}'")
-                if len(parts) > 2 and parts[1].lower() == "save_image":
-                    base_filename_from_routine = parts[2] # e.g., "OOD.jpg"
-                    
-                    if not self.current_routine_name or not self.current_routine_start_time_str:
-                        error_msg = "Cannot save camera image: Routine context (name/start time) not set."
-                        print(error_msg)
-                        if hasattr(self.main_window, 'statusBar'):
-                            self.main_window.statusBar().showMessage(error_msg)
-                        # Proceed to next command even if context is missing
-                        QTimer.singleShot(100, self._execute_next_command)
-                    else:
-                        # Generate timestamp
-                        timestamp_str = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3] # YYYYMMDD_HHMMSS_ms
-                        
-                        name_part, ext_part = os.path.splitext(base_filename_from_routine)
-                        actual_image_filename = f"{name_part}_{timestamp_str}{ext_part}"
-
-                        base_data_dir = "data" # Root directory for all routine data
-                        # Ensure routine name is filesystem-friendly for directory creation
-                        routine_name_folder = self.current_routine_name.replace(" ", "_").replace("/", "_")
-                        routine_start_time_folder = self.current_routine_start_time_str
-                        
-                        # Construct the full path: data/routine_name_folder/routine_start_time_folder/actual_image_filename
-                        target_dir = os.path.join(base_data_dir, routine_name_folder, routine_start_time_folder)
-                        # The CameraManager.save_image method is responsible for os.makedirs(target_dir, exist_ok=True)
-                        
-                        full_path_filename = os.path.join(target_dir, actual_image_filename)
-                        
-                        if hasattr(self.main_window, 'camera_manager') and self.main_window.camera_manager is not None:
-                            print(f"Attempting to save camera image to: {full_path_filename}")
-                            if hasattr(self.main_window, 'statusBar'):
-                                self.main_window.statusBar().showMessage(f"Saving camera image: {actual_image_filename}...")
-                            
-                            success = self.main_window.camera_manager.save_image(full_path_filename)
-                            
-                            if success:
-                                success_msg = f"Camera image saved: {actual_image_filename}" # Log with actual filename
-                                print(f"Successfully saved camera image: {full_path_filename}")
-                                if hasattr(self.main_window, 'statusBar'):
-                                    self.main_window.statusBar().showMessage(success_msg)
-                            else:
-                                fail_msg = f"Failed to save camera image: {actual_image_filename}" # Log with actual filename
-                                print(f"Failed to save camera image: {full_path_filename}")
-                                if hasattr(self.main_window, 'statusBar'):
-                                    self.main_window.statusBar().showMessage(fail_msg)
-                        else:
-                            error_msg = "Camera manager not available. Cannot save image."
-                            print(error_msg)
-                            if hasattr(self.main_window, 'statusBar'):
-                                self.main_window.statusBar().showMessage(error_msg)
-                        
-                        # Proceed to the next command after attempting to save the image
-                        QTimer.singleShot(500, self._execute_next_command)
-                else:
-                    print(f"Invalid camera command structure: {command}")
-                    if hasattr(self.main_window, 'statusBar'):
-                        self.main_window.statusBar().showMessage(f"Invalid camera command structure: {command}")
-                    QTimer.singleShot(100, self._execute_next_command)
-            
-            # Unknown command
-            else:
-                print(f"Unknown command: {command}")
-                # Continue to next command
-                QTimer.singleShot(100, self._execute_next_command)
-        
+            delay = self._handlers[instruction.op](*instruction.args)
         except Exception as e:
             import traceback
             self.main_window.statusBar().showMessage(f"Error executing command: {str(e)}")
-            print(f"Error executing command '{command}': {str(e)}")
+            print(f"Error executing line {instruction.line} '{instruction.text}': {str(e)}")
             print(traceback.format_exc())
             
             # Try to continue with next command
-            QTimer.singleShot(1000, self._execute_next_command)
+            self._waits.pop(token, None)
+            delay = 1000
+        if delay is None and token not in self._waits:
+            # Nothing to wait for: done at once, or after its fixed delay in the fixed completion mode
+            delay = FIXED_DELAYS_MS.get(instruction.op, 0) if self.completion_mode == "fixed" else 0
+        if delay is not None:
+            self._waits.pop(token, None)
+            QTimer.singleShot(int(delay), lambda: self._on_wait_done(token))
+        if instruction.background:
+            # Completes on its own while the routine goes on; a sync waits for it
+            self._background[token] = (instruction, started)
+            self._current = None
+            QTimer.singleShot(0, lambda: self.routine_running and self._execute_next_command())
+
+    def _expect(self, description, timeout_s, state=None, scans=0):
+        """Make the running instruction complete on an event; its handler then returns None.
+
+        With state, the instruction waits for a published state record for
+        which state(record) is true, then (or at once without state) for
+        scans more scans if the spectrometer is measuring. Returns done(*args),
+        which completes it when called from any thread (e.g. as a file writer
+        callback). After timeout_s the routine moves on with a warning. Call
+        it before sending the command, so no event is missed.
+        """
+        if self.completion_mode == "fixed":
+            return lambda *args: None
+        token = self._current[0]
+        wait = self._waits[token] = _Wait(description, state, scans, timeout_s=timeout_s)
+        QTimer.singleShot(int(1000 * timeout_s), lambda: self._on_wait_timeout(token))
+        if state is None and scans:
+            self._reached(token, wait, time.time())
+        return lambda *args: self._wait_done.emit(token)
+
+    def _reached(self, token, wait, when):
+        """The awaited state was reached at when; complete unless scans are still to come"""
+        wait.reached = when
+        spec = get_state_store().get(SpectrometerState)
+        if not wait.scans or spec is None or not spec.measuring:
+            self._wait_done.emit(token)
+
+    def _on_state(self, record):
+        for token, wait in list(self._waits.items()):
+            if wait.state is not None and wait.reached is None and wait.state(record):
+                self._reached(token, wait, record.timestamp)
+
+    def _on_scan(self, scan):
+        for token, wait in list(self._waits.items()):
+            if wait.reached is None or not wait.scans or scan.host_timestamp < wait.reached:
+                continue
+            wait.scans -= 1
+            if not wait.scans:
+                self._wait_done.emit(token)
+
+    def _on_wait_done(self, token):
+        self._waits.pop(token, None)
+        if self._current is not None and self._current[0] == token:
+            self._finish_command()
+        elif token in self._background:
+            self._finish_background(token)
+
+    def _on_wait_timeout(self, token):
+        wait = self._waits.pop(token, None)
+        if wait is None:
+            return
+        if self._current is not None and self._current[0] == token:
+            instruction = self._current[1]
+        elif token in self._background:
+            instruction = self._background[token][0]
+        else:
+            return
+        message = f"Line {instruction.line}: no {wait.description} after {wait.timeout_s:g} s, continuing"
+        print(f"Routine: {message}")
+        self.main_window.statusBar().showMessage(message)
+        if instruction.background:
+            self._finish_background(token, timed_out=True)
+        else:
+            self._finish_command(timed_out=True)
+
+    def _finish_command(self, timed_out=False):
+        """Record the time of the instruction the routine is on and go on with the next one"""
+        token, instruction, started = self._current
+        self._current = None
+        seconds = time.monotonic() - started
+        if instruction.op == "sync":
+            self._finish_step(instruction)
+        elif self.timing is not None:
+            self.timing.add(instruction, seconds, timed_out, concurrent=self._step is not None)
+            if self._step is not None:
+                self._step[1].append((instruction, seconds))
+        # A completed step, unless concurrent commands still run (or the device state is being restored)
+        if not self._background and self.current_command_index >= self._restore_count:
+            self._save_checkpoint()
+        self._execute_next_command()
+
+    def _finish_background(self, token, timed_out=False):
+        """Record the time of a concurrent instruction; the last one to finish completes a waiting sync"""
+        instruction, started = self._background.pop(token)
+        seconds = time.monotonic() - started
+        if self.timing is not None:
+            self.timing.add(instruction, seconds, timed_out, concurrent=True)
+        if self._step is not None:
+            self._step[1].append((instruction, seconds))
+        if not self._background and self._current is not None and self._current[1].op == "sync":
+            self._wait_done.emit(self._current[0])
+
+    def _finish_step(self, sync):
+        """Report the concurrent step the sync instruction ends"""
+        step, self._step = self._step, None
+        if step is None or not step[1] or self.timing is None:
+            return
+        started, commands = step
+        print(f"Routine: concurrent {self.timing.add_step(sync, time.monotonic() - started, commands)}")
+
+    def _cancel_wait(self):
+        self._wait_token += 1
+        self._current = None
+        self._waits.clear()
+        self._background.clear()
+        self._step = None
+
+    def _publish_to_wait(self, record):
+        """State store listener (on the publishing thread)"""
+        if self._waits:
+            self._state_event.emit(record)
+
+    def _attach_completion(self):
+        """Listen to state records and scans for instructions that complete on them, and for the results"""
+        get_state_store().subscribe(self._publish_to_wait)
+        spec_ctrl = getattr(self.main_window, 'spec_ctrl', None)
+        if spec_ctrl is not None and hasattr(spec_ctrl, 'scan_signal'):
+            spec_ctrl.scan_signal.connect(self._on_scan)
+            spec_ctrl.scan_signal.connect(self._collect_scan)
+
+    def _detach_completion(self):
+        get_state_store().unsubscribe(self._publish_to_wait)
+        spec_ctrl = getattr(self.main_window, 'spec_ctrl', None)
+        if spec_ctrl is not None and hasattr(spec_ctrl, 'scan_signal'):
+            for slot in (self._on_scan, self._collect_scan):
+                try:
+                    spec_ctrl.scan_signal.disconnect(slot)
+                except TypeError:
+                    pass  # Not connected
+
+    def _cmd_log(self, message=""):
+        self.main_window.statusBar().showMessage(message)
+        print(f"Routine log: {message}")
+
+    def _cmd_wait(self, wait_time):
+        self.main_window.statusBar().showMessage(f"Waiting for {wait_time} ms")
+        return wait_time
+
+    def _cmd_sync(self):
+        if self._background:
+            # Completed by the last concurrent instruction to finish (each has its own timeout)
+            self.main_window.statusBar().showMessage(f"Waiting for {len(self._background)} concurrent commands")
+            self._waits[self._current[0]] = _Wait("concurrent commands")
+
+    def _cmd_integration(self, integration_time):
+        spec_ctrl = self.main_window.spec_ctrl
+        if not spec_ctrl.is_ready():
+            self.main_window.statusBar().showMessage("Spectrometer not ready, integration time not set")
+            return 0
+        self.main_window.statusBar().showMessage(f"Setting integration time to {integration_time} ms")
+        # Complete once the measurement runs with the new settings (restarted after the
+        # command, or just prepared when not measuring) and has delivered a scan
+        sent = time.time()
+        self._expect(f"scan at {integration_time:g} ms integration", self.timeout_s + 3 * integration_time / 1000,
+                     state=lambda r: (isinstance(r, SpectrometerState) and r.timestamp >= sent
+                                      and (not r.measuring or r.started >= sent)),
+                     scans=1)
+        spec_ctrl.apply_integration_time(integration_time)
+        print(f"Integration time set to {integration_time} ms")
+        return None
+
+    def _cmd_plot(self):
+        self.main_window.statusBar().showMessage("Taking snapshot for plot")
+        self._take_snapshot_and_plot()
+
+    def _cmd_motor_move(self, angle):
+        motor_ctrl = self.main_window.motor_ctrl
+        self.main_window.statusBar().showMessage(f"Moving motor to {angle} degrees")
+        # Complete once the motor is in position and a scan begun there has been received
+        # (the first scan received may have begun before)
+        previous = motor_ctrl.current_angle_deg
+        travel_s = move_duration(100 * (abs(angle - previous) if previous is not None else 360))
+        sent = self._commanded[MotorState] = time.time()
+        self._expect(f"motor in position at {angle:g}°", self.timeout_s + travel_s,
+                     state=lambda r: isinstance(r, MotorState) and r.timestamp >= sent and not r.moving,
+                     scans=2)
+        if not motor_ctrl.move_to(angle):
+            print(f"Motor move to {angle} degrees failed")
+            return 0
+        print(f"Motor move command sent: {angle} degrees")
+        return None
+
+    def _cmd_filter_position(self, position):
+        filter_ctrl = self.main_window.filter_ctrl
+        if not filter_ctrl.is_connected():
+            self.main_window.statusBar().showMessage(f"Filter wheel not connected, position {position} not set")
+            return 0
+        self.main_window.statusBar().showMessage(f"Moving filter wheel to position {position}")
+        # Complete once the wheel reports the position and a scan begun there has been received
+        sent = self._commanded[FilterWheelState] = time.time()
+        self._expect(f"filter wheel at position {position}", self.timeout_s,
+                     state=lambda r: isinstance(r, FilterWheelState) and r.timestamp >= sent and r.position == position,
+                     scans=2)
+        filter_ctrl.set_position(position)
+        print(f"Filter wheel position command sent: {position}")
+        return None
+
+    def _cmd_spectrometer_start(self):
+        self.main_window.statusBar().showMessage("Starting spectrometer measurement")
+        self._expect("first scan", self.timeout_s, scans=1)
+        if not self.main_window.spec_ctrl.start_measurement():
+            return 0
+        return None
+
+    def _cmd_spectrometer_stop(self):
+        self.main_window.statusBar().showMessage("Stopping spectrometer measurement")
+        sent = time.time()
+        self._expect("measurement stop", self.timeout_s,
+                     state=lambda r: isinstance(r, SpectrometerState) and r.timestamp >= sent and not r.measuring)
+        if not self.main_window.spec_ctrl.stop_measurement():
+            return 0
+        return None
+
+    def _cmd_spectrometer_save(self, filename=None):
+        """spectrometer save (auto-generated file name) and spectrometer save_snapshot <filename>"""
+        if filename:
+            self.main_window.statusBar().showMessage(f"Saving spectrometer snapshot: {filename}")
+        else:
+            self.main_window.statusBar().showMessage("Saving current spectrometer data (routine context)...")
+        written = self._expect("snapshot written", self.timeout_s)
+        queued = self.main_window.spec_ctrl.save(
+            filename=filename,
+            routine_name=self.current_routine_name,
+            routine_start_time_str=self.current_routine_start_time_str,
+            callback=written
+        )
+        return None if queued else 0
+
+    def _cmd_data_start(self):
+        if hasattr(self.main_window, 'data_logger') and not self.main_window.data_logger.continuous_saving:
+            self.main_window.statusBar().showMessage("Starting data saving")
+            self.main_window.toggle_data_saving()
+
+    def _cmd_data_stop(self):
+        if hasattr(self.main_window, 'data_logger') and self.main_window.data_logger.continuous_saving:
+            self.main_window.statusBar().showMessage("Stopping data saving")
+            self.main_window.toggle_data_saving()
+
+    def _cmd_recorder_dump(self, label=""):
+        label = "_".join(label.split()) or "routine"
+        self.main_window.flight_recorder.trigger(label, routine=self.current_routine_name,
+                                                 command_index=self.current_command_index)
+
+    def _cmd_camera_save_image(self, base_filename_from_routine):
+        """Save a camera image as data/<routine>/<start time>/<name>_<timestamp><ext>"""
+        if not self.current_routine_name or not self.current_routine_start_time_str:
+            error_msg = "Cannot save camera image: Routine context (name/start time) not set."
+            print(error_msg)
+            self.main_window.statusBar().showMessage(error_msg)
+            return 0
+        
+        # Generate timestamp
+        timestamp_str = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3] # YYYYMMDD_HHMMSS_ms
+        
+        name_part, ext_part = os.path.splitext(base_filename_from_routine)
+        actual_image_filename = f"{name_part}_{timestamp_str}{ext_part}"
+
+        base_data_dir = "data" # Root directory for all routine data
+        # Ensure routine name is filesystem-friendly for directory creation
+        routine_name_folder = self.current_routine_name.replace(" ", "_").replace("/", "_")
+        
+        # data/routine_name_folder/routine_start_time_folder/actual_image_filename; the
+        # CameraManager.save_image method is responsible for creating the directory
+        target_dir = os.path.join(base_data_dir, routine_name_folder, self.current_routine_start_time_str)
+        full_path_filename = os.path.join(target_dir, actual_image_filename)
+        
+        print(f"Attempting to save camera image to: {full_path_filename}")
+        self.main_window.statusBar().showMessage(f"Saving camera image: {actual_image_filename}...")
+        written = self._expect("camera image written", self.timeout_s)
+        if self.main_window.camera_manager.save_image(full_path_filename, callback=written):
+            print(f"Successfully saved camera image: {full_path_filename}")
+            self.main_window.statusBar().showMessage(f"Camera image saved: {actual_image_filename}")
+            return None
+        print(f"Failed to save camera image: {full_path_filename}")
+        self.main_window.statusBar().showMessage(f"Failed to save camera image: {actual_image_filename}")
+        return 0
+
+    def _cmd_temperature_set(self, celsius):
+        self.main_window.statusBar().showMessage(f"Setting temperature to {celsius} °C")
+        self._setpoint = celsius
+        self.main_window.temp_ctrl.set_preset_temp(celsius)
 
     def _take_snapshot_and_plot(self):
         """Take a snapshot of current spectrometer data and plot it as a static curve"""
@@ -790,12 +999,12 @@ class RoutineManager(QObject):
             spec_ctrl = self.main_window.spec_ctrl
             
             # Check if we have intensity data
-            if not hasattr(spec_ctrl, 'intens') or not spec_ctrl.intens:
+            if not hasattr(spec_ctrl, 'intens') or not len(spec_ctrl.intens):
                 self.main_window.statusBar().showMessage("No spectrometer data available")
                 return
             
-            # Get current data
-            intensities = np.array(spec_ctrl.intens)
+            # Get current data (a read-only spectrum, shared with the static curve and the file)
+            intensities = as_spectrum(spec_ctrl.intens)
             pixel_indices = np.arange(len(intensities))
             
             # Create a timestamp for the snapshot
@@ -810,30 +1019,32 @@ class RoutineManager(QObject):
             # Create a name for this snapshot
             snapshot_name = f"Snapshot {timestamp}"
             
-            # Add a new static curve to the plot
-            # First, check if we have a list to store static curves
-            if not hasattr(spec_ctrl, 'static_curves'):
-                spec_ctrl.static_curves = []
+            # Add a new static curve to the plot (headless.py has none, only the file)
+            if hasattr(spec_ctrl, 'plot_px'):
+                import pyqtgraph as pg
+                # First, check if we have a list to store static curves
+                if not hasattr(spec_ctrl, 'static_curves'):
+                    spec_ctrl.static_curves = []
             
-            # Limit the number of static curves to prevent clutter (keep last 5)
-            if len(spec_ctrl.static_curves) >= 5:
-                # Remove the oldest curve
-                oldest_curve = spec_ctrl.static_curves.pop(0)
-                spec_ctrl.plot_px.removeItem(oldest_curve)
+                # Limit the number of static curves to prevent clutter (keep last 5)
+                if len(spec_ctrl.static_curves) >= 5:
+                    # Remove the oldest curve
+                    oldest_curve = spec_ctrl.static_curves.pop(0)
+                    spec_ctrl.plot_px.removeItem(oldest_curve)
             
-            # Create a new curve with the random color
-            new_curve = spec_ctrl.plot_px.plot(
-                pixel_indices, 
-                intensities,
-                pen=pg.mkPen(color=(r, g, b), width=1.5),
-                name=snapshot_name
-            )
+                # Create a new curve with the random color
+                new_curve = spec_ctrl.plot_px.plot(
+                    pixel_indices, 
+                    intensities,
+                    pen=pg.mkPen(color=(r, g, b), width=1.5),
+                    name=snapshot_name
+                )
             
-            # Add the new curve to our list
-            spec_ctrl.static_curves.append(new_curve)
+                # Add the new curve to our list
+                spec_ctrl.static_curves.append(new_curve)
             
-            # Update the plot title to show we've added a snapshot
-            spec_ctrl.plot_px.setTitle(f"Spectrometer - Added {snapshot_name}")
+                # Update the plot title to show we've added a snapshot
+                spec_ctrl.plot_px.setTitle(f"Spectrometer - Added {snapshot_name}")
             
             # Save the snapshot data to a file in the diagrams directory
             try:
@@ -845,13 +1056,17 @@ class RoutineManager(QObject):
                 ts = QDateTime.currentDateTime().toString("yyyyMMdd_hhmmss")
                 filename = os.path.join(diagrams_dir, f"snapshot_{ts}.csv")
                 
-                # Save the data to CSV
-                with open(filename, 'w') as f:
-                    f.write("Pixel,Intensity\n")
-                    for i, intensity in enumerate(intensities):
-                        f.write(f"{i},{intensity}\n")
+                # Save the data to CSV on the writer thread
+                snapshot = intensities
+                get_file_writer().write_file(
+                    filename,
+                    lambda: "Pixel,Intensity\n" + "".join(f"{i},{intensity}\n" for i, intensity in enumerate(snapshot)),
+                    catalog={"kind": "plot_snapshot", "routine": self.current_routine_name,
+                             "routine_start": self.current_routine_start_time_str,
+                             "rows": len(snapshot)}
+                )
                 
-                print(f"Snapshot data saved to {filename}")
+                print(f"Snapshot data queued for {filename}")
                 
             except Exception as e:
                 print(f"Error saving snapshot data: {e}")
@@ -0,0 +1,118 @@
+import os
+import time
+from datetime import datetime
+
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+from core.scheduler import Scheduler, load_schedule, DEFAULT_MAX_LATE_S
+from core.event_log import EventSource
+
+_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+DEFAULT_SCHEDULE = os.path.join(_ROOT, "schedules", "schedule.json")
+DEFAULT_STATE = os.path.join(_ROOT, "data", "scheduler_state.json")
+# Longest single timer; the scheduler re-checks at least this often (clock changes, suspend)
+MAX_SLEEP_S = 3600.0
+DEFAULT_STARTUP_DELAY_S = 30.0  # for the devices to connect before the first (e.g. missed) run
+
+
+class ScheduleManager(QObject):
+    """Runs the routines of a schedule file through the RoutineManager (see core.scheduler).
+
+    A single-shot timer sleeps until the earliest due entry, so an idle
+    schedule costs one timer however many entries it has. Configured by the
+    "scheduler" entry of hardware_config.json:
+
+        "scheduler": {"enabled": true, "file": "schedules/schedule.json", "conflict": "queue",
+                      "missed": "run_once", "max_late_s": 3600, "startup_delay_s": 30}
+    """
+    exhausted_signal = pyqtSignal()     # no entry will come due again (e.g. only "once" entries, all run)
+
+    def __init__(self, main_window, routine_manager, config=None):
+        super().__init__(main_window)
+        self.main_window = main_window
+        self.routine_manager = routine_manager
+        config = dict(config or {})
+        self.enabled = bool(config.get("enabled", False))
+        self.path = self._from_root(config.get("file") or DEFAULT_SCHEDULE)
+        self.state_path = self._from_root(config.get("state") or DEFAULT_STATE)
+        self.conflict = config.get("conflict", "queue")
+        self.missed = config.get("missed", "run_once")
+        self.max_late_s = float(config.get("max_late_s", DEFAULT_MAX_LATE_S))
+        self.startup_delay_s = float(config.get("startup_delay_s", DEFAULT_STARTUP_DELAY_S))
+        self.events = EventSource("scheduler", lambda message: self.main_window.statusBar().showMessage(message))
+        self.scheduler = None
+        self.running = None             # ScheduleEntry of the scheduled routine that runs
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._check)
+        routine_manager.finished_signal.connect(self._on_routine_finished)
+
+    @staticmethod
+    def _from_root(path):
+        return path if os.path.isabs(path) else os.path.join(_ROOT, path)
+
+    def start(self):
+        """Load the schedule and start waiting for its entries; returns False if it cannot be loaded"""
+        if not self.enabled:
+            return False
+        try:
+            entries, _ = load_schedule(self.path, [os.path.dirname(self.path), self.routine_manager.routines_dir])
+            self.scheduler = Scheduler(entries, time.time(), self.conflict, self.missed, self.max_late_s,
+                                       state_path=self.state_path)
+        except (OSError, ValueError) as e:
+            print(f"Scheduler: cannot load {self.path}: {e}")
+            self.events.error("load_failed", f"Schedule not started: {e}", path=self.path, error=str(e))
+            return False
+        print(f"Scheduler: {len(entries)} entries from {self.path}")
+        for entry in entries:
+            print(f"Scheduler:   {entry}")
+        self._timer.start(int(self.startup_delay_s * 1000))
+        return True
+
+    def stop(self):
+        self._timer.stop()
+        self.scheduler = None
+
+    def _check(self):
+        """Start whatever is due, then sleep until the next entry"""
+        if self.scheduler is None:
+            return
+        now = time.time()
+        busy = self.routine_manager.routine_running
+        run = self.scheduler.next_run(now, (self.running or True) if busy else None)
+        if run is not None:
+            if run.preempt:
+                print(f"Scheduler: stopping {self.running.name} for {run.entry.name} (priority {run.entry.priority})")
+                self.events.warning("preempted", f"Scheduled routine {self.running.name} stopped for {run.entry.name}",
+                                    entry=run.entry.name, stopped=self.running.name)
+                self.running = None
+                self.routine_manager.stop_routine()
+            self._start(run)
+        self._sleep(now)
+
+    def _start(self, run):
+        entry = run.entry
+        self.scheduler.started(run)
+        print(f"Scheduler: starting {entry.name} ({os.path.basename(entry.routine)}), "
+              f"due {datetime.fromtimestamp(run.due):%H:%M:%S}")
+        if self.routine_manager.run_file(entry.routine, entry.name):
+            self.running = entry
+        else:
+            print(f"Scheduler: {entry.name} could not be started")
+            self.events.error("start_failed", f"Scheduled routine {entry.name} could not be started",
+                              entry=entry.name, routine=entry.routine)
+
+    def _sleep(self, now):
+        wakeup = self.scheduler.next_wakeup()
+        if wakeup is None and not self.scheduler.waiting():
+            print("Scheduler: no more entries due")
+            self.exhausted_signal.emit()
+            return
+        delay = MAX_SLEEP_S if wakeup is None else min(MAX_SLEEP_S, max(0.0, wakeup - now))
+        self._timer.start(int(delay * 1000))
+
+    def _on_routine_finished(self, completed):
+        self.running = None
+        if self.scheduler is not None:
+            # After the routine manager has finished its own completion handling
+            QTimer.singleShot(0, self._check)
@@ -0,0 +1,122 @@
+"""
+Station set-up shared by MainWindow and headless.HeadlessStation.
+
+A station is the object RoutineManager, DataLogger and ScheduleManager are
+given: it has statusBar(), events, config, data_logger and the controllers
+(spec_ctrl, ...). These functions configure the shared services, open the
+session's event file, start a replay and start or stop continuous saving
+the same way for the GUI and for headless runs. No widgets are used here.
+"""
+import os
+
+from PyQt5.QtCore import QTimer, QDateTime
+
+from storage.file_writer import configure_file_writer, get_file_writer
+from storage.catalog import configure_catalog
+from core.event_log import configure_event_log, get_event_log
+from core.spectrum import configure_spectra
+from core.replay import Replayer, load_recording
+
+
+def configure_services(config, catalog=None):
+    """Configure spectra, the data catalog, the background file writer and the event log.
+
+    catalog overrides config["catalog"] (headless.py moves it to the output directory).
+    """
+    # Spectra are float32 arrays after acquisition unless "spectra": {"dtype": "float64"}
+    configure_spectra(**config.get("spectra", {}))
+    # Background writer used by every component that produces files; it
+    # enters each file in the SQLite catalog of data products
+    configure_catalog(**(catalog if catalog is not None else config.get("catalog", {})))
+    configure_file_writer(**config.get("file_writer", {}))
+    get_file_writer()
+    # Typed events of every component, shown on the status bar and logged as JSON lines
+    configure_event_log(**config.get("event_log", {}))
+
+
+def open_event_log(log_dir):
+    """Start this session's event file in the log directory"""
+    ts = QDateTime.currentDateTime().toString("yyyyMMdd_hhmmss")
+    path = os.path.join(log_dir, f"events_{ts}.jsonl")
+    try:
+        get_event_log().open(path)
+    except Exception as e:
+        print(f"Event log open error: {e}")
+
+
+def start_replay(station, options):
+    """Replay options["source"] (a scan log, segment index or flight recorder dump).
+
+    Returns the running Replayer, or None without a source, spectrometer or recording.
+    """
+    if not options.get("source") or not station.spec_ctrl:
+        return None
+    try:
+        recording = load_recording(options["source"], start=options.get("start"), end=options.get("end"))
+    except Exception as e:
+        station.events.error("replay_failed", f"Cannot load replay {options['source']}: {e}",
+                             source=options["source"], error=str(e))
+        return None
+    replayer = Replayer(recording, on_scan=station.spec_ctrl.replay_signal.emit,
+                        speed=options.get("speed", 1.0), loop=options.get("loop", False))
+    replayer.start()
+    station.events.info("replay_started", f"Replaying {len(recording)} scans from {options['source']}",
+                        source=options["source"], scans=len(recording), speed=replayer.speed)
+    return replayer
+
+
+def toggle_data_saving(station):
+    """Start or stop continuous data saving; returns True while saving.
+
+    Scan-driven sampling feeds the spectrometer's scan_signal to the data
+    logger; timer sampling creates station.data_timer and station.save_timer.
+    """
+    spec = station.spec_ctrl
+    data_logger = station.data_logger
+    is_saving = data_logger.toggle_data_saving()
+
+    if is_saving and data_logger.scan_driven:
+        # Rows are built from numbered scans as they arrive; no sampling timers
+        station.statusBar().showMessage(f"Data saving started ({data_logger.sampling_mode} sampling)")
+        if spec and hasattr(spec, 'scan_signal'):
+            spec.scan_signal.connect(data_logger.add_scan)
+    elif is_saving:
+        station.statusBar().showMessage("Data saving started")
+
+        # Get current integration time from spectrometer controller
+        integration_time_ms = 1000  # Default 1 second
+        if spec and hasattr(spec, 'current_integration_time_us'):
+            integration_time_ms = spec.current_integration_time_us
+        else:
+            station.statusBar().showMessage("Spectrometer controller not available, using default integration time for saving.")
+
+        # Ensure minimum interval of 100ms
+        collection_interval = max(100, int(integration_time_ms))
+
+        # Start data collection timer - collect at integration time rate
+        station.data_timer = QTimer(station)
+        station.data_timer.timeout.connect(data_logger.collect_data_sample)
+        station.data_timer.start(collection_interval)
+
+        # Start data saving timer - save at integration time rate plus a small buffer
+        save_interval = int(integration_time_ms + 200)  # Add 200ms buffer for processing
+        station.save_timer = QTimer(station)
+        station.save_timer.timeout.connect(data_logger.save_continuous_data)
+        station.save_timer.start(save_interval)
+
+        # Store the current timers for later adjustment
+        data_logger.collection_interval = collection_interval
+        data_logger.save_interval = save_interval
+    else:
+        station.statusBar().showMessage("Data saving stopped")
+
+        # Stop timers
+        if spec and hasattr(spec, 'scan_signal'):
+            try:
+                spec.scan_signal.disconnect(data_logger.add_scan)
+            except TypeError:
+                pass    # not connected (timer sampling)
+        for timer in (getattr(station, 'data_timer', None), getattr(station, 'save_timer', None)):
+            if timer is not None:
+                timer.stop()
+    return is_saving
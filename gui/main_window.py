@@ -21,8 +21,14 @@ from controllers.thp_controller import THPController
 
 from gui.components.data_logger import DataLogger
 from gui.components.routine_manager import RoutineManager
+from gui.components.schedule_manager import ScheduleManager
 from gui.components.camera_manager import CameraManager
 from gui.components.ui_manager import UIManager
+from gui.components.event_viewer import EventViewerDialog
+from gui.components import station_setup
+from storage.file_writer import get_file_writer, shutdown_file_writer
+from core.event_log import EventSource, get_event_log
+from core.flight_recorder import FlightRecorder
 
 class MainWindow(QMainWindow):
     def __init__(self, parent=None):
@@ -64,17 +70,37 @@ class MainWindow(QMainWindow):
         self.latest_data = {}
         self.pixel_counts = []
         
+        # Spectra, file writer, data catalog and event log (shared with headless.py)
+        station_setup.configure_services(self.config)
+        self.events = EventSource("main_window", lambda message: self.statusBar().showMessage(message))
+        
         # Initialize components
         self.data_logger = DataLogger(self)
+        station_setup.open_event_log(self.data_logger.log_dir)
         self.routine_manager = RoutineManager(self)
         self.camera_manager = CameraManager(self)
         
+        # Always-on ring buffer of raw scans and sensor records, dumped on a trigger
+        recorder_config = dict(self.config.get("flight_recorder", {}))
+        recorder_dir = recorder_config.pop("dir", None) or os.path.join(self.data_logger.csv_dir, "flight_recorder")
+        self.flight_recorder = FlightRecorder(recorder_dir, **recorder_config)
+        self.flight_recorder.attach()
+        
         # Initialize hardware controllers
         self.init_controllers()
+        if self.flight_recorder.enabled and self.spec_ctrl and hasattr(self.spec_ctrl, 'scan_signal'):
+            self.spec_ctrl.scan_signal.connect(self.flight_recorder.add_scan)
+        
+        # Optionally feed a recorded session through the pipeline instead of the instrument
+        self.replayer = station_setup.start_replay(self, self.config.get("replay", {}))
         
         # Set up the main UI layout
         self.setup_ui()
         
+        # Unattended operation: run the routines of the schedule file when they are due
+        self.schedule_manager = ScheduleManager(self, self.routine_manager, self.config.get("scheduler", {}))
+        self.schedule_manager.start()
+        
         # Initialize hardware state tracking variables
         self._last_motor_angle = 0
         self._last_filter_position = 0
@@ -90,7 +116,18 @@ class MainWindow(QMainWindow):
         
         # Set up status bar
         self.setStatusBar(QStatusBar())
+        self.events_btn = QPushButton("Events")
+        self.events_btn.clicked.connect(self.show_events)
+        self.statusBar().addPermanentWidget(self.events_btn)
+        self.recorder_btn = QPushButton("Dump Recorder")
+        self.recorder_btn.setToolTip("Save the last seconds of raw scans and sensor data")
+        self.recorder_btn.setEnabled(self.flight_recorder.enabled)
+        self.recorder_btn.clicked.connect(lambda: self.flight_recorder.trigger("manual"))
+        self.statusBar().addPermanentWidget(self.recorder_btn)
         self.statusBar().showMessage("Application initialized")
+        if self.data_logger.recovered:
+            rows = sum(count for _, count in self.data_logger.recovered)
+            self.statusBar().showMessage(f"Recovered {rows} unsaved rows from the data journal")
 
     def init_controllers(self):
         """Initialize hardware controllers"""
@@ -117,36 +154,33 @@ class MainWindow(QMainWindow):
             try:
                 controller = initializer()
                 setattr(self, attr_name, controller)
+                # Controllers log their own events; the signal only feeds the status bar
                 if hasattr(controller, 'status_signal'):
                     controller.status_signal.connect(self.statusBar().showMessage)
-                    controller.status_signal.connect(self.handle_status_message)
                 # Attempt to connect or check status if applicable, may vary by controller
                 if hasattr(controller, 'connect') and callable(getattr(controller, 'connect')):
                     if not controller.connect(): # Assuming connect returns True on success
-                        self.statusBar().showMessage(f"{name}: Initial connection failed.")
-                        self.handle_status_message(f"{name}: Initial connection failed.")
+                        self.events.warning("controller_connect_failed", f"{name}: Initial connection failed.",
+                                            controller=name)
                     else:
-                        self.statusBar().showMessage(f"{name}: Initialized successfully.")
-                        self.handle_status_message(f"{name}: Initialized successfully.")
+                        self.events.info("controller_ready", f"{name}: Initialized successfully.", controller=name)
                 elif hasattr(controller, 'is_connected') and callable(getattr(controller, 'is_connected')):
                     if controller.is_connected():
-                         self.statusBar().showMessage(f"{name}: Initialized and connected.")
-                         self.handle_status_message(f"{name}: Initialized and connected.")
+                        self.events.info("controller_ready", f"{name}: Initialized and connected.", controller=name)
                     else:
                         # For controllers like Spectrometer that auto-connect or have complex init
                         # their own status signals might be more appropriate.
                         # This provides a fallback status.
-                        self.statusBar().showMessage(f"{name}: Initialized, connection status pending or failed.")
-                        self.handle_status_message(f"{name}: Initialized, connection status pending or failed.")
+                        self.events.info("controller_pending", f"{name}: Initialized, connection status pending or failed.",
+                                         controller=name)
                 else:
-                    self.statusBar().showMessage(f"{name}: Initialized (connection status unknown).")
-                    self.handle_status_message(f"{name}: Initialized (connection status unknown).")
+                    self.events.info("controller_pending", f"{name}: Initialized (connection status unknown).",
+                                     controller=name)
 
             except Exception as e:
                 setattr(self, attr_name, None) # Ensure attribute exists but is None
-                error_msg = f"{name}: Initialization failed - {e}"
-                self.statusBar().showMessage(error_msg)
-                self.handle_status_message(error_msg)
+                self.events.error("controller_init_failed", f"{name}: Initialization failed - {e}",
+                                  controller=name, error=str(e))
                 # Optionally, create a dummy controller or handle this in UI updates
                 print(f"Error initializing {name}: {e}")
 
@@ -217,6 +251,21 @@ class MainWindow(QMainWindow):
         self.run_routine_btn.setEnabled(False)
         self.run_routine_btn.clicked.connect(self.routine_manager.run_routine)
         routine_btn_layout.addWidget(self.run_routine_btn)
+        
+        self.dry_run_btn = QPushButton("Dry Run")
+        self.dry_run_btn.setStyleSheet("font-weight: bold; font-size: 11pt;")
+        self.dry_run_btn.setToolTip("Estimate the routine's duration with simulated devices")
+        self.dry_run_btn.setEnabled(False)
+        self.dry_run_btn.clicked.connect(self.routine_manager.dry_run)
+        routine_btn_layout.addWidget(self.dry_run_btn)
+
+        self.resume_routine_btn = QPushButton("Resume")
+        self.resume_routine_btn.setStyleSheet("font-weight: bold; font-size: 11pt;")
+        self.resume_routine_btn.setToolTip("Continue the last stopped or interrupted routine from its last completed step")
+        self.resume_routine_btn.clicked.connect(lambda: self.routine_manager.resume_routine())
+        routine_btn_layout.addWidget(self.resume_routine_btn)
+        self.routine_manager.finished_signal.connect(lambda completed: self._update_resume_button())
+        self._update_resume_button()
         routine_layout.addLayout(routine_btn_layout)
         
         self.routine_status = QLabel("No routine loaded")
@@ -273,59 +322,24 @@ class MainWindow(QMainWindow):
         preset_name = self.preset_combo.currentText()
         self.routine_manager.load_preset_routine(preset_name)
 
+    def _update_resume_button(self):
+        """Enable Resume while a routine checkpoint is left, and say where it continues"""
+        checkpoint = self.routine_manager.pending_checkpoint()
+        self.resume_routine_btn.setEnabled(checkpoint is not None)
+        if checkpoint is not None:
+            self.resume_routine_btn.setToolTip(f"Continue {checkpoint.describe()}")
+
     def toggle_data_saving(self):
         """Toggle continuous data saving on/off"""
-        is_saving = self.data_logger.toggle_data_saving()
-        
-        # Update UI based on saving state
-        if is_saving:
-            self.statusBar().showMessage("Data saving started")
-            
-            # Get current integration time from spectrometer controller
-            integration_time_ms = 1000  # Default 1 second
-            if self.spec_ctrl and hasattr(self.spec_ctrl, 'current_integration_time_us'):
-                integration_time_ms = self.spec_ctrl.current_integration_time_us
-            else:
-                self.statusBar().showMessage("Spectrometer controller not available, using default integration time for saving.")
-            
-            # Ensure minimum interval of 100ms
-            collection_interval = max(100, int(integration_time_ms))
-            
-            # Start data collection timer - collect at integration time rate
-            self.data_timer = QTimer(self)
-            self.data_timer.timeout.connect(self.data_logger.collect_data_sample)
-            self.data_timer.start(collection_interval)
-            
-            # Start data saving timer - save at integration time rate plus a small buffer
-            save_interval = int(integration_time_ms + 200)  # Add 200ms buffer for processing
-            self.save_timer = QTimer(self)
-            self.save_timer.timeout.connect(self.data_logger.save_continuous_data)
-            self.save_timer.start(save_interval)
-            
-            # Store the current timers for later adjustment
-            self.data_logger.collection_interval = collection_interval
-            self.data_logger.save_interval = save_interval
-            
-            # Update button text if it exists
-            if self.spec_ctrl and hasattr(self.spec_ctrl, 'toggle_btn'):
-                self.spec_ctrl.toggle_btn.setText("Stop Saving")
-        else:
-            self.statusBar().showMessage("Data saving stopped")
-            
-            # Stop timers
-            if hasattr(self, 'data_timer'):
-                self.data_timer.stop()
-            if hasattr(self, 'save_timer'):
-                self.save_timer.stop()
-            
-            # Update button text if it exists
-            if self.spec_ctrl and hasattr(self.spec_ctrl, 'toggle_btn'):
-                self.spec_ctrl.toggle_btn.setText("Start Saving")
+        is_saving = station_setup.toggle_data_saving(self)
+        # Update button text if it exists
+        if self.spec_ctrl and hasattr(self.spec_ctrl, 'toggle_btn'):
+            self.spec_ctrl.toggle_btn.setText("Stop Saving" if is_saving else "Start Saving")
 
     def collect_data_sample(self):
         """Collect a data sample for averaging, with pause on hardware state changes"""
         if not (hasattr(self, 'continuous_saving') and self.continuous_saving and
-                  self.spec_ctrl and hasattr(self.spec_ctrl, 'intens') and self.spec_ctrl.intens):
+                  self.spec_ctrl and hasattr(self.spec_ctrl, 'intens') and len(self.spec_ctrl.intens)):
             if hasattr(self, 'continuous_saving') and self.continuous_saving:
                  # Only show message if saving is active but spec_ctrl is the issue
                 if not self.spec_ctrl:
@@ -348,8 +362,9 @@ class MainWindow(QMainWindow):
         if (motor_changed or filter_changed) and not self._hardware_changing:
             # Hardware state has changed, pause data collection
             self._hardware_changing = True
-            self.statusBar().showMessage("Hardware state changed - pausing data collection for 2 seconds...")
-            self.handle_status_message(f"Pausing data collection: {'Motor moved' if motor_changed else 'Filter changed'}")
+            self.events.info("collection_paused", "Hardware state changed - pausing data collection for 2 seconds...",
+                             reason="motor" if motor_changed else "filter",
+                             angle=current_motor_angle, filter_pos=current_filter_pos)
             
             # Update tracking variables
             self._last_motor_angle = current_motor_angle
@@ -370,8 +385,7 @@ class MainWindow(QMainWindow):
         """Resume data collection after hardware state change pause"""
         self._hardware_changing = False
         self._hardware_change_timer.stop()
-        self.statusBar().showMessage("Resuming data collection after hardware state change")
-        self.handle_status_message("Resuming data collection")
+        self.events.info("collection_resumed", "Resuming data collection after hardware state change")
 
     def _update_indicators(self):
         """Update groupbox titles with connection status (green if connected, red if not)"""
@@ -419,28 +433,13 @@ class MainWindow(QMainWindow):
                 }}
             """)
 
-    def handle_status_message(self, message: str):
-        """Log hardware state changes with level tags."""
-        if not hasattr(self.data_logger, 'log_file') or not self.data_logger.log_file:
-            return
-            
-        msg_lower = message.lower()
-        # Determine severity level
-        if ("fail" in msg_lower or "error" in msg_lower or "no response" in msg_lower or "cannot" in msg_lower):
-            level = "ERROR"
-        elif ("no ack" in msg_lower or "invalid" in msg_lower or "not connected" in msg_lower or "not ready" in msg_lower):
-            level = "WARNING"
-        else:
-            level = "INFO"
-            
-        ts = QDateTime.currentDateTime().toString("yyyy-MM-dd hh:mm:ss")
-        log_line = f"{ts} [{level}] {message}\n"
-        
-        try:
-            self.data_logger.log_file.write(log_line)
-            self.data_logger.log_file.flush() # Ensure log is written to OS buffer
-        except Exception as e:
-            print(f"Log write error: {e}")
+    def show_events(self):
+        """Open the event viewer (one instance, non-modal)"""
+        if getattr(self, '_event_viewer', None) is None:
+            self._event_viewer = EventViewerDialog(self)
+            self._event_viewer.finished.connect(lambda _: setattr(self, '_event_viewer', None))
+        self._event_viewer.show()
+        self._event_viewer.raise_()
 
     def resizeEvent(self, event):
         """Handle window resize events to adjust UI elements"""
@@ -490,10 +489,9 @@ class MainWindow(QMainWindow):
         if hasattr(self, 'data_logger') and hasattr(self.data_logger, 'continuous_saving') and self.data_logger.continuous_saving:
             self.toggle_data_saving()
         
-        if hasattr(self.data_logger, 'csv_file') and self.data_logger.csv_file:
-            self.data_logger.csv_file.close()
-        if hasattr(self.data_logger, 'log_file') and self.data_logger.log_file:
-            self.data_logger.log_file.close()
+        # Buffered rows are written out before the files are closed
+        if hasattr(self, 'data_logger'):
+            self.data_logger.close_files()
         
         # Release camera resources if initialized
         if hasattr(self, 'camera_manager'):
@@ -507,7 +505,11 @@ class MainWindow(QMainWindow):
         self.statusBar().showMessage("Shutting down resources...")
         print("MainWindow: Starting shutdown_resources...")
 
-        # 1. Stop all timers
+        # 1. Stop the replay and all timers
+        if getattr(self, 'replayer', None) is not None:
+            self.replayer.stop()
+        if getattr(self, 'schedule_manager', None) is not None:
+            self.schedule_manager.stop()
         for timer_attr in ['_hardware_change_timer', '_indicator_timer', 'camera_timer',
                            'data_timer', 'save_timer']: # data_timer and save_timer might be from DataLogger
             if hasattr(self, timer_attr):
@@ -591,5 +593,22 @@ class MainWindow(QMainWindow):
         # So, explicit closing here is redundant and potentially problematic if files are already None.
         print("MainWindow: DataLogger files should be closed by DataLogger._stop_data_saving if necessary.")
 
+        # 7. Write a pending flight recorder dump, close the event log, then drain the
+        # background writer so every queued file reaches the disk
+        try:
+            self.flight_recorder.close()
+        except Exception as e:
+            print(f"Error closing flight recorder: {e}")
+        try:
+            get_event_log().close()
+        except Exception as e:
+            print(f"Error closing event log: {e}")
+        try:
+            stats = get_file_writer().get_stats()
+            print(f"MainWindow: Writer stats: {stats}")
+            shutdown_file_writer()
+        except Exception as e:
+            print(f"Error stopping file writer: {e}")
+
         print("MainWindow: shutdown_resources completed.")
         self.statusBar().showMessage("Resources shut down.")
@@ -0,0 +1,374 @@
+"""
+Run a routine or a schedule without the GUI, for batch and unattended operation.
+
+    python headless.py routines/OO.txt
+    python headless.py schedules/schedule.json --output-dir /data/night_42
+    python headless.py routines/OO.txt --config station.json --timeout 3600
+    python headless.py --resume --output-dir /data/night_42
+
+Loads hardware_config.json, connects the devices it names and the
+spectrometer through the widget-free cores the GUI controllers wrap
+(controllers.cores), and runs the file through the same RoutineManager,
+DataLogger, flight recorder, event log and file writer as the GUI. Status messages are printed instead of shown. No QApplication
+is created and no plotting library is loaded.
+
+Exit status: 0 when the routine (or every routine the schedule ran)
+completed, 1 when one was stopped, interrupted or could not start, 2 when the
+file or the configuration cannot be loaded. With --resume the routine
+stopped or interrupted last (see core.routine_checkpoint) continues after
+its last completed step.
+"""
+import argparse
+import json
+import os
+import signal
+import sys
+import time
+
+from PyQt5.QtCore import QCoreApplication, QObject, QTimer
+
+from controllers.cores import MotorCore, FilterWheelCore, SpectrometerCore, TempCore, THPCore, IMUCore
+from gui.components.data_logger import DataLogger
+from gui.components.routine_manager import RoutineManager, DEFAULT_CHECKPOINT
+from gui.components.schedule_manager import ScheduleManager
+from gui.components import station_setup
+from storage.file_writer import shutdown_file_writer
+from core.event_log import EventSource, get_event_log
+from core.flight_recorder import FlightRecorder
+from core.routine_compiler import compile_file, check_devices, RoutineCompileError, CAMERA
+from core.scheduler import load_schedule
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CONFIG = os.path.join(ROOT, "hardware_config.json")
+ROUTINES_DIR = os.path.join(ROOT, "routines")
+DEFAULT_CONNECT_TIMEOUT_S = 15.0
+DEFAULT_CHECKPOINT_NAME = os.path.basename(DEFAULT_CHECKPOINT)
+
+EXIT_COMPLETED = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+
+# hardware_config.json key, station attribute (as on MainWindow) and controller core of each serial device
+DEVICES = (
+    ("thp_sensor", "thp_ctrl", THPCore),
+    ("temp_controller", "temp_ctrl", TempCore),
+    ("motor", "motor_ctrl", MotorCore),
+    ("filterwheel", "filter_ctrl", FilterWheelCore),
+    ("imu", "imu_ctrl", IMUCore),
+)
+
+
+class ConsoleStatusBar:
+    """The station's statusBar(): prints each new message with the time"""
+
+    def __init__(self):
+        self.last = None
+
+    def showMessage(self, message, timeout=0):
+        if message != self.last:
+            self.last = message
+            print(f"[{time.strftime('%H:%M:%S')}] {message}", flush=True)
+
+
+class HeadlessStation(QObject):
+    """What RoutineManager, DataLogger and ScheduleManager use of MainWindow, without widgets"""
+    headless = True
+
+    def __init__(self, config, output_dir=None):
+        super().__init__()
+        self.config = config
+        self._status_bar = ConsoleStatusBar()
+        self._hardware_changing = False
+        self._integration_changing = False
+
+        catalog = dict(self.config.get("catalog", {}))
+        if output_dir:
+            for name in ("data", "logs"):
+                os.makedirs(os.path.join(output_dir, name), exist_ok=True)
+            catalog.setdefault("path", os.path.join(output_dir, "data", "catalog.sqlite"))
+        station_setup.configure_services(self.config, catalog)
+        self.events = EventSource("headless", self._status_bar.showMessage)
+
+        self.data_logger = DataLogger(self)
+        if output_dir:
+            self.data_logger.csv_dir = os.path.join(output_dir, "data")
+            self.data_logger.log_dir = os.path.join(output_dir, "logs")
+        station_setup.open_event_log(self.data_logger.log_dir)
+        self.routine_manager = RoutineManager(self)
+        if output_dir and self.routine_manager.checkpoint_path and "checkpoint" not in self.config.get("routine", {}):
+            self.routine_manager.checkpoint_path = os.path.join(output_dir, "data", DEFAULT_CHECKPOINT_NAME)
+        self.camera_manager = None          # only when a routine takes pictures (see use_devices)
+        self.schedule_manager = None
+
+        recorder_config = dict(self.config.get("flight_recorder", {}))
+        recorder_dir = recorder_config.pop("dir", None) or os.path.join(self.data_logger.csv_dir, "flight_recorder")
+        self.flight_recorder = FlightRecorder(recorder_dir, **recorder_config)
+        self.flight_recorder.attach()
+
+        self.init_devices()
+        if self.flight_recorder.enabled:
+            self.spec_ctrl.scan_signal.connect(self.flight_recorder.add_scan)
+        self.replayer = station_setup.start_replay(self, self.config.get("replay", {}))
+
+    def statusBar(self):
+        return self._status_bar
+
+    def init_devices(self):
+        """Create and connect the spectrometer and every device hardware_config.json gives a port"""
+        self.spec_ctrl = SpectrometerCore(station=self, parent=self, csv_dir=self.data_logger.csv_dir)
+        self.spec_ctrl.status_signal.connect(self._status_bar.showMessage)
+        self.spec_ctrl.connect()
+        for key, attribute, controller_class in DEVICES:
+            port = self.config.get(key)
+            controller = controller_class(port, parent=self) if port else None
+            setattr(self, attribute, controller)
+            if controller is None:
+                continue
+            controller.status_signal.connect(self._status_bar.showMessage)
+            try:
+                controller.connect()
+            except Exception as e:
+                self.events.error("controller_init_failed", f"{key}: Initialization failed - {e}",
+                                  controller=key, error=str(e))
+
+    def use_devices(self, devices):
+        """Open what routines with these devices need beyond the always connected devices"""
+        if CAMERA in devices and self.camera_manager is None:
+            from gui.components.camera_manager import CameraManager
+            self.camera_manager = CameraManager(self)
+            self.camera_manager.init_camera()
+
+    def toggle_data_saving(self):
+        """Start or stop continuous data saving (MainWindow.toggle_data_saving without the button)"""
+        return station_setup.toggle_data_saving(self)
+
+    def shutdown(self):
+        """Release everything in the order of MainWindow.shutdown_resources"""
+        if self.replayer is not None:
+            self.replayer.stop()
+        if self.schedule_manager is not None:
+            self.schedule_manager.stop()
+        if self.routine_manager.routine_running:
+            self.routine_manager.stop_routine()
+        if getattr(self.data_logger, 'continuous_saving', False):
+            try:
+                self.toggle_data_saving()
+            except Exception as e:
+                print(f"Error stopping data saving: {e}")
+        try:
+            self.spec_ctrl.disconnect()
+        except Exception as e:
+            print(f"Error disconnecting spectrometer: {e}")
+        if self.camera_manager is not None:
+            self.camera_manager.release_camera()
+        for _, attribute, _ in DEVICES:
+            controller = getattr(self, attribute)
+            if controller is not None:
+                try:
+                    controller.disconnect()
+                except Exception as e:
+                    print(f"Error disconnecting {attribute}: {e}")
+        try:
+            self.flight_recorder.close()
+        except Exception as e:
+            print(f"Error closing flight recorder: {e}")
+        try:
+            get_event_log().close()
+        except Exception as e:
+            print(f"Error closing event log: {e}")
+        try:
+            shutdown_file_writer()
+        except Exception as e:
+            print(f"Error stopping file writer: {e}")
+
+
+class HeadlessRun(QObject):
+    """Runs a routine or a schedule on a station and decides the exit status"""
+
+    def __init__(self, station, app, connect_timeout_s=DEFAULT_CONNECT_TIMEOUT_S, timeout_s=None):
+        super().__init__()
+        self.station = station
+        self.app = app
+        self.connect_timeout_s = connect_timeout_s
+        self.mode = None                # "routine" or "schedule"
+        self.runs = 0
+        self.failures = 0
+        self.status = None
+        self._stopping = False
+        if timeout_s:
+            QTimer.singleShot(int(timeout_s * 1000), lambda: self.stop(f"time limit of {timeout_s:g} s reached"))
+
+    def run_routine(self, path):
+        """Start the routine once its devices are connected; finished_signal ends the run"""
+        self._start_when_ready(compile_file(path), lambda: self.station.routine_manager.run_file(path))
+
+    def resume_routine(self):
+        """Continue the routine of the station's checkpoint once its devices are connected"""
+        checkpoint = self.station.routine_manager.pending_checkpoint()
+        if checkpoint is None:
+            raise ValueError(f"no routine checkpoint in {self.station.routine_manager.checkpoint_path}")
+        self._start_when_ready(compile_file(checkpoint.routine), self.station.routine_manager.resume_routine)
+
+    def _start_when_ready(self, program, start):
+        """Call start() once the program's devices are connected (or the connect timeout passed)"""
+        self.mode = "routine"
+        self.station.use_devices(program.devices)
+        self.station.routine_manager.finished_signal.connect(self._on_routine_finished)
+        deadline = time.time() + self.connect_timeout_s
+
+        def start_when_ready():
+            if self._stopping:
+                return
+            available = self.station.routine_manager.available_devices()
+            if check_devices(program, available) and time.time() < deadline:
+                QTimer.singleShot(100, start_when_ready)
+                return
+            self.runs += 1
+            if not start():
+                self.failures += 1
+                self.finish()
+
+        start_when_ready()
+
+    def run_schedule(self, path):
+        """Run the schedule's routines as they come due, until no entry will again"""
+        self.mode = "schedule"
+        routine_manager = self.station.routine_manager
+        self.station.use_devices(devices_used(path))
+        config = dict(self.station.config.get("scheduler", {}), enabled=True, file=os.path.abspath(path))
+        manager = self.station.schedule_manager = ScheduleManager(self.station, routine_manager, config)
+        routine_manager.finished_signal.connect(self._on_scheduled_routine_finished)
+        manager.exhausted_signal.connect(self._on_schedule_exhausted)
+        if not manager.start():
+            raise ValueError(f"cannot start the schedule {path}")
+
+    def _on_routine_finished(self, completed):
+        self.runs, self.failures = 1, int(not completed)
+        self.finish()
+
+    def _on_scheduled_routine_finished(self, completed):
+        self.runs += 1
+        self.failures += not completed
+        if self._stopping:
+            self.finish()
+
+    def _on_schedule_exhausted(self):
+        if not self.station.routine_manager.routine_running:
+            self.finish()
+
+    def stop(self, reason):
+        """Stop the running routine (which then finishes the run, as failed) or finish now"""
+        if self._stopping:
+            return
+        self._stopping = True
+        self.station.statusBar().showMessage(f"Stopping: {reason}")
+        if self.station.routine_manager.routine_running:
+            self.station.routine_manager.stop_routine()
+        else:
+            self.finish()
+
+    def finish(self):
+        if self.status is not None:
+            return
+        # A routine run must have run; a schedule may have had nothing due
+        failed = self.failures or (self.mode == "routine" and not self.runs)
+        self.status = EXIT_FAILED if failed else EXIT_COMPLETED
+        self.station.statusBar().showMessage(f"Finished: {self.runs - min(self.failures, self.runs)} of "
+                                             f"{self.runs} routine(s) completed")
+        # After the routine manager's own completion handling
+        QTimer.singleShot(0, lambda: self.app.exit(self.status))
+
+
+def devices_used(path):
+    """Devices a routine file, or the routines of a schedule file, drive.
+
+    Compiles every routine, so that errors show before any device is connected.
+    """
+    if not is_schedule(path):
+        return compile_file(path).devices
+    entries, _ = load_schedule(path, [os.path.dirname(os.path.abspath(path)), ROUTINES_DIR])
+    devices = set()
+    for entry in entries:
+        devices |= compile_file(entry.routine).devices
+    return frozenset(devices)
+
+
+def is_schedule(path):
+    return path.lower().endswith(".json")
+
+
+def load_config(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="headless.py",
+                                     description="Run a routine (.txt) or a schedule (.json) without the GUI.")
+    parser.add_argument("file", nargs="?", help="routine file, or schedule file (.json)")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue the routine stopped or interrupted last, instead of running a file")
+    parser.add_argument("--config", default=DEFAULT_CONFIG, help="hardware configuration (default: %(default)s)")
+    parser.add_argument("--output-dir", help="write data/ and logs/ under this directory instead of the repository's")
+    parser.add_argument("--connect-timeout", type=float, default=DEFAULT_CONNECT_TIMEOUT_S,
+                        help="seconds to wait for a routine's devices to connect (default: %(default)s)")
+    parser.add_argument("--timeout", type=float, help="stop after this many seconds; a routine still running then fails")
+    args = parser.parse_args(argv)
+    if bool(args.file) == args.resume:
+        parser.error("give either a routine or schedule file, or --resume")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    try:
+        config = load_config(args.config)
+    except (OSError, ValueError) as e:
+        print(f"Config load error: {e}")
+        return EXIT_USAGE
+    try:
+        if args.file:
+            devices_used(args.file)
+    except RoutineCompileError as e:
+        print(f"Routine errors:\n{e}")
+        return EXIT_USAGE
+    except (OSError, ValueError) as e:
+        print(f"Cannot run {args.file}: {e}")
+        return EXIT_USAGE
+
+    app = QCoreApplication.instance() or QCoreApplication(sys.argv[:1])
+    station = HeadlessStation(config, args.output_dir)
+    run = HeadlessRun(station, app, args.connect_timeout, args.timeout)
+    try:
+        if args.resume:
+            run.resume_routine()
+        elif is_schedule(args.file):
+            run.run_schedule(args.file)
+        else:
+            run.run_routine(args.file)
+    except RoutineCompileError as e:
+        print(f"Routine errors:\n{e}")
+        station.shutdown()
+        return EXIT_USAGE
+    except (OSError, ValueError) as e:
+        print(f"Cannot run {args.file or 'the checkpoint'}: {e}")
+        station.shutdown()
+        return EXIT_USAGE
+
+    # Python only sees SIGINT/SIGTERM between Qt events; the timer makes sure there are some
+    previous = {sig: signal.signal(sig, lambda *_: run.stop("interrupted")) for sig in (signal.SIGINT, signal.SIGTERM)}
+    ticker = QTimer()
+    ticker.timeout.connect(lambda: None)
+    ticker.start(200)
+    try:
+        status = app.exec_()
+    finally:
+        ticker.stop()
+        for sig, handler in previous.items():
+            signal.signal(sig, handler)
+        station.shutdown()
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,260 @@
+"""
+SQLite catalog of every file the application writes.
+
+Each data product (continuous scan CSV and archive segments, segment
+indexes, logs, snapshots, camera images, final routine data) gets one row
+keyed by its path, holding what later processing needs to find it:
+
+    kind                 "scan_csv", "scan_archive", "segment_index", "log",
+                         "snapshot", "plot_snapshot", "image", "final"
+    session, segment     continuous logging session and segment number
+    routine,             routine name and start ("yyyyMMdd_hhmmss") the file
+    routine_start        was written for
+    filter_pos,          hardware state at the time of a snapshot
+    motor_angle,
+    integration_time_ms
+    first_timestamp,     POSIX time span of the rows in the file
+    last_timestamp
+    rows, size, codec    row count, bytes on disk, compression codec
+    complete             0 while the file is still being written
+
+The file writer records entries on its own thread when a file it was given
+catalog metadata for is opened, written or closed (see
+storage.file_writer), so the catalog is updated by every writer without the
+GUI thread touching the database. Readers use query() / latest() instead of
+listing and stat-ing the data directory. Files from before the catalog
+existed are entered with `python -m storage.catalog [directory]`.
+"""
+import os
+import re
+import sys
+import time
+import sqlite3
+import threading
+
+_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DEFAULT_PATH = os.path.join(_ROOT, "data", "catalog.sqlite")
+
+COLUMNS = [
+    ("path", "TEXT PRIMARY KEY"),     # relative to the catalog's directory when inside it
+    ("kind", "TEXT"),
+    ("session", "TEXT"),
+    ("segment", "INTEGER"),
+    ("routine", "TEXT"),
+    ("routine_start", "TEXT"),
+    ("filter_pos", "INTEGER"),
+    ("motor_angle", "REAL"),
+    ("integration_time_ms", "REAL"),
+    ("first_timestamp", "REAL"),
+    ("last_timestamp", "REAL"),
+    ("rows", "INTEGER"),
+    ("size", "INTEGER"),
+    ("codec", "TEXT"),
+    ("complete", "INTEGER"),
+    ("created", "REAL"),
+    ("modified", "REAL"),
+]
+FIELDS = [name for name, _ in COLUMNS]
+
+
+class Catalog:
+    """Thread-safe wrapper around the catalog database"""
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = os.path.abspath(path)
+        self.root = os.path.dirname(self.path)
+        os.makedirs(self.root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(f"CREATE TABLE IF NOT EXISTS files "
+                             f"({', '.join(f'{n} {t}' for n, t in COLUMNS)})")
+            existing = {row["name"] for row in self._db.execute("PRAGMA table_info(files)")}
+            for name, kind in COLUMNS:
+                if name not in existing:
+                    self._db.execute(f"ALTER TABLE files ADD COLUMN {name} {kind}")
+            self._db.execute("CREATE INDEX IF NOT EXISTS files_kind ON files (kind, created)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS files_session ON files (session, segment)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS files_routine ON files (routine, routine_start)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS files_time ON files (first_timestamp)")
+
+    def _key(self, path):
+        path = os.path.abspath(path)
+        rel = os.path.relpath(path, self.root)
+        return path if rel.startswith("..") else rel.replace(os.sep, "/")
+
+    def _entry(self, row):
+        entry = dict(row)
+        entry["path"] = os.path.normpath(os.path.join(self.root, entry["path"]))
+        return entry
+
+    def record(self, path, **meta):
+        """Insert or update the entry for path; fields passed as None keep their value"""
+        unknown = set(meta) - set(FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown catalog fields: {', '.join(sorted(unknown))}")
+        now = time.time()
+        meta = {k: v for k, v in meta.items() if v is not None and k != "path"}
+        created = meta.pop("created", now)
+        meta["modified"] = now
+        names = ["path", "created"] + list(meta)
+        values = [self._key(path), created] + list(meta.values())
+        updates = ", ".join(f"{name} = excluded.{name}" for name in meta)
+        with self._lock, self._db:
+            self._db.execute(
+                f"INSERT INTO files ({', '.join(names)}) VALUES ({', '.join('?' * len(names))}) "
+                f"ON CONFLICT(path) DO UPDATE SET {updates}", values)
+
+    def remove(self, path):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM files WHERE path = ?", (self._key(path),))
+
+    def get(self, path):
+        """Entry for path as a dict, or None"""
+        with self._lock:
+            row = self._db.execute("SELECT * FROM files WHERE path = ?", (self._key(path),)).fetchone()
+        return self._entry(row) if row is not None else None
+
+    def query(self, kind=None, start=None, end=None, newest_first=True, limit=None, **equals):
+        """Entries matching every given field, optionally overlapping [start, end].
+
+        equals takes any catalog field, e.g. session="20250611_113227" or
+        routine="OO", routine_start=..., filter_pos=1. Results are ordered by
+        creation time (newest first by default), then by segment.
+        """
+        unknown = set(equals) - set(FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown catalog fields: {', '.join(sorted(unknown))}")
+        clauses, params = [], []
+        if kind is not None:
+            equals["kind"] = kind
+        for name, value in equals.items():
+            if value is None:
+                continue
+            clauses.append(f"{name} = ?")
+            params.append(self._key(value) if name == "path" else value)
+        if start is not None:
+            clauses.append("(last_timestamp IS NULL OR last_timestamp >= ?)")
+            params.append(start)
+        if end is not None:
+            clauses.append("(first_timestamp IS NULL OR first_timestamp <= ?)")
+            params.append(end)
+        order = "DESC" if newest_first else "ASC"
+        sql = "SELECT * FROM files"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += f" ORDER BY created {order}, segment {order}"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        return [self._entry(row) for row in rows]
+
+    def latest(self, kind=None, **equals):
+        """Most recently created matching entry, or None"""
+        found = self.query(kind, limit=1, **equals)
+        return found[0] if found else None
+
+    def session_files(self, session, kind="scan_csv"):
+        """Files of one logging session in segment order"""
+        return sorted(self.query(kind, session=session), key=lambda e: e["segment"] or 0)
+
+    def import_directory(self, directory):
+        """Enter files written before the catalog existed; returns how many were added.
+
+        Kind, session, segment and routine are derived from the file names the
+        application uses, the creation time from the modification time.
+        """
+        added = 0
+        for dirpath, _, filenames in os.walk(directory):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                if os.path.abspath(path).startswith(self.path) or self.get(path) is not None:
+                    continue
+                meta = describe_file(path, directory)
+                if meta is None:
+                    continue
+                self.record(path, size=os.path.getsize(path), created=os.path.getmtime(path),
+                            complete=1, **meta)
+                added += 1
+        return added
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_SCAN_NAME = re.compile(r"^Scans_(\d{8}_\d{6})_mini(?:_(\d{3}))?(_index\.json|\.csv|\.sga)(\.\w+)?$")
+_LOG_NAME = re.compile(r"^log_(\d{8}_\d{6})(?:_(\d{3}))?\.txt$")
+_EVENT_LOG_NAME = re.compile(r"^events_(\d{8}_\d{6})\.jsonl$")
+
+
+def describe_file(path, directory):
+    """Catalog fields implied by a data file's name and location, or None if unknown"""
+    name = os.path.basename(path)
+    match = _SCAN_NAME.match(name)
+    if match:
+        session, segment, suffix, extension = match.groups()
+        kind = {"_index.json": "segment_index", ".csv": "scan_csv", ".sga": "scan_archive"}[suffix]
+        return {"kind": kind, "session": session, "segment": int(segment) if segment else 1,
+                "codec": extension[1:] if extension else None}
+    match = _LOG_NAME.match(name)
+    if match:
+        return {"kind": "log", "session": match.group(1),
+                "segment": int(match.group(2)) if match.group(2) else 1}
+    match = _EVENT_LOG_NAME.match(name)
+    if match:
+        return {"kind": "event_log", "session": match.group(1)}
+    if name.startswith("final_"):
+        return {"kind": "final"}
+    if name.startswith("flight_") and name.endswith(".npz"):
+        return {"kind": "flight_record"}
+    # Routine products are stored as <directory>/<routine>/<start>/<file>
+    parts = os.path.relpath(path, directory).split(os.sep)
+    routine = {"routine": parts[0], "routine_start": parts[1]} if len(parts) == 3 else {}
+    extension = os.path.splitext(name)[1].lower()
+    if extension in (".jpg", ".jpeg", ".png", ".bmp"):
+        return dict(routine, kind="image")
+    if name.startswith("snapshot_") or routine:
+        return dict(routine, kind="snapshot")
+    return None
+
+
+_catalog = None
+_catalog_options = {"path": DEFAULT_PATH, "enabled": True}
+_catalog_lock = threading.Lock()
+
+
+def configure_catalog(**options):
+    """Set the catalog path (relative paths are taken from the project root) or disable it"""
+    global _catalog
+    path = options.get("path")
+    if path and not os.path.isabs(path):
+        options["path"] = os.path.join(_ROOT, path)
+    with _catalog_lock:
+        _catalog_options.update({k: v for k, v in options.items() if v is not None})
+        if _catalog is not None:
+            _catalog.close()
+            _catalog = None
+
+
+def get_catalog():
+    """Return the shared Catalog, or None when the catalog is disabled or cannot be opened"""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None and _catalog_options.get("enabled", True):
+            try:
+                _catalog = Catalog(_catalog_options["path"])
+            except sqlite3.Error as e:
+                print(f"Catalog: cannot open {_catalog_options['path']}: {e}")
+                _catalog_options["enabled"] = False
+        return _catalog
+
+
+if __name__ == "__main__":
+    # Usage: python -m storage.catalog [directory]   (enters existing files, default data/)
+    directory = sys.argv[1] if len(sys.argv) > 1 else os.path.join(_ROOT, "data")
+    catalog = get_catalog()
+    print(f"Added {catalog.import_directory(directory)} files to {catalog.path}")
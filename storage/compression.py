@@ -0,0 +1,201 @@
+"""
+Streaming compression codecs for log and snapshot files.
+
+gzip is always available (standard library). zstd and lz4 are used when the
+optional 'zstandard' / 'lz4' packages are installed.
+
+Flushing a compressor (a sync flush for gzip/zstd, the end of a frame for lz4)
+leaves a file that decompresses cleanly up to that point. read_compressed() recovers
+everything up to the last flush from a file whose tail was cut off by a crash.
+"""
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+_READ_CHUNK = 1 << 16
+
+
+class _GzipCompressor:
+    def __init__(self, level):
+        # wbits=31 -> gzip container
+        self._obj = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._obj.compress(data)
+
+    def flush(self):
+        return self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._obj.flush(zlib.Z_FINISH)
+
+
+class _ZstdCompressor:
+    def __init__(self, level):
+        self._obj = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self._obj.compress(data)
+
+    def flush(self):
+        return self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+class _Lz4Compressor:
+    # lz4 frames cannot be sync-flushed, so every flush closes the current frame
+    # and the next write starts a new one; readers handle concatenated frames.
+    def __init__(self, level):
+        self._level = level
+        self._obj = None
+
+    def compress(self, data):
+        head = b""
+        if self._obj is None:
+            self._obj = lz4_frame.LZ4FrameCompressor(compression_level=self._level)
+            head = self._obj.begin()
+        return head + self._obj.compress(data)
+
+    def flush(self):
+        if self._obj is None:
+            return b""
+        out, self._obj = self._obj.flush(), None
+        return out
+
+    def finish(self):
+        return self.flush()
+
+
+class Codec:
+    """Description of one compression format"""
+
+    def __init__(self, name, extension, default_level, factory, available):
+        self.name = name
+        self.extension = extension
+        self.default_level = default_level
+        self._factory = factory
+        self.available = available
+
+    def compressor(self, level=None):
+        return self._factory(self.default_level if level is None else level)
+
+
+CODECS = {
+    "gzip": Codec("gzip", ".gz", 6, _GzipCompressor, True),
+    "zstd": Codec("zstd", ".zst", 3, _ZstdCompressor, zstandard is not None),
+    "lz4": Codec("lz4", ".lz4", 0, _Lz4Compressor, lz4_frame is not None),
+}
+
+
+def available_codecs():
+    return [name for name, codec in CODECS.items() if codec.available]
+
+
+def get_codec(name):
+    """Return the Codec for name; raises ValueError if unknown or not installed"""
+    codec = CODECS.get(str(name).lower())
+    if codec is None:
+        raise ValueError(f"Unknown compression codec '{name}'")
+    if not codec.available:
+        raise ValueError(f"Compression codec '{name}' is not installed")
+    return codec
+
+
+def resolve_codec(name, fallback="gzip"):
+    """Like get_codec, but falls back to gzip when an optional codec is missing.
+
+    Returns None when name is empty/None (compression disabled).
+    """
+    if not name:
+        return None
+    try:
+        return get_codec(name)
+    except ValueError:
+        if str(name).lower() in CODECS:
+            return CODECS[fallback]
+        raise
+
+
+def codec_for_path(path):
+    for codec in CODECS.values():
+        if path.endswith(codec.extension):
+            return codec
+    return None
+
+
+def compress_bytes(data, codec, level=None):
+    """One-shot compression of a complete file body"""
+    comp = codec.compressor(level)
+    return comp.compress(data) + comp.finish()
+
+
+def _decompressor(codec):
+    """Return (decompressor object, exception types raised on corrupt input)"""
+    if codec.name == "gzip":
+        return zlib.decompressobj(31), (zlib.error,)
+    if codec.name == "zstd":
+        return zstandard.ZstdDecompressor().decompressobj(), (zstandard.ZstdError,)
+    return lz4_frame.LZ4FrameDecompressor(), (RuntimeError,)
+
+
+def iter_decompressed(path, codec=None):
+    """Yield decompressed chunks of a (possibly truncated) compressed file.
+
+    Concatenated members/frames (appended files, lz4 flushes) are decoded one
+    after another; decoding stops quietly at a cut-off or corrupt tail.
+    """
+    codec = codec or codec_for_path(path)
+    if codec is None:
+        raise ValueError(f"Cannot tell compression format of {path}")
+    if not codec.available:
+        raise ValueError(f"Compression codec '{codec.name}' is not installed")
+    decomp, errors = _decompressor(codec)
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(_READ_CHUNK)
+            if not chunk:
+                return
+            while chunk:
+                try:
+                    out = decomp.decompress(chunk)
+                except errors:
+                    return
+                if out:
+                    yield out
+                if decomp.eof:
+                    chunk = decomp.unused_data
+                    decomp, errors = _decompressor(codec)
+                else:
+                    chunk = b""
+
+
+def read_compressed(path, codec=None):
+    """Return the decompressed contents recoverable from path as bytes"""
+    return b"".join(iter_decompressed(path, codec))
+
+
+def read_text(path, encoding="utf-8"):
+    """Decompressed text of path up to its last complete line"""
+    data = read_compressed(path)
+    return data[:data.rfind(b"\n") + 1].decode(encoding, "replace")
+
+
+def iter_lines(path, encoding="utf-8"):
+    """Stream text lines from a compressed file; a cut-off last line is dropped"""
+    pending = b""
+    for chunk in iter_decompressed(path):
+        pending += chunk
+        lines = pending.split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line.decode(encoding, "replace")
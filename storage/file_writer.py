@@ -0,0 +1,495 @@
+"""
+Background file writer shared by every component that produces files.
+
+All disk I/O (continuous CSV/archive rows, log lines, snapshots, final data,
+camera images) is queued here and performed by a single worker thread, so a
+slow disk never stalls the Qt GUI thread or the acquisition timers.
+
+Callers get file-like WriterStream objects (write/flush/close) for long-lived
+files and use write_file() for one-shot files. Expensive formatting can be
+deferred to the worker by passing a callable instead of the data.
+
+Streams and one-shot files can be compressed (see storage.compression); the
+compression runs on the writer thread as the batched chunks are written.
+Files opened or written with catalog metadata are entered in the SQLite
+catalog (storage.catalog) from the writer thread.
+"""
+import os
+import time
+import queue
+import threading
+
+from storage.compression import get_codec, compress_bytes
+from storage.catalog import get_catalog
+
+# fsync policies
+FSYNC_NEVER = "never"      # leave durability to the OS
+FSYNC_FLUSH = "flush"      # fsync every time a stream is flushed
+FSYNC_CLOSE = "close"      # fsync once when a stream is closed
+
+# Back-pressure policies for a full queue
+BLOCK = "block"            # wait for room (data files)
+DROP = "drop"              # discard the write and count it (log lines)
+
+_DEFAULTS = {
+    "queue_size": 2000,        # maximum pending operations
+    "batch_size": 256,         # operations drained per worker wake-up
+    "flush_interval_s": 1.0,   # flush streams at most this often (0 = every batch)
+    "fsync": FSYNC_NEVER,
+    "block_timeout_s": 5.0,    # how long a BLOCK write may wait before it is dropped and reported
+}
+
+
+class WriterStream:
+    """File-like handle to a file owned by the writer thread"""
+
+    def __init__(self, service, path, mode, encoding, newline, policy, codec=None, level=None,
+                 catalog=None):
+        self.service = service
+        self.path = path
+        self.mode = mode
+        self.encoding = encoding
+        self.newline = newline
+        self.policy = policy
+        self.codec = codec
+        self.level = level
+        self.catalog = dict(catalog) if catalog is not None else None   # storage.catalog fields
+        self.closed = False
+        self.bytes_queued = 0
+        # Only touched by the worker thread
+        self._fh = None
+        self._compressor = None
+        self._unflushed = False
+        self._last_flush = 0.0
+        self.rows = 0            # newline-terminated rows written
+        self.bytes_in = 0        # uncompressed bytes
+        self.bytes_out = 0       # bytes that reached the file
+        self.cpu_seconds = 0.0   # writer-thread CPU time spent compressing
+
+    def write(self, data):
+        """Queue data; returns False if it was dropped (DROP policy, or a BLOCK timeout)"""
+        if self.closed:
+            raise ValueError(f"write to closed stream {self.path}")
+        if not self.service._put(("write", self, data), self.policy):
+            return False
+        self.bytes_queued += len(data) if not callable(data) else 0
+        return True
+
+    def flush(self):
+        """Request a flush; returns immediately"""
+        if not self.closed:
+            self.service._put(("flush", self, None), self.policy)
+
+    def sync(self):
+        """Request a flush followed by an fsync, whatever the fsync policy; returns immediately"""
+        if not self.closed:
+            self.service._put(("sync", self, None), BLOCK)
+
+    def close(self, callback=None):
+        if not self.closed:
+            self.closed = True
+            self.service._put(("close", self, callback), BLOCK)
+
+    def annotate(self, **meta):
+        """Add or change catalog fields; they are recorded when the stream is closed"""
+        if self.catalog is not None:
+            self.catalog.update(meta)
+
+    def tell(self):
+        """Bytes queued for this stream so far (an estimate of its size)"""
+        return self.bytes_queued
+
+    def compression_stats(self):
+        """Compression ratio and cost of what has been written so far"""
+        return {
+            "codec": self.codec.name if self.codec else None,
+            "rows": self.rows,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "ratio": self.bytes_in / self.bytes_out if self.bytes_out else 0.0,
+            "cpu_us_per_row": 1e6 * self.cpu_seconds / self.rows if self.rows else 0.0,
+        }
+
+
+class FileWriterService:
+    """Single writer thread with a bounded queue and batched writes"""
+
+    def __init__(self, **options):
+        self.options = dict(_DEFAULTS)
+        self.options.update({k: v for k, v in options.items() if v is not None})
+        self._queue = queue.Queue(maxsize=int(self.options["queue_size"]))
+        self._streams = set()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self.error_callback = None
+        self.stats = {
+            "enqueued": 0, "written_ops": 0, "written_bytes": 0, "batches": 0,
+            "flushes": 0, "fsyncs": 0, "dropped": 0, "blocked": 0,
+            "blocked_seconds": 0.0, "max_queue_depth": 0, "errors": 0,
+            "last_error": None,
+        }
+        self._thread = threading.Thread(target=self._run, name="FileWriter", daemon=True)
+        self._thread.start()
+
+    # ------------------------------------------------------------------ API
+
+    def open_stream(self, path, mode="w", encoding="utf-8", newline=None, policy=BLOCK,
+                    compression=None, level=None, catalog=None):
+        """Open a file on the writer thread and return a WriterStream for it.
+
+        compression is a codec name from storage.compression ("gzip", "zstd",
+        "lz4"); the caller chooses the file name (usually path + codec.extension).
+        catalog is a dict of storage.catalog fields (at least "kind"); the file
+        is then entered in the catalog when it is opened and again when closed.
+        """
+        codec = get_codec(compression) if compression else None
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if "b" in mode:
+            encoding = None
+        stream = WriterStream(self, path, mode, encoding, newline, policy, codec, level, catalog)
+        self._put(("open", stream, None), BLOCK)
+        return stream
+
+    def write_file(self, path, data, mode="w", encoding="utf-8", newline=None, callback=None,
+                   compression=None, catalog=None):
+        """Write a complete file in one go.
+
+        data may be str/bytes or a zero-argument callable returning them; the
+        callable runs on the writer thread. callback(path, error) is invoked on
+        the writer thread once the file is written (error is None on success).
+        With compression set, the data is compressed on the writer thread.
+        With catalog (a dict of storage.catalog fields) the written file is
+        entered in the catalog.
+        """
+        codec = get_codec(compression) if compression else None
+        if "b" in mode:
+            encoding = None
+        catalog = dict(catalog) if catalog is not None else None
+        return self._put(("file", (path, mode, encoding, newline, codec), (data, callback, catalog)), BLOCK)
+
+    def submit(self, fn):
+        """Run fn() on the writer thread, ordered with the queued writes"""
+        return self._put(("call", None, fn), BLOCK)
+
+    def drain(self, timeout=None):
+        """Block until everything queued so far has been written; returns True on success"""
+        done = threading.Event()
+        if not self._put(("call", None, done.set), BLOCK):
+            return False
+        return done.wait(timeout)
+
+    def stop(self, timeout=10.0):
+        """Write out everything pending, close open streams and stop the thread"""
+        if self._stop.is_set():
+            return
+        self.drain(timeout)
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats["queue_depth"] = self._queue.qsize()
+        stats["open_streams"] = len(self._streams)
+        return stats
+
+    # ------------------------------------------------------------ internals
+
+    def _put(self, item, policy):
+        if self._stop.is_set():
+            self._count("dropped")
+            return False
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            if policy == DROP:
+                self._count("dropped")
+                return False
+            started = time.monotonic()
+            try:
+                self._queue.put(item, timeout=self.options["block_timeout_s"])
+            except queue.Full:
+                self._count("dropped")
+                self._record_error(f"Writer queue full, dropped write to {self._describe(item)}")
+                return False
+            finally:
+                with self._lock:
+                    self.stats["blocked"] += 1
+                    self.stats["blocked_seconds"] += time.monotonic() - started
+        with self._lock:
+            self.stats["enqueued"] += 1
+            depth = self._queue.qsize()
+            if depth > self.stats["max_queue_depth"]:
+                self.stats["max_queue_depth"] = depth
+        return True
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def _record_error(self, message):
+        with self._lock:
+            self.stats["errors"] += 1
+            self.stats["last_error"] = message
+        print(f"FileWriter: {message}")
+        if self.error_callback is not None:
+            try:
+                self.error_callback(message)
+            except Exception:
+                pass
+
+    @staticmethod
+    def _describe(item):
+        op, target, _ = item
+        if isinstance(target, WriterStream):
+            return target.path
+        if op == "file":
+            return target[0]
+        return op
+
+    def _run(self):
+        batch_size = int(self.options["batch_size"])
+        while True:
+            try:
+                first = self._queue.get(timeout=0.2)
+            except queue.Empty:
+                if self._stop.is_set():
+                    break
+                self._flush_due(time.monotonic())
+                continue
+            batch = [first]
+            while len(batch) < batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._process(batch)
+        for stream in list(self._streams):
+            self._close(stream, None)
+
+    def _process(self, batch):
+        # Consecutive writes to the same stream are joined into a single write call
+        pending_stream, pending = None, []
+        for op, target, payload in batch:
+            if op == "write" and target is pending_stream:
+                pending.append(payload)
+                continue
+            if pending:
+                self._write(pending_stream, pending)
+            pending_stream, pending = None, []
+            if op == "write":
+                pending_stream, pending = target, [payload]
+            elif op == "open":
+                self._open(target)
+            elif op == "flush":
+                self._flush(target)
+            elif op == "sync":
+                self._sync(target)
+            elif op == "close":
+                self._close(target, payload)
+            elif op == "file":
+                self._write_file(target, payload)
+            elif op == "call":
+                try:
+                    payload()
+                except Exception as e:
+                    self._record_error(f"Queued call failed: {e}")
+        if pending:
+            self._write(pending_stream, pending)
+        self._count("batches")
+        self._flush_due(time.monotonic())
+
+    def _open(self, stream):
+        try:
+            if stream.codec is not None:
+                mode = stream.mode.replace("t", "").replace("b", "") + "b"
+                stream._fh = open(stream.path, mode)
+                stream._compressor = stream.codec.compressor(stream.level)
+            else:
+                stream._fh = open(stream.path, stream.mode, encoding=stream.encoding, newline=stream.newline)
+            stream._last_flush = time.monotonic()
+            self._streams.add(stream)
+        except Exception as e:
+            self._record_error(f"Cannot open {stream.path}: {e}")
+            return
+        if stream.catalog is not None:
+            self._catalog(stream.path, stream.catalog, codec=stream.codec.name if stream.codec else None,
+                          complete=0)
+
+    def _write(self, stream, chunks):
+        if stream._fh is None:
+            self._count("dropped", len(chunks))
+            return
+        try:
+            chunks = [c() if callable(c) else c for c in chunks]
+            data = chunks[0][:0].join(chunks) if len(chunks) > 1 else chunks[0]
+            if stream._compressor is not None:
+                self._write_compressed(stream, data)
+            else:
+                stream._fh.write(data)
+            with self._lock:
+                self.stats["written_ops"] += len(chunks)
+                self.stats["written_bytes"] += len(data)
+        except Exception as e:
+            self._record_error(f"Write to {stream.path} failed: {e}")
+
+    def _write_compressed(self, stream, data):
+        if isinstance(data, str):
+            newline = os.linesep if stream.newline is None else stream.newline
+            if newline and newline != "\n":
+                data = data.replace("\n", newline)
+            data = data.encode(stream.encoding or "utf-8")
+        started = time.thread_time()
+        out = stream._compressor.compress(data)
+        stream.cpu_seconds += time.thread_time() - started
+        stream.rows += data.count(b"\n")
+        stream.bytes_in += len(data)
+        stream._unflushed = True
+        self._write_out(stream, out)
+
+    def _compressor_tail(self, stream, finish):
+        # Sync-flush (or finish) the compressor so the file is decodable up to here
+        if not finish and not stream._unflushed:
+            return
+        stream._unflushed = False
+        started = time.thread_time()
+        out = stream._compressor.finish() if finish else stream._compressor.flush()
+        stream.cpu_seconds += time.thread_time() - started
+        self._write_out(stream, out)
+
+    @staticmethod
+    def _write_out(stream, out):
+        if out:
+            stream._fh.write(out)
+            stream.bytes_out += len(out)
+
+    def _flush(self, stream):
+        if stream._fh is None:
+            return
+        try:
+            if stream._compressor is not None:
+                self._compressor_tail(stream, finish=False)
+            stream._fh.flush()
+            if self.options["fsync"] == FSYNC_FLUSH:
+                os.fsync(stream._fh.fileno())
+                self._count("fsyncs")
+            stream._last_flush = time.monotonic()
+            self._count("flushes")
+        except Exception as e:
+            self._record_error(f"Flush of {stream.path} failed: {e}")
+
+    def _sync(self, stream):
+        if stream._fh is None:
+            return
+        self._flush(stream)
+        try:
+            if self.options["fsync"] != FSYNC_FLUSH:     # otherwise _flush has just done it
+                os.fsync(stream._fh.fileno())
+                self._count("fsyncs")
+        except Exception as e:
+            self._record_error(f"Sync of {stream.path} failed: {e}")
+
+    def _flush_due(self, now):
+        interval = float(self.options["flush_interval_s"])
+        for stream in self._streams:
+            if now - stream._last_flush >= interval:
+                self._flush(stream)
+
+    def _close(self, stream, callback):
+        error = None
+        if stream._fh is not None:
+            try:
+                if stream._compressor is not None:
+                    self._compressor_tail(stream, finish=True)
+                stream._fh.flush()
+                if self.options["fsync"] in (FSYNC_FLUSH, FSYNC_CLOSE):
+                    os.fsync(stream._fh.fileno())
+                    self._count("fsyncs")
+                stream._fh.close()
+            except Exception as e:
+                error = e
+                self._record_error(f"Close of {stream.path} failed: {e}")
+            stream._fh = None
+            if error is None and stream.catalog is not None:
+                self._catalog(stream.path, stream.catalog, size=os.path.getsize(stream.path), complete=1)
+        self._streams.discard(stream)
+        if callback is not None:
+            try:
+                callback(stream.path, error)
+            except Exception as e:
+                self._record_error(f"Close callback for {stream.path} failed: {e}")
+
+    def _catalog(self, path, meta, **extra):
+        """Enter a file in the catalog (writer thread); failures are counted, not raised"""
+        catalog = get_catalog()
+        if catalog is None:
+            return
+        try:
+            catalog.record(path, **dict(meta, **{k: v for k, v in extra.items() if v is not None}))
+        except Exception as e:
+            self._record_error(f"Catalog update for {path} failed: {e}")
+
+    def _write_file(self, target, payload):
+        path, mode, encoding, newline, codec = target
+        data, callback, catalog = payload
+        error = None
+        try:
+            if callable(data):
+                data = data()
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            if codec is not None:
+                if isinstance(data, str):
+                    data = data.encode(encoding or "utf-8")
+                data = compress_bytes(data, codec)
+                mode, encoding, newline = mode.replace("t", "").replace("b", "") + "b", None, None
+            with open(path, mode, encoding=encoding, newline=newline) as f:
+                f.write(data)
+                if self.options["fsync"] != FSYNC_NEVER:
+                    f.flush()
+                    os.fsync(f.fileno())
+                    self._count("fsyncs")
+            with self._lock:
+                self.stats["written_ops"] += 1
+                self.stats["written_bytes"] += len(data)
+        except Exception as e:
+            error = e
+            self._record_error(f"Writing {path} failed: {e}")
+        if error is None and catalog is not None:
+            self._catalog(path, catalog, size=len(data), codec=codec.name if codec else None, complete=1)
+        if callback is not None:
+            try:
+                callback(path, error)
+            except Exception as e:
+                self._record_error(f"Callback for {path} failed: {e}")
+
+
+_service = None
+_service_options = {}
+_service_lock = threading.Lock()
+
+
+def configure_file_writer(**options):
+    """Set options for the shared writer; takes effect when it is (re)started"""
+    _service_options.update(options)
+
+
+def get_file_writer():
+    """Return the shared FileWriterService, starting it on first use"""
+    global _service
+    with _service_lock:
+        if _service is None or _service._stop.is_set():
+            _service = FileWriterService(**_service_options)
+        return _service
+
+
+def shutdown_file_writer(timeout=10.0):
+    """Flush and stop the shared writer (called on application exit)"""
+    global _service
+    with _service_lock:
+        service, _service = _service, None
+    if service is not None:
+        service.stop(timeout)
@@ -0,0 +1,410 @@
+"""
+Write-ahead journal for continuous scan rows that are not on disk yet.
+
+DataLogger keeps the last few CSV rows in memory and hands rows to the
+background writer, whose data may sit in its queue or the OS cache for a
+while. A crash or power loss loses them. Each row is therefore first
+appended to a small journal file, which is synced according to the
+configured durability:
+
+    "off"    no journal
+    "os"     journal written, never fsynced (survives an application crash)
+    "batch"  fsync every batch_rows rows or batch_interval_s seconds
+    "row"    fsync after every row
+
+The caller (the GUI thread) only encodes the records. Each journal writes
+and fsyncs them on a thread of its own, so a slow disk does not stall the
+GUI or the acquisition timers, and the journal does not wait behind the
+data files in the background writer's queue.
+
+There is one journal per segment, split into generations
+(<segment>.<generation>.wal). Every checkpoint_rows rows DataLogger starts a
+new generation and asks the writer to fsync the data files; once that is
+done the older generations are deleted, so a journal only ever holds the
+rows since the last checkpoint. A cleanly closed segment deletes its journal.
+
+Journal files left behind by a crash are replayed by recover_journals() at
+the next start: rows missing from the segment's CSV and archive are
+appended (a compressed CSV is rewritten), then the journal is deleted. The
+segment index of the crashed session is not rewritten.
+
+Record framing: length (uint32) | CRC-32 (uint32) | kind (1 byte) | payload.
+A torn or corrupt record ends the journal. Spectra are journaled in the
+dtype named by the segment info's "dtype" ("<f4" for float32 spectra,
+"<f8" when absent), so recovery formats exactly the values the live CSV did.
+"""
+import os
+import re
+import glob
+import json
+import time
+import zlib
+import queue
+import struct
+import threading
+
+import numpy as np
+
+from storage.spectral_archive import SpectralArchiveWriter, read_header
+from storage.compression import codec_for_path, read_text, compress_bytes
+from storage.csv_format import format_rows
+from storage.catalog import get_catalog
+
+DURABILITY_OFF = "off"
+DURABILITY_OS = "os"
+DURABILITY_BATCH = "batch"
+DURABILITY_ROW = "row"
+DURABILITIES = (DURABILITY_OFF, DURABILITY_OS, DURABILITY_BATCH, DURABILITY_ROW)
+
+JOURNAL_EXTENSION = ".wal"
+_MAGIC = b"SGWJ\x01\x00"
+_FRAME = struct.Struct("<IIc")
+_ROW = struct.Struct("<qqI")
+_SEGMENT, _ROW_KIND = b"S", b"R"
+_NAME = re.compile(r"^(.*)\.(\d{4})" + re.escape(JOURNAL_EXTENSION) + "$")
+
+
+class RowJournal:
+    """Journal of the rows of one segment.
+
+    begin() must be called with the segment description before the first
+    append(); it is repeated at the start of every generation file so each
+    file can be replayed on its own. begin() starts the journal's thread and
+    close() ends it; a write error on that thread stops the journal and is
+    raised by the next append().
+    """
+
+    def __init__(self, directory, name, durability=DURABILITY_BATCH, batch_rows=10, batch_interval_s=2.0):
+        if durability not in DURABILITIES or durability == DURABILITY_OFF:
+            raise ValueError(f"Unknown journal durability '{durability}'")
+        self.directory = directory
+        self.name = name
+        self.durability = durability
+        self.batch_rows = max(1, int(batch_rows))
+        self.batch_interval_s = float(batch_interval_s)
+        self.generation = 0
+        self.rows_since_checkpoint = 0
+        self.fsyncs = 0
+        self.error = None
+        self._info = None
+        self._values_dtype = None
+        self._queue = queue.Queue()
+        self._thread = None
+        self._stopped = False
+        self._state_lock = threading.Lock()
+        # Only touched by the journal thread
+        self._fd = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def started(self):
+        return self._info is not None
+
+    def path(self, generation):
+        return os.path.join(self.directory, f"{self.name}.{generation:04d}{JOURNAL_EXTENSION}")
+
+    def begin(self, info):
+        """Start journaling; info (a JSON-serialisable dict) describes the segment files"""
+        self._info = dict(info)
+        self._values_dtype = _values_dtype(self._info)
+        self._thread = threading.Thread(target=self._run, name=f"Journal {self.name}", daemon=True)
+        self._thread.start()
+        self._put("open", self.generation)
+
+    def append(self, csv_index, archive_index, prefix, spectrum, archive_record=b""):
+        """Journal one row.
+
+        csv_index / archive_index are the row's position in the segment's
+        CSV and archive (-1 if it is not written there), prefix its CSV
+        metadata columns, spectrum its values (formatted at recovery exactly
+        as the live CSV) and archive_record its encoded archive record. Raises
+        the OSError that stopped the journal, if any.
+        """
+        if self.error is not None:
+            raise self.error
+        prefix = prefix.encode("utf-8")
+        values = np.asarray(spectrum, dtype=self._values_dtype).tobytes()
+        payload = _ROW.pack(csv_index, archive_index, len(prefix)) + prefix + \
+            struct.pack("<I", len(values)) + values + archive_record
+        self.rows_since_checkpoint += 1
+        self._put("row", _frame(_ROW_KIND, payload))
+
+    def sync(self):
+        """fsync the rows journaled so far; returns immediately"""
+        self._put("sync")
+
+    def checkpoint(self):
+        """Continue in a new generation; returns the last generation the data files must cover.
+
+        Once the data files are synced up to this point, release() the
+        returned generation.
+        """
+        done = self.generation
+        self.generation += 1
+        self.rows_since_checkpoint = 0
+        self._put("open", self.generation)
+        return done
+
+    def release(self, generation=None):
+        """Delete the journal files up to generation (all of them if None); thread-safe.
+
+        Waits for the journal thread to write what is queued, so that it does
+        not write to a file being deleted. Called from the background writer.
+        """
+        last = self.generation if generation is None else generation
+        self.flush()
+        with self._lock:
+            for path in _generation_files(self.directory, self.name):
+                if _generation_of(path) <= last:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+
+    def close(self):
+        """Stop journaling once the queued records are written; the files stay until release()"""
+        self._put("close")
+
+    def flush(self, timeout=None):
+        """Wait until the journal thread has handled everything queued so far"""
+        done = threading.Event()
+        with self._state_lock:
+            if self._thread is None or self._stopped:
+                return True
+            self._queue.put(("call", done.set))
+        return done.wait(timeout)
+
+    def wait(self, timeout=None):
+        """Wait for the journal thread to end after close()"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _put(self, op, arg=None):
+        if self._thread is not None:
+            self._queue.put((op, arg))
+
+    # ---------------------------------------------------- journal thread
+
+    def _run(self):
+        while True:
+            op, arg = self._queue.get()
+            if op == "close":
+                break
+            if op == "call":
+                arg()
+            elif self.error is None:
+                try:
+                    if op == "open":
+                        self._open_generation(arg)
+                    elif op == "row":
+                        self._write_row(arg)
+                    elif op == "sync":
+                        self._sync()
+                except OSError as e:
+                    self.error = e
+                    print(f"Journal: {self.name} stopped: {e}")
+                    self._close_fd()
+        with self._state_lock:
+            self._close_fd()
+            self._stopped = True
+            while True:     # flush() calls queued behind close()
+                try:
+                    op, arg = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if op == "call":
+                    arg()
+
+    def _open_generation(self, generation):
+        self._close_fd()
+        os.makedirs(self.directory, exist_ok=True)
+        flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0)
+        self._fd = os.open(self.path(generation), flags)
+        os.write(self._fd, _MAGIC + _frame(_SEGMENT, json.dumps(self._info).encode("utf-8")))
+        self._unsynced += 1
+
+    def _write_row(self, frame):
+        os.write(self._fd, frame)
+        self._unsynced += 1
+        if self.durability == DURABILITY_ROW or (
+                self.durability == DURABILITY_BATCH and
+                (self._unsynced >= self.batch_rows or time.monotonic() - self._last_sync >= self.batch_interval_s)):
+            self._sync()
+
+    def _sync(self):
+        if self._fd is not None and self._unsynced:
+            os.fsync(self._fd)
+            self.fsyncs += 1
+            self._unsynced = 0
+            self._last_sync = time.monotonic()
+
+    def _close_fd(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+def _values_dtype(info):
+    return np.dtype(info.get("dtype", "<f8")).newbyteorder("<")
+
+
+def _frame(kind, payload):
+    return _FRAME.pack(len(payload), zlib.crc32(kind + payload), kind) + payload
+
+
+def _generation_of(path):
+    return int(_NAME.match(os.path.basename(path)).group(2))
+
+
+def _generation_files(directory, name):
+    paths = glob.glob(os.path.join(glob.escape(directory), glob.escape(name) + ".*" + JOURNAL_EXTENSION))
+    paths = [p for p in paths if _NAME.match(os.path.basename(p)) and
+             _NAME.match(os.path.basename(p)).group(1) == name]
+    return sorted(paths, key=_generation_of)
+
+
+def read_journal(path):
+    """(segment info, list of rows) of one journal file, up to its first damaged record.
+
+    Each row is a dict with csv_index, archive_index, prefix, spectrum, archive_record.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(_MAGIC):
+        return None, []
+    info, rows, pos = None, [], len(_MAGIC)
+    dtype = _values_dtype({})
+    while pos + _FRAME.size <= len(data):
+        length, crc, kind = _FRAME.unpack_from(data, pos)
+        payload = data[pos + _FRAME.size:pos + _FRAME.size + length]
+        if len(payload) < length or zlib.crc32(kind + payload) != crc:
+            break
+        pos += _FRAME.size + length
+        if kind == _SEGMENT:
+            info = json.loads(payload.decode("utf-8"))
+            dtype = _values_dtype(info)
+        elif kind == _ROW_KIND:
+            csv_index, archive_index, prefix_len = _ROW.unpack_from(payload)
+            at = _ROW.size
+            prefix = payload[at:at + prefix_len].decode("utf-8")
+            at += prefix_len
+            (values_len,) = struct.unpack_from("<I", payload, at)
+            at += 4
+            spectrum = np.frombuffer(payload, dtype=dtype, count=values_len // dtype.itemsize, offset=at)
+            rows.append({"csv_index": csv_index, "archive_index": archive_index, "prefix": prefix,
+                         "spectrum": spectrum, "archive_record": payload[at + values_len:]})
+    return info, rows
+
+
+def recover_journals(directory):
+    """Replay the journals left in directory by a crash.
+
+    Returns a list of (data file path, rows added). Journals are deleted
+    once their rows are in the data files.
+    """
+    if not directory or not os.path.isdir(directory):
+        return []
+    names = {}
+    for path in glob.glob(os.path.join(glob.escape(directory), "*" + JOURNAL_EXTENSION)):
+        match = _NAME.match(os.path.basename(path))
+        if match:
+            names.setdefault(match.group(1), []).append(path)
+    recovered = []
+    for name, paths in sorted(names.items()):
+        info, rows = None, []
+        for path in sorted(paths, key=_generation_of):
+            file_info, file_rows = read_journal(path)
+            info = info or file_info
+            rows.extend(file_rows)
+        if info is not None and rows:
+            try:
+                if info.get("csv"):
+                    recovered.append((info["csv"], _recover_csv(info, rows)))
+                if info.get("archive"):
+                    recovered.append((info["archive"], _recover_archive(info, rows)))
+            except Exception as e:
+                print(f"Journal: cannot recover {name}: {e}")
+                continue
+        for path in paths:
+            os.remove(path)
+    return recovered
+
+
+def _missing(rows, key, present):
+    """Rows (in order, without duplicates) whose index in the file is >= present"""
+    found = {}
+    for row in rows:
+        if row[key] >= present:
+            found[row[key]] = row
+    return [found[i] for i in sorted(found)]
+
+
+def _recover_csv(info, rows):
+    path = info["csv"]
+    codec = codec_for_path(path)
+    if codec is not None:
+        text = read_text(path) if os.path.exists(path) else ""
+    else:
+        text = ""
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8", newline="") as f:
+                text = f.read()
+            text = text[:text.rfind("\n") + 1]      # drop a torn last line
+    if not text:
+        text = info["csv_header"]
+    present = text.count("\n") - 1
+    missing = _missing(rows, "csv_index", present)
+    if missing:
+        lines = format_rows([row["prefix"] for row in missing], [row["spectrum"] for row in missing])
+        text += "".join(line + "\n" for line in lines)
+    data = text.encode("utf-8")
+    if codec is not None:
+        data = compress_bytes(data, codec)
+    _replace(path, data)
+    _catalog(path, present + len(missing))
+    return len(missing)
+
+
+def _recover_archive(info, rows):
+    path = info["archive"]
+    npix = int(info["npix"])
+    writer = None
+    if os.path.exists(path):
+        try:
+            with open(path, "rb") as fh:
+                read_header(fh)
+            writer = SpectralArchiveWriter(path, npix)
+        except ValueError:
+            os.remove(path)     # header never made it to disk
+    if writer is None:
+        writer = SpectralArchiveWriter(path, npix, info.get("wavelengths"))
+    with writer:
+        missing = _missing(rows, "archive_index", writer.rows_written)
+        for row in missing:
+            writer.write_raw(row["archive_record"])
+        writer.flush()
+        os.fsync(writer._fh.fileno())
+        total = writer.rows_written
+    _catalog(path, total)
+    return len(missing)
+
+
+def _replace(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _catalog(path, rows):
+    catalog = get_catalog()
+    if catalog is None:
+        return
+    try:
+        catalog.record(path, rows=rows, size=os.path.getsize(path), complete=1)
+    except Exception as e:
+        print(f"Journal: catalog update for {path} failed: {e}")
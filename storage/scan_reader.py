@@ -0,0 +1,286 @@
+"""
+Fast reader for continuous scan logs.
+
+Loading a day of Scans_*_mini.csv with pandas parses thousands of float
+columns per row. This module reads the binary spectral archive instead:
+
+    data = read_scans("data/Scans_20250611_113227_mini.sga",
+                      start=t0, end=t1, routine_code="OO", filter_pos=2, angle=45)
+    data.meta["timestamp"], data.meta["motor_angle"]    # structured array
+    data.spectra                                        # (rows x pixels) float32
+    data.wavelengths
+
+Archives are memory-mapped; the time range is found by binary search on the
+(ascending) row timestamps and the other filters only read the metadata
+fields of the rows in that range, so selecting a few rows never loads the
+whole file. Legacy CSV logs (plain or compressed) are converted once to an
+archive in a ".scan_cache" directory next to them and read from there; the
+cache is rebuilt when the CSV changes.
+
+read_scans() also takes a list of files or a session's segment index
+(*_index.json), of which only the segments overlapping [start, end] are
+opened.
+"""
+import os
+from datetime import datetime
+
+import numpy as np
+
+from storage.spectral_archive import (
+    SpectralArchive, SpectralArchiveWriter, CSV_COLUMNS, META_DTYPE, ARCHIVE_EXTENSION, empty_meta,
+)
+from storage.segment_index import INDEX_SUFFIX, find_segments, load_index, segment_path
+from storage.compression import codec_for_path, iter_lines
+from core.scan_sampler import parse_scan_ids
+
+CACHE_DIR = ".scan_cache"
+CACHE_SUFFIX = ".cache" + ARCHIVE_EXTENSION
+_CHUNK_ROWS = 256
+_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+# CSV column name -> archive field, including names used by older versions
+_CSV_FIELDS = {name: field for name, field, _ in CSV_COLUMNS}
+_CSV_FIELDS.update({"MotorAngle": "motor_angle", "Motor_Angle": "motor_angle",
+                    "FilterPosition": "filter_pos", "Filter_Position": "filter_pos"})
+
+
+class ScanData:
+    """Rows read from one or more scan logs.
+
+    Attributes:
+        meta: structured array with the spectral_archive.META_FIELDS of every row
+        spectra: (rows x pixels) float32 array
+        wavelengths: float64 wavelength table (zeros when not recorded)
+    """
+
+    def __init__(self, meta, spectra, wavelengths):
+        self.meta = meta
+        self.spectra = spectra
+        self.wavelengths = wavelengths
+
+    def __len__(self):
+        return len(self.meta)
+
+    def select(self, start=None, end=None, routine_code=None, filter_pos=None, angle=None, angle_tol=0.05):
+        """Subset of the rows matching the filters (see read_scans)"""
+        mask = _match(self.meta, start, end, routine_code, filter_pos, angle, angle_tol)
+        return ScanData(self.meta[mask], self.spectra[mask], self.wavelengths)
+
+
+class ScanFile:
+    """One scan log opened for reading, as a memory-mapped archive.
+
+    path is a .sga archive or a CSV log (optionally compressed); CSV logs are
+    converted to a cached archive on first use.
+    """
+
+    def __init__(self, path, cache_dir=None):
+        self.path = path
+        if path.endswith(ARCHIVE_EXTENSION):
+            self.archive_path = path
+        else:
+            self.archive_path = cached_archive(path, cache_dir)
+        self.archive = SpectralArchive(self.archive_path)
+
+    def __len__(self):
+        return len(self.archive)
+
+    @property
+    def wavelengths(self):
+        return self.archive.wavelengths
+
+    def find(self, start=None, end=None, routine_code=None, filter_pos=None, angle=None, angle_tol=0.05):
+        """Indices of the rows matching the filters, reading only metadata"""
+        records = self.archive.records
+        timestamps = records["timestamp"]
+        lo = _bisect(timestamps, start) if start is not None else 0
+        hi = _bisect(timestamps, end, right=True) if end is not None else len(records)
+        if hi <= lo:
+            return np.zeros(0, dtype=np.int64)
+        if routine_code is None and filter_pos is None and angle is None:
+            return np.arange(lo, hi)
+        meta = _normalize(records[lo:hi])
+        return lo + np.flatnonzero(_match(meta, None, None, routine_code, filter_pos, angle, angle_tol))
+
+    def read(self, rows=None, **filters):
+        """ScanData of the given row indices, or of the rows matching filters"""
+        if rows is None:
+            rows = self.find(**filters)
+        records = self.archive.records[np.asarray(rows, dtype=np.int64)]
+        return ScanData(_normalize(records), np.ascontiguousarray(records["spectrum"], dtype=np.float32),
+                        self.archive.wavelengths)
+
+
+def read_scans(source, start=None, end=None, routine_code=None, filter_pos=None, angle=None,
+               angle_tol=0.05, cache_dir=None):
+    """Read the matching rows of one or more scan logs into a ScanData.
+
+    source is an archive or CSV path, a segment index (*_index.json) or a list
+    of paths. start / end are POSIX seconds; routine_code, filter_pos and
+    angle may each be a single value or a list of accepted values, angles
+    matching within angle_tol degrees. Files must have the same pixel count.
+    """
+    filters = dict(start=start, end=end, routine_code=routine_code, filter_pos=filter_pos,
+                   angle=angle, angle_tol=angle_tol)
+    parts = [ScanFile(path, cache_dir).read(**filters) for path in _resolve(source, start, end)]
+    if not parts:
+        return ScanData(np.zeros(0, dtype=META_DTYPE), np.zeros((0, 0), dtype=np.float32), np.zeros(0))
+    if len({p.spectra.shape[1] for p in parts}) > 1:
+        raise ValueError("Scan logs have different pixel counts")
+    return ScanData(np.concatenate([p.meta for p in parts]), np.concatenate([p.spectra for p in parts]),
+                    parts[0].wavelengths)
+
+
+def _resolve(source, start, end):
+    """Data files behind source, preferring a segment's archive over its CSV"""
+    if isinstance(source, (list, tuple)):
+        return list(source)
+    if not source.endswith(INDEX_SUFFIX):
+        return [source]
+    paths = []
+    for segment in find_segments(load_index(source), start, end):
+        path = segment_path(source, segment, "archive") or segment_path(source, segment, "csv")
+        if path and os.path.exists(path):
+            paths.append(path)
+    return paths
+
+
+def _bisect(values, target, right=False):
+    """First index whose value is >= target (> target if right) in an ascending array.
+
+    Works element by element so only ~log2(n) pages of a memmap are touched.
+    """
+    lo, hi = 0, len(values)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if values[mid] < target or (right and values[mid] == target):
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def _normalize(records):
+    """Copy the metadata of records into a META_DTYPE array (older archives lack fields)"""
+    meta = np.zeros(len(records), dtype=META_DTYPE)
+    defaults = empty_meta()
+    for name in META_DTYPE.names:
+        if name in records.dtype.names:
+            meta[name] = records[name]
+        else:
+            meta[name] = defaults[name]
+    return meta
+
+
+def _match(meta, start, end, routine_code, filter_pos, angle, angle_tol):
+    mask = np.ones(len(meta), dtype=bool)
+    if start is not None:
+        mask &= meta["timestamp"] >= start
+    if end is not None:
+        mask &= meta["timestamp"] <= end
+    if routine_code is not None:
+        codes = [c.encode("ascii") for c in np.atleast_1d(routine_code)]
+        mask &= np.isin(meta["routine_code"], codes)
+    if filter_pos is not None:
+        mask &= np.isin(meta["filter_pos"], np.atleast_1d(filter_pos))
+    if angle is not None:
+        angles = np.asarray(meta["motor_angle"], dtype=np.float64)
+        near = np.zeros(len(meta), dtype=bool)
+        for a in np.atleast_1d(angle):
+            near |= np.abs(angles - float(a)) <= angle_tol
+        mask &= near
+    return mask
+
+
+def cached_archive(csv_path, cache_dir=None):
+    """Path of the archive converted from csv_path, converting it if the cache is stale"""
+    cache_dir = cache_dir or os.path.join(os.path.dirname(os.path.abspath(csv_path)), CACHE_DIR)
+    archive_path = os.path.join(cache_dir, os.path.basename(csv_path) + CACHE_SUFFIX)
+    stat = os.stat(csv_path)
+    source = {"source": os.path.basename(csv_path), "source_size": stat.st_size,
+              "source_mtime": stat.st_mtime}
+    if os.path.exists(archive_path):
+        try:
+            header = SpectralArchive(archive_path).header
+            if all(header.get(k) == v for k, v in source.items()):
+                return archive_path
+        except (ValueError, KeyError, OSError):
+            pass
+    os.makedirs(cache_dir, exist_ok=True)
+    convert_csv(csv_path, archive_path, header_extra=source)
+    return archive_path
+
+
+def convert_csv(csv_path, archive_path, header_extra=None):
+    """Convert a continuous scan CSV to an archive; returns the number of rows.
+
+    The CSV is streamed in chunks of rows, so files of any size convert in
+    bounded memory. Values that cannot be parsed ("None", empty) are stored
+    as the archive's "unknown" value. The archive is written to a temporary
+    name and moved into place when complete.
+    """
+    lines = iter_lines(csv_path) if codec_for_path(csv_path) else _iter_plain_lines(csv_path)
+    header = next(lines, "").strip().split(",")
+    if not header or header == [""]:
+        raise ValueError(f"{csv_path} is empty")
+    columns = [(i, _CSV_FIELDS[name]) for i, name in enumerate(header) if name in _CSV_FIELDS]
+    first_pixel = next((i for i, name in enumerate(header)
+                        if name.startswith("Wavelength_") or name.startswith("Pixel_")), len(header))
+    pixel_names = header[first_pixel:]
+    npix = len(pixel_names)
+    wavelengths = None
+    if pixel_names and all(name.startswith("Wavelength_") for name in pixel_names):
+        wavelengths = [float(name[len("Wavelength_"):-len("nm")]) for name in pixel_names]
+
+    tmp_path = archive_path + ".tmp"
+    rows = 0
+    with SpectralArchiveWriter(tmp_path, npix, wavelengths, header_extra=header_extra) as writer:
+        chunk = []
+        for line in lines:
+            if line.strip():
+                chunk.append(line.rstrip("\r\n").split(","))
+            if len(chunk) >= _CHUNK_ROWS:
+                rows += _write_chunk(writer, chunk, columns, first_pixel, npix)
+                chunk = []
+        if chunk:
+            rows += _write_chunk(writer, chunk, columns, first_pixel, npix)
+    os.replace(tmp_path, archive_path)
+    return rows
+
+
+def _iter_plain_lines(path):
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        yield from f
+
+
+def _write_chunk(writer, chunk, columns, first_pixel, npix):
+    # Rows cut short (e.g. the last line of a log that is still being written) are skipped
+    chunk = [cells for cells in chunk if len(cells) == first_pixel + npix]
+    if not chunk:
+        return 0
+    metas = [_parse_meta(cells, columns) for cells in chunk]
+    spectra = np.array([cells[first_pixel:] for cells in chunk], dtype=np.float32)
+    writer.append_many(metas, spectra)
+    return len(chunk)
+
+
+def _parse_meta(cells, columns):
+    meta = empty_meta()
+    for i, field in columns:
+        text = cells[i]
+        try:
+            if field == "timestamp":
+                meta[field] = datetime.strptime(text, _TIMESTAMP_FORMAT).timestamp()
+            elif field == "routine_code":
+                meta[field] = text
+            elif field == "scan_first":
+                ids = parse_scan_ids(text)
+                if ids:
+                    meta[field] = ids[0]
+            elif field in ("filter_pos", "scan_count"):
+                meta[field] = int(float(text))
+            else:
+                meta[field] = float(text)
+        except ValueError:
+            pass
+    return meta
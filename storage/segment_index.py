@@ -0,0 +1,131 @@
+"""
+Index of the segment files a continuous logging session was split into.
+
+DataLogger rotates the scan CSV, binary archive and text log to new segment
+files by size or time. Each session gets one small JSON index next to its
+data files listing, per segment:
+
+    files            basenames of the segment's csv / archive / log files
+    first_timestamp  POSIX time of the first and last row in the segment
+    last_timestamp
+    rows             number of rows
+    routine_codes    routine codes seen, in order of first appearance
+    offsets          per data file, the byte offset of the first row
+                     ("data_offset") and the end of the last row ("end_offset")
+
+CSV offsets count uncompressed bytes: for a compressed CSV they are positions
+in the decompressed text. A reader looking for a time range loads the index,
+picks the segments with find_segments() and opens only those files.
+"""
+import os
+import json
+
+INDEX_VERSION = 1
+INDEX_SUFFIX = "_index.json"
+
+
+class SegmentIndex:
+    """Builds the index of one logging session and writes it to path"""
+
+    def __init__(self, path, session, rotation=None):
+        self.path = path
+        self.session = session
+        self.rotation = dict(rotation or {})
+        self.segments = []
+
+    @property
+    def current(self):
+        return self.segments[-1] if self.segments else None
+
+    def start_segment(self, files):
+        """Begin a new segment; files maps "csv"/"archive"/"log" to paths (None if unused)"""
+        segment = {
+            "segment": len(self.segments) + 1,
+            "files": {kind: os.path.basename(path) for kind, path in files.items() if path},
+            "first_timestamp": None,
+            "last_timestamp": None,
+            "rows": 0,
+            "routine_codes": [],
+            "offsets": {},
+        }
+        self.segments.append(segment)
+        return segment
+
+    def record_row(self, timestamp, routine_code=None, offsets=None):
+        """Account for one row of the current segment.
+
+        offsets maps a file kind to the (start, end) byte offsets of the row in it.
+        """
+        segment = self.current
+        if segment is None:
+            raise RuntimeError("record_row() called before start_segment()")
+        if segment["first_timestamp"] is None:
+            segment["first_timestamp"] = timestamp
+        segment["last_timestamp"] = timestamp
+        segment["rows"] += 1
+        if routine_code and routine_code not in segment["routine_codes"]:
+            segment["routine_codes"].append(routine_code)
+        for kind, (start, end) in (offsets or {}).items():
+            span = segment["offsets"].setdefault(kind, {"data_offset": start, "end_offset": end})
+            span["end_offset"] = end
+
+    def to_dict(self):
+        return {
+            "version": INDEX_VERSION,
+            "session": self.session,
+            "rotation": self.rotation,
+            "segments": self.segments,
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=1)
+
+    def catalog_fields(self):
+        """storage.catalog fields describing the whole session"""
+        rows = [s for s in self.segments if s["rows"]]
+        return {
+            "kind": "segment_index",
+            "session": self.session,
+            "first_timestamp": rows[0]["first_timestamp"] if rows else None,
+            "last_timestamp": rows[-1]["last_timestamp"] if rows else None,
+            "rows": sum(s["rows"] for s in rows),
+        }
+
+    def save(self, writer=None):
+        """Write the index; through the background file writer (and into the catalog) if one is given"""
+        if writer is not None:
+            return writer.write_file(self.path, self.to_json(), catalog=self.catalog_fields())
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(self.to_json())
+        return True
+
+
+def load_index(path):
+    """Read a session index written by SegmentIndex"""
+    with open(path, "r", encoding="utf-8") as f:
+        index = json.load(f)
+    if index.get("version", 0) > INDEX_VERSION:
+        raise ValueError(f"Unsupported segment index version {index.get('version')}")
+    return index
+
+
+def find_segments(index, start=None, end=None):
+    """Segments of index (a dict or a path) with rows between start and end (POSIX seconds)"""
+    if not isinstance(index, dict):
+        index = load_index(index)
+    found = []
+    for segment in index["segments"]:
+        if not segment["rows"]:
+            continue
+        if start is not None and segment["last_timestamp"] < start:
+            continue
+        if end is not None and segment["first_timestamp"] > end:
+            continue
+        found.append(segment)
+    return found
+
+
+def segment_path(index_path, segment, kind):
+    """Full path of a segment's file of the given kind, resolved next to the index"""
+    name = segment["files"].get(kind)
+    return os.path.join(os.path.dirname(index_path), name) if name else None
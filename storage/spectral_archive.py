@@ -0,0 +1,335 @@
+"""
+Binary append-only container for continuous spectrometer logs.
+
+File layout:
+    magic (4 bytes) | version (uint16) | header length (uint32) | JSON header
+    wavelength table (float64 x npix) | padding to a 64-byte boundary
+    fixed-size records: metadata fields followed by a float32 spectrum block
+
+Every record has the same size, so the file can be appended to at any time and
+read back with numpy.memmap without parsing. A truncated record at the end of
+the file (e.g. after a power loss) is simply ignored by the reader.
+"""
+import os
+import sys
+import json
+import struct
+from datetime import datetime
+
+import numpy as np
+
+MAGIC = b"SGSA"
+VERSION = 1
+ARCHIVE_EXTENSION = ".sga"
+_PREFIX = struct.Struct("<4sHI")
+_ALIGNMENT = 64
+
+# Per-row metadata, in the same order as the continuous CSV columns
+META_FIELDS = [
+    ("timestamp", "<f8"),        # POSIX seconds
+    ("motor_angle", "<f4"),      # NaN when unknown
+    ("filter_pos", "<i2"),       # -1 when unknown
+    ("roll", "<f4"), ("pitch", "<f4"), ("yaw", "<f4"),
+    ("accel_x", "<f4"), ("accel_y", "<f4"), ("accel_z", "<f4"),
+    ("mag_x", "<f4"), ("mag_y", "<f4"), ("mag_z", "<f4"),
+    ("pressure", "<f4"), ("temp_env", "<f4"),
+    ("tec_current", "<f4"), ("tec_setpoint", "<f4"),
+    ("latitude", "<f8"), ("longitude", "<f8"),
+    ("integration_time", "<f4"),
+    ("thp_temp", "<f4"), ("thp_hum", "<f4"), ("thp_pres", "<f4"),
+    ("spec_temp", "<f4"),
+    ("routine_code", "S8"),
+    ("imu_age", "<f4"),          # seconds between the row and the sensor reading used,
+    ("thp_age", "<f4"),          # NaN when the sensor has not reported
+    ("tec_age", "<f4"),
+    ("scan_first", "<i8"),       # sequence number of the first scan averaged into the row
+    ("scan_count", "<i4"),       # number of scans averaged into the row
+]
+META_DTYPE = np.dtype(META_FIELDS)
+
+# CSV column name -> (field name, format) used when exporting to CSV
+CSV_COLUMNS = [
+    ("Timestamp", "timestamp", None),
+    ("MotorAngle_deg", "motor_angle", None),
+    ("FilterPos", "filter_pos", None),
+    ("Roll_deg", "roll", "%.2f"), ("Pitch_deg", "pitch", "%.2f"), ("Yaw_deg", "yaw", "%.2f"),
+    ("AccelX_g", "accel_x", "%.2f"), ("AccelY_g", "accel_y", "%.2f"), ("AccelZ_g", "accel_z", "%.2f"),
+    ("MagX_uT", "mag_x", "%.2f"), ("MagY_uT", "mag_y", "%.2f"), ("MagZ_uT", "mag_z", "%.2f"),
+    ("Pressure_hPa", "pressure", "%.2f"), ("TempEnv_C", "temp_env", "%.2f"),
+    ("TempCurr_C", "tec_current", "%.2f"), ("TempSet_C", "tec_setpoint", "%.2f"),
+    ("Latitude", "latitude", "%.6f"), ("Longitude", "longitude", "%.6f"),
+    ("IntegTime_us", "integration_time", "%g"),
+    ("THPTemp_C", "thp_temp", "%.2f"), ("THPHum_pct", "thp_hum", "%.2f"),
+    ("THPPres_hPa", "thp_pres", "%.2f"), ("Spec_temp_C", "spec_temp", "%.2f"),
+    ("RoutineCode", "routine_code", None),
+    ("IMUAge_s", "imu_age", "%.3f"), ("THPAge_s", "thp_age", "%.3f"), ("TECAge_s", "tec_age", "%.3f"),
+    ("NumScans", "scan_count", "%d"), ("ScanIDs", "scan_first", None),
+]
+
+
+def record_dtype(npix, fields=None):
+    """Structured dtype of one archive record for a detector with npix pixels.
+
+    fields defaults to META_FIELDS; readers pass the list stored in the file
+    header so archives written with an older field set stay readable.
+    """
+    fields = META_FIELDS if fields is None else [(name, fmt) for name, fmt in fields]
+    return np.dtype(fields + [("spectrum", "<f4", (int(npix),))])
+
+
+def empty_meta():
+    """Return a metadata dict with the 'unknown' value for every field"""
+    meta = {name: 0 for name, _ in META_FIELDS}
+    meta["motor_angle"] = float("nan")
+    meta["filter_pos"] = -1
+    meta["routine_code"] = "XX"
+    for name in ("imu_age", "thp_age", "tec_age"):
+        meta[name] = float("nan")
+    meta["scan_first"] = -1
+    return meta
+
+
+def _encode_header(npix, wavelengths, extra=None):
+    header = {
+        "npix": int(npix),
+        "fields": [[name, fmt] for name, fmt in META_FIELDS],
+        "created": datetime.now().isoformat(timespec="seconds"),
+    }
+    if extra:
+        header.update(extra)
+    header_json = json.dumps(header).encode("utf-8")
+    wls = np.zeros(npix, dtype="<f8")
+    if wavelengths is not None and len(wavelengths) > 0:
+        count = min(npix, len(wavelengths))
+        wls[:count] = np.asarray(wavelengths, dtype="<f8")[:count]
+    body_len = _PREFIX.size + len(header_json) + wls.nbytes
+    pad = (-body_len) % _ALIGNMENT
+    header_len = len(header_json) + wls.nbytes + pad
+    return (_PREFIX.pack(MAGIC, VERSION, header_len) + header_json +
+            wls.tobytes() + b"\x00" * pad)
+
+
+def read_header(fh):
+    """Read the archive header from an open binary file.
+
+    Returns (header dict, wavelengths array, data offset).
+    """
+    fh.seek(0)
+    prefix = fh.read(_PREFIX.size)
+    if len(prefix) < _PREFIX.size:
+        raise ValueError("File too short to be a spectral archive")
+    magic, version, header_len = _PREFIX.unpack(prefix)
+    if magic != MAGIC:
+        raise ValueError("Not a spectral archive (bad magic)")
+    if version > VERSION:
+        raise ValueError(f"Unsupported spectral archive version {version}")
+    raw = fh.read(header_len)
+    # The JSON header is terminated by the first byte that cannot belong to it;
+    # JSONDecoder.raw_decode tells us exactly where it ends.
+    text = raw.decode("latin-1")
+    header, json_end = json.JSONDecoder().raw_decode(text)
+    npix = int(header["npix"])
+    wls = np.frombuffer(raw, dtype="<f8", count=npix, offset=json_end).copy()
+    return header, wls, _PREFIX.size + header_len
+
+
+class SpectralArchiveWriter:
+    """Appends fixed-size metadata + spectrum records to an archive file.
+
+    Opening an existing archive with the same pixel count continues appending
+    to it; a partially written trailing record is truncated first.
+
+    If stream is given (any object with write/flush/close, e.g. a
+    storage.file_writer.WriterStream for a new file) the header and records
+    are written to it instead of a file opened here.
+    """
+
+    def __init__(self, path, npix, wavelengths=None, header_extra=None, stream=None):
+        self.path = path
+        self.npix = int(npix)
+        self.dtype = record_dtype(self.npix)
+        self.rows_written = 0
+
+        if stream is not None:
+            self._fh = stream
+            header = _encode_header(self.npix, wavelengths, header_extra)
+            self._fh.write(header)
+            self.data_offset = len(header)
+        elif os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, "rb") as fh:
+                header, _, data_offset = read_header(fh)
+            if int(header["npix"]) != self.npix:
+                raise ValueError(f"Archive {path} has {header['npix']} pixels, expected {self.npix}")
+            if [tuple(f) for f in header["fields"]] != META_FIELDS:
+                raise ValueError(f"Archive {path} was written with a different field layout")
+            size = os.path.getsize(path)
+            complete = (size - data_offset) // self.dtype.itemsize
+            self._fh = open(path, "r+b")
+            self._fh.truncate(data_offset + complete * self.dtype.itemsize)
+            self._fh.seek(0, os.SEEK_END)
+            self.rows_written = complete
+            self.data_offset = data_offset
+        else:
+            self._fh = open(path, "wb")
+            header = _encode_header(self.npix, wavelengths, header_extra)
+            self._fh.write(header)
+            self._fh.flush()
+            self.data_offset = len(header)
+
+    def encode_rows(self, metas, spectra):
+        """Pack rows into bytes without touching the file (safe on any thread)"""
+        records = np.zeros(len(metas), dtype=self.dtype)
+        for i, (meta, spectrum) in enumerate(zip(metas, spectra)):
+            rec = records[i]
+            for name, _ in META_FIELDS:
+                value = meta.get(name)
+                if value is None:
+                    continue
+                if name == "routine_code":
+                    value = str(value).encode("ascii", "replace")[:8]
+                rec[name] = value
+            spec = np.asarray(spectrum, dtype="<f4")
+            count = min(self.npix, spec.shape[0])
+            rec["spectrum"][:count] = spec[:count]
+        return records.tobytes()
+
+    def tell(self):
+        """Byte offset at which the next record will be written"""
+        return self.data_offset + self.rows_written * self.dtype.itemsize
+
+    def append(self, meta, spectrum):
+        """Append one row"""
+        self.write_raw(self.encode_rows([meta], [spectrum]))
+
+    def append_many(self, metas, spectra):
+        """Append several rows with a single write call"""
+        if metas:
+            self.write_raw(self.encode_rows(metas, spectra))
+
+    def write_raw(self, data):
+        """Write already-encoded records; returns False if the writer stream dropped them"""
+        if self._fh.write(data) is False:
+            return False
+        self.rows_written += len(data) // self.dtype.itemsize
+        return True
+
+    def flush(self):
+        if self._fh:
+            self._fh.flush()
+
+    def close(self):
+        if self._fh:
+            self._fh.close()
+            self._fh = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SpectralArchive:
+    """Read-only memory-mapped view of an archive file.
+
+    Attributes:
+        header: the decoded JSON header
+        wavelengths: float64 wavelength table (npix,)
+        records: structured memmap of all complete rows
+        meta: the metadata fields of every row (view, no copy)
+        spectra: (rows x npix) float32 memmap
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as fh:
+            self.header, self.wavelengths, self.data_offset = read_header(fh)
+        self.npix = int(self.header["npix"])
+        self.fields = [name for name, _ in self.header["fields"]]
+        self.dtype = record_dtype(self.npix, self.header["fields"])
+        size = os.path.getsize(path)
+        self.nrows = max(0, (size - self.data_offset) // self.dtype.itemsize)
+        if self.nrows:
+            self.records = np.memmap(path, dtype=self.dtype, mode="r",
+                                     offset=self.data_offset, shape=(self.nrows,))
+        else:
+            self.records = np.zeros(0, dtype=self.dtype)
+
+    def __len__(self):
+        return self.nrows
+
+    @property
+    def meta(self):
+        return self.records[self.fields]
+
+    @property
+    def spectra(self):
+        return self.records["spectrum"]
+
+    def csv_header(self, use_wavelengths=True):
+        """Column names matching DataLogger's continuous CSV"""
+        cols = [name for name, field, _ in CSV_COLUMNS if field in self.fields]
+        if use_wavelengths and np.any(self.wavelengths):
+            cols += [f"Wavelength_{w:.2f}nm" for w in self.wavelengths]
+        else:
+            cols += [f"Pixel_{i}" for i in range(self.npix)]
+        return cols
+
+    def format_csv_row(self, index):
+        """Render one record the way DataLogger writes continuous CSV rows"""
+        rec = self.records[index]
+        return ",".join(_format_meta(rec) + [f"{v:.4f}" for v in rec["spectrum"]])
+
+    def to_csv(self, csv_path, start=0, stop=None, use_wavelengths=True):
+        """Export rows [start, stop) to a CSV file; returns the number of rows written"""
+        stop = self.nrows if stop is None else min(stop, self.nrows)
+        with open(csv_path, "w", encoding="utf-8", newline="") as f:
+            f.write(",".join(self.csv_header(use_wavelengths)) + "\n")
+            for i in range(start, stop):
+                f.write(self.format_csv_row(i) + "\n")
+        return max(0, stop - start)
+
+
+def _format_meta(rec):
+    out = []
+    for _, field, fmt in CSV_COLUMNS:
+        if field not in rec.dtype.names:
+            continue
+        value = rec[field]
+        if field == "timestamp":
+            out.append(datetime.fromtimestamp(float(value)).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3])
+        elif field == "motor_angle":
+            out.append(f"{float(value):g}")         # "nan" when unknown, as in the live CSV
+        elif field == "filter_pos":
+            out.append(str(int(value)))             # -1 when unknown
+        elif field == "routine_code":
+            out.append(bytes(value).decode("ascii", "replace"))
+        elif field == "scan_first":
+            # Only the first scan and the count are stored, so the IDs render as a range
+            first, count = int(value), int(rec["scan_count"])
+            out.append("" if first < 0 or count <= 0 else
+                       str(first) if count == 1 else f"{first}-{first + count - 1}")
+        else:
+            out.append(fmt % float(value))
+    return out
+
+
+def archive_to_csv(archive_path, csv_path=None):
+    """Convert an archive to CSV next to it (or to csv_path); returns the CSV path.
+
+    The default name, <name>.from_archive.csv, never is the CSV the data
+    logger writes alongside the archive (scan_format "both").
+    """
+    if csv_path is None:
+        csv_path = os.path.splitext(archive_path)[0] + ".from_archive.csv"
+    SpectralArchive(archive_path).to_csv(csv_path)
+    return csv_path
+
+
+if __name__ == "__main__":
+    # Usage: python -m storage.spectral_archive <archive.sga> [out.csv]
+    if len(sys.argv) < 2:
+        print("Usage: python -m storage.spectral_archive <archive.sga> [out.csv]")
+        sys.exit(1)
+    out = archive_to_csv(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
+    print(f"Wrote {out}")
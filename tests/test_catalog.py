@@ -0,0 +1,81 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from storage.catalog import Catalog, configure_catalog, get_catalog, DEFAULT_PATH
+from storage.file_writer import FileWriterService
+
+
+class TestCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        configure_catalog(path=os.path.join(self.tmpdir, "catalog.sqlite"))
+
+    def tearDown(self):
+        configure_catalog(path=DEFAULT_PATH)
+        shutil.rmtree(self.tmpdir)
+
+    def test_record_and_query(self):
+        catalog = get_catalog()
+        catalog.record(os.path.join(self.tmpdir, "a.csv"), kind="scan_csv", session="s1", segment=1,
+                       first_timestamp=100.0, last_timestamp=200.0, created=1.0)
+        catalog.record(os.path.join(self.tmpdir, "b.csv"), kind="scan_csv", session="s1", segment=2,
+                       first_timestamp=200.0, last_timestamp=300.0, created=2.0)
+        catalog.record(os.path.join(self.tmpdir, "OO", "t0", "x.csv"), kind="snapshot",
+                       routine="OO", routine_start="t0", filter_pos=2, motor_angle=45.0)
+        # Updates keep fields that are not passed again
+        catalog.record(os.path.join(self.tmpdir, "a.csv"), rows=10, complete=1)
+
+        entry = catalog.get(os.path.join(self.tmpdir, "a.csv"))
+        self.assertEqual((entry["session"], entry["rows"], entry["complete"]), ("s1", 10, 1))
+        self.assertEqual(entry["path"], os.path.join(self.tmpdir, "a.csv"))
+        self.assertEqual(catalog.latest("scan_csv")["segment"], 2)
+        self.assertEqual([e["segment"] for e in catalog.session_files("s1")], [1, 2])
+        self.assertEqual(len(catalog.query("scan_csv", start=250.0)), 1)
+        self.assertEqual(len(catalog.query(routine="OO", filter_pos=2)), 1)
+        with self.assertRaises(ValueError):
+            catalog.query(colour="red")
+
+    def test_file_writer_enters_files(self):
+        writer = FileWriterService()
+        try:
+            snap = os.path.join(self.tmpdir, "snap.csv")
+            writer.write_file(snap, "a,b\n", catalog={"kind": "snapshot", "filter_pos": 1})
+            log = os.path.join(self.tmpdir, "log.txt")
+            stream = writer.open_stream(log, catalog={"kind": "log", "session": "s"})
+            stream.write("line\n")
+            writer.drain(5)
+            self.assertEqual(get_catalog().get(log)["complete"], 0)
+            stream.annotate(rows=1)
+            stream.close()
+            writer.drain(5)
+        finally:
+            writer.stop()
+        catalog = get_catalog()
+        self.assertEqual(catalog.get(snap)["size"], 4)
+        entry = catalog.get(log)
+        self.assertEqual((entry["complete"], entry["rows"], entry["size"]), (1, 1, 5))
+
+    def test_import_directory(self):
+        data = os.path.join(self.tmpdir, "data")
+        os.makedirs(os.path.join(data, "OO", "20250101_120000"))
+        for name in ["Scans_20250101_120000_mini.csv", "Scans_20250101_120000_mini_002.csv.gz",
+                     "final_x.csv", "notes.md", os.path.join("OO", "20250101_120000", "OO.jpg")]:
+            with open(os.path.join(data, name), "w") as f:
+                f.write("x")
+        catalog = Catalog(os.path.join(data, "catalog.sqlite"))
+        self.assertEqual(catalog.import_directory(data), 4)
+        self.assertEqual(catalog.import_directory(data), 0)
+        segments = catalog.session_files("20250101_120000")
+        self.assertEqual([(e["segment"], e["codec"]) for e in segments], [(1, None), (2, "gz")])
+        image = catalog.latest("image")
+        self.assertEqual((image["routine"], image["routine_start"]), ("OO", "20250101_120000"))
+        catalog.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from controllers.cores import FilterWheelCore, _commanded_position
+from core.state_store import get_state_store, FilterWheelState
+
+
+class TestFilterWheelCore(unittest.TestCase):
+
+    def setUp(self):
+        get_state_store().clear()
+        self.core = FilterWheelCore("COM0")
+        self.messages = []
+        self.core.status_signal.connect(self.messages.append)
+        self.core._pending = 1
+
+    def test_commanded_position(self):
+        self.assertEqual(_commanded_position("F1r"), 1)
+        self.assertEqual(_commanded_position("F14"), 4)
+        for cmd in ("F17", "F1x", "F2", "", None):
+            self.assertIsNone(_commanded_position(cmd))
+
+    def test_confirmed_position(self):
+        self.core._on_result("F13", "3", "ok")
+        self.assertEqual(self.core.get_position(), 3)
+        self.assertFalse(self.core.is_busy())
+        self.assertEqual(get_state_store().get(FilterWheelState.KEY).position, 3)
+
+    def test_unconfirmed_position_uses_command(self):
+        self.core._on_result("F15", None, "timeout")
+        self.assertEqual(self.core.get_position(), 5)
+        self.assertTrue(any("not confirmed" in message for message in self.messages))
+
+    def test_invalid_reported_position_is_unknown(self):
+        self.core._on_result("F12", "9", "")
+        self.assertIsNone(self.core.get_position())
+        self.assertIsNone(get_state_store().get(FilterWheelState.KEY).position)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from storage.csv_format import format_fixed, format_rows, format_table
+
+
+def reference(values, precision):
+    return ",".join(f"{v:.{precision}f}" for v in values)
+
+
+class TestCsvFormat(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.values = np.concatenate([
+            rng.uniform(-100, 70000, 2000),
+            [0.0, -0.0, 0.5, 1.5, 2.5, -2.5, 0.03125, 0.00005, 0.00015, 1e-7, -1e-7,
+             9.99995, 123456789.12345, 1e17, np.nan, np.inf, -np.inf],
+        ])
+
+    def test_matches_python_formatting(self):
+        for precision in (0, 1, 2, 4, 6):
+            self.assertEqual(format_fixed(self.values, precision), reference(self.values, precision))
+        self.assertEqual(format_fixed([]), "")
+        self.assertEqual(format_fixed([3], sep=";"), "3.0000")
+
+    def test_table(self):
+        wls = np.linspace(300.0, 800.0, 50)
+        text = format_table([wls, self.values[:50]], [2, 4])
+        expected = "".join(f"{w:.2f},{v:.4f}\n" for w, v in zip(wls, self.values[:50]))
+        self.assertEqual(text, expected)
+        self.assertEqual(format_table([range(3), [1.0, 2.0, 3.0]], [0, 4]),
+                         "0,1.0000\n1,2.0000\n2,3.0000\n")
+
+    def test_rows(self):
+        spectra = self.values[:2000].reshape(4, 500)
+        prefixes = [f"t{i},OO" for i in range(4)]
+        lines = format_rows(prefixes, spectra)
+        self.assertEqual(lines, [p + "," + reference(s, 4) for p, s in zip(prefixes, spectra)])
+        # Rows without spectrum or of different lengths
+        self.assertEqual(format_rows(["a", "b"], [[], []]), ["a", "b"])
+        self.assertEqual(format_rows(["a", "b"], [[1.0], []]), ["a,1.0000", "b"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+import os
+import sys
+import datetime
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from astral import Observer
+from astral.sun import azimuth, elevation
+from core.ephemeris import SolarEphemeris, solar_position, get_ephemeris, DAY_S
+
+SITES = ((52.0, 4.4), (-33.9, 151.2), (78.2, 15.6), (0.0, -78.0))
+
+
+def utc(ts):
+    return datetime.datetime.fromtimestamp(ts, datetime.timezone.utc)
+
+
+class TestEphemeris(unittest.TestCase):
+
+    def test_matches_astral(self):
+        for lat, lon in SITES:
+            ephemeris = SolarEphemeris(lat, lon)
+            observer = Observer(lat, lon)
+            # astral counts whole seconds
+            for ts in range(1767225600, 1767225600 + 400 * 86400, 86400 * 7 + 3607):
+                expected_azimuth, expected_elevation = azimuth(observer, utc(ts)), elevation(observer, utc(ts))
+                exact_azimuth, exact_elevation = solar_position(lat, lon, ts)
+                self.assertAlmostEqual(float(exact_elevation), expected_elevation, places=6)
+                self.assertAlmostEqual(ephemeris.elevation(ts), expected_elevation, delta=0.001)
+                if expected_elevation > -85:
+                    difference = (ephemeris.azimuth(ts) - expected_azimuth + 180) % 360 - 180
+                    self.assertAlmostEqual(difference, 0.0, delta=0.005)
+
+    def test_next_crossing(self):
+        ephemeris = SolarEphemeris(52.0, 4.4)
+        observer = Observer(52.0, 4.4)
+        start = 1782000000.0
+        rising = ephemeris.next_crossing(10.0, start)
+        setting = ephemeris.next_crossing(10.0, start, rising=False)
+        self.assertGreater(rising, start)
+        for when, going_up in ((rising, True), (setting, False)):
+            self.assertAlmostEqual(elevation(observer, utc(when)), 10.0, delta=0.01)
+            self.assertEqual(elevation(observer, utc(when + 30)) > 10.0, going_up)
+        # The next one is a day later
+        self.assertAlmostEqual(ephemeris.next_crossing(10.0, rising + 1) - rising, DAY_S, delta=300)
+        # Never higher than about 61.5° here in June, and within_s is respected
+        self.assertIsNone(ephemeris.next_crossing(70.0, start))
+        self.assertIsNone(ephemeris.next_crossing(10.0, start, within_s=min(rising, setting) - start - 1))
+
+    def test_tables_are_built_once_per_day(self):
+        ephemeris = SolarEphemeris(52.0, 4.4)
+        day = 1782000000.0 - 1782000000.0 % DAY_S
+        for i in range(1000):
+            ephemeris.position(day + i * 60)
+        self.assertEqual(ephemeris.builds, 1)
+        ephemeris.elevation(day + DAY_S + 1)
+        self.assertEqual(ephemeris.builds, 2)
+        # Old days are let go
+        for i in range(2, 10):
+            ephemeris.elevation(day + i * DAY_S)
+        ephemeris.elevation(day)
+        self.assertEqual(ephemeris.builds, 11)
+        self.assertIs(get_ephemeris(52.0, 4.4), get_ephemeris(52, 4.4))
+
+    def test_sun_vector(self):
+        x, y, z = SolarEphemeris(52.0, 4.4).sun_vector(1782000000.0)
+        self.assertAlmostEqual(x * x + y * y + z * z, 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import unittest
+import os
+import sys
+import json
+import shutil
+import tempfile
+from unittest import mock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from core import event_log
+from core.event_log import EventLog, EventSource, INFO, WARNING, ERROR
+from storage.catalog import configure_catalog, get_catalog, DEFAULT_PATH
+from storage.file_writer import FileWriterService
+
+
+class TestEventLog(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        configure_catalog(path=os.path.join(self.tmpdir, "catalog.sqlite"))
+        self.now = 1000.0
+        patcher = mock.patch.object(event_log, "_now", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        configure_catalog(path=DEFAULT_PATH)
+        shutil.rmtree(self.tmpdir)
+
+    def test_rate_limiting_carries_suppressed_count(self):
+        log = EventLog(rate_window_s=10, burst=2)
+        recorded = [log.log("tec", WARNING, "not_connected", "TC: Not connected") for _ in range(5)]
+        self.assertEqual(sum(e is not None for e in recorded), 2)
+        # Other codes have their own budget
+        self.assertIsNotNone(log.log("tec", INFO, "temperature", "TC: 20.0"))
+
+        self.now += 10
+        event = log.log("tec", WARNING, "not_connected", "TC: Not connected")
+        self.assertEqual(event.suppressed, 3)
+        self.assertEqual(log.log("tec", WARNING, "not_connected", "again").suppressed, 0)
+        self.assertEqual(len(log.recent()), 5)
+
+    def test_history_ring_and_filters(self):
+        log = EventLog(history=3, burst=100)
+        log.log("motor", INFO, "moved", "a")
+        log.log("motor", ERROR, "move_failed", "b")
+        log.log("imu", WARNING, "no_data", "c")
+        log.log("imu", INFO, "connected", "d")
+        self.assertEqual([e.message for e in log.recent()], ["b", "c", "d"])
+        self.assertEqual([e.message for e in log.recent(min_level=WARNING)], ["b", "c"])
+        self.assertEqual([e.message for e in log.recent(component="imu")], ["c", "d"])
+        self.assertEqual([e.message for e in log.recent(1)], ["d"])
+        self.assertEqual(log.counts[INFO], 2)
+
+    def test_min_level(self):
+        log = EventLog(min_level=WARNING)
+        self.assertIsNone(log.log("motor", INFO, "moved", "a"))
+        self.assertIsNotNone(log.log("motor", ERROR, "move_failed", "b"))
+
+    def test_json_lines_file(self):
+        writer = FileWriterService()
+        path = os.path.join(self.tmpdir, "events_20250611_113227.jsonl")
+        log = EventLog(burst=1)
+        try:
+            log.open(path, writer=writer)
+            log.log("motor", INFO, "moved", "Motor: Moved to 45°", angle=45)
+            log.log("motor", WARNING, "not_connected", "Motor not connected")
+            log.log("motor", WARNING, "not_connected", "Motor not connected")
+            log.close()
+        finally:
+            writer.stop()
+
+        with open(path, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual([r["code"] for r in records], ["moved", "not_connected", "not_connected"])
+        self.assertEqual(records[0]["payload"], {"angle": 45})
+        self.assertEqual(records[0]["message"], "Motor: Moved to 45°")
+        # The summary written at close reports what the rate limit held back
+        self.assertEqual(records[2]["suppressed"], 1)
+        entry = get_catalog().get(path)
+        self.assertEqual((entry["kind"], entry["rows"]), ("event_log", 3))
+
+    def test_source_reports_status_and_event(self):
+        log = EventLog(burst=1)
+        shown = []
+        received = []
+        log.subscribe(received.append)
+        source = EventSource("filter_wheel", shown.append, log=log)
+        source.warning("invalid_position", "FW: invalid position 9", position=9)
+        source.warning("invalid_position", "FW: invalid position 9", position=9)
+        # The status bar is rate limited with the log
+        self.assertEqual(shown, ["FW: invalid position 9"])
+        self.assertEqual(len(received), 1)
+        self.assertEqual((received[0].component, received[0].level, received[0].payload),
+                         ("filter_wheel", WARNING, {"position": 9}))
+        # Payload keys may reuse the names of the positional arguments
+        source.error("prepare_failed", "Prepare error: 5", code=5, level=2)
+        self.assertEqual(received[-1].payload, {"code": 5, "level": 2})
+
+        # Once the window has passed, the next one is shown with the repeats held back
+        self.now += 10
+        source.warning("invalid_position", "FW: invalid position 9", position=9)
+        self.assertEqual(shown[-1], "FW: invalid position 9 (1 repeats suppressed)")
+        # Events below min_level are not logged, but still shown
+        quiet = EventSource("motor", shown.append, log=EventLog(min_level=WARNING))
+        quiet.info("moved", "Motor: Moved to 45°")
+        self.assertEqual(shown[-1], "Motor: Moved to 45°")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+import os
+import sys
+import tempfile
+import threading
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from storage.file_writer import FileWriterService, DROP, FSYNC_FLUSH
+
+
+class TestFileWriterService(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _path(self, name):
+        return os.path.join(self.tmpdir.name, name)
+
+    def test_stream_writes_in_order(self):
+        service = FileWriterService(flush_interval_s=0)
+        stream = service.open_stream(self._path("out.csv"))
+        for i in range(100):
+            stream.write(f"{i}\n")
+        stream.write(lambda: "deferred\n")
+        stream.close()
+        self.assertTrue(service.drain(5))
+        service.stop()
+        with open(self._path("out.csv")) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[:100], [str(i) for i in range(100)])
+        self.assertEqual(lines[-1], "deferred")
+        stats = service.get_stats()
+        self.assertEqual(stats["dropped"], 0)
+        self.assertEqual(stats["errors"], 0)
+        # Consecutive writes to one stream are batched
+        self.assertLess(stats["batches"], 101)
+
+    def test_write_file_with_callable_and_callback(self):
+        service = FileWriterService(fsync=FSYNC_FLUSH)
+        done = threading.Event()
+        results = []
+
+        def callback(path, error):
+            results.append((path, error))
+            done.set()
+
+        path = self._path(os.path.join("sub", "snap.csv"))
+        service.write_file(path, lambda: "a,b\n1,2\n", callback=callback)
+        self.assertTrue(done.wait(5))
+        service.stop()
+        self.assertEqual(results, [(path, None)])
+        with open(path) as f:
+            self.assertEqual(f.read(), "a,b\n1,2\n")
+
+    def test_drop_policy_counts_dropped_writes(self):
+        service = FileWriterService(queue_size=1)
+        gate = threading.Event()
+        service.submit(gate.wait)          # keep the worker busy
+        stream = service.open_stream(self._path("log.txt"), policy=DROP)
+        dropped_before = service.get_stats()["dropped"]
+        for _ in range(20):
+            stream.write("line\n")
+        gate.set()
+        service.stop()
+        self.assertGreater(service.get_stats()["dropped"], dropped_before)
+
+    def test_block_timeout_drops_and_reports(self):
+        service = FileWriterService(queue_size=1, block_timeout_s=0.05)
+        errors = []
+        service.error_callback = errors.append
+        gate, busy = threading.Event(), threading.Event()
+        stream = service.open_stream(self._path("data.csv"))
+        service.submit(lambda: (busy.set(), gate.wait()))      # keep the worker busy
+        self.assertTrue(busy.wait(5))
+        service.submit(lambda: None)       # and the queue full
+        self.assertFalse(stream.write("row\n"))
+        # A dropped write is not counted as queued
+        self.assertEqual(stream.tell(), 0)
+        self.assertEqual(len(errors), 1)
+        gate.set()
+        self.assertTrue(stream.write("row\n"))
+        self.assertEqual(stream.tell(), 4)
+        service.stop()
+
+    def test_write_error_is_reported(self):
+        service = FileWriterService()
+        errors = []
+        service.error_callback = errors.append
+        service.write_file(self._path(os.path.join("missing_dir_file", "")), "x")
+        service.stop()
+        self.assertEqual(service.get_stats()["errors"], 1)
+        self.assertEqual(len(errors), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
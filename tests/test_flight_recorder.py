@@ -0,0 +1,134 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+from unittest import mock
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from core import flight_recorder
+from core.flight_recorder import FlightRecorder, load_flight_record
+from core.event_log import EventLog, WARNING, ERROR
+from core.state_store import StateStore, MotorState, TECState
+from core.scan_sampler import Scan
+from storage.catalog import configure_catalog, get_catalog, DEFAULT_PATH
+from storage.file_writer import FileWriterService
+
+
+def make_scan(seq, t, value=100.0, npix=8):
+    return Scan(seq=seq, hw_timestamp=t, host_timestamp=t, integration_time_ms=10.0,
+                intensities=tuple([value] * npix))
+
+
+class TestFlightRecorder(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        configure_catalog(path=os.path.join(self.tmpdir, "catalog.sqlite"))
+        self.writer = FileWriterService()
+        self.now = 1000.0
+        patcher = mock.patch.object(flight_recorder, "_now", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.writer.stop()
+        configure_catalog(path=DEFAULT_PATH)
+        shutil.rmtree(self.tmpdir)
+
+    def recorder(self, **options):
+        options.setdefault("post_trigger_s", 0)
+        return FlightRecorder(os.path.join(self.tmpdir, "flight"), writer=self.writer, **options)
+
+    def test_history_is_bounded_by_time_and_count(self):
+        recorder = self.recorder(seconds=5, max_scans=100)
+        for i in range(20):
+            recorder.add_scan(make_scan(i, 100.0 + i))
+        self.assertEqual([s[0] for s in recorder._scans], list(range(14, 20)))
+        recorder = self.recorder(seconds=60, max_scans=4)
+        for i in range(20):
+            recorder.add_scan(make_scan(i, 100.0 + i))
+        self.assertEqual([s[0] for s in recorder._scans], [16, 17, 18, 19])
+        self.assertEqual(recorder._scans[0][4].dtype, np.float32)
+
+    def test_manual_dump_contains_scans_and_samples(self):
+        store = StateStore()
+        log = EventLog()
+        recorder = self.recorder()
+        recorder.attach(store, log)
+        store.publish(MotorState(angle_deg=45.0, connected=True, timestamp=101.5))
+        for i in range(3):
+            recorder.add_scan(make_scan(i, 100.0 + i, value=float(i)))
+        path = recorder.trigger("manual", note="test")
+        self.writer.drain(5)
+
+        record = load_flight_record(path)
+        self.assertEqual(list(record["seq"]), [0, 1, 2])
+        self.assertEqual(record["spectra"].shape, (3, 8))
+        self.assertEqual(record["spectra"][2, 0], 2.0)
+        self.assertEqual(record["sensors"][0]["kind"], "motor")
+        self.assertEqual(record["sensors"][0]["angle_deg"], 45.0)
+        self.assertEqual((record["triggers"][0]["reason"], record["triggers"][0]["note"]), ("manual", "test"))
+        entry = get_catalog().get(path)
+        self.assertEqual((entry["kind"], entry["rows"], entry["first_timestamp"]), ("flight_record", 3, 100.0))
+        recorder.close()
+
+    def test_saturation_trigger_and_cooldown(self):
+        recorder = self.recorder(saturation_scans=2, saturation_counts=1000, cooldown_s=30)
+        recorder.add_scan(make_scan(0, 100.0, value=1000))
+        recorder.add_scan(make_scan(1, 100.1, value=10))
+        recorder.add_scan(make_scan(2, 100.2, value=1000))
+        self.assertEqual(recorder.dumps, [])
+        recorder.add_scan(make_scan(3, 100.3, value=1000))
+        self.assertEqual(len(recorder.dumps), 1)
+        # A long burst triggers once
+        recorder.add_scan(make_scan(4, 100.4, value=1000))
+        self.assertEqual(len(recorder.dumps), 1)
+
+        # Automatic triggers within the cooldown are ignored, manual ones are not
+        self.now += 10
+        self.assertIsNone(recorder.trigger("x", automatic=True))
+        self.assertEqual(recorder.ignored, 1)
+        self.assertIsNotNone(recorder.trigger("manual"))
+        self.now += 31
+        self.assertIsNotNone(recorder.trigger("x", automatic=True))
+        self.assertEqual(len(recorder.dumps), 3)
+
+    def test_event_and_tec_triggers(self):
+        store = StateStore()
+        log = EventLog()
+        recorder = self.recorder(tec_excursion_c=1.0, cooldown_s=0,
+                                 trigger_events=["spectrometer:recovery"])
+        recorder.attach(store, log)
+        log.log("spectrometer", WARNING, "saturation", "not a trigger here")
+        self.assertEqual(recorder.dumps, [])
+        log.log("spectrometer", ERROR, "recovery", "Spectrometer 0 error (level 2)")
+        self.assertEqual(len(recorder.dumps), 1)
+        self.assertIn("spectrometer_recovery", recorder.dumps[0])
+
+        store.publish(TECState(current_temp=20.5, setpoint=20.0, connected=True))
+        store.publish(TECState(current_temp=22.0, setpoint=20.0, connected=True))
+        store.publish(TECState(current_temp=22.5, setpoint=20.0, connected=True))
+        self.assertEqual(len(recorder.dumps), 2)
+        recorder.detach()
+        log.log("spectrometer", ERROR, "recovery", "after detach")
+        self.assertEqual(len(recorder.dumps), 2)
+
+    def test_post_trigger_window_merges_triggers(self):
+        recorder = self.recorder(post_trigger_s=60)
+        recorder.add_scan(make_scan(0, 100.0))
+        path = recorder.trigger("first")
+        self.assertEqual(recorder.trigger("second"), path)
+        recorder.add_scan(make_scan(1, 100.5))
+        # flush() writes the pending dump without waiting for the timer
+        recorder.flush()
+        self.writer.drain(5)
+        record = load_flight_record(path)
+        self.assertEqual(list(record["seq"]), [0, 1])
+        self.assertEqual([t["reason"] for t in record["triggers"]], ["first", "second"])
+
+
+if __name__ == '__main__':
+    unittest.main()
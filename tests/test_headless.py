@@ -0,0 +1,105 @@
+import unittest
+import os
+import sys
+import json
+import shutil
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+HEADLESS = os.path.join(os.path.dirname(__file__), '..', 'headless.py')
+
+
+class TestHeadless(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.config = self._write("config.json", json.dumps({
+            "scheduler": {"startup_delay_s": 0, "state": os.path.join(self.tmpdir, "state.json")}}))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, name, text):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def _run(self, path, *options):
+        env = dict(os.environ, QT_QPA_PLATFORM="offscreen")
+        result = subprocess.run([sys.executable, HEADLESS, *([path] if path else []), "--config", self.config,
+                                 "--output-dir", os.path.join(self.tmpdir, "out"), *options],
+                                capture_output=True, text=True, timeout=60, env=env)
+        return result.returncode, result.stdout
+
+    def test_import_loads_no_widgets_or_camera(self):
+        # A fresh interpreter: the test process itself has imported the GUI modules
+        code = ("import sys, headless; "
+                "print(sorted(m for m in ('cv2', 'PyQt5.QtWidgets', 'matplotlib', 'pyqtgraph') if m in sys.modules))")
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, timeout=60,
+                                cwd=os.path.dirname(HEADLESS) or ".")
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), "[]")
+
+    def test_routine_exit_status(self):
+        status, output = self._run(self._write("ok.txt", "log hello\nwait 100\n"))
+        self.assertEqual(status, 0, output)
+        self.assertIn("1 of 1 routine(s) completed", output)
+        self.assertTrue(os.listdir(os.path.join(self.tmpdir, "out", "logs")))
+        # No motor in the configuration: not started once the connect timeout passed
+        status, output = self._run(self._write("motor.txt", "motor move 10\n"), "--connect-timeout", "0.2")
+        self.assertEqual(status, 1, output)
+        self.assertIn("not available: motor", output)
+        # Errors are reported before anything is connected
+        status, output = self._run(self._write("bad.txt", "bogus 1\n"))
+        self.assertEqual(status, 2, output)
+        self.assertIn("unknown command", output)
+        self.assertNotIn("Spectrometer", output)
+
+    def test_data_saving_starts_and_stops(self):
+        status, output = self._run(self._write("data.txt", "data start\nwait 300\ndata stop\n"))
+        self.assertEqual(status, 0, output)
+        self.assertIn("Data saving started", output)
+        self.assertIn("Data saving stopped", output)
+        logs = os.listdir(os.path.join(self.tmpdir, "out", "logs"))
+        self.assertTrue(any(name.startswith("events_") for name in logs), logs)
+
+    def test_time_limit_stops_the_routine(self):
+        started = time.time()
+        status, output = self._run(self._write("long.txt", "wait 20000\n"), "--timeout", "0.5")
+        self.assertEqual(status, 1, output)
+        self.assertIn("time limit", output)
+        self.assertLess(time.time() - started, 15)
+
+    def test_resume_after_time_limit(self):
+        checkpoint = os.path.join(self.tmpdir, "out", "data", "routine_checkpoint.json")
+        status, output = self._run(None, "--resume")
+        self.assertEqual(status, 2, output)
+        self.assertIn("no routine checkpoint", output)
+        status, output = self._run(self._write("two.txt", "log first\nwait 1500\nlog second\n"), "--timeout", "0.5")
+        self.assertEqual(status, 1, output)
+        self.assertTrue(os.path.exists(checkpoint))
+        status, output = self._run(None, "--resume")
+        self.assertEqual(status, 0, output)
+        self.assertIn("resuming two at line 2", output)
+        self.assertIn("second", output)
+        self.assertNotIn("first", output.split("resuming")[1])
+        self.assertFalse(os.path.exists(checkpoint))
+
+    def test_schedule_runs_until_no_entry_is_due(self):
+        routine = self._write("ok.txt", "log hello\nwait 100\n")
+        at = datetime.fromtimestamp(time.time() + 1).isoformat()
+        schedule = self._write("schedule.json", json.dumps({"entries": [
+            {"name": "first", "routine": routine, "at": at},
+            {"name": "second", "routine": routine, "at": at}]}))
+        status, output = self._run(schedule)
+        self.assertEqual(status, 0, output)
+        self.assertIn("2 of 2 routine(s) completed", output)
+
+
+if __name__ == '__main__':
+    unittest.main()
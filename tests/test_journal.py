@@ -0,0 +1,165 @@
+import unittest
+import os
+import sys
+import glob
+import shutil
+import tempfile
+import threading
+from unittest import mock
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from PyQt5.QtCore import QDateTime
+from storage.journal import RowJournal, read_journal, recover_journals, JOURNAL_EXTENSION
+from storage.spectral_archive import SpectralArchive, SpectralArchiveWriter, empty_meta
+from storage.compression import get_codec, compress_bytes, read_text
+from storage.csv_format import format_fixed
+from storage.file_writer import get_file_writer
+from storage.catalog import configure_catalog, DEFAULT_PATH
+
+
+class TestJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.journal_dir = os.path.join(self.tmpdir, ".journal")
+        configure_catalog(path=os.path.join(self.tmpdir, "catalog.sqlite"))
+
+    def tearDown(self):
+        configure_catalog(path=DEFAULT_PATH)
+        shutil.rmtree(self.tmpdir)
+
+    def journal_rows(self, name, info, count, archive=None, durability="batch"):
+        journal = RowJournal(self.journal_dir, name, durability, batch_rows=3)
+        journal.begin(info)
+        for i in range(count):
+            record = b""
+            if archive is not None:
+                meta = empty_meta()
+                meta["timestamp"] = 100.0 + i
+                record = archive.encode_rows([meta], [[i] * 4])
+            journal.append(i, i if archive is not None else -1, f"t{i}", [i + 0.5] * 4, record)
+            if i == 2:
+                journal.checkpoint()
+        journal.close()
+        journal.wait(5)
+        return journal
+
+    def test_torn_record_is_ignored(self):
+        journal = self.journal_rows("a.csv", {"csv": None}, 5)
+        self.assertEqual(journal.fsyncs, 2)
+        path = journal.path(1)
+        with open(path, "ab") as f:
+            f.write(b"\x40\x00\x00\x00garbage")
+        info, rows = read_journal(path)
+        self.assertEqual(info, {"csv": None})
+        self.assertEqual([r["csv_index"] for r in rows], [3, 4])
+        self.assertEqual(list(rows[1]["spectrum"]), [4.5] * 4)
+        journal.release(0)
+        self.assertEqual([os.path.basename(p) for p in glob.glob(os.path.join(self.journal_dir, "*"))],
+                         ["a.csv.0001" + JOURNAL_EXTENSION])
+
+    def test_float32_spectra(self):
+        journal = self.journal_rows("b.csv", {"csv": None, "dtype": "<f4"}, 2)
+        info, rows = read_journal(journal.path(0))
+        self.assertEqual(rows[1]["spectrum"].dtype, np.float32)
+        self.assertEqual(list(rows[1]["spectrum"]), [1.5] * 4)
+
+    def test_fsync_off_the_callers_thread(self):
+        caller = threading.current_thread()
+        threads = []
+        fsync = os.fsync
+        with mock.patch("storage.journal.os.fsync",
+                        side_effect=lambda fd: (threads.append(threading.current_thread()), fsync(fd))):
+            journal = self.journal_rows("c.csv", {"csv": None}, 4, durability="row")
+        self.assertEqual(journal.fsyncs, 4)
+        self.assertEqual(len(threads), 4)
+        self.assertNotIn(caller, threads)
+        self.assertEqual(len(read_journal(journal.path(1))[1]), 1)
+
+    def test_recover_csv_and_archive(self):
+        csv_path = os.path.join(self.tmpdir, "s.csv")
+        archive_path = os.path.join(self.tmpdir, "s.sga")
+        with open(csv_path, "w", newline="") as f:
+            f.write("T,a,b,c,d\nt0,0.5000,0.5000,0.5000,0.5000\nt1,1.50")     # torn third line
+        writer = SpectralArchiveWriter(archive_path, 4)
+        info = {"csv": csv_path, "csv_header": "T,a,b,c,d\n", "archive": archive_path, "npix": 4}
+        self.journal_rows("s.csv", info, 5, archive=writer)
+        meta = empty_meta()
+        writer.append(dict(meta, timestamp=100.0), [0] * 4)
+        writer._fh.write(b"\x01\x02")      # torn record
+        writer.close()
+
+        recovered = dict(recover_journals(self.journal_dir))
+        self.assertEqual(recovered, {csv_path: 4, archive_path: 4})
+        with open(csv_path) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[1:], [f"t{i}," + format_fixed([i + 0.5] * 4) for i in range(5)])
+        archive = SpectralArchive(archive_path)
+        self.assertEqual(list(archive.records["timestamp"]), [100.0, 101.0, 102.0, 103.0, 104.0])
+        self.assertEqual(os.listdir(self.journal_dir), [])
+        self.assertEqual(recover_journals(self.journal_dir), [])
+
+    def test_recover_compressed_csv(self):
+        csv_path = os.path.join(self.tmpdir, "s.csv.gz")
+        with open(csv_path, "wb") as f:
+            f.write(compress_bytes(b"T,a,b,c,d\nt0,0.5000,0.5000,0.5000,0.5000\n", get_codec("gzip"))[:-8])
+        info = {"csv": csv_path, "csv_header": "T,a,b,c,d\n", "archive": None, "npix": 4}
+        self.journal_rows("s.csv.gz", info, 3)
+        recover_journals(self.journal_dir)
+        self.assertEqual(read_text(csv_path).count("\n"), 4)
+
+    def test_logger_rows_survive_crash(self):
+        from gui.components.data_logger import DataLogger
+        logger = DataLogger(None)
+        logger.csv_dir = logger.log_dir = self.tmpdir
+        logger.scan_format = "both"
+        logger.compression = None
+        logger.fusion_enabled = False
+        logger.journal_checkpoint_rows = 5
+        logger.toggle_data_saving()
+        for i in range(13):
+            ts = QDateTime.fromMSecsSinceEpoch(1700000000000 + i * 1000)
+            logger._queue_row(0.0, 0.0, [float(i)] * 16, [i + 1], timestamp=ts)
+            logger._write_ready_rows()
+        # Crash: three CSV rows are still in memory and the files are never finished
+        csv_path = logger.csv_file_path
+        logger._journal.flush(5)     # what the journal thread had written when the application died
+        logger.csv_file.close()
+        logger.log_file.close()
+        logger._archive_stream.close()
+        get_file_writer().drain(5)
+        journals = glob.glob(os.path.join(logger.journal_dir, "*" + JOURNAL_EXTENSION))
+        self.assertEqual(len(journals), 1)     # generations before the last checkpoint are gone
+        with open(csv_path) as f:
+            self.assertEqual(len(f.read().splitlines()), 11)
+
+        recovered = DataLogger(None)
+        recovered.csv_dir = self.tmpdir
+        recovered.recovered = recover_journals(recovered.journal_dir)
+        self.assertIn((csv_path, 3), recovered.recovered)
+        self.assertIn((os.path.abspath(logger.archive_file_path), 0), recovered.recovered)
+        with open(csv_path) as f:
+            rows = f.read().splitlines()
+        self.assertEqual(len(rows), 14)
+        self.assertTrue(rows[-1].endswith(format_fixed([12.0] * 16)))
+
+    def test_clean_stop_removes_journal(self):
+        from gui.components.data_logger import DataLogger
+        logger = DataLogger(None)
+        logger.csv_dir = logger.log_dir = self.tmpdir
+        logger.fusion_enabled = False
+        logger.journal_durability = "row"
+        logger.toggle_data_saving()
+        for i in range(3):
+            logger._queue_row(0.0, 0.0, [1.0] * 8, [i + 1])
+            logger._write_ready_rows()
+        logger.close_files()
+        get_file_writer().drain(5)
+        self.assertEqual(os.listdir(logger.journal_dir), [])
+        with open(logger.csv_file_path) as f:
+            self.assertEqual(len(f.read().splitlines()), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from core.replay import Replayer, load_recording
+from core.state_store import StateStore, MotorState, FilterWheelState, IMUState, THPState, RoutineState
+from core.scan_sampler import Scan
+from core.flight_recorder import FlightRecorder
+from storage.spectral_archive import SpectralArchiveWriter, empty_meta
+from storage.catalog import configure_catalog, DEFAULT_PATH
+from storage.file_writer import FileWriterService
+
+
+def write_session(path, rows=6, npix=4):
+    metas, spectra = [], []
+    for i in range(rows):
+        meta = empty_meta()
+        meta.update(timestamp=100.0 + i, motor_angle=0.0 if i < 3 else 45.0, filter_pos=2,
+                    integration_time=10.0, routine_code="OO", roll=1.5, scan_first=10 * i + 1, scan_count=10,
+                    imu_age=0.25, thp_age=float(i % 3), thp_temp=20.0 + (i // 3))
+        metas.append(meta)
+        spectra.append(np.full(npix, float(i)))
+    with SpectralArchiveWriter(path, npix, [500.0 + p for p in range(npix)]) as writer:
+        writer.append_many(metas, np.array(spectra, dtype=np.float32))
+
+
+class TestReplay(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        configure_catalog(path=os.path.join(self.tmpdir, "catalog.sqlite"))
+        self.path = os.path.join(self.tmpdir, "Scans_20250101_000000_mini.sga")
+        write_session(self.path)
+
+    def tearDown(self):
+        configure_catalog(path=DEFAULT_PATH)
+        shutil.rmtree(self.tmpdir)
+
+    def replay(self, recording, **options):
+        store = StateStore(history_seconds=1e9)
+        scans, published = [], []
+        store.subscribe(published.append)
+        stats = Replayer(recording, on_scan=scans.append, store=store, **options).run()
+        return stats, scans, published
+
+    def test_scan_log_replay(self):
+        recording = load_recording(self.path)
+        stats, scans, published = self.replay(recording, speed=None, rebase=False)
+        # From the first IMU reading (0.25 s before the first row) to the last row
+        self.assertEqual((stats.scans, stats.recorded_s), (6, 5.25))
+        self.assertEqual([s.seq for s in scans], [1, 11, 21, 31, 41, 51])
+        self.assertEqual(scans[2].intensities.tolist(), [2.0] * 4)
+        self.assertEqual(scans[2].host_timestamp, 102.0)
+
+        motors = [r for r in published if isinstance(r, MotorState)]
+        self.assertEqual([(r.angle_deg, r.timestamp) for r in motors], [(0.0, 100.0), (45.0, 103.0)])
+        self.assertEqual(len([r for r in published if isinstance(r, FilterWheelState)]), 1)
+        routine = [r for r in published if isinstance(r, RoutineState)]
+        self.assertEqual((routine[0].code, routine[0].running), ("OO", True))
+        # Sensor records are dated when they were read (row time minus age), once per reading
+        imu = [r for r in published if isinstance(r, IMUState)]
+        self.assertEqual([r.timestamp for r in imu], [99.75, 100.75, 101.75, 102.75, 103.75, 104.75])
+        thp = [r for r in published if isinstance(r, THPState)]
+        self.assertEqual([r.timestamp for r in thp], [100.0, 103.0])
+        self.assertIs(published[0], imu[0])
+
+    def test_replay_is_repeatable(self):
+        recording = load_recording(self.path, start=101.0, end=104.0)
+        first = self.replay(recording, speed=None, rebase=False)
+        second = self.replay(recording, speed=None, rebase=False)
+        self.assertEqual(first[1], second[1])
+        for a, b in zip(first[1], second[1]):
+            np.testing.assert_array_equal(a.intensities, b.intensities)
+        self.assertEqual(first[2], second[2])
+        self.assertEqual(len(first[1]), 4)
+
+    def test_paced_replay_with_rebased_timestamps(self):
+        recording = load_recording(self.path)
+        stats, scans, _ = self.replay(recording, speed=50.0)
+        # 5 s of data at 50x
+        self.assertGreaterEqual(stats.elapsed_s, 0.09)
+        self.assertAlmostEqual(scans[-1].host_timestamp - scans[0].host_timestamp, 0.1, places=6)
+
+    def test_flight_record_replay(self):
+        writer = FileWriterService()
+        recorder = FlightRecorder(self.tmpdir, writer=writer, post_trigger_s=0)
+        store = StateStore()
+        recorder.attach(store)
+        store.publish(MotorState(angle_deg=90.0, connected=True, timestamp=50.5))
+        for i in range(3):
+            recorder.add_scan(Scan(seq=i, hw_timestamp=i, host_timestamp=50.0 + i,
+                                   integration_time_ms=5.0, intensities=(1.0, 2.0)))
+        path = recorder.trigger("manual")
+        writer.stop()
+        recorder.detach()
+
+        stats, scans, published = self.replay(load_recording(path), speed=None, rebase=False)
+        self.assertEqual([s.host_timestamp for s in scans], [50.0, 51.0, 52.0])
+        self.assertEqual(published, [MotorState(angle_deg=90.0, connected=True, timestamp=50.5)])
+
+
+if __name__ == '__main__':
+    unittest.main()
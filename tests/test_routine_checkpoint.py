@@ -0,0 +1,51 @@
+import unittest
+import os
+import sys
+import json
+import shutil
+import tempfile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from core.routine_checkpoint import Checkpoint, save_checkpoint, load_checkpoint, clear_checkpoint
+from core.routine_compiler import compile_routine, MOTOR, FILTER_WHEEL, SPECTROMETER
+
+
+class TestRoutineCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "data", "checkpoint.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_round_trip(self):
+        checkpoint = Checkpoint(routine="routines/OO.txt", name="OO", digest="ab12", next_index=12, total=30,
+                                line=24, motor_angle=45.0, filter_pos=2, integration_ms=100.0, measuring=True)
+        save_checkpoint(self.path, checkpoint)
+        self.assertEqual(load_checkpoint(self.path), checkpoint)
+        self.assertFalse(os.path.exists(self.path + ".tmp"))
+        clear_checkpoint(self.path)
+        self.assertIsNone(load_checkpoint(self.path))
+
+    def test_unreadable_checkpoint(self):
+        os.makedirs(os.path.dirname(self.path))
+        for text in ("{not json", json.dumps({"version": 99, "routine": "x"}), json.dumps({"version": 1})):
+            with open(self.path, "w") as f:
+                f.write(text)
+            self.assertIsNone(load_checkpoint(self.path))
+
+    def test_restore_commands_compile(self):
+        checkpoint = Checkpoint(routine="r.txt", name="r", digest="", next_index=3, total=5, motor_angle=90.0,
+                                filter_pos=4, integration_ms=250.0, measuring=True, setpoint=25.0, data_saving=True)
+        commands = checkpoint.restore_commands({MOTOR, FILTER_WHEEL, SPECTROMETER})
+        self.assertEqual(commands, ["integration 250", "parallel { filter position 4; motor move 90 }",
+                                    "spectrometer start", "data start"])
+        ops = [instruction.op for instruction in compile_routine("\n".join(commands)).instructions]
+        self.assertEqual(ops[:2], ["integration", "filter.position"])
+        # Only the devices the routine drives are put back
+        self.assertEqual(checkpoint.restore_commands({MOTOR}), ["motor move 90", "data start"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,212 @@
+import unittest
+import os
+import sys
+import glob
+import shutil
+import tempfile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from core.routine_compiler import (compile_routine, compile_file, check_devices, strip_comment,
+                                   RoutineCompileError, COMMANDS, MOTOR, FILTER_WHEEL, SPECTROMETER)
+
+ROUTINES_DIR = os.path.join(os.path.dirname(__file__), '..', 'routines')
+SCHEDULES_DIR = os.path.join(os.path.dirname(__file__), '..', 'schedules')
+
+
+class TestRoutineCompiler(unittest.TestCase):
+
+    def test_instructions_are_typed_with_line_numbers(self):
+        program = compile_routine("# Header\n\nMOTOR Move 45\nfilter position 2 # Open\n"
+                                  "wait 2000\nLOG Starting  Angle 0\nspectrometer SAVE_SNAPSHOT Open_0.csv\n"
+                                  "recorder dump\n")
+        self.assertEqual([(i.line, i.op, i.args) for i in program], [
+            (3, "motor.move", (45.0,)),
+            (4, "filter.position", (2,)),
+            (5, "wait", (2000,)),
+            (6, "log", ("Starting  Angle 0",)),
+            (7, "spectrometer.save_snapshot", ("Open_0.csv",)),
+            (8, "recorder.dump", ("",)),
+        ])
+        self.assertEqual(program[1].text, "filter position 2")
+        self.assertEqual(program.devices, {MOTOR, FILTER_WHEEL, SPECTROMETER, "flight_recorder"})
+
+    def test_all_errors_are_reported(self):
+        with self.assertRaises(RoutineCompileError) as cm:
+            compile_routine("motor mve 45\nfilter position x\nwait -1\nplot now\n"
+                            "integration 5000\nmotr move 3\nspectrometer\nmotor move\nwait 100\n", "r.txt")
+        errors = cm.exception.errors
+        self.assertEqual([e.line for e in errors], [1, 2, 3, 4, 5, 6, 7, 8])
+        self.assertIn("did you mean 'move'", errors[0].message)
+        self.assertIn("position must be an integer", errors[1].message)
+        self.assertIn("time_ms must be >= 0", errors[2].message)
+        self.assertIn("unexpected argument 'now'", errors[3].message)
+        self.assertIn("1 to 4000", errors[4].message)
+        self.assertIn("did you mean 'motor'", errors[5].message)
+        self.assertIn("needs one of", errors[6].message)
+        self.assertIn("missing angle", errors[7].message)
+        self.assertTrue(str(cm.exception).startswith("r.txt:1: "))
+
+    def test_comments(self):
+        self.assertEqual(strip_comment("  # all comment"), "")
+        self.assertEqual(strip_comment("filter position 1 # Opaque"), "filter position 1")
+        self.assertEqual(strip_comment("camera save_image a#b.jpg"), "camera save_image a#b.jpg")
+
+    def test_compiled_files_are_cached_by_content(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        first, second = os.path.join(tmpdir, "a.txt"), os.path.join(tmpdir, "b.txt")
+        for path in (first, second):
+            with open(path, "w") as f:
+                f.write("wait 10\n")
+        a, b = compile_file(first), compile_file(second)
+        self.assertIs(a.instructions, b.instructions)
+        self.assertEqual((a.source, b.source), (first, second))
+        with open(first, "a") as f:
+            f.write("wait 20\n")
+        self.assertEqual(len(compile_file(first)), 2)
+
+    def test_concurrent_commands(self):
+        program = compile_routine("parallel { motor move 45; filter position 1 }\n"
+                                  "async motor move 90\nlog moving\nparallel {\n  wait 100\n"
+                                  "  filter position 2 # Open\n}\nasync wait 5\n")
+        self.assertEqual([(i.line, i.op, i.background) for i in program], [
+            (1, "motor.move", True), (1, "filter.position", True), (1, "sync", False),
+            (2, "motor.move", True), (3, "log", False),
+            (5, "wait", True), (6, "filter.position", True), (7, "sync", False),
+            # A final sync for the command still running
+            (8, "wait", True), (8, "sync", False),
+        ])
+
+    def test_concurrency_errors(self):
+        with self.assertRaises(RoutineCompileError) as cm:
+            compile_routine("async motor move 0\nmotor move 45\nsync\nparallel { filter position 1; "
+                            "filter position 2 }\nasync sync\n}\nparalel { log x }\nparallel {\nlog x\n")
+        self.assertEqual([(e.line, e.message.split(" (")[0]) for e in cm.exception.errors], [
+            (2, "motor is still busy with line 1"),
+            (4, "filter_wheel is still busy with line 4"),
+            (5, "'sync' cannot run concurrently"),
+            (6, "'}' without 'parallel {'"),
+            (7, "unknown command 'paralel'"),
+            (8, "'parallel {' is not closed with '}'"),
+        ])
+        self.assertIn("did you mean 'parallel'", cm.exception.errors[4].message)
+
+    def test_loops_variables_and_subroutines(self):
+        program = compile_routine("set prefix = OOD\n"
+                                  "for angle in 0 45 {\n"
+                                  "    parallel { motor move ${angle}; filter position 1 }\n"
+                                  "    call save ${prefix}\n"
+                                  "}\n"
+                                  "for t in range 0.5 1 0.25 {\n"
+                                  "    log ${t} ${prefix}\n"
+                                  "}\n"
+                                  "for angle in range 90 0 -45 {\n"
+                                  "    motor move ${angle}\n"
+                                  "}\n"
+                                  "def save name {\n"
+                                  "    set prefix = x\n"
+                                  "    spectrometer save_snapshot ${name}_${angle}.csv\n"
+                                  "}\n")
+        self.assertEqual([(i.line, i.op, i.args) for i in program if i.op != "sync"], [
+            (3, "motor.move", (0.0,)), (3, "filter.position", (1,)),
+            (14, "spectrometer.save_snapshot", ("OOD_0.csv",)),
+            (3, "motor.move", (45.0,)), (3, "filter.position", (1,)),
+            (14, "spectrometer.save_snapshot", ("OOD_45.csv",)),
+            (7, "log", ("0.5 OOD",)), (7, "log", ("0.75 OOD",)),
+            (10, "motor.move", (90.0,)), (10, "motor.move", (45.0,)),
+        ])
+        self.assertEqual(program[3].text, "spectrometer save_snapshot OOD_0.csv")
+
+    def test_multi_line_parallel_blocks_in_loops_and_subroutines(self):
+        program = compile_routine("for angle in 0 45 {\n"
+                                  "    parallel {\n"
+                                  "        filter position 1\n"
+                                  "        motor move ${angle}\n"
+                                  "    }\n"
+                                  "    call move ${angle}\n"
+                                  "}\n"
+                                  "def move angle {\n"
+                                  "    parallel { filter position 2\n"
+                                  "        motor move ${angle}\n"
+                                  "    }\n"
+                                  "}\n")
+        self.assertEqual([(i.line, i.op, i.args, i.background) for i in program], [
+            (3, "filter.position", (1,), True), (4, "motor.move", (0.0,), True), (5, "sync", (), False),
+            (9, "filter.position", (2,), True), (10, "motor.move", (0.0,), True), (11, "sync", (), False),
+            (3, "filter.position", (1,), True), (4, "motor.move", (45.0,), True), (5, "sync", (), False),
+            (9, "filter.position", (2,), True), (10, "motor.move", (45.0,), True), (11, "sync", (), False),
+        ])
+
+    def test_loops_inside_parallel_blocks_are_rejected(self):
+        with self.assertRaises(RoutineCompileError) as cm:
+            compile_routine("parallel {\n"
+                            "    for angle in 0 45 {\n"
+                            "        motor move ${angle}\n"
+                            "    }\n"
+                            "    filter position 1\n"
+                            "}\n"
+                            "log after\n")
+        self.assertEqual([(e.line, e.message) for e in cm.exception.errors],
+                         [(2, "'for' cannot be used inside a parallel block")])
+
+    def test_expansions_match_the_flat_routines(self):
+        # OOD.txt, po_routine.txt and schedule_sg.txt were hundreds of lines of repeated blocks
+        ood = [i.args[0] for i in compile_file(os.path.join(ROUTINES_DIR, "OOD.txt"))
+               if i.op == "spectrometer.save_snapshot"]
+        self.assertEqual(ood, [f"{name}_{angle}.csv" for angle in (0, 45, 90, 135)
+                               for name in ("Opaque", "Open", "Diff")])
+        po = [(i.op, i.args) for i in compile_file(os.path.join(ROUTINES_DIR, "po_routine.txt"))
+              if i.op in ("motor.move", "filter.position")]
+        self.assertEqual(po, [("filter.position", (1,)), ("filter.position", (2,))] +
+                         [step for angle in (45, 90, 135, 180) for step in
+                          (("motor.move", (float(angle),)), ("filter.position", (1,)), ("filter.position", (2,)))])
+        sg = [i.args[0] for i in compile_file(os.path.join(SCHEDULES_DIR, "schedule_sg.txt"))
+              if i.op == "motor.move"]
+        self.assertEqual(sg, [0.0] + [float(a) for a in range(10, 190, 10)] + [float(a) for a in range(10, 100, 10)])
+
+    def test_expansion_errors(self):
+        with self.assertRaises(RoutineCompileError) as cm:
+            compile_routine("for a in 1 2 {\n"
+                            "    log ${b}\n"
+                            "    motor move ${a}x\n"
+                            "}\n"
+                            "for a in range 0 1 0 {\n"
+                            "}\n"
+                            "call nope\n"
+                            "call loop 1\n"
+                            "call loop\n"
+                            "def loop {\n"
+                            "    call loop\n"
+                            "}\n"
+                            "for a in x {\n")
+        self.assertEqual([(e.line, e.message.split(" (")[0]) for e in cm.exception.errors], [
+            (2, "unknown variable 'b'"),
+            (3, "angle must be a number, got '1x'"),
+            (3, "angle must be a number, got '2x'"),
+            (5, "range step must not be 0"),
+            (7, "unknown sub-routine 'nope'"),
+            (8, "'loop' takes 0 arguments"),
+            (11, "'loop' calls itself"),
+            (13, "'for' is not closed with '}'"),
+        ])
+
+    def test_check_devices(self):
+        program = compile_routine("motor move 0\nwait 1\nmotor move 45\nspectrometer start\n")
+        self.assertEqual(check_devices(program, {SPECTROMETER}), {MOTOR: [1, 3]})
+        self.assertEqual(check_devices(program, {SPECTROMETER, MOTOR}), {})
+
+    def test_shipped_routines_compile(self):
+        paths = glob.glob(os.path.join(ROUTINES_DIR, "*.txt")) + glob.glob(os.path.join(SCHEDULES_DIR, "*.txt"))
+        self.assertTrue(paths)
+        for path in paths:
+            with self.subTest(path=os.path.basename(path)):
+                self.assertTrue(len(compile_file(path)))
+
+    def test_every_operation_has_a_handler(self):
+        from gui.components.routine_manager import RoutineManager
+        manager = RoutineManager(None)
+        self.assertEqual(set(manager._handlers), {command.op for command in COMMANDS})
+
+
+if __name__ == '__main__':
+    unittest.main()
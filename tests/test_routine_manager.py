@@ -0,0 +1,274 @@
+import unittest
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+from PyQt5.QtWidgets import QApplication
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from core.state_store import get_state_store, MotorState, FilterWheelState, SpectrometerState
+from core.scan_sampler import Scan
+from gui.components.routine_manager import RoutineManager, RoutineTiming, FIXED_DELAYS_MS
+from core.routine_compiler import compile_routine
+from core.routine_results import ResultKey
+
+app = QApplication.instance() or QApplication([])
+ROUTINES_DIR = os.path.join(os.path.dirname(__file__), '..', 'routines')
+
+
+class StatusBar:
+    def __init__(self):
+        self.messages = []
+
+    def showMessage(self, message):
+        self.messages.append(message)
+
+
+class FakeMotor:
+    def __init__(self, log, travel_ms=50):
+        self.log = log
+        self.travel_ms = travel_ms
+        self.current_angle_deg = 0.0
+
+    def is_connected(self):
+        return True
+
+    def move_to(self, angle):
+        self.log.append(("move", angle))
+        self.current_angle_deg = angle
+        get_state_store().publish(MotorState(angle_deg=angle, connected=True, moving=True))
+        QTimer.singleShot(self.travel_ms, self._arrive)
+        return True
+
+    def _arrive(self):
+        self.log.append(("in_position", self.current_angle_deg))
+        get_state_store().publish(MotorState(angle_deg=self.current_angle_deg, connected=True, moving=False))
+
+
+class FakeFilterWheel:
+    def __init__(self, log, confirm=True):
+        self.log = log
+        self.confirm = confirm
+
+    def is_connected(self):
+        return True
+
+    def set_position(self, position):
+        self.log.append(("filter", position))
+        if self.confirm:
+            QTimer.singleShot(30, lambda: get_state_store().publish(FilterWheelState(position=position, connected=True)))
+
+
+class FakeSpectrometer(QObject):
+    scan_signal = pyqtSignal(object)
+
+    def __init__(self, log, period_ms=20):
+        super().__init__()
+        self.log = log
+        self.seq = 0
+        self.timer = QTimer()
+        self.timer.timeout.connect(self._scan)
+        self.timer.start(period_ms)
+        get_state_store().publish(SpectrometerState(integration_time_ms=10.0, measuring=True, started=time.time()))
+
+    def is_ready(self):
+        return True
+
+    def _scan(self):
+        self.seq += 1
+        self.log.append(("scan", self.seq))
+        self.scan_signal.emit(Scan(seq=self.seq, hw_timestamp=0.0, host_timestamp=time.time(),
+                                   integration_time_ms=10.0, intensities=(1.0,)))
+
+
+class FakeMainWindow(QObject):
+    def __init__(self, config=None):
+        super().__init__()
+        self.config = config or {}
+        self.log = []
+        self.status = StatusBar()
+        self.motor_ctrl = FakeMotor(self.log)
+        self.filter_ctrl = FakeFilterWheel(self.log)
+        self.spec_ctrl = FakeSpectrometer(self.log)
+
+    def statusBar(self):
+        return self.status
+
+
+class TestRoutineSequencing(unittest.TestCase):
+
+    def setUp(self):
+        get_state_store().clear()
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        get_state_store().clear()
+
+    def run_routine(self, window, text, timeout=5.0):
+        manager = RoutineManager(window)
+        manager._process_and_plot_routine_data = lambda: None
+        manager.checkpoint_path = os.path.join(self.tmpdir, "checkpoint.json")
+        path = os.path.join(self.tmpdir, "routine.txt")
+        with open(path, "w") as f:
+            f.write(text)
+        manager._load_routine_from_file(path)
+        started = time.monotonic()
+        manager.run_routine()
+        while manager.routine_running and time.monotonic() - started < timeout:
+            app.processEvents()
+            time.sleep(0.002)
+        window.spec_ctrl.timer.stop()
+        self.assertFalse(manager.routine_running)
+        return manager, time.monotonic() - started
+
+    def test_commands_complete_on_events(self):
+        window = FakeMainWindow()
+        manager, elapsed = self.run_routine(window, "motor move 45\nfilter position 2\nlog done\n")
+        log = window.log
+        # The filter moves after the motor is in position and two scans have arrived since
+        arrived = log.index(("in_position", 45))
+        self.assertEqual([entry[0] for entry in log[arrived + 1:arrived + 3]], ["scan", "scan"])
+        confirmed = log.index(("filter", 2))
+        self.assertGreater(confirmed, arrived + 2)
+        # Far below the 4.5 s of fixed delays
+        self.assertLess(elapsed, 2.0)
+        self.assertEqual(manager.timing.timeouts, 0)
+        self.assertEqual(set(manager.timing.ops), {"motor.move", "filter.position", "log"})
+        self.assertAlmostEqual(manager.timing.fixed, 4.5)
+        self.assertIn("saved", window.status.messages[-1])
+
+    def test_concurrent_commands_and_critical_path(self):
+        window = FakeMainWindow()
+        window.motor_ctrl.travel_ms = 300
+        manager, elapsed = self.run_routine(window, "parallel { motor move 45; filter position 2 }\nlog done\n")
+        log = window.log
+        # The filter wheel is commanded while the motor is still moving
+        self.assertLess(log.index(("filter", 2)), log.index(("in_position", 45)))
+        step, = manager.timing.steps
+        self.assertEqual((step.first_line, step.last_line, step.critical.op), (1, 1, "motor.move"))
+        self.assertLess(step.seconds, step.sequential)
+        self.assertAlmostEqual(manager.timing.elapsed, step.seconds + manager.timing.ops["log"][1])
+
+    def test_timeout_moves_on(self):
+        window = FakeMainWindow({"routine": {"timeout_s": 0.1}})
+        window.filter_ctrl.confirm = False
+        manager, elapsed = self.run_routine(window, "filter position 3\nlog after\n")
+        self.assertEqual(manager.timing.timeouts, 1)
+        self.assertEqual(manager.timing.ops["log"][0], 1)
+        self.assertTrue(any("no filter wheel at position 3" in m for m in window.status.messages))
+
+    def test_fixed_completion_mode(self):
+        window = FakeMainWindow({"routine": {"completion": "fixed"}})
+        manager, elapsed = self.run_routine(window, "log one\n")
+        self.assertGreaterEqual(elapsed, FIXED_DELAYS_MS["log"] / 1000 - 0.05)
+
+    def test_dry_run(self):
+        window = FakeMainWindow({"routine": {"simulation": {"filter_move_s": 4.0}}})
+        window.spec_ctrl.timer.stop()
+        window.motor_ctrl.current_angle_deg = 45.0
+        manager = RoutineManager(window)
+        manager._load_routine_from_file(os.path.join(ROUTINES_DIR, "OO.txt"))
+        simulation = manager.dry_run()
+        # Simulated from the motor's current angle, without driving the devices
+        first_move = next(step for step in simulation.steps if step.instruction.op == "motor.move")
+        self.assertEqual(first_move.instruction.args, (0.0,))
+        self.assertGreater(first_move.seconds, 0.5)
+        self.assertTrue(all(step.seconds >= 4.0 for step in simulation.steps if step.instruction.op == "filter.position"))
+        self.assertEqual(window.log, [])
+        self.assertIn("Dry run: routine takes about", window.status.messages[-1])
+
+    def test_results_aggregated_during_the_run(self):
+        window = FakeMainWindow()
+        manager, elapsed = self.run_routine(
+            window, "parallel { motor move 45; filter position 2 }\nwait 200\nmotor move 90\nwait 200\n")
+        results = manager.results
+        keys = [ResultKey(2, angle, (("integration_ms", 10.0),)) for angle in (45.0, 90.0)]
+        self.assertEqual(results.keys(), keys)
+        self.assertTrue(all(results.count(key) >= 5 for key in keys))
+        self.assertEqual(results.mean(keys[1]).tolist(), [1.0])
+        self.assertEqual(results.label(keys[1]), "Filter 2, 90°")
+        # Nothing from while the motor moved or before the wheel confirmed
+        self.assertGreater(results.skipped, 0)
+
+    def test_resume_from_checkpoint(self):
+        window = FakeMainWindow()
+        manager = RoutineManager(window)
+        manager._process_and_plot_routine_data = lambda: None
+        manager.checkpoint_path = os.path.join(self.tmpdir, "checkpoint.json")
+        path = os.path.join(self.tmpdir, "routine.txt")
+        with open(path, "w") as f:
+            f.write("motor move 45\nfilter position 2\nwait 5000\nlog done\n")
+        self.assertTrue(manager.run_file(path, "resumable"))
+        started = time.monotonic()
+        while manager.current_command_index < 3 and time.monotonic() - started < 5:
+            app.processEvents()
+            time.sleep(0.002)
+        manager.stop_routine()
+        checkpoint = manager.pending_checkpoint()
+        self.assertEqual((checkpoint.name, checkpoint.next_index, checkpoint.line), ("resumable", 2, 3))
+        self.assertEqual((checkpoint.motor_angle, checkpoint.filter_pos), (45.0, 2))
+
+        # A new run (e.g. after a restart) puts the devices back, then continues with the wait
+        window.motor_ctrl.move_to(0)
+        del window.log[:]
+        with open(path) as f:
+            text = f.read()
+        with open(path, "w") as f:
+            f.write(text.replace("wait 5000", "wait 50"))
+        self.assertFalse(manager.resume_routine())      # not the routine the checkpoint was taken of
+        with open(path, "w") as f:
+            f.write(text)
+        manager = RoutineManager(window)
+        manager._process_and_plot_routine_data = lambda: None
+        manager.checkpoint_path = os.path.join(self.tmpdir, "checkpoint.json")
+        manager._cmd_wait = lambda wait_time: 50
+        self.assertTrue(manager.resume_routine())
+        while manager.routine_running and time.monotonic() - started < 10:
+            app.processEvents()
+            time.sleep(0.002)
+        window.spec_ctrl.timer.stop()
+        moves = [entry for entry in window.log if entry[0] in ("move", "filter")]
+        self.assertEqual(moves, [("filter", 2), ("move", 45.0)])
+        self.assertEqual(set(manager.timing.ops), {"filter.position", "motor.move", "wait", "log"})
+        self.assertEqual(manager.current_routine_start_time_str, checkpoint.start_time)
+        self.assertIsNone(manager.pending_checkpoint())
+
+        # Run then starts the whole routine again, checkpointed against its own instructions
+        self.assertEqual(manager.routine_commands, manager.program.instructions)
+        window.spec_ctrl.timer.start()
+        del window.log[:]
+        manager.run_routine()
+        started = time.monotonic()
+        checkpoint = manager.pending_checkpoint()
+        while (checkpoint is None or checkpoint.next_index < 1) and time.monotonic() - started < 5:
+            app.processEvents()
+            time.sleep(0.002)
+            checkpoint = manager.pending_checkpoint()
+        self.assertEqual((checkpoint.next_index, checkpoint.line), (1, 2))
+        while manager.routine_running and time.monotonic() - started < 10:
+            app.processEvents()
+            time.sleep(0.002)
+        window.spec_ctrl.timer.stop()
+        moves = [entry for entry in window.log if entry[0] in ("move", "filter")]
+        self.assertEqual(moves, [("move", 45.0), ("filter", 2)])
+
+
+class TestRoutineTiming(unittest.TestCase):
+
+    def test_report(self):
+        timing = RoutineTiming()
+        for instruction in compile_routine("motor move 45\nwait 2000\nmotor move 90\n"):
+            timing.add(instruction, 1.0 if instruction.op != "wait" else 2.0)
+        self.assertEqual(timing.ops["motor.move"], [2, 2.0, 4.0])
+        self.assertEqual((timing.elapsed, timing.fixed), (4.0, 6.0))
+        self.assertEqual(timing.summary(), "4.0 s (fixed delays: 6.0 s, saved 2.0 s)")
+        self.assertIn("motor.move", timing.report())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from core.routine_results import RoutineResults, ResultKey
+
+
+class TestRoutineResults(unittest.TestCase):
+
+    def test_running_means_per_state(self):
+        results = RoutineResults()
+        for filter_pos, angle, value in ((1, 0.0, 1.0), (1, 0.0, 2.0), (1, 0.0, 3.0),
+                                         (2, 45.0, 10.0), (2, 45.0, 20.0), (2, 45.0, 30.0)):
+            results.add(np.full(4, value), filter_pos, angle, integration_ms=100)
+        opaque, open_ = ResultKey(1, 0.0, (("integration_ms", 100),)), ResultKey(2, 45.0, (("integration_ms", 100),))
+        self.assertEqual(results.keys(), [opaque, open_])
+        # The first scan at each state is skipped
+        self.assertEqual((results.count(opaque), results.scans, results.skipped), (2, 4, 2))
+        self.assertEqual(results.mean(opaque).tolist(), [2.5] * 4)
+        self.assertEqual(results.means()[open_].tolist(), [25.0] * 4)
+        self.assertEqual((results.filter_positions(), results.angles(2)), ([1, 2], [45.0]))
+        self.assertEqual(results.label(open_), "Filter 2, 45°")
+
+    def test_states_are_grouped_and_interrupted(self):
+        results = RoutineResults()
+        results.add(np.ones(3), 2, 90.0)
+        self.assertTrue(results.add(np.ones(3), 2, 90.04))
+        results.interrupt()
+        self.assertFalse(results.add(np.ones(3), 2, 90.0))
+        self.assertFalse(results.add(np.ones(2), 2, 90.0))
+        self.assertEqual((len(results), results.scans, results.skipped), (1, 1, 4))
+
+    def test_labels_show_tags_that_varied(self):
+        results = RoutineResults()
+        for integration in (10.0, 10.0, 20.0, 20.0):
+            results.add(np.ones(2), None, 30.0, integration_ms=integration, setpoint=20.0)
+        self.assertEqual([results.label(key) for key in results.sorted_keys()],
+                         ["30°, integration_ms 10", "30°, integration_ms 20"])
+        results = RoutineResults()
+        results.add(np.ones(2), None, None)
+        results.add(np.ones(2), None, None)
+        self.assertEqual(results.label(results.keys()[0]), "All scans")
+
+
+if __name__ == '__main__':
+    unittest.main()
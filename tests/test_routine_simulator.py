@@ -0,0 +1,82 @@
+import unittest
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from core.routine_compiler import compile_routine, compile_file, MOTOR, FILTER_WHEEL, SPECTROMETER
+from core.routine_simulator import simulate, DeviceModels, main
+from drivers.motor import move_duration
+
+ROUTINES_DIR = os.path.join(os.path.dirname(__file__), '..', 'routines')
+
+# 10 ms scans (1 ms integration averaged 10 times), no other overheads
+MODELS = dict(integration_ms=1.0, scan_overhead_ms=0.0, command_s=0.0, restart_s=0.0, write_s=0.0,
+              filter_move_s=1.5, motor_angle=0.0)
+
+
+class TestRoutineSimulator(unittest.TestCase):
+
+    def simulate(self, text, **models):
+        return simulate(compile_routine(text), DeviceModels(**dict(MODELS, **models)))
+
+    def test_timeline(self):
+        simulation = self.simulate("motor move 45\nfilter position 2\nwait 500\nspectrometer save_snapshot a.csv\n")
+        travel = move_duration(4500)
+        # Two scans at the 10 ms period after the motor is in position, then after the wheel confirmed
+        in_position = travel + 0.02 - (travel % 0.01)
+        self.assertEqual([step.instruction.op for step in simulation.steps],
+                         ["motor.move", "filter.position", "wait", "spectrometer.save_snapshot"])
+        self.assertAlmostEqual(simulation.steps[0].end, in_position, places=6)
+        self.assertAlmostEqual(simulation.steps[1].seconds, 1.52, delta=0.011)
+        self.assertAlmostEqual(simulation.duration, simulation.steps[2].start + 0.5, places=6)
+        self.assertAlmostEqual(simulation.busy[MOTOR], simulation.steps[0].seconds)
+        self.assertAlmostEqual(simulation.idle[FILTER_WHEEL], simulation.duration - simulation.steps[1].seconds)
+        self.assertEqual(simulation.busy[SPECTROMETER], 0.0)
+        self.assertTrue(simulation.fits(simulation.duration))
+        self.assertFalse(simulation.fits(simulation.duration - 0.1))
+
+    def test_concurrent_steps_take_the_longest_command(self):
+        sequential = self.simulate("motor move 90\nfilter position 2\n")
+        concurrent = self.simulate("parallel { motor move 90; filter position 2 }\n")
+        move, wheel, sync = concurrent.steps
+        self.assertEqual((move.start, wheel.start, sync.start), (0.0, 0.0, 0.0))
+        self.assertEqual(sync.end, max(move.end, wheel.end))
+        self.assertEqual(concurrent.duration, sync.end)
+        self.assertLess(concurrent.duration, sequential.duration)
+
+    def test_scans_are_only_waited_for_while_measuring(self):
+        simulation = self.simulate("filter position 2\nspectrometer start\nintegration 100\n", measuring=False)
+        wheel, start, integration = simulation.steps
+        self.assertEqual(wheel.seconds, 1.5)
+        # First scan of the started measurement, then of the restarted one at 100 ms x 2 averages
+        self.assertAlmostEqual(start.seconds, 0.01)
+        self.assertAlmostEqual(integration.seconds, 0.2)
+
+    def test_unknown_motor_angle_counts_as_a_full_turn(self):
+        simulation = self.simulate("motor move 10\nmotor move 10\n", motor_angle=None, measuring=False)
+        self.assertAlmostEqual(simulation.steps[0].seconds, move_duration(36000))
+        self.assertAlmostEqual(simulation.steps[1].seconds, move_duration(0))
+
+    def test_models_from_config(self):
+        models = DeviceModels.from_config({"filter_move_s": 3.0, "nope": 1}, motor_angle=90.0)
+        self.assertEqual((models.filter_move_s, models.motor_angle), (3.0, 90.0))
+
+    def test_simulates_hours_in_milliseconds(self):
+        program = compile_routine("for i in range 0 600 {\n    motor move 90\n    motor move 0\n    wait 1000\n}\n")
+        started = time.perf_counter()
+        simulation = simulate(program)
+        elapsed = time.perf_counter() - started
+        self.assertGreater(simulation.duration, 3600)
+        self.assertLess(elapsed, 0.5)
+        self.assertIn("(1:", simulation.summary())
+
+    def test_command_line(self):
+        path = os.path.join(ROUTINES_DIR, "OOD.txt")
+        duration = simulate(compile_file(path)).duration
+        self.assertEqual(main([path, "--window", str(duration + 1)]), 0)
+        self.assertEqual(main([path, "--window", str(duration - 1)]), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+import os
+import sys
+import gzip
+import shutil
+import tempfile
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from storage.spectral_archive import SpectralArchiveWriter, empty_meta
+from storage.segment_index import SegmentIndex
+from storage.scan_reader import ScanFile, read_scans, cached_archive
+
+
+class TestScanReader(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.archive = os.path.join(self.tmpdir, "Scans_20250101_120000_mini.sga")
+        self.t0 = 1735732800.0
+        with SpectralArchiveWriter(self.archive, 8, np.linspace(300, 307, 8)) as writer:
+            for i in range(40):
+                meta = empty_meta()
+                meta.update(timestamp=self.t0 + i, motor_angle=float(45 * (i % 4)),
+                            filter_pos=1 + i % 2, routine_code="OO" if i < 20 else "XX",
+                            scan_first=10 * i, scan_count=3)
+                writer.append(meta, np.full(8, i, dtype=float))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_filters(self):
+        scans = ScanFile(self.archive)
+        self.assertEqual(list(scans.find(start=self.t0 + 5, end=self.t0 + 9)), [5, 6, 7, 8, 9])
+        rows = scans.find(routine_code="OO", filter_pos=2, angle=45)
+        self.assertEqual(list(rows), [1, 5, 9, 13, 17])
+        data = scans.read(rows)
+        self.assertEqual(data.spectra.dtype, np.float32)
+        self.assertEqual(data.spectra.shape, (5, 8))
+        self.assertEqual(list(data.spectra[:, 0]), [1, 5, 9, 13, 17])
+        self.assertEqual(data.meta["routine_code"][0], b"OO")
+
+        data = read_scans(self.archive, start=self.t0 + 30, angle=[0, 90])
+        self.assertEqual(list(data.meta["scan_first"]), [300, 320, 340, 360, 380])
+        self.assertEqual(list(data.select(filter_pos=1, angle=90).meta["scan_first"]), [300, 340, 380])
+        self.assertEqual(len(read_scans(self.archive, start=self.t0 + 100)), 0)
+
+    def test_csv_is_converted_once(self):
+        from storage.spectral_archive import SpectralArchive
+        csv_path = os.path.join(self.tmpdir, "legacy.csv.gz")
+        SpectralArchive(self.archive).to_csv(csv_path[:-3])
+        with open(csv_path[:-3], "rb") as src, gzip.open(csv_path, "wb") as dst:
+            dst.write(src.read())
+
+        from_csv = read_scans(csv_path, routine_code="XX", filter_pos=1)
+        from_archive = read_scans(self.archive, routine_code="XX", filter_pos=1)
+        np.testing.assert_array_equal(from_csv.spectra, from_archive.spectra)
+        np.testing.assert_allclose(from_csv.meta["timestamp"], from_archive.meta["timestamp"], atol=1e-3)
+        np.testing.assert_array_equal(from_csv.meta["scan_first"], from_archive.meta["scan_first"])
+        np.testing.assert_allclose(from_csv.wavelengths, from_archive.wavelengths)
+
+        cache = cached_archive(csv_path)
+        mtime = os.path.getmtime(cache)
+        self.assertEqual(cached_archive(csv_path), cache)
+        self.assertEqual(os.path.getmtime(cache), mtime)
+
+    def test_segment_index(self):
+        index_path = os.path.join(self.tmpdir, "Scans_20250101_120000_mini_index.json")
+        index = SegmentIndex(index_path, "20250101_120000")
+        index.start_segment({"archive": self.archive})
+        for i in range(40):
+            index.record_row(self.t0 + i)
+        index.start_segment({"archive": os.path.join(self.tmpdir, "later.sga")})
+        index.record_row(self.t0 + 1000)
+        index.save()
+        data = read_scans(index_path, start=self.t0 + 38, end=self.t0 + 100)
+        self.assertEqual(list(data.spectra[:, 0]), [38, 39])
+
+
+if __name__ == '__main__':
+    unittest.main()
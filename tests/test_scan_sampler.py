@@ -0,0 +1,76 @@
+import unittest
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from core.scan_sampler import (Scan, ScanAggregator, MODE_SCANS, MODE_WINDOW,
+                               format_scan_ids, parse_scan_ids)
+
+
+def make_scan(seq, hw=None, integ=10.0, value=None):
+    hw = seq * 0.1 if hw is None else hw
+    value = float(seq) if value is None else value
+    return Scan(seq=seq, hw_timestamp=hw, host_timestamp=1000.0 + hw,
+                integration_time_ms=integ, intensities=(value, 2 * value))
+
+
+class TestScanSampler(unittest.TestCase):
+
+    def test_rows_hold_exactly_n_consecutive_scans(self):
+        agg = ScanAggregator(MODE_SCANS, scans_per_row=3)
+        rows = []
+        for seq in range(1, 8):
+            rows += agg.add(make_scan(seq))
+        self.assertEqual([r.scan_ids for r in rows], [[1, 2, 3], [4, 5, 6]])
+        self.assertEqual(rows[0].average().tolist(), [2.0, 4.0])
+        self.assertEqual(agg.flush().scan_ids, [7])
+
+    def test_duplicate_scans_are_ignored(self):
+        agg = ScanAggregator(MODE_SCANS, scans_per_row=2)
+        rows = agg.add(make_scan(1)) + agg.add(make_scan(1)) + agg.add(make_scan(2))
+        self.assertEqual([r.scan_ids for r in rows], [[1, 2]])
+
+    def test_window_mode_groups_by_hardware_time(self):
+        agg = ScanAggregator(MODE_WINDOW, window_s=0.25)
+        rows = []
+        for seq, hw in [(1, 0.0), (2, 0.1), (3, 0.2), (4, 0.3), (5, 0.9), (6, 1.0)]:
+            rows += agg.add(make_scan(seq, hw=hw))
+        # Windows stay aligned to the first scan: [0, .25) [.25, .5) ... [.75, 1.0) [1.0, ...
+        self.assertEqual([r.scan_ids for r in rows], [[1, 2, 3], [4], [5]])
+
+    def test_integration_change_discards_partial_row(self):
+        agg = ScanAggregator(MODE_SCANS, scans_per_row=3)
+        agg.add(make_scan(1))
+        agg.add(make_scan(2))
+        rows = agg.add(make_scan(3, integ=20.0))
+        self.assertEqual(rows, [])
+        self.assertEqual(agg.discarded, 2)
+        self.assertEqual(agg.flush().scan_ids, [3])
+
+    def test_scan_id_text(self):
+        self.assertEqual(format_scan_ids([4, 5, 6, 9]), "4-6;9")
+        self.assertEqual(format_scan_ids([7, 7]), "7;7")
+        self.assertEqual(parse_scan_ids("4-6;9"), [4, 5, 6, 9])
+        self.assertEqual(parse_scan_ids(""), [])
+
+    def test_logger_writes_scan_ids(self):
+        from gui.components.data_logger import DataLogger
+        logger = DataLogger(None)
+        logger.fusion_enabled = False
+        logger.sampling_mode = MODE_SCANS
+        logger.continuous_saving = True
+        written = []
+        logger.csv_file = type("Stream", (), {"write": lambda self, text: written.append(text)})()
+        logger._aggregator = ScanAggregator(MODE_SCANS, scans_per_row=2)
+        for seq in (1, 2, 3):
+            logger.add_scan(make_scan(seq))
+        self.assertEqual(len(logger._csv_buffer), 1)      # one row, not written yet
+        logger._flush_csv_buffer()
+        header, row = [line.split(",") for line in "".join(written).splitlines()]
+        self.assertEqual(row[header.index("NumScans")], "2")
+        self.assertEqual(row[header.index("ScanIDs")], "1-2")
+        self.assertEqual(row[-1], "3.0000")
+
+
+if __name__ == '__main__':
+    unittest.main()
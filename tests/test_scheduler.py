@@ -0,0 +1,230 @@
+import unittest
+import os
+import sys
+import json
+import shutil
+import tempfile
+import time
+from datetime import datetime
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+from PyQt5.QtWidgets import QApplication
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from core.scheduler import (Scheduler, ScheduleEntry, DailyAt, Every, Once, SunElevation, sun_elevation,
+                            load_schedule)
+from gui.components.schedule_manager import ScheduleManager
+from core.event_log import EventLog, EventSource, get_event_log, WARNING, ERROR
+
+SCHEDULES_DIR = os.path.join(os.path.dirname(__file__), '..', 'schedules')
+ROUTINES_DIR = os.path.join(os.path.dirname(__file__), '..', 'routines')
+
+app = QApplication.instance() or QApplication([])
+
+
+def local(*args):
+    return datetime(*args).timestamp()
+
+
+def entry(name, trigger, priority=0):
+    return ScheduleEntry(name, name + ".txt", trigger, priority)
+
+
+class TestTriggers(unittest.TestCase):
+
+    def test_daily_once_and_every(self):
+        morning = local(2026, 3, 10, 9, 0)
+        self.assertEqual(DailyAt("12:30").next_after(morning), local(2026, 3, 10, 12, 30))
+        self.assertEqual(DailyAt("08:00").next_after(morning), local(2026, 3, 11, 8, 0))
+        self.assertEqual(Once("2026-03-10T10:00:00").next_after(morning), local(2026, 3, 10, 10, 0))
+        self.assertIsNone(Once("2026-03-10T08:00:00").next_after(morning))
+        every = Every(1800, "06:00", "09:30")
+        self.assertEqual(every.next_after(morning), local(2026, 3, 10, 9, 30))
+        self.assertEqual(every.next_after(local(2026, 3, 10, 9, 30)), local(2026, 3, 11, 6, 0))
+        self.assertEqual(every.next_after(local(2026, 3, 10, 5, 0)), local(2026, 3, 10, 6, 0))
+        # Without an end the count restarts at the next day's start
+        self.assertEqual(Every(7 * 3600, "06:00").next_after(local(2026, 3, 10, 20, 30)), local(2026, 3, 11, 3, 0))
+        self.assertEqual(Every(7 * 3600, "06:00").next_after(local(2026, 3, 11, 3, 0)), local(2026, 3, 11, 6, 0))
+        with self.assertRaises(ValueError):
+            Every(60, "10:00", "09:00")
+        with self.assertRaises(ValueError):
+            DailyAt("25:00")
+
+    def test_sun_elevation_crossings(self):
+        start = local(2026, 6, 21, 0, 0)
+        rising = SunElevation(10, 52.0, 4.4).next_after(start)
+        setting = SunElevation(10, 52.0, 4.4, "setting").next_after(start)
+        self.assertLess(rising, setting)
+        self.assertLess(setting - start, 86400)
+        for when, before, after in ((rising, False, True), (setting, True, False)):
+            self.assertAlmostEqual(sun_elevation(52.0, 4.4, when), 10.0, delta=0.05)
+            self.assertEqual(sun_elevation(52.0, 4.4, when - 60) >= 10, before)
+            self.assertEqual(sun_elevation(52.0, 4.4, when + 60) >= 10, after)
+        # Polar night: the sun never gets there
+        self.assertIsNone(SunElevation(10, 80.0, 0.0).next_after(local(2026, 12, 21, 0, 0)))
+
+
+class TestScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.state = os.path.join(self.tmpdir, "state.json")
+        self.t0 = local(2026, 3, 10, 9, 0)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_heap_returns_entries_in_due_order(self):
+        entries = [entry(f"e{i}", Once(datetime.fromtimestamp(self.t0 + 60 * (500 - i)).isoformat()))
+                   for i in range(500)]
+        scheduler = Scheduler(entries, self.t0)
+        self.assertEqual(scheduler.next_wakeup(), self.t0 + 60)
+        self.assertIsNone(scheduler.next_run(self.t0 + 59))
+        run = scheduler.next_run(self.t0 + 60)
+        self.assertEqual((run.entry.name, run.due, run.preempt), ("e499", self.t0 + 60, False))
+        self.assertEqual(scheduler.next_wakeup(), self.t0 + 120)
+
+    def test_queue_by_priority_while_busy(self):
+        low, high = entry("low", DailyAt("09:10"), 1), entry("high", DailyAt("09:20"), 5)
+        scheduler = Scheduler([low, high], self.t0)
+        self.assertIsNone(scheduler.next_run(local(2026, 3, 10, 9, 30), running=True))
+        self.assertEqual(scheduler.waiting(), [high, low])
+        self.assertEqual(scheduler.next_run(local(2026, 3, 10, 9, 40)).entry, high)
+        self.assertEqual(scheduler.next_run(local(2026, 3, 10, 9, 50)).entry, low)
+        self.assertIsNone(scheduler.next_run(local(2026, 3, 10, 9, 50)))
+        # Rescheduled for the next day
+        self.assertEqual(scheduler.next_wakeup(), local(2026, 3, 11, 9, 10))
+
+    def test_skip_and_preempt_policies(self):
+        low, high = entry("low", DailyAt("09:10"), 1), entry("high", DailyAt("09:20"), 5)
+        now = local(2026, 3, 10, 9, 30)
+        skipping = Scheduler([low, high], self.t0, conflict="skip")
+        self.assertIsNone(skipping.next_run(now, running=low))
+        self.assertEqual((skipping.waiting(), skipping.dropped), ([], 2))
+        preempting = Scheduler([high], self.t0, conflict="preempt")
+        self.assertTrue(preempting.next_run(now, running=low).preempt)
+        # Never a routine started by hand, nor one of the same or higher priority
+        preempting = Scheduler([low], self.t0, conflict="preempt")
+        self.assertIsNone(preempting.next_run(now, running=True))
+        self.assertIsNone(preempting.next_run(now, running=high))
+
+    def test_queued_entries_expire(self):
+        log = EventLog()
+        scheduler = Scheduler([entry("e", DailyAt("09:10"))], self.t0, max_late_s=600)
+        scheduler.events = EventSource("scheduler", log=log)
+        self.assertIsNone(scheduler.next_run(local(2026, 3, 10, 9, 15), running=True))
+        self.assertIsNone(scheduler.next_run(local(2026, 3, 10, 9, 21)))
+        self.assertEqual(scheduler.dropped, 1)
+        event, = log.recent()
+        self.assertEqual((event.component, event.level, event.code, event.payload["entry"]),
+                         ("scheduler", WARNING, "overrun", "e"))
+
+    def test_state_file_errors_are_reported(self):
+        with open(self.state, "w") as f:
+            f.write("{broken")
+        received = []
+        get_event_log().subscribe(received.append)
+        self.addCleanup(get_event_log().unsubscribe, received.append)
+        Scheduler([entry("e", DailyAt("09:10"))], self.t0, state_path=self.state)
+        self.assertEqual([(e.level, e.code) for e in received if e.component == "scheduler"],
+                         [(ERROR, "state_read_failed")])
+
+    def test_missed_runs_after_downtime(self):
+        every = entry("every", Every(600))
+        daily = entry("daily", DailyAt("06:00"))
+        scheduler = Scheduler([every, daily], self.t0, state_path=self.state)
+        scheduler.started(scheduler.next_run(self.t0 + 600))
+        with open(self.state) as f:
+            self.assertEqual(json.load(f)["last_runs"], {"every": self.t0 + 600})
+        scheduler.last_runs["daily"] = local(2026, 3, 10, 6, 0)
+        scheduler._save_state()
+
+        # Down from 09:10 to the next day 07:05: each runs once for its latest missed occurrence, if recent
+        restart = local(2026, 3, 11, 7, 5)
+        skipping = Scheduler([every, daily], restart, state_path=self.state, missed="skip")
+        self.assertIsNone(skipping.next_run(restart))
+        self.assertEqual(skipping.dropped, 2)
+        self.assertIsNone(Scheduler([daily], restart, state_path=self.state, max_late_s=3600).next_run(restart))
+        scheduler._save_state()
+        scheduler = Scheduler([every, daily], restart, state_path=self.state, max_late_s=7200)
+        run = scheduler.next_run(restart)
+        self.assertEqual((run.entry, run.due), (daily, local(2026, 3, 11, 6, 0)))
+        scheduler.started(run)
+        self.assertEqual(scheduler.next_run(restart).due, local(2026, 3, 11, 7, 0))
+        self.assertIsNone(scheduler.next_run(restart))
+
+    def test_load_schedule(self):
+        entries, schedule = load_schedule(os.path.join(SCHEDULES_DIR, "schedule.json"), [SCHEDULES_DIR, ROUTINES_DIR])
+        self.assertTrue(entries)
+        self.assertTrue(all(os.path.exists(e.routine) for e in entries))
+        path = os.path.join(self.tmpdir, "schedule.json")
+        for bad, message in (({"routine": "OO.txt"}, "needs 'at'"),
+                             ({"routine": "missing.txt", "at": "10:00"}, "not found"),
+                             ({"routine": "OO.txt", "sun_elevation": 5}, "latitude")):
+            with open(path, "w") as f:
+                json.dump({"entries": [bad]}, f)
+            with self.assertRaises(ValueError) as cm:
+                load_schedule(path, [ROUTINES_DIR])
+            self.assertIn(message, str(cm.exception))
+
+
+class StatusBar:
+    def showMessage(self, message):
+        pass
+
+
+class FakeWindow(QObject):
+    def statusBar(self):
+        return StatusBar()
+
+
+class FakeRoutineManager(QObject):
+    finished_signal = pyqtSignal(bool)
+
+    def __init__(self):
+        super().__init__()
+        self.routines_dir = ROUTINES_DIR
+        self.routine_running = False
+        self.runs = []
+
+    def run_file(self, path, name):
+        self.runs.append(name)
+        self.routine_running = True
+        QTimer.singleShot(300, self.complete)
+        return True
+
+    def complete(self):
+        self.routine_running = False
+        self.finished_signal.emit(True)
+
+
+class TestScheduleManager(unittest.TestCase):
+
+    def test_runs_due_routines_one_at_a_time(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            now = time.time()
+            path = os.path.join(tmpdir, "schedule.json")
+            with open(path, "w") as f:
+                json.dump({"entries": [
+                    {"name": "second", "routine": "OO.txt", "at": datetime.fromtimestamp(now + 0.2).isoformat()},
+                    {"name": "first", "routine": "OOD.txt", "at": datetime.fromtimestamp(now + 0.1).isoformat()},
+                ]}, f)
+            routines = FakeRoutineManager()
+            manager = ScheduleManager(FakeWindow(), routines, {"enabled": True, "file": path, "startup_delay_s": 0,
+                                                               "state": os.path.join(tmpdir, "state.json")})
+            self.assertTrue(manager.start())
+            while len(routines.runs) < 2 and time.time() - now < 3:
+                app.processEvents()
+                time.sleep(0.005)
+            # "second" came due while "first" ran and was queued until it completed
+            self.assertEqual(routines.runs, ["first", "second"])
+            self.assertGreater(time.time() - now, 0.35)
+            manager.stop()
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    unittest.main()
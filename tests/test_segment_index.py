@@ -0,0 +1,91 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from PyQt5.QtCore import QDateTime
+from storage.segment_index import SegmentIndex, load_index, find_segments, segment_path
+from storage.spectral_archive import SpectralArchive
+from storage.file_writer import get_file_writer
+from storage.catalog import configure_catalog, get_catalog, DEFAULT_PATH
+
+
+class TestSegmentIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        configure_catalog(path=os.path.join(self.tmpdir, "catalog.sqlite"))
+
+    def tearDown(self):
+        configure_catalog(path=DEFAULT_PATH)
+        shutil.rmtree(self.tmpdir)
+
+    def test_record_and_find(self):
+        path = os.path.join(self.tmpdir, "s_index.json")
+        index = SegmentIndex(path, "s")
+        index.start_segment({"csv": "/x/a_001.csv", "archive": None})
+        index.record_row(100.0, "XX", {"csv": (50, 80)})
+        index.record_row(160.0, "OO", {"csv": (80, 110)})
+        index.start_segment({"csv": "/x/a_002.csv"})
+        index.record_row(200.0, "OO", {"csv": (50, 80)})
+        index.start_segment({"csv": "/x/a_003.csv"})
+        index.save()
+
+        loaded = load_index(path)
+        first = loaded["segments"][0]
+        self.assertEqual(first["files"], {"csv": "a_001.csv"})
+        self.assertEqual(first["rows"], 2)
+        self.assertEqual(first["routine_codes"], ["XX", "OO"])
+        self.assertEqual(first["offsets"]["csv"], {"data_offset": 50, "end_offset": 110})
+        self.assertEqual([s["segment"] for s in find_segments(path, 150.0, 190.0)], [1])
+        self.assertEqual([s["segment"] for s in find_segments(loaded, 170.0)], [2])
+        self.assertEqual(segment_path(path, first, "csv"), os.path.join(self.tmpdir, "a_001.csv"))
+
+    def test_logger_rotates_by_size(self):
+        from gui.components.data_logger import DataLogger
+        logger = DataLogger(None)
+        logger.csv_dir = logger.log_dir = self.tmpdir
+        logger.scan_format = "both"
+        logger.compression = None
+        logger.fusion_enabled = False
+        logger.rotate_max_bytes = 600
+        logger.toggle_data_saving()
+        for i in range(12):
+            ts = QDateTime.fromMSecsSinceEpoch(1700000000000 + i * 1000)
+            logger._queue_row(0.0, 0.0, [float(i)] * 16, [i + 1], timestamp=ts)
+            logger._write_ready_rows()
+        logger.toggle_data_saving()
+        get_file_writer().drain(5)
+
+        index_path = logger.segment_index_path
+        segments = load_index(index_path)["segments"]
+        self.assertGreater(len(segments), 1)
+        self.assertEqual(sum(s["rows"] for s in segments), 12)
+        for segment in segments:
+            csv_path = segment_path(index_path, segment, "csv")
+            with open(csv_path, "rb") as f:
+                data = f.read()
+            span = segment["offsets"]["csv"]
+            self.assertEqual(span["end_offset"], len(data))
+            rows = data[span["data_offset"]:].decode().splitlines()
+            self.assertEqual(len(rows), segment["rows"])
+            archive = SpectralArchive(segment_path(index_path, segment, "archive"))
+            self.assertEqual(len(archive), segment["rows"])
+            self.assertAlmostEqual(archive.records[0]["timestamp"], segment["first_timestamp"])
+            self.assertEqual(segment["offsets"]["archive"]["end_offset"],
+                             os.path.getsize(archive.path))
+
+        # Every segment file is in the catalog with its time span
+        session = load_index(index_path)["session"]
+        cataloged = get_catalog().session_files(session)
+        self.assertEqual(len(cataloged), len(segments))
+        self.assertEqual([e["rows"] for e in cataloged], [s["rows"] for s in segments])
+        self.assertEqual(cataloged[0]["first_timestamp"], segments[0]["first_timestamp"])
+        self.assertEqual(len(get_catalog().session_files(session, "scan_archive")), len(segments))
+        self.assertEqual(get_catalog().latest("segment_index")["rows"], 12)
+
+
+if __name__ == '__main__':
+    unittest.main()
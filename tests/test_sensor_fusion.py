@@ -0,0 +1,75 @@
+import unittest
+import os
+import sys
+import math
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from core.state_store import StateStore, IMUState, THPState, TECState
+from core.sensor_fusion import fuse, wait_satisfied
+
+
+class TestSensorFusion(unittest.TestCase):
+
+    def test_average_inside_window(self):
+        records = [TECState(current_temp=t, setpoint=20.0, timestamp=ts)
+                   for ts, t in [(9.0, 10.0), (10.2, 20.0), (10.8, 22.0), (12.0, 50.0)]]
+        fused, age = fuse(records, 10.0, 11.0)
+        self.assertAlmostEqual(fused.current_temp, 21.0)
+        self.assertAlmostEqual(fused.setpoint, 20.0)
+        self.assertAlmostEqual(age, 0.3)
+
+    def test_interpolates_between_readings_around_window(self):
+        records = [THPState(temperature=20.0, humidity=40.0, timestamp=100.0),
+                   THPState(temperature=23.0, humidity=46.0, timestamp=103.0)]
+        fused, age = fuse(records, 100.5, 101.5)
+        self.assertAlmostEqual(fused.temperature, 21.0)
+        self.assertAlmostEqual(fused.humidity, 42.0)
+        self.assertAlmostEqual(age, 1.0)
+
+    def test_holds_last_reading_and_reports_age(self):
+        records = [THPState(temperature=20.0, timestamp=100.0)]
+        fused, age = fuse(records, 102.0, 104.0)
+        self.assertEqual(fused.temperature, 20.0)
+        self.assertAlmostEqual(age, 3.0)
+        self.assertEqual(fuse([], 0, 1), (None, None))
+
+    def test_angles_wrap_and_vectors_average(self):
+        records = [IMUState(yaw=179.0, accel=(0.0, 0.0, 1.0), timestamp=1.0),
+                   IMUState(yaw=-179.0, accel=(0.0, 0.2, 0.8), timestamp=1.5)]
+        fused, _ = fuse(records, 0.9, 1.6)
+        self.assertAlmostEqual(abs(fused.yaw), 180.0, places=6)
+        self.assertAlmostEqual(fused.accel[1], 0.1)
+        fused, _ = fuse(records, 1.2, 1.3)
+        self.assertTrue(math.isclose(abs(fused.yaw), 180.0, abs_tol=1e-6))
+
+    def test_wait_for_reading_after_window(self):
+        records = [THPState(timestamp=100.0)]
+        self.assertFalse(wait_satisfied(records, 101.0, 102.0, 3.5))
+        self.assertTrue(wait_satisfied(records, 101.0, 104.6, 3.5))
+        self.assertTrue(wait_satisfied(records + [THPState(timestamp=103.0)], 101.0, 103.1, 3.5))
+        # A sensor that stopped reporting long before the window is not waited for
+        self.assertTrue(wait_satisfied(records, 110.0, 110.1, 3.5))
+
+    def test_store_history_is_time_bounded(self):
+        store = StateStore(history_seconds=5)
+        for ts in range(10):
+            store.publish(THPState(timestamp=float(ts)))
+        self.assertEqual([r.timestamp for r in store.history(THPState)], [4.0, 5.0, 6.0, 7.0, 8.0, 9.0])
+        self.assertEqual(len(store.history(THPState, since=8.0)), 2)
+
+    def test_logger_row_uses_window_values_and_ages(self):
+        from gui.components.data_logger import DataLogger
+        logger = DataLogger(None)
+        logger.state_store = StateStore()
+        logger.state_store.publish(THPState(temperature=20.0, timestamp=100.0))
+        logger.state_store.publish(THPState(temperature=23.0, timestamp=103.0))
+        values = logger._collect_row_values(window=(100.5, 101.5))
+        self.assertAlmostEqual(values['thp_temp'], 21.0)
+        self.assertAlmostEqual(values['thp_age'], 1.0)
+        self.assertTrue(math.isnan(values['imu_age']))
+        row = logger._build_csv_row("t", [], values)
+        self.assertEqual(row[-5:-2], ["nan", "1.000", "nan"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import unittest
+import os
+import sys
+import tempfile
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from storage import spectral_archive as sa
+
+
+class TestSpectralArchive(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "Scans_test_mini.sga")
+        self.wls = np.linspace(300.0, 800.0, 16)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _meta(self, ts, angle, pos):
+        meta = sa.empty_meta()
+        meta.update({'timestamp': ts, 'motor_angle': angle, 'filter_pos': pos,
+                     'integration_time': 50, 'routine_code': 'OO'})
+        return meta
+
+    def test_roundtrip_and_append(self):
+        with sa.SpectralArchiveWriter(self.path, 16, self.wls) as w:
+            w.append(self._meta(1000.0, 0, 1), np.arange(16))
+            w.append(self._meta(1001.0, 45, 2), np.arange(16) * 2.0)
+
+        # Reopening appends to the same file
+        with sa.SpectralArchiveWriter(self.path, 16, self.wls) as w:
+            self.assertEqual(w.rows_written, 2)
+            w.append_many([self._meta(1002.0, 90, 1)], [np.ones(16)])
+
+        archive = sa.SpectralArchive(self.path)
+        self.assertEqual(len(archive), 3)
+        self.assertEqual(archive.spectra.dtype, np.float32)
+        self.assertEqual(archive.spectra.shape, (3, 16))
+        np.testing.assert_allclose(archive.wavelengths, self.wls)
+        np.testing.assert_allclose(archive.spectra[1], np.arange(16) * 2.0)
+        self.assertEqual(list(archive.meta['motor_angle']), [0, 45, 90])
+        self.assertEqual(archive.meta['routine_code'][0], b'OO')
+
+    def test_dropped_write_is_not_counted(self):
+        class Stream:
+            accept = True
+
+            def write(self, data):
+                return self.accept
+
+        stream = Stream()
+        w = sa.SpectralArchiveWriter(self.path, 16, self.wls, stream=stream)
+        w.append(self._meta(1000.0, 0, 1), np.arange(16))
+        stream.accept = False
+        self.assertFalse(w.write_raw(w.encode_rows([self._meta(1001.0, 0, 1)], [np.arange(16)])))
+        self.assertEqual(w.rows_written, 1)
+
+    def test_truncated_tail_is_ignored(self):
+        with sa.SpectralArchiveWriter(self.path, 16, self.wls) as w:
+            w.append(self._meta(1000.0, 0, 1), np.arange(16))
+        with open(self.path, "ab") as f:
+            f.write(b"\x01\x02\x03")  # partial record, e.g. after a power loss
+        self.assertEqual(len(sa.SpectralArchive(self.path)), 1)
+
+        # The writer drops the partial record before appending
+        with sa.SpectralArchiveWriter(self.path, 16, self.wls) as w:
+            w.append(self._meta(1001.0, 0, 1), np.arange(16))
+        self.assertEqual(len(sa.SpectralArchive(self.path)), 2)
+
+    def test_pixel_mismatch_rejected(self):
+        with sa.SpectralArchiveWriter(self.path, 16, self.wls) as w:
+            w.append(self._meta(1000.0, 0, 1), np.arange(16))
+        with self.assertRaises(ValueError):
+            sa.SpectralArchiveWriter(self.path, 32)
+
+    def test_to_csv(self):
+        meta = self._meta(1000.0, float("nan"), -1)
+        meta.update(scan_first=40, scan_count=5)
+        with sa.SpectralArchiveWriter(self.path, 16, self.wls) as w:
+            w.append(meta, np.full(16, 1.5))
+        logged_csv = os.path.splitext(self.path)[0] + ".csv"
+        with open(logged_csv, "w") as f:
+            f.write("logged\n")
+        csv_path = sa.archive_to_csv(self.path)
+        # The CSV the data logger wrote next to the archive is left alone
+        self.assertNotEqual(csv_path, logged_csv)
+        with open(logged_csv) as f:
+            self.assertEqual(f.read(), "logged\n")
+        with open(csv_path) as f:
+            header = f.readline().strip().split(",")
+            row = f.readline().strip().split(",")
+        self.assertEqual(header[0], "Timestamp")
+        self.assertEqual(header[24:27], ["IMUAge_s", "THPAge_s", "TECAge_s"])
+        self.assertEqual(header[27:29], ["NumScans", "ScanIDs"])
+        self.assertEqual(header[29], "Wavelength_300.00nm")
+        self.assertEqual(len(row), 29 + 16)
+        self.assertEqual(row[1], "nan")
+        self.assertEqual(row[2], "-1")
+        self.assertEqual(row[23], "OO")
+        self.assertEqual(row[24], "nan")
+        self.assertEqual(row[27:29], ["5", "40-44"])
+        self.assertEqual(row[29], "1.5000")
+
+    def test_reads_archive_with_older_field_layout(self):
+        old_fields = [f for f in sa.META_FIELDS if not f[0].endswith("_age") and not f[0].startswith("scan_")]
+        header = dict(fields=[list(f) for f in old_fields])
+        with open(self.path, "wb") as fh:
+            fh.write(sa._encode_header(16, self.wls, header))
+            rec = np.zeros(1, dtype=sa.record_dtype(16, old_fields))
+            rec["timestamp"] = 1000.0
+            rec["spectrum"] = 2.0
+            fh.write(rec.tobytes())
+        archive = sa.SpectralArchive(self.path)
+        self.assertEqual(len(archive), 1)
+        self.assertNotIn("IMUAge_s", archive.csv_header())
+        self.assertTrue(archive.format_csv_row(0).endswith(",2.0000"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+import os
+import sys
+import ctypes
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from core.spectrum import as_spectrum, mean_spectrum, configure_spectra, spectrum_dtype
+from core.scan_sampler import Scan
+
+
+class TestSpectrum(unittest.TestCase):
+
+    def tearDown(self):
+        configure_spectra()
+
+    def test_driver_buffer_is_copied_to_float32(self):
+        buffer = (ctypes.c_double * 4096)(*range(4096))
+        spectrum = as_spectrum(buffer, 2048)
+        self.assertEqual((spectrum.dtype, spectrum.shape), (np.float32, (2048,)))
+        self.assertEqual(spectrum[2047], 2047.0)
+        buffer[0] = -1.0
+        self.assertEqual(spectrum[0], 0.0)
+        self.assertFalse(spectrum.flags.writeable)
+        # Short input is zero-padded
+        self.assertEqual(as_spectrum([1.0, 2.0], 4).tolist(), [1.0, 2.0, 0.0, 0.0])
+
+    def test_arrays_of_the_right_dtype_are_shared(self):
+        data = np.arange(8, dtype=np.float32)
+        spectrum = as_spectrum(data)
+        self.assertTrue(np.shares_memory(spectrum, data))
+        self.assertTrue(data.flags.writeable)
+        self.assertFalse(np.shares_memory(as_spectrum(data, dtype=np.float64), data))
+
+    def test_mean_accumulates_in_float64(self):
+        # A float32 sum would round 2 * (2**24 - 1) + 1 to 2**25
+        spectra = [as_spectrum([2.0 ** 24 - 1, 1.0]), as_spectrum([2.0 ** 24 - 1, 2.0, 5.0]), as_spectrum([1.0, 3.0])]
+        mean = mean_spectrum(spectra)
+        self.assertEqual(mean.dtype, np.float32)
+        self.assertEqual(mean.tolist(), [11184810.0, 2.0])
+
+    def test_float64_opt_in(self):
+        configure_spectra(dtype="float64")
+        self.assertEqual(spectrum_dtype(), np.float64)
+        scan = Scan(seq=1, hw_timestamp=0.0, host_timestamp=0.0, integration_time_ms=1.0,
+                    intensities=(0.1, 0.2))
+        self.assertEqual(scan.intensities.tolist(), [0.1, 0.2])
+        configure_spectra(dtype="float16")
+        self.assertEqual(spectrum_dtype(), np.float32)
+
+    def test_scans_hold_read_only_arrays(self):
+        scan = Scan(seq=1, hw_timestamp=0.0, host_timestamp=0.0, integration_time_ms=1.0,
+                    intensities=[1.0, 2.0])
+        self.assertEqual(scan.intensities.dtype, np.float32)
+        with self.assertRaises(ValueError):
+            scan.intensities[0] = 5.0
+        self.assertEqual(scan, Scan(seq=1, hw_timestamp=0.0, host_timestamp=0.0, integration_time_ms=1.0,
+                                    intensities=[1.0, 2.0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+import os
+import sys
+import dataclasses
+import threading
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from core.state_store import (StateStore, MotorState, FilterWheelState, IMUState,
+                              THPState, TECState, SpectrometerState, RoutineState)
+
+
+class TestStateStore(unittest.TestCase):
+
+    def test_publish_and_get_latest(self):
+        store = StateStore()
+        store.publish(MotorState(angle_deg=10, connected=True))
+        store.publish(MotorState(angle_deg=45, connected=True))
+        self.assertEqual(store.get(MotorState).angle_deg, 45)
+        self.assertEqual(store.get("motor").angle_deg, 45)
+        self.assertIsNone(store.get(THPState))
+        store.clear(MotorState)
+        self.assertIsNone(store.get(MotorState))
+
+    def test_records_are_immutable_and_timestamped(self):
+        record = THPState(temperature=21.5, humidity=40.0, pressure=1013.0)
+        self.assertGreater(record.timestamp, 0)
+        with self.assertRaises(dataclasses.FrozenInstanceError):
+            record.temperature = 0
+
+    def test_snapshot_is_a_copy(self):
+        store = StateStore()
+        store.publish(FilterWheelState(position=2))
+        snap = store.snapshot()
+        store.publish(FilterWheelState(position=5))
+        self.assertEqual(snap["filter_wheel"].position, 2)
+
+    def test_listener_and_threaded_publish(self):
+        store = StateStore()
+        seen = []
+        store.subscribe(seen.append)
+        threads = [threading.Thread(target=store.publish, args=(IMUState(roll=i),)) for i in range(10)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(seen), 10)
+
+    def test_routine_code(self):
+        self.assertEqual(RoutineState(name="OOD", running=True).code, "OO")
+        self.assertEqual(RoutineState(name="OOD", running=False).code, "XX")
+        self.assertEqual(RoutineState().code, "XX")
+
+
+class TestDataLoggerRowValues(unittest.TestCase):
+
+    def test_row_built_from_state_records(self):
+        from gui.components.data_logger import DataLogger
+        logger = DataLogger(None)
+        logger.state_store = StateStore()
+        self.assertIsNone(logger._collect_row_values()['motor_angle'])
+
+        store = logger.state_store
+        store.publish(MotorState(angle_deg=30, connected=True))
+        store.publish(FilterWheelState(position=3, connected=True))
+        store.publish(IMUState(roll=1.5, pitch=-2.0, yaw=180.0, accel=(0.0, 0.0, 1.0),
+                               mag=(10.0, 20.0, 30.0), latitude=39.0, longitude=-76.9))
+        store.publish(THPState(temperature=22.0, humidity=35.0, pressure=1009.0))
+        store.publish(TECState(current_temp=20.1, setpoint=20.0, auxiliary_temp=25.3))
+        store.publish(SpectrometerState(integration_time_ms=50, wavelengths=(300.0, 301.0)))
+        store.publish(RoutineState(name="OO", running=True))
+
+        values = logger._collect_row_values()
+        self.assertEqual(values['motor_angle'], 30)
+        self.assertEqual(values['filter_pos'], 3)
+        self.assertEqual(values['yaw'], 180.0)
+        self.assertEqual(values['accel_z'], 1.0)
+        self.assertEqual(values['latitude'], 39.0)
+        self.assertEqual(values['thp_pres'], 1009.0)
+        self.assertEqual(values['spec_temp'], 25.3)
+        self.assertEqual(values['integration_time'], 50)
+        self.assertEqual(values['routine_code'], "OO")
+
+        row = logger._build_csv_row("2024-01-01 00:00:00.000", [1.0, 2.0], values)
+        self.assertEqual(row[:3], ["2024-01-01 00:00:00.000", "30", "3"])
+        self.assertEqual(logger._get_csv_headers(2)[-2:], ["Wavelength_300.00nm", "Wavelength_301.00nm"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,8 +3,9 @@ import numpy as np
 from astral import LocationInfo
 from astral.sun import azimuth, elevation
 
-def compute_sun_vector(lat,lon):
-    now=datetime.datetime.now(datetime.timezone.utc)
+def compute_sun_vector(lat,lon,when=None):
+    """Unit vector (east, north, up) towards the sun at when (an aware datetime, default now)"""
+    now=when or datetime.datetime.now(datetime.timezone.utc)
     city=LocationInfo(latitude=lat,longitude=lon)
     az=azimuth(city.observer,now); el=elevation(city.observer,now)
     azr,elr=math.radians(az),math.radians(el)